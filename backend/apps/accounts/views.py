@@ -6,6 +6,7 @@ from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework_simplejwt.tokens import RefreshToken
 from django.contrib.auth import logout
+from django.db.models import Sum
 from .models import User, Achievement
 from .serializers import (
     UserRegistrationSerializer,
@@ -168,19 +169,18 @@ class UserStatsView(APIView):
         user = request.user
         
         # Calculate statistics
-        from apps.progress.models import LessonProgress, ExerciseAttempt
+        from apps.progress.models import LessonProgress
+        from apps.exercises.models import UserExerciseStatus
         
         completed_lessons = LessonProgress.objects.filter(
             user=user,
             is_completed=True
         ).count()
         
-        completed_exercises = ExerciseAttempt.objects.filter(
-            user=user,
-            is_passed=True
-        ).values('exercise').distinct().count()
-        
-        total_attempts = ExerciseAttempt.objects.filter(user=user).count()
+        # Statuses also cover archived attempts
+        statuses = UserExerciseStatus.objects.filter(user=user)
+        completed_exercises = statuses.filter(passed=True).count()
+        total_attempts = statuses.aggregate(total=Sum('attempts_count'))['total'] or 0
         
         achievements_unlocked = user.achievements.count()
         
@@ -1,17 +1,22 @@
 """
 Admin interface for exercises.
 """
-from django.contrib import admin
-from .models import Exercise, ExerciseAttempt
+from django.contrib import admin, messages
+from django.db import transaction
+from .models import (
+    ArchivedAttempt, CodeBlob, Exercise, ExerciseAttempt, ExerciseStats, RegradeJob, SolutionValidation, UserExerciseStatus
+)
 
 
 @admin.register(Exercise)
 class ExerciseAdmin(admin.ModelAdmin):
-    list_display = ['title', 'lesson', 'difficulty', 'xp_reward', 'order', 'is_published']
+    list_display = ['title', 'lesson', 'difficulty', 'xp_reward', 'order', 'is_published', 'validation_status']
     list_filter = ['difficulty', 'is_published', 'lesson__module']
     search_fields = ['title', 'description']
     prepopulated_fields = {'slug': ('title',)}
     ordering = ['lesson', 'order']
+    readonly_fields = ['reference_fingerprint']
+    actions = ['regrade_attempts']
     
     fieldsets = (
         ('Basic Info', {
@@ -21,21 +26,149 @@ class ExerciseAdmin(admin.ModelAdmin):
             'fields': ('starter_code', 'solution_code')
         }),
         ('Testing', {
-            'fields': ('test_cases', 'hints')
+            'fields': ('test_cases', 'hints', 'reference_fingerprint')
+        }),
+        ('Environment', {
+            'fields': ('precondition_playbook',)
         }),
         ('Settings', {
-            'fields': ('difficulty', 'xp_reward', 'order', 'time_limit_seconds', 'max_attempts', 'is_published')
+            'fields': ('difficulty', 'xp_reward', 'order', 'time_limit_seconds', 'max_attempts', 'requires_clean_state', 'is_published')
         }),
     )
+    
+    @admin.display(description='Solution')
+    def validation_status(self, obj):
+        validation = obj.current_validation()
+        return validation.status if validation else 'not validated'
+    
+    def save_model(self, request, obj, form, change):
+        # Publishing needs a passed validation of this exact version; until
+        # then the exercise stays unpublished and is published on pass
+        deferred = False
+        if obj.is_published:
+            validation = obj.current_validation() if obj.pk else None
+            if validation is None or validation.status != 'passed':
+                obj.is_published = False
+                deferred = validation is None or validation.status != 'failed'
+                if deferred:
+                    messages.warning(
+                        request,
+                        f"“{obj.title}” will be published once its solution passes its test cases."
+                    )
+                else:
+                    messages.error(
+                        request,
+                        f"“{obj.title}” was not published: its solution fails its test cases."
+                    )
+        
+        super().save_model(request, obj, form, change)
+        if 'precondition_playbook' in form.changed_data and obj.precondition_playbook.strip():
+            from apps.sandbox.tasks import build_precondition_image
+            transaction.on_commit(lambda: build_precondition_image.delay(obj.id))
+        if deferred or {'solution_code', 'precondition_playbook', 'test_cases'} & set(form.changed_data):
+            # Validation also captures the reference fingerprint
+            from .tasks import validate_exercise_solution
+            transaction.on_commit(
+                lambda: validate_exercise_solution.delay(obj.id, publish_on_pass=deferred)
+            )
+        if change and 'test_cases' in form.changed_data and obj.attempts.exists():
+            # Starts once the solution passes the new test cases
+            from .tasks import queue_regrade
+            queue_regrade(obj, created_by=request.user)
+            messages.info(request, f"Attempts of “{obj.title}” will be regraded with the new test cases.")
+    
+    @admin.action(description='Regrade attempts with the current test cases')
+    def regrade_attempts(self, request, queryset):
+        from .tasks import queue_regrade
+        for exercise in queryset:
+            queue_regrade(exercise, created_by=request.user)
+        self.message_user(request, f"Queued regrading of {queryset.count()} exercises.")
 
 
 @admin.register(ExerciseAttempt)
 class ExerciseAttemptAdmin(admin.ModelAdmin):
-    list_display = ['user', 'exercise', 'is_passed', 'execution_time', 'attempt_number', 'created_at']
+    list_display = ['user', 'exercise', 'is_passed', 'execution_time', 'queue_wait_time', 'attempt_number', 'created_at']
     list_filter = ['is_passed', 'exercise__difficulty', 'created_at']
     search_fields = ['user__email', 'exercise__title']
-    readonly_fields = ['attempt_number', 'created_at']
+    readonly_fields = ['code_blob', 'attempt_number', 'exit_code', 'timings', 'created_at']
+    ordering = ['-created_at']
+    
+    def has_add_permission(self, request):
+        return False
+
+
+@admin.register(CodeBlob)
+class CodeBlobAdmin(admin.ModelAdmin):
+    list_display = ['sha256', 'created_at', 'last_used_at']
+    search_fields = ['sha256']
+    readonly_fields = [field.name for field in CodeBlob._meta.fields]
+    ordering = ['-last_used_at']
+    
+    def has_add_permission(self, request):
+        return False
+
+
+@admin.register(UserExerciseStatus)
+class UserExerciseStatusAdmin(admin.ModelAdmin):
+    list_display = ['user', 'exercise', 'attempts_count', 'passed', 'best_time', 'last_attempt_at']
+    list_filter = ['passed']
+    search_fields = ['user__email', 'exercise__title']
+    readonly_fields = [field.name for field in UserExerciseStatus._meta.fields]
+    ordering = ['-last_attempt_at']
+    
+    def has_add_permission(self, request):
+        return False
+
+
+@admin.register(ArchivedAttempt)
+class ArchivedAttemptAdmin(admin.ModelAdmin):
+    list_display = ['id', 'user', 'exercise', 'attempt_number', 'is_passed', 'created_at', 'archive_file']
+    list_filter = ['is_passed', 'archived_at']
+    search_fields = ['user__email', 'exercise__title']
+    readonly_fields = [field.name for field in ArchivedAttempt._meta.fields]
+    ordering = ['-created_at']
+    
+    def has_add_permission(self, request):
+        return False
+
+
+@admin.register(ExerciseStats)
+class ExerciseStatsAdmin(admin.ModelAdmin):
+    list_display = [
+        'exercise', 'attempters', 'passers', 'total_attempts',
+        'median_execution_time', 'p95_execution_time', 'reconciled_at'
+    ]
+    search_fields = ['exercise__title']
+    readonly_fields = [field.name for field in ExerciseStats._meta.fields]
+    
+    def has_add_permission(self, request):
+        return False
+
+
+@admin.register(SolutionValidation)
+class SolutionValidationAdmin(admin.ModelAdmin):
+    list_display = ['exercise', 'version', 'status', 'execution_time', 'created_at', 'completed_at']
+    list_filter = ['status', 'created_at']
+    search_fields = ['exercise__title', 'version']
+    readonly_fields = [field.name for field in SolutionValidation._meta.fields]
+    ordering = ['-created_at']
+    
+    def has_add_permission(self, request):
+        return False
+
+
+@admin.register(RegradeJob)
+class RegradeJobAdmin(admin.ModelAdmin):
+    list_display = ['exercise', 'status', 'progress_display', 'total_attempts', 'unique_codes', 'xp_changed', 'created_at']
+    list_filter = ['status', 'created_at']
+    search_fields = ['exercise__title']
+    readonly_fields = [field.name for field in RegradeJob._meta.fields]
     ordering = ['-created_at']
     
+    @admin.display(description='Progress')
+    def progress_display(self, obj):
+        progress = obj.progress()
+        return f"{progress['percent']}% ({progress['executed']} executed, {progress['changed']} changed)"
+    
     def has_add_permission(self, request):
         return False
@@ -0,0 +1,128 @@
+"""
+Model fields for the exercises app.
+"""
+import zlib
+
+from django import forms
+from django.db import models
+
+# Compressed values start with a byte that never starts UTF-8 text,
+# followed by the version of the preset dictionary they were made with
+COMPRESSED_MARKER = 0xFF
+
+# Values shorter than this are stored as plain UTF-8
+COMPRESS_MIN_LENGTH = 64
+
+# Preset dictionary of strings frequent in playbooks and ansible-playbook
+# output. zlib looks back into it for matches, so even short outputs
+# compress well; the most frequent strings go last. Never edit a
+# published version, add a new one: stored values name theirs.
+_ASTERISKS = b'*' * 64
+DICTIONARIES = {
+    1: b''.join([
+        b'---\n- name: \n  hosts: all\n  become: true\n  gather_facts: false\n  vars:\n  tasks:\n',
+        b'  handlers:\n    - name: \n      ansible.builtin.',
+        b'package:\n        name: \n        state: present\n',
+        b'service:\n        name: \n        state: started\n        enabled: true\n',
+        b'copy:\n        dest: \n        content: \n        mode: "0644"\n',
+        b'template:\n        src: \n        dest: \n',
+        b'file:\n        path: \n        state: directory\n        owner: root\n        group: root\n',
+        b'lineinfile:\n        path: \n        line: \n        regexp: \n',
+        b'user:\n        name: \n        shell: /bin/bash\n',
+        b'command: \n      register: result\n      when: \n      loop: "{{ }}"\n      notify: \n',
+        b'debug:\n        msg: "{{ }}"\n        var: \n',
+        b'Using /etc/ansible/ansible.cfg as config file\n',
+        b'[WARNING]: provided hosts list is empty, only localhost is available\n',
+        b'[DEPRECATION WARNING]: ',
+        b'fatal: [node1]: FAILED! => {"changed": false, "msg": "',
+        b'fatal: [node1]: UNREACHABLE! => {"changed": false, "msg": "',
+        b'...ignoring\n',
+        b'skipping: [node1]\n',
+        b'included: ',
+        b'RUNNING HANDLER [',
+        b'"ansible_facts": {"discovered_interpreter_python": "/usr/bin/python3"}, ',
+        b'"changed": true, "cmd": ["", ""], "delta": "0:00:00.00", "end": "", "rc": 0, "start": "", ',
+        b'"stderr": "", "stderr_lines": [], "stdout": "", "stdout_lines": []}\n',
+        b'ok: [node1] => {\n    "msg": "',
+        b'changed: [node1] => (item=',
+        b'ok: [node1] => (item=',
+        b'changed: [node2]\n',
+        b'changed: [node1]\n',
+        b'ok: [node2]\n',
+        b'ok: [node1]\n',
+        b'\nTASK [Gathering Facts] ' + _ASTERISKS + b'\n',
+        b'\nPLAY RECAP ' + _ASTERISKS + b'\n',
+        b'node1                      : ok=2    changed=1    unreachable=0    failed=0    ',
+        b'skipped=0    rescued=0    ignored=0   \n',
+        b'\nPLAY [all] ' + _ASTERISKS + b'\n',
+        b'\nTASK [' + _ASTERISKS + b'\n',
+    ]),
+}
+CURRENT_DICTIONARY = max(DICTIONARIES)
+
+
+def compress_text(value: str) -> bytes:
+    data = value.encode('utf-8')
+    if len(data) < COMPRESS_MIN_LENGTH:
+        return data
+    compressor = zlib.compressobj(9, zdict=DICTIONARIES[CURRENT_DICTIONARY])
+    compressed = compressor.compress(data) + compressor.flush()
+    if len(compressed) + 2 >= len(data):
+        return data
+    return bytes([COMPRESSED_MARKER, CURRENT_DICTIONARY]) + compressed
+
+
+def decompress_text(data: bytes) -> str:
+    data = bytes(data)
+    if data[:1] != bytes([COMPRESSED_MARKER]):
+        # Stored before compression, or too short to be worth it
+        return data.decode('utf-8')
+    decompressor = zlib.decompressobj(zdict=DICTIONARIES[data[1]])
+    return (decompressor.decompress(data[2:]) + decompressor.flush()).decode('utf-8')
+
+
+class CompressedTextField(models.Field):
+    """
+    Text stored zlib-compressed in a binary column.
+    
+    Behaves like a TextField in Python, but the database only sees bytes:
+    the value cannot be filtered on or searched in SQL.
+    """
+    
+    description = "Compressed text"
+    
+    def get_internal_type(self):
+        return "BinaryField"
+    
+    def get_placeholder(self, value, compiler, connection):
+        return connection.ops.binary_placeholder_sql(value)
+    
+    def from_db_value(self, value, expression, connection):
+        if value is None:
+            return value
+        return decompress_text(value)
+    
+    def to_python(self, value):
+        if value is None or isinstance(value, str):
+            return value
+        if isinstance(value, (bytes, bytearray, memoryview)):
+            return decompress_text(value)
+        return str(value)
+    
+    def get_prep_value(self, value):
+        value = super().get_prep_value(value)
+        if value is None:
+            return value
+        return compress_text(self.to_python(value))
+    
+    def get_db_prep_value(self, value, connection, prepared=False):
+        value = super().get_db_prep_value(value, connection, prepared)
+        if value is not None:
+            return connection.Database.Binary(value)
+        return value
+    
+    def value_to_string(self, obj):
+        return self.value_from_object(obj)
+    
+    def formfield(self, **kwargs):
+        return super().formfield(**{'form_class': forms.CharField, 'widget': forms.Textarea, **kwargs})
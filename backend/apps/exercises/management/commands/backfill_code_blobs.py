@@ -0,0 +1,57 @@
+"""
+Move the code of attempts stored before code blobs into blobs.
+"""
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from apps.exercises.models import CodeBlob, ExerciseAttempt
+
+
+class Command(BaseCommand):
+    help = (
+        'Store the code of existing exercise attempts once per distinct '
+        'content and point the attempts at it, in batches.'
+    )
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Attempts moved per transaction (default: 1000)'
+        )
+    
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        moved = 0
+        last_id = 0
+        while True:
+            batch = list(
+                ExerciseAttempt.objects.filter(id__gt=last_id, code_blob__isnull=True)
+                .order_by('id').only('id', 'code_submitted')[:batch_size]
+            )
+            if not batch:
+                break
+            last_id = batch[-1].id
+            
+            codes = {CodeBlob.digest(attempt.code_submitted): attempt.code_submitted for attempt in batch}
+            with transaction.atomic():
+                CodeBlob.objects.bulk_create(
+                    [
+                        CodeBlob(sha256=digest, code=code, last_used_at=timezone.now())
+                        for digest, code in codes.items()
+                    ],
+                    update_conflicts=True,
+                    unique_fields=['sha256'],
+                    update_fields=['last_used_at']
+                )
+                blob_ids = dict(CodeBlob.objects.filter(sha256__in=codes).values_list('sha256', 'id'))
+                for attempt in batch:
+                    attempt.code_blob_id = blob_ids[CodeBlob.digest(attempt.code_submitted)]
+                    attempt.code_submitted = ''
+                ExerciseAttempt.objects.bulk_update(batch, ['code_blob', 'code_submitted'])
+            
+            moved += len(batch)
+            self.stdout.write(f"{moved} attempts moved, {len(codes)} distinct codes in the last batch")
+        self.stdout.write(self.style.SUCCESS(f"Moved the code of {moved} attempts to blobs"))
@@ -0,0 +1,43 @@
+"""
+Build the near-duplicate index of exercise submissions.
+"""
+from itertools import groupby
+
+from django.core.management.base import BaseCommand
+
+from apps.exercises.models import CodeBlob
+from apps.exercises.services.similarity import SimilarityIndex
+
+
+class Command(BaseCommand):
+    help = (
+        'Index the submissions of every exercise that are not indexed yet, '
+        'e.g. the attempts stored before the index existed. Attempts whose '
+        'code is not in a blob yet are skipped: run backfill_code_blobs first.'
+    )
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--exercise',
+            type=int,
+            help='Only index the submissions to this exercise ID'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Codes signed per transaction (default: 500)'
+        )
+    
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        pairs = list(SimilarityIndex.unindexed(options['exercise']))
+        
+        indexed = 0
+        for exercise_id, group in groupby(pairs, key=lambda pair: pair[0]):
+            blob_ids = [blob_id for _, blob_id in group]
+            for start in range(0, len(blob_ids), batch_size):
+                blobs = CodeBlob.objects.filter(id__in=blob_ids[start:start + batch_size])
+                indexed += SimilarityIndex.add(exercise_id, blobs)
+            self.stdout.write(f"Exercise {exercise_id}: {len(blob_ids)} codes indexed")
+        self.stdout.write(self.style.SUCCESS(f"Indexed {indexed} distinct submissions"))
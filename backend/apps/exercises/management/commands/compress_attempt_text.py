@@ -0,0 +1,79 @@
+"""
+Compress the code and output of exercise attempts stored as plain text.
+"""
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from apps.exercises.models import ExerciseAttempt
+
+COMPRESSED_COLUMNS = ('code_submitted', 'output')
+
+
+class Command(BaseCommand):
+    help = (
+        'Rewrite existing exercise attempts so their code and output are '
+        'stored compressed, and fill their output previews.'
+    )
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--convert-columns',
+            action='store_true',
+            help=(
+                'Only turn the text columns into binary ones (PostgreSQL). '
+                'Run it before migrating: the cast of a generated migration '
+                'fails on text containing backslashes.'
+            )
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Attempts rewritten per query (default: 1000)'
+        )
+    
+    def handle(self, *args, **options):
+        if options['convert_columns']:
+            self._convert_columns()
+            return
+        
+        batch_size = options['batch_size']
+        rewritten = 0
+        last_id = 0
+        while True:
+            batch = list(ExerciseAttempt.objects.filter(id__gt=last_id).order_by('id').only(
+                'id', *COMPRESSED_COLUMNS
+            )[:batch_size])
+            if not batch:
+                break
+            for attempt in batch:
+                attempt.output_preview = attempt.output[-ExerciseAttempt.OUTPUT_PREVIEW_LENGTH:]
+            # Saving recompresses plain values; compressed ones are unchanged
+            ExerciseAttempt.objects.bulk_update(batch, [*COMPRESSED_COLUMNS, 'output_preview'])
+            rewritten += len(batch)
+            last_id = batch[-1].id
+            self.stdout.write(f"{rewritten} attempts rewritten")
+        self.stdout.write(self.style.SUCCESS(f"Compressed {rewritten} attempts"))
+    
+    def _convert_columns(self):
+        if connection.vendor != 'postgresql':
+            self.stdout.write('Only needed on PostgreSQL')
+            return
+        table = ExerciseAttempt._meta.db_table
+        with connection.cursor() as cursor:
+            for column in COMPRESSED_COLUMNS:
+                cursor.execute(
+                    """
+                    SELECT data_type FROM information_schema.columns
+                    WHERE table_schema = current_schema() AND table_name = %s AND column_name = %s
+                    """,
+                    [table, column]
+                )
+                row = cursor.fetchone()
+                if row is None or row[0] == 'bytea':
+                    continue
+                cursor.execute(
+                    f'ALTER TABLE "{table}" ALTER COLUMN "{column}" TYPE bytea '
+                    f'USING convert_to("{column}", \'UTF8\')'
+                )
+                self.stdout.write(f"Converted {table}.{column} to bytea")
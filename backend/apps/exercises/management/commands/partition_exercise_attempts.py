@@ -0,0 +1,63 @@
+"""
+Convert the exercise attempts table to monthly partitions (PostgreSQL).
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from apps.exercises.models import ExerciseAttempt
+from apps.exercises.services.partitions import AttemptPartitions
+
+
+class Command(BaseCommand):
+    help = (
+        'Partition exercise_attempts by month of created_at, copying the '
+        'existing attempts. Locks the table while copying: run it in a '
+        'maintenance window. Once partitioned, only creates missing partitions.'
+    )
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--status',
+            action='store_true',
+            help='Only show the partitions, indexes missing on them and a sample query plan'
+        )
+    
+    def handle(self, *args, **options):
+        partitions = AttemptPartitions()
+        if not partitions.supported():
+            raise CommandError('Partitioning needs PostgreSQL')
+        
+        if options['status']:
+            self._status(partitions)
+            return
+        
+        if not partitions.is_partitioned():
+            copied = partitions.convert(settings.EXERCISE_ATTEMPTS_PARTITIONS_AHEAD)
+            self.stdout.write(self.style.SUCCESS(f"Partitioned {partitions.table}, {copied} attempts copied"))
+        created = partitions.ensure_partitions(settings.EXERCISE_ATTEMPTS_PARTITIONS_AHEAD)
+        self.stdout.write(f"Created {len(created)} partitions")
+        self._status(partitions)
+    
+    def _status(self, partitions):
+        if not partitions.is_partitioned():
+            self.stdout.write(f"{partitions.table} is not partitioned")
+            return
+        
+        missing = partitions.index_report()
+        for month, name in sorted(partitions.partitions().items()):
+            line = f"{month:%Y-%m}  {name}"
+            if missing.get(name):
+                line += f"  missing indexes: {', '.join(missing[name])}"
+            self.stdout.write(line)
+        
+        # Recent-range queries should only scan the latest partitions,
+        # through their copies of the parent indexes
+        recent = ExerciseAttempt.objects.filter(
+            created_at__gte=timezone.now() - timedelta(days=7),
+            exercise_id=0,
+            is_passed=True
+        ).values('id')
+        self.stdout.write(recent.explain())
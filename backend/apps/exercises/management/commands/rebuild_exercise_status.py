@@ -0,0 +1,24 @@
+"""
+Rebuild the per-user exercise status read model from the attempts.
+"""
+from django.core.management.base import BaseCommand
+
+from apps.exercises.models import UserExerciseStatus
+
+
+class Command(BaseCommand):
+    help = (
+        'Recompute every user exercise status from the stored attempts, '
+        'e.g. to backfill them or after attempts were edited by hand.'
+    )
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--exercise',
+            type=int,
+            help='Only rebuild the statuses of this exercise ID'
+        )
+    
+    def handle(self, *args, **options):
+        count = UserExerciseStatus.rebuild(exercise_id=options['exercise'])
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {count} exercise statuses"))
@@ -0,0 +1,67 @@
+"""
+Validate exercise solutions against their own test cases.
+"""
+from django.core.management.base import BaseCommand
+
+from apps.exercises.models import Exercise
+from apps.exercises.tasks import validate_exercise_solution, validate_solutions
+
+
+class Command(BaseCommand):
+    help = (
+        'Run every published exercise solution through its test cases, '
+        'in parallel on the Celery workers.'
+    )
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='Include unpublished exercises'
+        )
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Validate again exercise versions that already have a result'
+        )
+        parser.add_argument(
+            '--wait',
+            action='store_true',
+            help='Wait for the results and print them'
+        )
+        parser.add_argument(
+            '--timeout',
+            type=int,
+            default=1800,
+            help='Seconds to wait for all results with --wait (default: 1800)'
+        )
+    
+    def handle(self, *args, **options):
+        if not options['wait']:
+            count = validate_solutions(
+                include_unpublished=options['all'],
+                force=options['force']
+            )
+            self.stdout.write(f"Queued solution validation of {count} exercises")
+            return
+        
+        exercises = Exercise.objects.order_by('id')
+        if not options['all']:
+            exercises = exercises.filter(is_published=True)
+        pending = [
+            (exercise, validate_exercise_solution.delay(exercise.id, force=options['force']))
+            for exercise in exercises
+        ]
+        
+        failed = 0
+        for exercise, result in pending:
+            status = result.get(timeout=options['timeout'])
+            if status == 'passed':
+                self.stdout.write(self.style.SUCCESS(f"passed  {exercise.id:>5}  {exercise.title}"))
+            else:
+                failed += 1
+                validation = exercise.current_validation()
+                reason = validation.error_message.splitlines()[0] if validation and validation.error_message else ''
+                self.stdout.write(self.style.ERROR(f"{status:<7} {exercise.id:>5}  {exercise.title}  {reason}"))
+        
+        self.stdout.write(f"{len(pending) - failed}/{len(pending)} solutions passed")
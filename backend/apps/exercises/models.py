@@ -1,11 +1,18 @@
 """
 Models for exercises and student attempts.
 """
-from django.db import models
+from typing import List, Optional
+from django.db import IntegrityError, connection, models, transaction
+from django.db.models import Count, Exists, F, Max, Min, OuterRef, Q, Sum, Value
+from django.db.models.functions import Coalesce, Least
 from django.conf import settings
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 from apps.courses.models import Lesson
+from .fields import CompressedTextField
+import hashlib
 import json
+import math
 
 
 class Exercise(models.Model):
@@ -24,6 +31,9 @@ class Exercise(models.Model):
         xp_reward: XP points for completion
         difficulty: Exercise difficulty
         order: Display order within lesson
+        requires_clean_state: Reset managed nodes before every graded run
+        precondition_playbook: Playbook that prepares the managed nodes' starting state
+        reference_fingerprint: Managed node state left by the solution, with its version
     """
     
     DIFFICULTY_CHOICES = [
@@ -60,6 +70,15 @@ class Exercise(models.Model):
         default=list,
         help_text='Progressive hints for students'
     )
+    precondition_playbook = models.TextField(
+        blank=True,
+        help_text='Playbook applied once to build the managed node image this exercise starts from'
+    )
+    reference_fingerprint = models.JSONField(
+        default=dict,
+        blank=True,
+        help_text='Final managed node state of the solution, compared by state_matches_solution tests'
+    )
     
     # Metadata
     xp_reward = models.PositiveIntegerField(default=100)
@@ -77,6 +96,10 @@ class Exercise(models.Model):
         default=10,
         help_text='Maximum number of attempts (0 = unlimited)'
     )
+    requires_clean_state = models.BooleanField(
+        default=False,
+        help_text='Recreate managed nodes from their baseline before each graded run'
+    )
     is_published = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -91,14 +114,127 @@ class Exercise(models.Model):
     def __str__(self) -> str:
         return f"{self.lesson.title} - {self.title}"
     
+    @property
+    def solution_version(self) -> str:
+        """Hash of everything that decides whether the solution passes."""
+        content = json.dumps({
+            'solution': self.solution_code,
+            'precondition': self.precondition_playbook,
+            'test_cases': self.test_cases,
+        }, sort_keys=True)
+        return hashlib.sha256(content.encode('utf-8')).hexdigest()
+    
+    def current_validation(self):
+        """Solution validation of the current version, if any."""
+        return self.validations.filter(version=self.solution_version).first()
+    
     @property
     def completion_rate(self) -> float:
-        """Calculate percentage of users who completed this exercise."""
-        total_attempts = self.attempts.values('user').distinct().count()
-        if total_attempts == 0:
+        """Percentage of users who completed this exercise, from ExerciseStats."""
+        try:
+            return self.stats.completion_rate
+        except ExerciseStats.DoesNotExist:
             return 0.0
-        passed_attempts = self.attempts.filter(is_passed=True).values('user').distinct().count()
-        return (passed_attempts / total_attempts) * 100
+
+
+class SolutionValidation(models.Model):
+    """
+    Result of running an exercise's solution against its own test cases.
+    
+    One row per exercise version (see Exercise.solution_version); exercises
+    can only be published once the current version passed.
+    
+    Attributes:
+        exercise: Validated exercise
+        version: Exercise.solution_version that was validated
+        status: pending, running, passed, failed or error (could not run)
+        test_results: JSON object with test results
+        output: Playbook output (truncated)
+        error_message: Why validation failed or could not run
+        execution_time: How long the solution run took
+        publish_on_pass: Publish the exercise once this validation passes
+    """
+    
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('passed', 'Passed'),
+        ('failed', 'Failed'),
+        ('error', 'Error'),
+    ]
+    
+    exercise = models.ForeignKey(
+        Exercise,
+        on_delete=models.CASCADE,
+        related_name='validations'
+    )
+    version = models.CharField(max_length=64)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    test_results = models.JSONField(default=dict, blank=True)
+    output = models.TextField(blank=True)
+    error_message = models.TextField(blank=True)
+    execution_time = models.FloatField(
+        null=True,
+        help_text='Solution run time in seconds'
+    )
+    publish_on_pass = models.BooleanField(default=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        db_table = 'solution_validations'
+        verbose_name = _('Solution Validation')
+        verbose_name_plural = _('Solution Validations')
+        ordering = ['-created_at']
+        unique_together = ['exercise', 'version']
+    
+    def __str__(self) -> str:
+        return f"{self.exercise.title} - {self.version[:12]} - {self.status}"
+
+
+class CodeBlob(models.Model):
+    """
+    Submitted code, stored once per distinct content.
+    
+    Attempts reference their code by blob, so identical submissions
+    (starter code, common fixes, retries) share one row. Blobs no attempt
+    or submission signature references any more are removed by the
+    collect_code_blobs task.
+    
+    Attributes:
+        sha256: Hex SHA-256 of the UTF-8 code
+        code: The code (stored compressed)
+        last_used_at: When an attempt last stored this code; recently used
+            blobs are never collected, even if not referenced yet
+    """
+    
+    sha256 = models.CharField(max_length=64, unique=True)
+    code = CompressedTextField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_used_at = models.DateTimeField(default=timezone.now, db_index=True)
+    
+    class Meta:
+        db_table = 'code_blobs'
+        verbose_name = _('Code Blob')
+        verbose_name_plural = _('Code Blobs')
+    
+    def __str__(self) -> str:
+        return self.sha256[:12]
+    
+    @staticmethod
+    def digest(code: str) -> str:
+        return hashlib.sha256(code.encode('utf-8')).hexdigest()
+    
+    @classmethod
+    def store(cls, code: str) -> 'CodeBlob':
+        """Get or create the blob of some code, marking it as used."""
+        blob, = cls.objects.bulk_create(
+            [cls(sha256=cls.digest(code), code=code, last_used_at=timezone.now())],
+            update_conflicts=True,
+            unique_fields=['sha256'],
+            update_fields=['last_used_at']
+        )
+        return blob
 
 
 class ExerciseAttempt(models.Model):
@@ -108,16 +244,28 @@ class ExerciseAttempt(models.Model):
     Attributes:
         exercise: Exercise being attempted
         user: Student making the attempt
-        code_submitted: Code submitted by student
-        output: Execution output
+        code_blob: Code submitted by student
+        code_submitted: Code of attempts stored before code blobs, moved
+            to a blob on save (read the code through `code`)
+        output: Execution output (stored compressed)
+        output_preview: End of the output, for attempt lists
         error_message: Error message if execution failed
         test_results: JSON object with test results
         is_passed: Whether all tests passed
         execution_time: How long execution took
+        queue_wait_time: How long the execution waited in the scheduler queue
+        exit_code: Playbook exit code (None if the playbook was not run)
+        timings: Compact phase and per-task timing breakdown
         hints_used: Number of hints viewed
         attempt_number: Sequential attempt number for this user/exercise
+    
+    On PostgreSQL the table can be partitioned by month of created_at,
+    see services.partitions.
     """
     
+    # Characters of output kept uncompressed for attempt lists
+    OUTPUT_PREVIEW_LENGTH = 500
+    
     exercise = models.ForeignKey(
         Exercise,
         on_delete=models.CASCADE,
@@ -128,8 +276,15 @@ class ExerciseAttempt(models.Model):
         on_delete=models.CASCADE,
         related_name='exercise_attempts'
     )
-    code_submitted = models.TextField()
-    output = models.TextField(blank=True)
+    code_blob = models.ForeignKey(
+        CodeBlob,
+        on_delete=models.PROTECT,
+        null=True,
+        related_name='attempts'
+    )
+    code_submitted = CompressedTextField(blank=True)
+    output = CompressedTextField(blank=True)
+    output_preview = models.CharField(max_length=OUTPUT_PREVIEW_LENGTH, blank=True)
     error_message = models.TextField(blank=True)
     test_results = models.JSONField(
         default=dict,
@@ -140,6 +295,20 @@ class ExerciseAttempt(models.Model):
         null=True,
         help_text='Execution time in seconds'
     )
+    queue_wait_time = models.FloatField(
+        null=True,
+        help_text='Time spent waiting in the execution queue, in seconds'
+    )
+    exit_code = models.IntegerField(
+        null=True,
+        blank=True,
+        help_text='Playbook exit code, kept so attempts can be regraded without running them'
+    )
+    timings = models.JSONField(
+        default=dict,
+        blank=True,
+        help_text='Phase durations and [name, action, seconds] per task'
+    )
     hints_used = models.PositiveIntegerField(default=0)
     attempt_number = models.PositiveIntegerField()
     created_at = models.DateTimeField(auto_now_add=True)
@@ -150,7 +319,7 @@ class ExerciseAttempt(models.Model):
         verbose_name_plural = _('Exercise Attempts')
         ordering = ['-created_at']
         indexes = [
-            models.Index(fields=['user', 'exercise', '-created_at']),
+            models.Index(fields=['user', 'exercise', '-created_at', '-id']),
             models.Index(fields=['exercise', 'is_passed']),
         ]
     
@@ -158,14 +327,579 @@ class ExerciseAttempt(models.Model):
         status = "✅ Passed" if self.is_passed else "❌ Failed"
         return f"{self.user.email} - {self.exercise.title} - {status}"
     
+    @property
+    def code(self) -> str:
+        """Submitted code."""
+        if self.code_blob_id:
+            return self.code_blob.code
+        return self.code_submitted
+    
     def save(self, *args, **kwargs):
-        # Auto-increment attempt number
-        if not self.pk:
-            last_attempt = ExerciseAttempt.objects.filter(
-                user=self.user,
-                exercise=self.exercise
-            ).order_by('-attempt_number').first()
+        created = not self.pk
+        # The recap at the end tells most about a run
+        self.output_preview = self.output[-self.OUTPUT_PREVIEW_LENGTH:]
+        with transaction.atomic():
+            # Full saves move the code to its blob
+            if self.code_submitted and self.code_blob_id is None and kwargs.get('update_fields') is None:
+                self.code_blob = CodeBlob.store(self.code_submitted)
+                self.code_submitted = ''
+            if created:
+                self.attempt_number = UserExerciseStatus.next_attempt_number(
+                    self.user_id,
+                    self.exercise_id,
+                    self.exercise.max_attempts
+                )
             
-            self.attempt_number = (last_attempt.attempt_number + 1) if last_attempt else 1
+            super().save(*args, **kwargs)
+            
+            if created:
+                first_pass = UserExerciseStatus.record_result(self)
+                ExerciseStats.record_attempt(self.exercise_id, self.attempt_number == 1, first_pass)
+                if self.code_blob_id:
+                    from .tasks import index_submission
+                    exercise_id, code_blob_id = self.exercise_id, self.code_blob_id
+                    # Indexing is best effort: never fail a saved attempt over it
+                    transaction.on_commit(lambda: index_submission.delay(exercise_id, code_blob_id), robust=True)
+
+
+class AttemptLimitReached(Exception):
+    """Raised when a user has used all attempts at an exercise."""
+
+
+class UserExerciseStatus(models.Model):
+    """
+    Summary of one user's attempts at one exercise, for exercise lists.
+    
+    Updated incrementally whenever an attempt is created, and rebuilt from
+    the attempts when their results change in bulk (regrades). The attempt
+    counter also numbers the attempts and enforces Exercise.max_attempts.
+    
+    Attributes:
+        user: Student
+        exercise: Exercise attempted
+        attempts_count: Number of attempts made, including ones removed
+            since by retention
+        passed: Whether any attempt passed
+        best_time: Fastest execution time of a passing attempt
+        last_attempt_at: When the latest attempt was made
+    """
+    
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='exercise_statuses'
+    )
+    exercise = models.ForeignKey(
+        Exercise,
+        on_delete=models.CASCADE,
+        related_name='user_statuses'
+    )
+    attempts_count = models.PositiveIntegerField(default=0)
+    passed = models.BooleanField(default=False)
+    best_time = models.FloatField(
+        null=True,
+        blank=True,
+        help_text='Fastest passing execution time in seconds'
+    )
+    last_attempt_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        db_table = 'user_exercise_statuses'
+        verbose_name = _('User Exercise Status')
+        verbose_name_plural = _('User Exercise Statuses')
+        unique_together = ['user', 'exercise']
+        indexes = [
+            models.Index(fields=['exercise', 'passed']),
+        ]
+    
+    def __str__(self) -> str:
+        return f"{self.user_id} - {self.exercise_id} - {self.attempts_count} attempts"
+    
+    @classmethod
+    def _increment(cls, user_id: int, exercise_id: int, max_attempts: int) -> Optional[int]:
+        """Count an attempt unless the limit is reached; the new count or None."""
+        sql = (
+            f"UPDATE {connection.ops.quote_name(cls._meta.db_table)} "
+            f"SET attempts_count = attempts_count + 1, last_attempt_at = %s "
+            f"WHERE user_id = %s AND exercise_id = %s"
+        )
+        params = [connection.ops.adapt_datetimefield_value(timezone.now()), user_id, exercise_id]
+        if max_attempts:
+            sql += " AND attempts_count < %s"
+            params.append(max_attempts)
+        with connection.cursor() as cursor:
+            cursor.execute(sql + " RETURNING attempts_count", params)
+            row = cursor.fetchone()
+        return row[0] if row else None
+    
+    @classmethod
+    def next_attempt_number(cls, user_id: int, exercise_id: int, max_attempts: int = 0) -> int:
+        """
+        Reserve the next attempt number of a user at an exercise.
+        
+        A single conditional UPDATE ... RETURNING increments the counter, so
+        concurrent attempts get distinct numbers and the limit holds. Must
+        run in the transaction inserting the attempt.
+        
+        Args:
+            max_attempts: Attempt limit, 0 for unlimited
+        
+        Raises:
+            AttemptLimitReached: If the user has no attempts left
+        """
+        number = cls._increment(user_id, exercise_id, max_attempts)
+        if number is None and not cls.objects.filter(user_id=user_id, exercise_id=exercise_id).exists():
+            # First attempt since statuses were introduced: continue the
+            # numbering of any stored or archived attempts
+            seed = max(
+                model.objects.filter(
+                    user_id=user_id,
+                    exercise_id=exercise_id
+                ).aggregate(number=Max('attempt_number'))['number'] or 0
+                for model in (ExerciseAttempt, ArchivedAttempt)
+            )
+            cls.objects.bulk_create(
+                [cls(user_id=user_id, exercise_id=exercise_id, attempts_count=seed)],
+                ignore_conflicts=True
+            )
+            number = cls._increment(user_id, exercise_id, max_attempts)
+        if number is None:
+            raise AttemptLimitReached(f"All {max_attempts} attempts have been used")
+        return number
+    
+    @classmethod
+    def has_attempts_left(cls, user_id: int, exercise) -> bool:
+        """Cheap pre-check; next_attempt_number() is what enforces the limit."""
+        if not exercise.max_attempts:
+            return True
+        used = cls.objects.filter(
+            user_id=user_id,
+            exercise_id=exercise.id
+        ).values_list('attempts_count', flat=True).first()
+        return (used or 0) < exercise.max_attempts
+    
+    @classmethod
+    def record_result(cls, attempt: ExerciseAttempt) -> bool:
+        """
+        Fold a new attempt's result into its user's status.
+        
+        Returns:
+            Whether this is the user's first passing attempt
+        """
+        if not attempt.is_passed:
+            return False
+        status = cls.objects.filter(user_id=attempt.user_id, exercise_id=attempt.exercise_id)
+        if attempt.execution_time is not None:
+            best_time = Value(attempt.execution_time)
+            status.update(best_time=Least(Coalesce('best_time', best_time), best_time))
+        # Conditional update: of concurrent passes, only one flips the flag
+        return bool(status.filter(passed=False).update(passed=True))
+    
+    @classmethod
+    def rebuild(cls, exercise_id=None, user_ids=None) -> int:
+        """
+        Recompute statuses from the attempts.
         
-        super().save(*args, **kwargs)
+        Args:
+            exercise_id: Only this exercise's statuses
+            user_ids: Only these users' statuses
+        
+        Returns:
+            Number of statuses written
+        """
+        scope = Q()
+        if exercise_id is not None:
+            scope &= Q(exercise_id=exercise_id)
+        if user_ids is not None:
+            scope &= Q(user_id__in=list(user_ids))
+        
+        # Archived attempts count as well: history moved to cold storage
+        # keeps its passes
+        merged = {}
+        for model in (ExerciseAttempt, ArchivedAttempt):
+            rows = model.objects.filter(scope).values('user_id', 'exercise_id').annotate(
+                # Attempt numbers keep counting past attempts removed by retention
+                attempts=Max('attempt_number'),
+                passed_attempts=Count('pk', filter=Q(is_passed=True)),
+                best=Min('execution_time', filter=Q(is_passed=True)),
+                last=Max('created_at'),
+            ).order_by()
+            for row in rows:
+                key = (row['user_id'], row['exercise_id'])
+                if key not in merged:
+                    merged[key] = cls(
+                        user_id=row['user_id'],
+                        exercise_id=row['exercise_id'],
+                        attempts_count=row['attempts'],
+                        passed=row['passed_attempts'] > 0,
+                        best_time=row['best'],
+                        last_attempt_at=row['last'],
+                    )
+                    continue
+                status = merged[key]
+                status.attempts_count = max(status.attempts_count, row['attempts'])
+                status.passed = status.passed or row['passed_attempts'] > 0
+                if row['best'] is not None:
+                    status.best_time = min(time for time in (status.best_time, row['best']) if time is not None)
+                status.last_attempt_at = max(status.last_attempt_at, row['last'])
+        statuses = list(merged.values())
+        
+        with transaction.atomic():
+            cls.objects.bulk_create(
+                statuses,
+                batch_size=1000,
+                update_conflicts=True,
+                unique_fields=['user', 'exercise'],
+                update_fields=['attempts_count', 'passed', 'best_time', 'last_attempt_at'],
+            )
+            # Statuses whose attempts are all gone
+            cls.objects.filter(scope).exclude(Exists(ExerciseAttempt.objects.filter(
+                user_id=OuterRef('user_id'),
+                exercise_id=OuterRef('exercise_id')
+            ))).exclude(Exists(ArchivedAttempt.objects.filter(
+                user_id=OuterRef('user_id'),
+                exercise_id=OuterRef('exercise_id')
+            ))).delete()
+        return len(statuses)
+
+
+class ExerciseStats(models.Model):
+    """
+    Precomputed statistics of an exercise.
+    
+    The counters are incremented in the transaction creating each attempt;
+    execution time percentiles are only computed by reconcile(), which
+    also repairs counter drift and runs periodically.
+    
+    Attributes:
+        exercise: Exercise described
+        attempters: Distinct users with an attempt
+        passers: Distinct users with a passing attempt
+        total_attempts: Attempts made, including ones removed by retention
+        median_execution_time: Median execution time of executed attempts
+        p95_execution_time: 95th percentile execution time of executed attempts
+        reconciled_at: When the figures were last recomputed
+    """
+    
+    # Most recent executed attempts the percentiles are computed from
+    PERCENTILE_SAMPLE_SIZE = 1000
+    
+    exercise = models.OneToOneField(
+        Exercise,
+        on_delete=models.CASCADE,
+        related_name='stats'
+    )
+    attempters = models.PositiveIntegerField(default=0)
+    passers = models.PositiveIntegerField(default=0)
+    total_attempts = models.PositiveIntegerField(default=0)
+    median_execution_time = models.FloatField(null=True, blank=True)
+    p95_execution_time = models.FloatField(null=True, blank=True)
+    reconciled_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        db_table = 'exercise_stats'
+        verbose_name = _('Exercise Stats')
+        verbose_name_plural = _('Exercise Stats')
+    
+    def __str__(self) -> str:
+        return f"{self.exercise.title} - {self.passers}/{self.attempters} passed"
+    
+    @property
+    def completion_rate(self) -> float:
+        if not self.attempters:
+            return 0.0
+        return (self.passers / self.attempters) * 100
+    
+    @classmethod
+    def record_attempt(cls, exercise_id: int, first_attempt: bool, first_pass: bool) -> None:
+        """Count a newly created attempt."""
+        updates = {'total_attempts': F('total_attempts') + 1}
+        if first_attempt:
+            updates['attempters'] = F('attempters') + 1
+        if first_pass:
+            updates['passers'] = F('passers') + 1
+        if cls.objects.filter(exercise_id=exercise_id).update(**updates):
+            return
+        try:
+            with transaction.atomic():
+                cls.objects.create(
+                    exercise_id=exercise_id,
+                    attempters=int(first_attempt),
+                    passers=int(first_pass),
+                    total_attempts=1
+                )
+        except IntegrityError:
+            # Created concurrently
+            cls.objects.filter(exercise_id=exercise_id).update(**updates)
+    
+    @classmethod
+    def reconcile(cls, exercise_id: int) -> 'ExerciseStats':
+        """Recompute an exercise's statistics from its user statuses and attempts."""
+        counts = UserExerciseStatus.objects.filter(exercise_id=exercise_id).aggregate(
+            attempters=Count('id'),
+            passers=Count('id', filter=Q(passed=True)),
+            total_attempts=Coalesce(Sum('attempts_count'), 0),
+        )
+        times = sorted(
+            ExerciseAttempt.objects.filter(exercise_id=exercise_id, execution_time__gt=0)
+            .order_by('-created_at')
+            .values_list('execution_time', flat=True)[:cls.PERCENTILE_SAMPLE_SIZE]
+        )
+        stats, _ = cls.objects.update_or_create(
+            exercise_id=exercise_id,
+            defaults={
+                **counts,
+                'median_execution_time': _percentile(times, 0.5),
+                'p95_execution_time': _percentile(times, 0.95),
+                'reconciled_at': timezone.now(),
+            }
+        )
+        return stats
+
+
+def _percentile(values: List[float], fraction: float) -> Optional[float]:
+    """Nearest-rank percentile of sorted values."""
+    if not values:
+        return None
+    return values[min(len(values) - 1, max(math.ceil(len(values) * fraction) - 1, 0))]
+
+
+class ArchivedAttempt(models.Model):
+    """
+    Index entry of an exercise attempt moved to cold storage.
+    
+    The attempt itself is a JSON line in a gzip file under
+    EXERCISE_ATTEMPTS_ARCHIVE_DIR; see services.archive. The entry keeps
+    the attempt's ID and the fields needed for history and statistics.
+    
+    Attributes:
+        id: ID the attempt had in exercise_attempts
+        archive_file: Archive file, relative to the archive directory
+        member_offset: Byte offset of the gzip member holding the attempt
+        line: Line of the attempt within that member
+        archived_at: When the attempt was archived
+    """
+    
+    id = models.BigIntegerField(primary_key=True)
+    exercise = models.ForeignKey(
+        Exercise,
+        on_delete=models.CASCADE,
+        related_name='archived_attempts'
+    )
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='archived_exercise_attempts'
+    )
+    attempt_number = models.PositiveIntegerField()
+    is_passed = models.BooleanField(default=False)
+    execution_time = models.FloatField(null=True)
+    created_at = models.DateTimeField()
+    archive_file = models.CharField(max_length=255)
+    member_offset = models.BigIntegerField()
+    line = models.PositiveIntegerField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        db_table = 'archived_exercise_attempts'
+        verbose_name = _('Archived Attempt')
+        verbose_name_plural = _('Archived Attempts')
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['user', 'exercise', '-created_at']),
+        ]
+    
+    def __str__(self) -> str:
+        return f"Archived attempt {self.id} - {self.archive_file}"
+
+
+class SubmissionSignature(models.Model):
+    """
+    MinHash signature of a distinct code submitted to an exercise.
+    
+    One per exercise and code blob, so identical submissions share it.
+    Used with SignatureBucket to find near-duplicate submissions; see
+    services.similarity.
+    
+    Attributes:
+        minhash: Minimum hash of the code's token shingles per hash function
+    """
+    
+    exercise = models.ForeignKey(
+        Exercise,
+        on_delete=models.CASCADE,
+        related_name='submission_signatures'
+    )
+    code_blob = models.ForeignKey(
+        CodeBlob,
+        on_delete=models.CASCADE,
+        related_name='signatures'
+    )
+    minhash = models.JSONField(default=list)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        db_table = 'submission_signatures'
+        verbose_name = _('Submission Signature')
+        verbose_name_plural = _('Submission Signatures')
+        unique_together = ['exercise', 'code_blob']
+    
+    def __str__(self) -> str:
+        return f"{self.exercise_id} - {self.code_blob_id}"
+
+
+class SignatureBucket(models.Model):
+    """
+    LSH bucket of one band of a submission signature.
+    
+    Signatures sharing a bucket in any band are near-duplicate candidates.
+    """
+    
+    signature = models.ForeignKey(
+        SubmissionSignature,
+        on_delete=models.CASCADE,
+        related_name='buckets'
+    )
+    exercise = models.ForeignKey(
+        Exercise,
+        on_delete=models.CASCADE,
+        related_name='+'
+    )
+    band = models.PositiveSmallIntegerField()
+    bucket = models.BigIntegerField()
+    
+    class Meta:
+        db_table = 'signature_buckets'
+        indexes = [
+            models.Index(fields=['exercise', 'band', 'bucket']),
+        ]
+
+
+class RegradeJob(models.Model):
+    """
+    Re-evaluation of an exercise's stored attempts against a new test plan.
+    
+    Attempts are grouped by identical submitted code and the groups are
+    split into shards processed in parallel; see RegradeShard. XP changes
+    are applied once all shards are done.
+    
+    Attributes:
+        exercise: Exercise whose attempts are regraded
+        version: Exercise.solution_version the job regrades against
+        test_cases: Test plan applied (snapshot)
+        status: pending (waiting for solution validation), running,
+            completed, failed or cancelled
+        max_attempt_id: Newest attempt included; later ones were graded
+            with the new plan already
+        total_attempts: Attempts to regrade
+        unique_codes: Distinct submitted codes among them
+        xp_changed: Total XP change applied
+        error_message: Why the job failed or was cancelled
+    """
+    
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('completed', 'Completed'),
+        ('failed', 'Failed'),
+        ('cancelled', 'Cancelled'),
+    ]
+    ACTIVE_STATUSES = ('pending', 'running')
+    
+    exercise = models.ForeignKey(
+        Exercise,
+        on_delete=models.CASCADE,
+        related_name='regrade_jobs'
+    )
+    version = models.CharField(max_length=64)
+    test_cases = models.JSONField(default=list)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    created_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='+'
+    )
+    max_attempt_id = models.BigIntegerField(default=0)
+    total_attempts = models.PositiveIntegerField(default=0)
+    unique_codes = models.PositiveIntegerField(default=0)
+    xp_changed = models.IntegerField(default=0)
+    error_message = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        db_table = 'regrade_jobs'
+        verbose_name = _('Regrade Job')
+        verbose_name_plural = _('Regrade Jobs')
+        ordering = ['-created_at']
+    
+    def __str__(self) -> str:
+        return f"{self.exercise.title} - regrade #{self.id} - {self.status}"
+    
+    def progress(self) -> dict:
+        """Counts of processed, re-executed and changed attempts so far."""
+        totals = self.shards.aggregate(
+            processed=models.Sum('processed_attempts'),
+            executed=models.Sum('executed_codes'),
+            changed=models.Sum('changed_attempts'),
+            shards_done=models.Count('id', filter=models.Q(status='done')),
+            shards=models.Count('id'),
+        )
+        totals = {key: value or 0 for key, value in totals.items()}
+        totals['percent'] = (
+            round(totals['processed'] / self.total_attempts * 100, 1)
+            if self.total_attempts else (100.0 if self.status == 'completed' else 0.0)
+        )
+        return totals
+
+
+class RegradeShard(models.Model):
+    """
+    Slice of a regrade job processed by one worker.
+    
+    groups lists [code hash, [attempt IDs]] sorted by hash; the shard
+    processes them in that order and checkpoints after every batch, so a
+    restarted shard resumes after the last completed hash without
+    re-executing or double-counting anything.
+    
+    Attributes:
+        job: Parent regrade job
+        index: Shard number within the job
+        groups: [code hash, [attempt IDs]] pairs assigned to this shard
+        checkpoint: Last code hash fully processed
+        passed_deltas: User ID -> change in number of passed attempts
+    """
+    
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+    
+    job = models.ForeignKey(
+        RegradeJob,
+        on_delete=models.CASCADE,
+        related_name='shards'
+    )
+    index = models.PositiveIntegerField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    groups = models.JSONField(default=list)
+    checkpoint = models.CharField(max_length=64, blank=True)
+    processed_attempts = models.PositiveIntegerField(default=0)
+    executed_codes = models.PositiveIntegerField(default=0)
+    changed_attempts = models.PositiveIntegerField(default=0)
+    passed_deltas = models.JSONField(default=dict)
+    error_message = models.TextField(blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        db_table = 'regrade_shards'
+        ordering = ['job', 'index']
+        unique_together = ['job', 'index']
+    
+    def __str__(self) -> str:
+        return f"Regrade #{self.job_id} shard {self.index} - {self.status}"
@@ -0,0 +1,112 @@
+"""
+Pagination classes for the exercises app.
+"""
+import base64
+from collections import OrderedDict
+
+from django.db import connections
+from django.db.models import BooleanField
+from django.db.models.expressions import RawSQL
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class AttemptCursorPagination(BasePagination):
+    """
+    Keyset pagination of attempts, newest first, on (created_at, id).
+    
+    The cursor is the position of the last attempt of the previous page,
+    so each page is an index range scan whatever its depth: no OFFSET and
+    no COUNT(*). Only forward links are given.
+    
+    Pages start after the cursor by the row value comparison
+    (created_at, id) < cursor, which the (user, exercise, -created_at,
+    -id) index of the attempts serves as one range, unlike the equivalent
+    OR of two conditions.
+    """
+    
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    page_size = 20
+    max_page_size = 100
+    ordering = ('-created_at', '-id')
+    invalid_cursor_message = 'Invalid cursor'
+    
+    def get_page_size(self, request) -> int:
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+    
+    @staticmethod
+    def encode_cursor(created_at, pk: int) -> str:
+        return base64.urlsafe_b64encode(f"{created_at.isoformat()}|{pk}".encode()).decode()
+    
+    def decode_cursor(self, cursor: str):
+        try:
+            created_at, pk = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+            created_at = parse_datetime(created_at)
+            pk = int(pk)
+        except ValueError:
+            raise NotFound(self.invalid_cursor_message)
+        if created_at is None:
+            raise NotFound(self.invalid_cursor_message)
+        return created_at, pk
+    
+    @staticmethod
+    def before(queryset, created_at, pk) -> RawSQL:
+        """Condition selecting the rows of `queryset` older than the cursor position."""
+        connection = connections[queryset.db]
+        quote = connection.ops.quote_name
+        table = quote(queryset.model._meta.db_table)
+        return RawSQL(
+            f"({table}.{quote('created_at')}, {table}.{quote('id')}) < (%s, %s)",
+            (connection.ops.adapt_datetimefield_value(created_at), pk),
+            output_field=BooleanField()
+        )
+    
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        page_size = self.get_page_size(request)
+        queryset = queryset.order_by(*self.ordering)
+        
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor:
+            created_at, pk = self.decode_cursor(cursor)
+            queryset = queryset.filter(self.before(queryset, created_at, pk))
+        
+        # One extra row tells whether there is a next page
+        page = list(queryset[:page_size + 1])
+        self.has_next = len(page) > page_size
+        page = page[:page_size]
+        self.last = page[-1] if page else None
+        return page
+    
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        return replace_query_param(
+            self.request.build_absolute_uri(),
+            self.cursor_query_param,
+            self.encode_cursor(self.last.created_at, self.last.id)
+        )
+    
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('results', data),
+        ]))
+    
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
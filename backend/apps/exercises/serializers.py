@@ -2,16 +2,21 @@
 Serializers for exercises.
 """
 from rest_framework import serializers
-from .models import Exercise, ExerciseAttempt
+from apps.sandbox.services.static_checks import StaticChecker
+from .models import ArchivedAttempt, Exercise, ExerciseAttempt
 
 
 class ExerciseListSerializer(serializers.ModelSerializer):
-    """Serializer for exercise list."""
+    """
+    Serializer for exercise list.
+    
+    Expects the annotations of ExerciseListView's queryset.
+    """
     
     lesson_title = serializers.CharField(source='lesson.title', read_only=True)
     completion_rate = serializers.FloatField(read_only=True)
-    user_attempts = serializers.SerializerMethodField()
-    user_passed = serializers.SerializerMethodField()
+    user_attempts = serializers.IntegerField(read_only=True)
+    user_passed = serializers.BooleanField(read_only=True)
     
     class Meta:
         model = Exercise
@@ -21,20 +26,6 @@ class ExerciseListSerializer(serializers.ModelSerializer):
             'max_attempts', 'time_limit_seconds', 'completion_rate',
             'user_attempts', 'user_passed'
         ]
-    
-    def get_user_attempts(self, obj):
-        """Get number of attempts by current user."""
-        request = self.context.get('request')
-        if request and request.user.is_authenticated:
-            return obj.attempts.filter(user=request.user).count()
-        return 0
-    
-    def get_user_passed(self, obj):
-        """Check if user has passed this exercise."""
-        request = self.context.get('request')
-        if request and request.user.is_authenticated:
-            return obj.attempts.filter(user=request.user, is_passed=True).exists()
-        return False
 
 
 class ExerciseDetailSerializer(serializers.ModelSerializer):
@@ -44,6 +35,7 @@ class ExerciseDetailSerializer(serializers.ModelSerializer):
     hints = serializers.JSONField(read_only=True)
     user_attempts = serializers.SerializerMethodField()
     user_best_attempt = serializers.SerializerMethodField()
+    requires_sandbox = serializers.SerializerMethodField()
     
     class Meta:
         model = Exercise
@@ -52,14 +44,21 @@ class ExerciseDetailSerializer(serializers.ModelSerializer):
             'description', 'instructions', 'starter_code',
             'hints', 'difficulty', 'xp_reward', 'order',
             'max_attempts', 'time_limit_seconds',
-            'user_attempts', 'user_best_attempt', 'is_published'
+            'user_attempts', 'user_best_attempt', 'is_published',
+            'requires_sandbox'
         ]
     
+    def get_requires_sandbox(self, obj):
+        """Whether grading runs the playbook (False if all tests are static)."""
+        return bool(StaticChecker.split(obj.test_cases)[1])
+    
     def get_user_attempts(self, obj):
-        """Get user's attempts count."""
+        """Get user's attempts count (the one max_attempts is enforced on)."""
         request = self.context.get('request')
         if request and request.user.is_authenticated:
-            return obj.attempts.filter(user=request.user).count()
+            return obj.user_statuses.filter(user=request.user).values_list(
+                'attempts_count', flat=True
+            ).first() or 0
         return 0
     
     def get_user_best_attempt(self, obj):
@@ -69,7 +68,7 @@ class ExerciseDetailSerializer(serializers.ModelSerializer):
             best = obj.attempts.filter(
                 user=request.user,
                 is_passed=True
-            ).order_by('execution_time').first()
+            ).select_related('code_blob').order_by('execution_time').first()
             if best:
                 return ExerciseAttemptSerializer(best).data
         return None
@@ -79,17 +78,54 @@ class ExerciseAttemptSerializer(serializers.ModelSerializer):
     """Serializer for exercise attempts."""
     
     exercise_title = serializers.CharField(source='exercise.title', read_only=True)
+    code_submitted = serializers.CharField(source='code', read_only=True)
     
     class Meta:
         model = ExerciseAttempt
         fields = [
             'id', 'exercise', 'exercise_title', 'code_submitted',
             'output', 'error_message', 'test_results', 'is_passed',
-            'execution_time', 'hints_used', 'attempt_number', 'created_at'
+            'execution_time', 'queue_wait_time', 'hints_used', 'attempt_number', 'created_at'
         ]
         read_only_fields = ['id', 'is_passed', 'test_results', 'created_at']
 
 
+class ExerciseAttemptListSerializer(serializers.ModelSerializer):
+    """
+    Serializer for attempt lists: the end of the output instead of the
+    full output and code, which come from the attempt detail endpoint.
+    """
+    
+    exercise_title = serializers.CharField(source='exercise.title', read_only=True)
+    
+    class Meta:
+        model = ExerciseAttempt
+        fields = [
+            'id', 'exercise', 'exercise_title', 'output_preview',
+            'error_message', 'test_results', 'is_passed',
+            'execution_time', 'queue_wait_time', 'hints_used', 'attempt_number', 'created_at'
+        ]
+        read_only_fields = fields
+
+
+class ExerciseAttemptSummarySerializer(serializers.ModelSerializer):
+    """Serializer for the attempt history: no output, results or code."""
+    
+    class Meta:
+        model = ExerciseAttempt
+        fields = ['id', 'attempt_number', 'is_passed', 'execution_time', 'created_at']
+        read_only_fields = fields
+
+
+class ArchivedAttemptSerializer(serializers.ModelSerializer):
+    """Serializer for the index entries of archived attempts."""
+    
+    class Meta:
+        model = ArchivedAttempt
+        fields = ['id', 'exercise', 'attempt_number', 'is_passed', 'execution_time', 'created_at', 'archived_at']
+        read_only_fields = fields
+
+
 class HintRequestSerializer(serializers.Serializer):
     """Serializer for hint requests."""
     
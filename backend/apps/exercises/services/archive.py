@@ -0,0 +1,132 @@
+"""
+Cold storage of old exercise attempts.
+"""
+import json
+import os
+import zlib
+from pathlib import Path
+from typing import Iterable, List, Optional
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.utils.dateparse import parse_datetime
+
+from ..models import ArchivedAttempt, ExerciseAttempt
+
+# Attempts per gzip member: a lookup decompresses one member only
+MEMBER_RECORDS = 100
+
+
+class AttemptArchive:
+    """
+    Append-only store of exercise attempts as gzip-compressed JSON lines.
+    
+    Each archived batch becomes one file, ROOT/YYYY/MM/attempts-<first
+    ID>-<last ID>.ndjson.gz, made of several concatenated gzip members.
+    The file is a valid gzip stream (zcat works), and an ArchivedAttempt
+    row points at the member and line of every attempt so a single one
+    can be read back without decompressing the whole file.
+    """
+    
+    def __init__(self, root: Optional[str] = None):
+        self.root = Path(root or settings.EXERCISE_ATTEMPTS_ARCHIVE_DIR)
+    
+    @staticmethod
+    def _record(attempt: ExerciseAttempt) -> dict:
+        record = {
+            field.attname: getattr(attempt, field.attname)
+            for field in ExerciseAttempt._meta.concrete_fields
+        }
+        # The blob may be collected once the attempt leaves the table
+        del record['code_blob_id']
+        record['code_submitted'] = attempt.code
+        # DjangoJSONEncoder would truncate to milliseconds
+        record['created_at'] = attempt.created_at.isoformat()
+        return record
+    
+    def write(self, attempts: List[ExerciseAttempt]) -> List[ArchivedAttempt]:
+        """
+        Write attempts to a new archive file.
+        
+        Returns:
+            Unsaved index entries of the written attempts
+        """
+        first = attempts[0]
+        relative = Path(
+            f"{first.created_at:%Y}", f"{first.created_at:%m}",
+            f"attempts-{first.id}-{attempts[-1].id}.ndjson.gz"
+        )
+        path = self.root / relative
+        path.parent.mkdir(parents=True, exist_ok=True)
+        
+        entries = []
+        offset = 0
+        temporary = path.with_name(path.name + '.tmp')
+        with open(temporary, 'wb') as archive_file:
+            for start in range(0, len(attempts), MEMBER_RECORDS):
+                member = attempts[start:start + MEMBER_RECORDS]
+                lines = []
+                for line, attempt in enumerate(member):
+                    lines.append(json.dumps(self._record(attempt), cls=DjangoJSONEncoder))
+                    entries.append(ArchivedAttempt(
+                        id=attempt.id,
+                        user_id=attempt.user_id,
+                        exercise_id=attempt.exercise_id,
+                        attempt_number=attempt.attempt_number,
+                        is_passed=attempt.is_passed,
+                        execution_time=attempt.execution_time,
+                        created_at=attempt.created_at,
+                        archive_file=str(relative),
+                        member_offset=offset,
+                        line=line,
+                    ))
+                compressor = zlib.compressobj(wbits=31)
+                data = compressor.compress(('\n'.join(lines) + '\n').encode('utf-8'))
+                data += compressor.flush()
+                archive_file.write(data)
+                offset += len(data)
+            archive_file.flush()
+            os.fsync(archive_file.fileno())
+        os.replace(temporary, path)
+        return entries
+    
+    def store(self, attempts: Iterable[ExerciseAttempt]) -> int:
+        """
+        Move attempts from the database to the archive.
+        
+        The file is complete on disk before the index entries are created
+        and the attempts deleted, in one transaction: a failure leaves at
+        worst an unreferenced file, never a lost attempt.
+        
+        Returns:
+            Number of archived attempts
+        """
+        attempts = sorted(attempts, key=lambda attempt: attempt.id)
+        if not attempts:
+            return 0
+        entries = self.write(attempts)
+        with transaction.atomic():
+            ArchivedAttempt.objects.bulk_create(entries, ignore_conflicts=True)
+            ExerciseAttempt.objects.filter(id__in=[entry.id for entry in entries]).delete()
+        return len(entries)
+    
+    def load(self, entry: ArchivedAttempt) -> ExerciseAttempt:
+        """
+        Read an archived attempt back.
+        
+        Returns:
+            Unsaved ExerciseAttempt with the archived values
+        """
+        decompressor = zlib.decompressobj(wbits=31)
+        data = b''
+        with open(self.root / entry.archive_file, 'rb') as archive_file:
+            archive_file.seek(entry.member_offset)
+            while not decompressor.eof:
+                chunk = archive_file.read(64 * 1024)
+                if not chunk:
+                    break
+                data += decompressor.decompress(chunk)
+        record = json.loads(data.decode('utf-8').split('\n')[entry.line])
+        record['created_at'] = parse_datetime(record['created_at'])
+        return ExerciseAttempt(**record)
@@ -0,0 +1,228 @@
+"""
+Monthly range partitioning of the exercise attempts table (PostgreSQL).
+"""
+import logging
+import re
+from datetime import date, datetime, timezone as dt_timezone
+from typing import Dict, List
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from ..models import ExerciseAttempt
+
+logger = logging.getLogger(__name__)
+
+
+def month_start(day: date, months: int = 0) -> date:
+    """First day of the month `months` months after `day`'s month."""
+    index = day.year * 12 + day.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+class AttemptPartitions:
+    """
+    Manages the monthly partitions of exercise_attempts.
+    
+    The table is partitioned by range of created_at, one partition per
+    month named <table>_pYYYYMM. Postgres requires the partition key in
+    the primary key, so it becomes (id, created_at); id stays unique
+    through its identity sequence and the ORM keeps using it alone.
+    Indexes are declared on the parent table, so every partition gets
+    its own copy and queries on recent ranges only touch recent
+    partitions.
+    """
+    
+    def __init__(self):
+        self.table = ExerciseAttempt._meta.db_table
+        self.name_pattern = re.compile(rf'^{re.escape(self.table)}_p(\d{{4}})(\d{{2}})$')
+    
+    @staticmethod
+    def supported() -> bool:
+        return connection.vendor == 'postgresql'
+    
+    def partition_name(self, month: date) -> str:
+        return f"{self.table}_p{month:%Y%m}"
+    
+    def is_partitioned(self) -> bool:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(%s)",
+                [self.table]
+            )
+            return cursor.fetchone() is not None
+    
+    def partitions(self) -> Dict[date, str]:
+        """Attached monthly partitions by month."""
+        with connection.cursor() as cursor:
+            cursor.execute(
+                """
+                SELECT child.relname FROM pg_inherits
+                JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+                WHERE pg_inherits.inhparent = to_regclass(%s)
+                """,
+                [self.table]
+            )
+            names = [row[0] for row in cursor.fetchall()]
+        months = {}
+        for name in names:
+            match = self.name_pattern.match(name)
+            if match:
+                months[date(int(match[1]), int(match[2]), 1)] = name
+        return months
+    
+    def _create_partition(self, cursor, month: date) -> str:
+        name = self.partition_name(month)
+        start, end = (
+            datetime.combine(day, datetime.min.time(), tzinfo=dt_timezone.utc).isoformat()
+            for day in (month, month_start(month, 1))
+        )
+        cursor.execute(
+            f'CREATE TABLE IF NOT EXISTS "{name}" PARTITION OF "{self.table}" '
+            f"FOR VALUES FROM ('{start}') TO ('{end}')"
+        )
+        return name
+    
+    def ensure_partitions(self, months_ahead: int) -> List[str]:
+        """
+        Create the partitions of the current month and `months_ahead` next ones.
+        
+        Returns:
+            Names of the created partitions
+        """
+        existing = self.partitions()
+        current = month_start(timezone.now().date())
+        created = []
+        with connection.cursor() as cursor:
+            for offset in range(months_ahead + 1):
+                month = month_start(current, offset)
+                if month not in existing:
+                    created.append(self._create_partition(cursor, month))
+        return created
+    
+    def expire_partitions(self, retention_months: int, drop: bool = False) -> List[str]:
+        """
+        Detach, or drop, the partitions older than `retention_months` months.
+        
+        A detached partition is a plain table again and can be dumped or
+        dropped later; either way it is a catalog change, not a DELETE.
+        
+        Returns:
+            Names of the expired partitions
+        """
+        cutoff = month_start(timezone.now().date(), -retention_months)
+        expired = []
+        with connection.cursor() as cursor:
+            for month, name in sorted(self.partitions().items()):
+                if month >= cutoff:
+                    break
+                with transaction.atomic():
+                    cursor.execute(f'ALTER TABLE "{self.table}" DETACH PARTITION "{name}"')
+                    if drop:
+                        cursor.execute(f'DROP TABLE "{name}"')
+                expired.append(name)
+        return expired
+    
+    def convert(self, months_ahead: int) -> int:
+        """
+        Turn the plain exercise_attempts table into a partitioned one.
+        
+        The rows are copied into new monthly partitions under an exclusive
+        lock, so submissions wait for the conversion: run it in a
+        maintenance window. Indexes are recreated on the partitioned table
+        with their original names, keeping later migrations applicable.
+        
+        Returns:
+            Number of copied attempts
+        """
+        legacy = f"{self.table}_legacy"
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(f'LOCK TABLE "{self.table}" IN ACCESS EXCLUSIVE MODE')
+            cursor.execute(
+                """
+                SELECT conname FROM pg_constraint
+                WHERE conrelid = to_regclass(%s) AND contype = 'p'
+                """,
+                [self.table]
+            )
+            primary_key = cursor.fetchone()[0]
+            cursor.execute(
+                """
+                SELECT indexdef FROM pg_indexes
+                WHERE schemaname = current_schema() AND tablename = %s AND indexname <> %s
+                """,
+                [self.table, primary_key]
+            )
+            index_definitions = [row[0] for row in cursor.fetchall()]
+            cursor.execute(
+                """
+                SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint
+                WHERE conrelid = to_regclass(%s) AND contype = 'f'
+                """,
+                [self.table]
+            )
+            foreign_keys = cursor.fetchall()
+            cursor.execute(
+                f'SELECT date_trunc(\'month\', MIN(created_at) AT TIME ZONE \'UTC\') FROM "{self.table}"'
+            )
+            oldest = cursor.fetchone()[0]
+            
+            cursor.execute(f'ALTER TABLE "{self.table}" RENAME TO "{legacy}"')
+            cursor.execute(f'ALTER TABLE "{legacy}" RENAME CONSTRAINT "{primary_key}" TO "{legacy}_pkey"')
+            cursor.execute(
+                f'CREATE TABLE "{self.table}" (LIKE "{legacy}" INCLUDING DEFAULTS '
+                f'INCLUDING CONSTRAINTS INCLUDING IDENTITY) PARTITION BY RANGE (created_at)'
+            )
+            cursor.execute(f'ALTER TABLE "{self.table}" ADD CONSTRAINT "{primary_key}" PRIMARY KEY (id, created_at)')
+            for name, definition in foreign_keys:
+                cursor.execute(f'ALTER TABLE "{self.table}" ADD CONSTRAINT "{name}" {definition}')
+            
+            current = month_start(timezone.now().date())
+            month = oldest.date() if oldest else current
+            while month <= month_start(current, months_ahead):
+                self._create_partition(cursor, month)
+                month = month_start(month, 1)
+            
+            cursor.execute(f'INSERT INTO "{self.table}" SELECT * FROM "{legacy}"')
+            copied = cursor.rowcount
+            cursor.execute(
+                f"SELECT setval(pg_get_serial_sequence(%s, 'id'), COALESCE(MAX(id), 0) + 1, false) "
+                f'FROM "{self.table}"',
+                [self.table]
+            )
+            cursor.execute(f'DROP TABLE "{legacy}"')
+            for definition in index_definitions:
+                cursor.execute(definition)
+        logger.info(f"Partitioned {self.table}: {copied} attempts copied")
+        return copied
+    
+    def index_report(self) -> Dict[str, List[str]]:
+        """
+        Indexes of the parent table missing on each partition.
+        
+        Returns:
+            Partition name -> names of the parent indexes it lacks
+        """
+        with connection.cursor() as cursor:
+            cursor.execute(
+                """
+                SELECT parent_index.relname, child.relname
+                FROM pg_index
+                JOIN pg_class parent_index ON parent_index.oid = pg_index.indexrelid
+                CROSS JOIN pg_inherits
+                JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+                WHERE pg_index.indrelid = to_regclass(%s)
+                  AND pg_inherits.inhparent = to_regclass(%s)
+                  AND NOT EXISTS (
+                      SELECT 1 FROM pg_inherits attached
+                      JOIN pg_index child_index ON child_index.indexrelid = attached.inhrelid
+                      WHERE attached.inhparent = pg_index.indexrelid
+                        AND child_index.indrelid = child.oid
+                  )
+                """,
+                [self.table, self.table]
+            )
+            missing = {name: [] for name in self.partitions().values()}
+            for index_name, partition in cursor.fetchall():
+                missing.setdefault(partition, []).append(index_name)
+        return missing
@@ -0,0 +1,135 @@
+"""
+Regrading of stored exercise attempts against a new test plan.
+"""
+import logging
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+
+from apps.sandbox.services import AnsibleValidator, DockerExecutor, StaticChecker, TestRunner, fingerprint
+from apps.sandbox.services.fingerprint import FingerprintGrader
+from apps.sandbox.services.static_checks import merge_results
+
+logger = logging.getLogger(__name__)
+
+
+def plan_shards(attempts, shard_count: int) -> Tuple[List[List[List[Any]]], int]:
+    """
+    Group attempts by identical code and spread the groups over shards.
+    
+    Args:
+        attempts: Iterable of (attempt ID, code hash)
+        shard_count: Number of shards
+    
+    Returns:
+        Tuple of (per shard, [code hash, [attempt IDs]] sorted by hash;
+        number of distinct codes)
+    """
+    groups = defaultdict(list)
+    for attempt_id, digest in attempts:
+        groups[digest].append(attempt_id)
+    
+    shards = [[] for _ in range(shard_count)]
+    for digest in sorted(groups):
+        shards[int(digest[:8], 16) % shard_count].append([digest, groups[digest]])
+    return shards, len(groups)
+
+
+class Regrader:
+    """
+    Grades stored attempts with a test plan, executing as little as possible.
+    
+    Static tests only need the code. Runtime tests reuse the stored output
+    and exit code of each attempt. A group of attempts with identical code
+    is executed once, in an isolated topology, only when the plan has
+    final-state tests or some attempt has no stored exit code (graded
+    statically, or recorded before exit codes were kept).
+    """
+    
+    def __init__(self, exercise, test_cases: List[Dict[str, Any]], executor: Optional[DockerExecutor] = None):
+        self.exercise = exercise
+        self.static_tests, other_tests = StaticChecker.split(test_cases)
+        self.fingerprint_tests, self.runtime_tests = fingerprint.split(other_tests)
+        self.spec = fingerprint.probe_spec(self.fingerprint_tests)
+        self._executor = executor
+        self._node_image = None
+        self._reference = None
+    
+    @property
+    def executor(self) -> DockerExecutor:
+        if self._executor is None:
+            self._executor = DockerExecutor()
+        return self._executor
+    
+    def needs_execution(self, attempts) -> bool:
+        if self.fingerprint_tests:
+            return True
+        return bool(self.runtime_tests) and any(attempt.exit_code is None for attempt in attempts)
+    
+    def _execute(self, code: str) -> Dict[str, Any]:
+        if self._node_image is None:
+            self._node_image = self.executor.prepare_node_image(self.exercise.precondition_playbook)
+        return self.executor.run_isolated(
+            code,
+            self._node_image,
+            timeout=self.exercise.time_limit_seconds,
+            probe_spec=self.spec or None
+        )
+    
+    def _reference_state(self) -> Dict[str, Any]:
+        if self._reference is None:
+            self._reference = FingerprintGrader(self.executor).reference(self.exercise, self.spec)
+        return self._reference
+    
+    def grade_group(self, code: str, attempts) -> Tuple[Dict[int, Dict[str, Any]], bool]:
+        """
+        Grade attempts sharing the same submitted code.
+        
+        Returns:
+            Tuple of (attempt ID -> test results, whether the code was executed)
+        """
+        total = len(self.static_tests) + len(self.fingerprint_tests) + len(self.runtime_tests)
+        validation_result = AnsibleValidator.validate_playbook(code)
+        if not validation_result['valid']:
+            results = {
+                "passed": False,
+                "total_tests": total,
+                "passed_tests": 0,
+                "failed_tests": total,
+                "test_results": [],
+                "error": "; ".join(validation_result['errors'])
+            }
+            return {attempt.id: results for attempt in attempts}, False
+        
+        static_results = None
+        if self.static_tests:
+            static_results = StaticChecker.run_tests(self.static_tests, validation_result['data'])
+            # Like live grading: static failures are final, nothing is run
+            if not static_results['passed'] or not (self.runtime_tests or self.fingerprint_tests):
+                return {attempt.id: static_results for attempt in attempts}, False
+        
+        execution_result = None
+        if self.needs_execution(attempts):
+            execution_result = self._execute(code)
+        
+        fingerprint_results = None
+        if self.fingerprint_tests:
+            fingerprint_results = FingerprintGrader.run_tests(
+                self.fingerprint_tests,
+                self._reference_state(),
+                execution_result.get('fingerprint')
+            )
+        
+        graded = {}
+        for attempt in attempts:
+            result = execution_result or {
+                "success": attempt.exit_code == 0,
+                "exit_code": attempt.exit_code,
+                "stdout": attempt.output,
+                "stderr": attempt.error_message,
+            }
+            graded[attempt.id] = merge_results(
+                static_results,
+                TestRunner.run_tests(self.runtime_tests, result),
+                fingerprint_results
+            )
+        return graded, execution_result is not None
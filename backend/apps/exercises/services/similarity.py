@@ -0,0 +1,280 @@
+"""
+Near-duplicate detection of submitted code with MinHash and LSH.
+"""
+import hashlib
+import operator
+import random
+import re
+from collections import defaultdict
+from typing import Any, Dict, Iterable, List, Optional
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, Exists, OuterRef, Q
+
+from ..models import CodeBlob, ExerciseAttempt, SignatureBucket, SubmissionSignature
+
+# Tokens per shingle
+SHINGLE_SIZE = 4
+
+# Signature length, split into BANDS bands of ROWS values. Two codes with
+# Jaccard similarity s share a bucket with probability 1 - (1 - s^4)^16:
+# 0.99 at s = 0.7, 0.23 at s = 0.4
+BANDS = 16
+ROWS = 4
+NUM_PERM = BANDS * ROWS
+
+# Members of a bucket compared pairwise. Larger buckets (boilerplate most
+# submissions share) are sampled down to this many, with a different
+# sample per bucket, so no bucket costs more than MAX_BUCKET_SIZE^2 / 2
+# comparisons
+MAX_BUCKET_SIZE = 200
+
+# Universal hashing (a * x + b) mod a Mersenne prime, with fixed seeds so
+# signatures stay comparable across processes and releases
+_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+_PERMUTATIONS = [
+    (
+        int.from_bytes(hashlib.blake2b(f"a{i}".encode(), digest_size=8).digest(), 'big') % (_PRIME - 1) + 1,
+        int.from_bytes(hashlib.blake2b(f"b{i}".encode(), digest_size=8).digest(), 'big') % _PRIME,
+    )
+    for i in range(NUM_PERM)
+]
+
+_COMMENT = re.compile(r'(^|\s)#.*$', re.MULTILINE)
+# Play and task names are free text, renaming them changes nothing
+_NAME = re.compile(r'^(\s*-?\s*)name:.*$', re.MULTILINE)
+_TOKEN = re.compile(r"[\w.]+|[^\s\w'\"]")
+
+
+def tokens(code: str) -> List[str]:
+    """Tokens of a playbook, without comments, names, quotes and case."""
+    code = _NAME.sub(r'\1name:', _COMMENT.sub('', code))
+    return _TOKEN.findall(code.lower())
+
+
+def shingles(code: str) -> set:
+    words = tokens(code)
+    if len(words) <= SHINGLE_SIZE:
+        return {' '.join(words)} if words else set()
+    return {' '.join(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)}
+
+
+def minhash(code: str) -> List[int]:
+    hashes = [
+        int.from_bytes(hashlib.blake2b(shingle.encode('utf-8'), digest_size=4).digest(), 'big')
+        for shingle in shingles(code)
+    ]
+    if not hashes:
+        return [_MAX_HASH] * NUM_PERM
+    return [min((a * value + b) % _PRIME & _MAX_HASH for value in hashes) for a, b in _PERMUTATIONS]
+
+
+def similarity(first: List[int], second: List[int]) -> float:
+    """Estimated Jaccard similarity of the shingles of two signatures."""
+    return sum(map(operator.eq, first, second)) / NUM_PERM
+
+
+def band_buckets(signature: List[int]) -> List[int]:
+    """Bucket of each band, as a signed 64-bit integer."""
+    buckets = []
+    for band in range(BANDS):
+        rows = signature[band * ROWS:(band + 1) * ROWS]
+        digest = hashlib.blake2b(repr(rows).encode(), digest_size=8).digest()
+        buckets.append(int.from_bytes(digest, 'big', signed=True))
+    return buckets
+
+
+class SimilarityIndex:
+    """
+    LSH index of the submissions of each exercise.
+    
+    Each distinct code (code blob) submitted to an exercise gets a MinHash
+    signature and one bucket row per band. Finding near-duplicates only
+    reads the colliding buckets of one exercise and compares the
+    signatures of those candidates, never all pairs.
+    """
+    
+    # Default estimated similarity for two submissions to be clustered
+    THRESHOLD = 0.8
+    
+    @staticmethod
+    def add(exercise_id: int, blobs: Iterable[CodeBlob]) -> int:
+        """
+        Index code blobs submitted to an exercise, skipping indexed ones.
+        
+        Returns:
+            Number of new signatures
+        """
+        blobs = list(blobs)
+        indexed = set(SubmissionSignature.objects.filter(
+            exercise_id=exercise_id,
+            code_blob__in=blobs
+        ).values_list('code_blob_id', flat=True))
+        signatures = [
+            SubmissionSignature(exercise_id=exercise_id, code_blob_id=blob.id, minhash=minhash(blob.code))
+            for blob in blobs if blob.id not in indexed
+        ]
+        if not signatures:
+            return 0
+        try:
+            with transaction.atomic():
+                created = SubmissionSignature.objects.bulk_create(signatures)
+                SimilarityIndex._add_buckets(created)
+        except IntegrityError:
+            # Some were indexed concurrently: index the others one by one
+            created = []
+            for signature in signatures:
+                try:
+                    with transaction.atomic():
+                        signature.save()
+                        SimilarityIndex._add_buckets([signature])
+                except IntegrityError:
+                    continue
+                created.append(signature)
+        return len(created)
+    
+    @staticmethod
+    def _add_buckets(signatures: List[SubmissionSignature]) -> None:
+        SignatureBucket.objects.bulk_create([
+            SignatureBucket(signature=signature, exercise_id=signature.exercise_id, band=band, bucket=bucket)
+            for signature in signatures
+            for band, bucket in enumerate(band_buckets(signature.minhash))
+        ])
+    
+    @staticmethod
+    def unindexed(exercise_id: Optional[int] = None):
+        """(exercise ID, code blob ID) pairs of attempts without a signature."""
+        attempts = ExerciseAttempt.objects.filter(code_blob__isnull=False)
+        if exercise_id is not None:
+            attempts = attempts.filter(exercise_id=exercise_id)
+        return attempts.exclude(Exists(SubmissionSignature.objects.filter(
+            exercise_id=OuterRef('exercise_id'),
+            code_blob_id=OuterRef('code_blob_id')
+        ))).values_list('exercise_id', 'code_blob_id').distinct().order_by('exercise_id', 'code_blob_id')
+    
+    @classmethod
+    def clusters(cls, exercise, threshold: Optional[float] = None) -> List[Dict[str, Any]]:
+        """
+        Groups of near-identical submissions to an exercise by different users.
+        
+        Submissions at least `threshold` similar to the starter code are
+        left out: they only share what every student was given.
+        
+        Returns:
+            Clusters, largest first, with their submissions and the users
+            who submitted them
+        """
+        threshold = cls.THRESHOLD if threshold is None else threshold
+        
+        # Signatures sharing at least one bucket
+        buckets = SignatureBucket.objects.filter(exercise=exercise)
+        collisions = set(buckets.values('band', 'bucket').annotate(
+            members=Count('id')
+        ).filter(members__gt=1).order_by().values_list('band', 'bucket'))
+        candidates = defaultdict(list)
+        rows = buckets.filter(bucket__in={bucket for _, bucket in collisions}).values_list(
+            'band', 'bucket', 'signature_id'
+        )
+        for band, bucket, signature_id in rows:
+            if (band, bucket) in collisions:
+                candidates[band, bucket].append(signature_id)
+        
+        # Identical code submitted by several users needs no other member
+        shared_blob_ids = set(ExerciseAttempt.objects.filter(
+            exercise=exercise,
+            code_blob__isnull=False
+        ).values('code_blob_id').annotate(
+            users=Count('user_id', distinct=True)
+        ).filter(users__gt=1).values_list('code_blob_id', flat=True))
+        
+        candidate_ids = {signature_id for members in candidates.values() for signature_id in members}
+        signatures = {
+            signature.id: signature
+            for signature in SubmissionSignature.objects.filter(
+                Q(id__in=candidate_ids) | Q(exercise=exercise, code_blob_id__in=shared_blob_ids)
+            ).only('id', 'code_blob_id', 'minhash')
+        }
+        
+        # Submissions near the starter code only share what every student
+        # was given; leaving them out before pairing also shrinks the
+        # buckets of the boilerplate
+        if exercise.starter_code.strip():
+            starter = minhash(exercise.starter_code)
+            signatures = {
+                signature_id: signature
+                for signature_id, signature in signatures.items()
+                if similarity(signature.minhash, starter) < threshold
+            }
+        
+        scores = {
+            signature.id: 1.0
+            for signature in signatures.values()
+            if signature.code_blob_id in shared_blob_ids
+        }
+        
+        parent = {signature_id: signature_id for signature_id in signatures}
+        
+        def find(signature_id):
+            while parent[signature_id] != signature_id:
+                parent[signature_id] = parent[parent[signature_id]]
+                signature_id = parent[signature_id]
+            return signature_id
+        
+        compared = set()
+        for (_, bucket), members in candidates.items():
+            members = sorted(signature_id for signature_id in members if signature_id in signatures)
+            if len(members) > MAX_BUCKET_SIZE:
+                members = random.Random(bucket).sample(members, MAX_BUCKET_SIZE)
+            for i, first in enumerate(members):
+                for second in members[i + 1:]:
+                    pair = (min(first, second), max(first, second))
+                    if pair in compared:
+                        continue
+                    compared.add(pair)
+                    if find(first) == find(second):
+                        continue  # Already clustered through other members
+                    score = similarity(signatures[first].minhash, signatures[second].minhash)
+                    if score < threshold:
+                        continue
+                    parent[find(first)] = find(second)
+                    scores[first] = max(scores.get(first, 0.0), score)
+                    scores[second] = max(scores.get(second, 0.0), score)
+        
+        groups = defaultdict(list)
+        for signature_id in scores:
+            groups[find(signature_id)].append(signatures[signature_id])
+        return cls._describe(exercise, list(groups.values()), scores)
+    
+    @staticmethod
+    def _describe(exercise, groups, scores) -> List[Dict[str, Any]]:
+        blob_ids = [signature.code_blob_id for group in groups for signature in group]
+        submitters = defaultdict(dict)
+        for attempt_id, blob_id, user_id, username, created_at in ExerciseAttempt.objects.filter(
+            exercise=exercise,
+            code_blob_id__in=blob_ids
+        ).order_by('created_at').values_list('id', 'code_blob_id', 'user_id', 'user__username', 'created_at'):
+            # First attempt of each user with this code
+            submitters[blob_id].setdefault(user_id, {
+                "user_id": user_id,
+                "username": username,
+                "attempt_id": attempt_id,
+                "created_at": created_at,
+            })
+        
+        clusters = []
+        for group in groups:
+            submissions = [
+                {
+                    "code_blob_id": signature.code_blob_id,
+                    "similarity": round(scores[signature.id], 3),
+                    "users": list(submitters[signature.code_blob_id].values()),
+                }
+                for signature in group
+            ]
+            users = {user["user_id"] for submission in submissions for user in submission["users"]}
+            if len(users) < 2:
+                continue  # One student's own resubmissions
+            clusters.append({"users": len(users), "submissions": submissions})
+        clusters.sort(key=lambda cluster: -cluster["users"])
+        return clusters
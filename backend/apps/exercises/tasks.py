@@ -1,45 +1,625 @@
 """
 Celery tasks for exercises.
 """
-from celery import shared_task
+from celery import group, shared_task
+from collections import defaultdict
+from django.conf import settings
+from django.db import transaction
+from django.db.models import ProtectedError
+from django.db.models import Exists, F, OuterRef, Q, Window
+from django.db.models.functions import Greatest, RowNumber
 from django.utils import timezone
 from datetime import timedelta
+from typing import Optional
 import logging
+import time
 
-from .models import ExerciseAttempt
+from apps.sandbox.services import AnsibleValidator, DockerExecutor, StaticChecker, TestRunner, fingerprint
+from apps.sandbox.services.fingerprint import FingerprintGrader
+from apps.sandbox.services.static_checks import merge_results
+from .models import (
+    CodeBlob, Exercise, ExerciseAttempt, ExerciseStats, RegradeJob, RegradeShard, SolutionValidation,
+    SubmissionSignature, UserExerciseStatus
+)
+from .services.archive import AttemptArchive
+from .services.partitions import AttemptPartitions
+from .services.regrade import Regrader, plan_shards
+from .services.similarity import SimilarityIndex
 
 logger = logging.getLogger(__name__)
 
 
 @shared_task
-def cleanup_old_attempts():
+def cleanup_old_attempts(keep: Optional[int] = None, batch_size: Optional[int] = None):
     """
-    Delete old exercise attempts (keep only last 10 per user/exercise).
+    Archive old exercise attempts, keeping the latest `keep` per user/exercise
+    in the database.
     Runs daily at 2 AM via Celery Beat.
+    
+    Surplus attempts are selected in one pass with ROW_NUMBER() over each
+    user/exercise partition, newest first, and moved to cold storage in
+    batches (one archive file each) with a pause in between so the nightly
+    run does not monopolize the database. Attempts created meanwhile are
+    newer than everything selected.
     """
-    logger.info("Starting cleanup of old exercise attempts")
+    keep = settings.EXERCISE_ATTEMPTS_KEEP if keep is None else keep
+    batch_size = batch_size or settings.EXERCISE_ATTEMPTS_CLEANUP_BATCH_SIZE
+    pause = settings.EXERCISE_ATTEMPTS_CLEANUP_PAUSE
+    logger.info(f"Starting cleanup of old exercise attempts (keeping {keep} per user/exercise)")
+    started = time.monotonic()
     
-    from django.db.models import Count
-    from apps.accounts.models import User
+    surplus = ExerciseAttempt.objects.annotate(
+        rank=Window(
+            RowNumber(),
+            partition_by=[F('user_id'), F('exercise_id')],
+            order_by=[F('created_at').desc(), F('id').desc()]
+        )
+    ).filter(rank__gt=keep).values_list('id', flat=True)
+    
+    archive = AttemptArchive()
+    archived_count = batches = 0
+    batch = []
+    for attempt_id in surplus.iterator(chunk_size=batch_size):
+        batch.append(attempt_id)
+        if len(batch) < batch_size:
+            continue
+        archived_count += archive.store(
+            ExerciseAttempt.objects.filter(id__in=batch).select_related('code_blob')
+        )
+        batches += 1
+        batch = []
+        logger.info(
+            f"Cleanup progress: {archived_count} attempts archived in {batches} batches, "
+            f"{time.monotonic() - started:.1f}s"
+        )
+        time.sleep(pause)
+    if batch:
+        archived_count += archive.store(
+            ExerciseAttempt.objects.filter(id__in=batch).select_related('code_blob')
+        )
+        batches += 1
+    
+    logger.info(
+        f"Cleanup completed. Archived {archived_count} old attempts in {batches} batches, "
+        f"{time.monotonic() - started:.1f}s."
+    )
+    return archived_count
+
+
+@shared_task
+def archive_old_attempts(days: Optional[int] = None, batch_size: Optional[int] = None):
+    """
+    Move attempts older than `days` to cold storage.
+    Runs daily at 2:30 AM via Celery Beat, after the cleanup.
+    
+    Each batch becomes one gzip file of the archive; the attempts keep a
+    small index row for history, statistics and lookups by ID.
+    """
+    days = settings.EXERCISE_ATTEMPTS_ARCHIVE_AFTER_DAYS if days is None else days
+    batch_size = batch_size or settings.EXERCISE_ATTEMPTS_ARCHIVE_BATCH_SIZE
+    pause = settings.EXERCISE_ATTEMPTS_CLEANUP_PAUSE
+    cutoff = timezone.now() - timedelta(days=days)
+    logger.info(f"Starting archival of exercise attempts created before {cutoff:%Y-%m-%d}")
+    started = time.monotonic()
+    
+    archive = AttemptArchive()
+    archived_count = batches = 0
+    last_id = 0
+    while True:
+        batch = list(
+            ExerciseAttempt.objects.filter(created_at__lt=cutoff, id__gt=last_id)
+            .select_related('code_blob').order_by('id')[:batch_size]
+        )
+        if not batch:
+            break
+        last_id = batch[-1].id
+        archived_count += archive.store(batch)
+        batches += 1
+        logger.info(
+            f"Archival progress: {archived_count} attempts archived in {batches} files, "
+            f"{time.monotonic() - started:.1f}s"
+        )
+        time.sleep(pause)
+    
+    logger.info(
+        f"Archival completed. Archived {archived_count} attempts in {batches} files, "
+        f"{time.monotonic() - started:.1f}s."
+    )
+    return archived_count
+
+
+@shared_task
+def maintain_attempt_partitions():
+    """
+    Keep the monthly partitions of exercise_attempts ahead of time.
+    Runs daily at 4 AM via Celery Beat.
+    
+    Creates the partitions of the next EXERCISE_ATTEMPTS_PARTITIONS_AHEAD
+    months and, with a retention set, detaches or drops the partitions
+    older than it. Does nothing until the table has been converted with
+    the partition_exercise_attempts command.
+    """
+    partitions = AttemptPartitions()
+    if not partitions.supported() or not partitions.is_partitioned():
+        logger.info("exercise_attempts is not partitioned, skipping partition maintenance")
+        return {"created": [], "expired": []}
+    
+    created = partitions.ensure_partitions(settings.EXERCISE_ATTEMPTS_PARTITIONS_AHEAD)
+    expired = []
+    if settings.EXERCISE_ATTEMPTS_PARTITION_RETENTION_MONTHS:
+        expired = partitions.expire_partitions(
+            settings.EXERCISE_ATTEMPTS_PARTITION_RETENTION_MONTHS,
+            drop=settings.EXERCISE_ATTEMPTS_PARTITION_DROP
+        )
+    
+    logger.info(f"Attempt partitions: created {created or 'none'}, expired {expired or 'none'}")
+    return {"created": created, "expired": expired}
+
+
+@shared_task
+def collect_code_blobs(batch_size: Optional[int] = None):
+    """
+    Delete code blobs no attempt or submission signature references any more.
+    Runs daily at 4:30 AM via Celery Beat.
+    
+    Blobs used within CODE_BLOB_GC_GRACE_HOURS are kept: an attempt
+    being saved may have stored its blob without being inserted yet.
+    Signatures cascade with their blob, so a blob still indexed for
+    similarity is kept as well.
+    """
+    batch_size = batch_size or settings.EXERCISE_ATTEMPTS_CLEANUP_BATCH_SIZE
+    cutoff = timezone.now() - timedelta(hours=settings.CODE_BLOB_GC_GRACE_HOURS)
+    unreferenced = CodeBlob.objects.filter(last_used_at__lt=cutoff).exclude(
+        Exists(ExerciseAttempt.objects.filter(code_blob_id=OuterRef('pk')))
+    ).exclude(
+        Exists(SubmissionSignature.objects.filter(code_blob_id=OuterRef('pk')))
+    )
     
     deleted_count = 0
+    last_id = 0
+    while True:
+        batch = list(unreferenced.filter(id__gt=last_id).order_by('id').values_list('id', flat=True)[:batch_size])
+        if not batch:
+            break
+        last_id = batch[-1]
+        try:
+            deleted_count += CodeBlob.objects.filter(id__in=batch).delete()[0]
+        except ProtectedError:
+            # Referenced again meanwhile; the next run retries the others
+            logger.info("Skipped a batch of code blobs referenced during collection")
     
-    for user in User.objects.all():
-        for exercise_id in ExerciseAttempt.objects.filter(
-            user=user
-        ).values_list('exercise_id', flat=True).distinct():
-            
-            # Keep only last 10 attempts
-            attempts = ExerciseAttempt.objects.filter(
-                user=user,
-                exercise_id=exercise_id
-            ).order_by('-created_at')
-            
-            if attempts.count() > 10:
-                old_attempts = attempts[10:]
-                count = old_attempts.count()
-                old_attempts.delete()
-                deleted_count += count
-    
-    logger.info(f"Cleanup completed. Deleted {deleted_count} old attempts.")
+    logger.info(f"Collected {deleted_count} unreferenced code blobs")
     return deleted_count
+
+
+@shared_task(ignore_result=True)
+def index_submission(exercise_id: int, code_blob_id: int):
+    """Add a submitted code to its exercise's near-duplicate index."""
+    blob = CodeBlob.objects.filter(id=code_blob_id).first()
+    if blob is not None:
+        SimilarityIndex.add(exercise_id, [blob])
+
+
+# Stored playbook output of a validation run
+VALIDATION_OUTPUT_LIMIT = 20000
+
+
+def run_solution_tests(exercise, executor=None):
+    """
+    Run an exercise's solution and grade it with the exercise's test cases.
+    
+    Static tests are checked on the parsed solution; the other ones need one
+    run in an isolated topology. Fingerprint tests are graded against the
+    solution's own state, so they only check that it can be probed, and the
+    state becomes the exercise's reference fingerprint.
+    
+    Returns:
+        Tuple of (test results, execution result or None)
+    """
+    validation_result = AnsibleValidator.validate_playbook(exercise.solution_code)
+    if not validation_result['valid']:
+        return {
+            "passed": False,
+            "total_tests": len(exercise.test_cases),
+            "passed_tests": 0,
+            "failed_tests": len(exercise.test_cases),
+            "test_results": [],
+            "error": "; ".join(validation_result['errors'])
+        }, None
+    
+    static_tests, other_tests = StaticChecker.split(exercise.test_cases)
+    fingerprint_tests, runtime_tests = fingerprint.split(other_tests)
+    static_results = (
+        StaticChecker.run_tests(static_tests, validation_result['data']) if static_tests else None
+    )
+    if not other_tests:
+        return merge_results(static_results), None
+    
+    executor = executor or DockerExecutor()
+    spec = fingerprint.probe_spec(fingerprint_tests)
+    execution_result = executor.run_isolated(
+        exercise.solution_code,
+        executor.prepare_node_image(exercise.precondition_playbook),
+        timeout=exercise.time_limit_seconds,
+        probe_spec=spec or None
+    )
+    
+    fingerprint_results = None
+    state = execution_result.pop('fingerprint', None)
+    if fingerprint_tests:
+        fingerprint_results = FingerprintGrader.run_tests(fingerprint_tests, state or {}, state)
+        if execution_result.get('success') and state:
+            Exercise.objects.filter(id=exercise.id).update(reference_fingerprint={
+                'version': FingerprintGrader.version_of(exercise, spec),
+                'nodes': state,
+            })
+    
+    test_results = merge_results(
+        static_results,
+        TestRunner.run_tests(runtime_tests, execution_result),
+        fingerprint_results
+    )
+    return test_results, execution_result
+
+
+@shared_task
+def validate_exercise_solution(exercise_id: int, force: bool = False, publish_on_pass: bool = False):
+    """
+    Check that an exercise's solution passes its own test cases.
+    Triggered by exercise admin saves and by the validate_solutions command.
+    
+    Each exercise version is validated once unless forced; concurrent
+    requests for the same version run it only once.
+    """
+    try:
+        exercise = Exercise.objects.get(id=exercise_id)
+    except Exercise.DoesNotExist:
+        logger.warning(f"Exercise {exercise_id} not found, skipping solution validation")
+        return None
+    
+    version = exercise.solution_version
+    validation, _ = SolutionValidation.objects.get_or_create(exercise=exercise, version=version)
+    if publish_on_pass and not validation.publish_on_pass:
+        SolutionValidation.objects.filter(id=validation.id).update(publish_on_pass=True)
+    
+    # Claim the run; finished validations only run again when forced
+    claimable = ['pending', 'error'] + (['passed', 'failed'] if force else [])
+    claimed = SolutionValidation.objects.filter(
+        id=validation.id,
+        status__in=claimable
+    ).update(status='running', error_message='', completed_at=None)
+    if not claimed:
+        validation.refresh_from_db()
+        if validation.status == 'passed':
+            _publish_if_requested(validation)
+        return validation.status
+    
+    status = 'error'
+    fields = {}
+    try:
+        test_results, execution_result = run_solution_tests(exercise)
+        execution_result = execution_result or {}
+        status = 'passed' if test_results['passed'] else 'failed'
+        fields = {
+            'test_results': test_results,
+            'output': execution_result.get('stdout', '')[-VALIDATION_OUTPUT_LIMIT:],
+            'error_message': test_results.get('error') or execution_result.get('error', ''),
+            'execution_time': execution_result.get('execution_time'),
+        }
+    except Exception as e:
+        logger.error(f"Solution validation of exercise {exercise_id} could not run: {e}")
+        fields = {'error_message': str(e)}
+    finally:
+        SolutionValidation.objects.filter(id=validation.id).update(
+            status=status,
+            completed_at=timezone.now(),
+            **fields
+        )
+    
+    logger.info(f"Solution of exercise {exercise_id} ({version[:12]}): {status}")
+    if status == 'passed':
+        validation.refresh_from_db()
+        _publish_if_requested(validation)
+    return status
+
+
+def _publish_if_requested(validation):
+    """Publish an exercise whose publication waited for this validation."""
+    if not validation.publish_on_pass:
+        return
+    with transaction.atomic():
+        exercise = Exercise.objects.select_for_update().get(id=validation.exercise_id)
+        # Only if the exercise was not edited meanwhile
+        if exercise.solution_version == validation.version and not exercise.is_published:
+            exercise.is_published = True
+            exercise.save(update_fields=['is_published', 'updated_at'])
+            logger.info(f"Published exercise {exercise.id} after solution validation")
+
+
+@shared_task
+def validate_solutions(include_unpublished: bool = False, force: bool = False):
+    """
+    Validate the solutions of all published exercises in parallel, one
+    task per exercise spread across the workers.
+    """
+    exercises = Exercise.objects.all()
+    if not include_unpublished:
+        exercises = exercises.filter(is_published=True)
+    exercise_ids = list(exercises.values_list('id', flat=True))
+    
+    group(
+        validate_exercise_solution.s(exercise_id, force=force)
+        for exercise_id in exercise_ids
+    ).apply_async()
+    
+    logger.info(f"Queued solution validation of {len(exercise_ids)} exercises")
+    return len(exercise_ids)
+
+
+# Regrade sharding: parallel shards per job, code groups per checkpoint
+REGRADE_SHARDS = 8
+REGRADE_BATCH_SIZE = 25
+
+
+def queue_regrade(exercise, created_by=None):
+    """
+    Start regrading an exercise's attempts with its current test cases.
+    
+    Older unfinished regrades of the exercise are cancelled.
+    
+    Returns:
+        The new RegradeJob
+    """
+    with transaction.atomic():
+        RegradeJob.objects.filter(
+            exercise=exercise,
+            status__in=RegradeJob.ACTIVE_STATUSES
+        ).update(
+            status='cancelled',
+            error_message='Superseded by a newer regrade',
+            completed_at=timezone.now()
+        )
+        job = RegradeJob.objects.create(
+            exercise=exercise,
+            version=exercise.solution_version,
+            test_cases=exercise.test_cases,
+            created_by=created_by
+        )
+    transaction.on_commit(lambda: start_regrade.delay(job.id))
+    return job
+
+
+@shared_task(bind=True, max_retries=60)
+def start_regrade(self, job_id: int):
+    """
+    Plan a regrade job and fan its shards out to the workers.
+    Waits until the exercise's solution passes the new test plan.
+    """
+    job = RegradeJob.objects.select_related('exercise').filter(id=job_id, status='pending').first()
+    if job is None:
+        return None
+    exercise = job.exercise
+    
+    def stop(status, message):
+        RegradeJob.objects.filter(id=job_id, status='pending').update(
+            status=status, error_message=message, completed_at=timezone.now()
+        )
+        logger.warning(f"Regrade {job_id} of exercise {exercise.id} {status}: {message}")
+        return status
+    
+    if exercise.solution_version != job.version:
+        return stop('cancelled', 'Exercise changed before the regrade started')
+    
+    # Never regrade against a plan the reference solution does not pass
+    validation = exercise.current_validation()
+    if validation is None or validation.status in ('pending', 'running'):
+        if validation is None:
+            validate_exercise_solution.delay(exercise.id)
+        try:
+            raise self.retry(countdown=30)
+        except self.MaxRetriesExceededError:
+            return stop('failed', 'Solution validation did not finish in time')
+    if validation.status != 'passed':
+        return stop('failed', f"Reference solution validation {validation.status}")
+    
+    attempts = ExerciseAttempt.objects.filter(exercise=exercise)
+    max_attempt_id = attempts.order_by('-id').values_list('id', flat=True).first() or 0
+    # Blobs already carry the hash; attempts not moved to a blob yet are hashed here
+    codes = attempts.filter(id__lte=max_attempt_id).values_list('id', 'code_blob__sha256', 'code_submitted')
+    shards, unique_codes = plan_shards(
+        (
+            (attempt_id, digest or CodeBlob.digest(code))
+            for attempt_id, digest, code in codes.iterator()
+        ),
+        REGRADE_SHARDS
+    )
+    
+    with transaction.atomic():
+        created = [
+            RegradeShard.objects.create(job=job, index=index, groups=groups)
+            for index, groups in enumerate(shards) if groups
+        ]
+        started = RegradeJob.objects.filter(id=job_id, status='pending').update(
+            status='running',
+            max_attempt_id=max_attempt_id,
+            total_attempts=sum(len(ids) for groups in shards for _, ids in groups),
+            unique_codes=unique_codes,
+            started_at=timezone.now()
+        )
+        if not started:
+            transaction.set_rollback(True)
+            return None
+    
+    if not created:
+        finalize_regrade.delay(job_id)
+    for shard in created:
+        run_regrade_shard.delay(shard.id)
+    logger.info(f"Regrade {job_id}: {unique_codes} distinct codes in {len(created)} shards")
+    return job_id
+
+
+@shared_task(bind=True, acks_late=True, max_retries=3)
+def run_regrade_shard(self, shard_id: int):
+    """
+    Regrade one shard, checkpointing after every batch of code groups.
+    Safe to run again after a crash: it resumes after the checkpoint.
+    """
+    shard = RegradeShard.objects.select_related('job__exercise').get(id=shard_id)
+    job = shard.job
+    if job.status != 'running' or shard.status == 'done':
+        return shard.status
+    RegradeShard.objects.filter(id=shard_id).update(status='running')
+    
+    regrader = Regrader(job.exercise, job.test_cases)
+    remaining = [group for group in shard.groups if group[0] > shard.checkpoint]
+    
+    try:
+        for start in range(0, len(remaining), REGRADE_BATCH_SIZE):
+            if RegradeJob.objects.filter(id=job.id).values_list('status', flat=True).first() != 'running':
+                logger.info(f"Regrade {job.id} stopped, leaving shard {shard.index}")
+                return 'stopped'
+            batch = remaining[start:start + REGRADE_BATCH_SIZE]
+            _regrade_batch(shard, regrader, batch)
+    except Exception as e:
+        logger.error(f"Regrade {job.id} shard {shard.index} failed: {e}")
+        if self.request.retries < self.max_retries:
+            raise self.retry(exc=e, countdown=60)
+        RegradeShard.objects.filter(id=shard_id).update(status='failed', error_message=str(e))
+        RegradeJob.objects.filter(id=job.id, status='running').update(
+            status='failed',
+            error_message=f"Shard {shard.index} failed: {e}",
+            completed_at=timezone.now()
+        )
+        raise
+    
+    RegradeShard.objects.filter(id=shard_id).update(status='done')
+    if not job.shards.exclude(status='done').exists():
+        finalize_regrade.delay(job.id)
+    return 'done'
+
+
+def _regrade_batch(shard, regrader, batch) -> None:
+    """Grade code groups and persist them together with the checkpoint."""
+    attempt_ids = [attempt_id for _, ids in batch for attempt_id in ids]
+    attempts = {
+        attempt.id: attempt
+        for attempt in ExerciseAttempt.objects.filter(id__in=attempt_ids).select_related('code_blob').only(
+            'id', 'user_id', 'code_blob__code', 'code_submitted', 'output', 'error_message',
+            'exit_code', 'is_passed', 'test_results'
+        )
+    }
+    
+    # Grading (possibly executing) happens outside the transaction
+    updated, executed = [], 0
+    for _, ids in batch:
+        members = [attempts[attempt_id] for attempt_id in ids if attempt_id in attempts]
+        if not members:
+            continue  # Deleted meanwhile
+        graded, was_executed = regrader.grade_group(members[0].code, members)
+        executed += was_executed
+        for attempt in members:
+            attempt.was_passed = attempt.is_passed
+            attempt.test_results = graded[attempt.id]
+            attempt.is_passed = graded[attempt.id]['passed']
+            updated.append(attempt)
+    
+    deltas = dict(shard.passed_deltas)
+    changed = 0
+    for attempt in updated:
+        if attempt.is_passed != attempt.was_passed:
+            changed += 1
+            key = str(attempt.user_id)
+            deltas[key] = deltas.get(key, 0) + (1 if attempt.is_passed else -1)
+    
+    with transaction.atomic():
+        ExerciseAttempt.objects.bulk_update(updated, ['test_results', 'is_passed'])
+        shard.checkpoint = batch[-1][0]
+        shard.passed_deltas = deltas
+        shard.processed_attempts += sum(len(ids) for _, ids in batch)
+        shard.executed_codes += executed
+        shard.changed_attempts += changed
+        shard.save(update_fields=[
+            'checkpoint', 'passed_deltas', 'processed_attempts',
+            'executed_codes', 'changed_attempts', 'updated_at'
+        ])
+
+
+@shared_task
+def finalize_regrade(job_id: int):
+    """
+    Apply a finished regrade's XP changes in bulk and complete the job.
+    
+    Every passed attempt awarded the exercise's XP, so each user's XP
+    changes by the XP reward times the change in passed attempts.
+    """
+    from apps.accounts.models import User
+    
+    with transaction.atomic():
+        job = RegradeJob.objects.select_for_update().select_related('exercise').filter(
+            id=job_id,
+            status='running'
+        ).first()
+        if job is None or job.shards.exclude(status='done').exists():
+            return None
+        
+        passed_deltas = defaultdict(int)
+        for deltas in job.shards.values_list('passed_deltas', flat=True):
+            for user_id, delta in deltas.items():
+                passed_deltas[int(user_id)] += delta
+        
+        # One UPDATE per distinct XP change rather than per user
+        by_xp = defaultdict(list)
+        for user_id, delta in passed_deltas.items():
+            if delta:
+                by_xp[delta * job.exercise.xp_reward].append(user_id)
+        for xp, user_ids in by_xp.items():
+            User.objects.filter(id__in=user_ids).update(total_xp=Greatest(F('total_xp') + xp, 0))
+        changed_users = [user_id for user_ids in by_xp.values() for user_id in user_ids]
+        if changed_users:
+            # Same leveling as User.add_xp: every 1000 XP = 1 level; levels
+            # reached are kept when a regrade takes XP back
+            User.objects.filter(id__in=changed_users).update(
+                level=Greatest('level', F('total_xp') / 1000 + 1)
+            )
+        
+        # Changed results may change who passed and the best times
+        UserExerciseStatus.rebuild(exercise_id=job.exercise_id, user_ids=passed_deltas.keys())
+        ExerciseStats.reconcile(job.exercise_id)
+        
+        job.status = 'completed'
+        job.xp_changed = sum(xp * len(user_ids) for xp, user_ids in by_xp.items())
+        job.completed_at = timezone.now()
+        job.save(update_fields=['status', 'xp_changed', 'completed_at'])
+    
+    logger.info(
+        f"Regrade {job_id} completed: {len(changed_users)} users, {job.xp_changed:+d} XP"
+    )
+    return job_id
+
+
+@shared_task
+def reconcile_exercise_stats(full: bool = False):
+    """
+    Recompute exercise statistics, repairing drift of the counters.
+    
+    By default only exercises attempted since their last reconciliation
+    are recomputed; hourly via Celery Beat. A full run (daily) also
+    rebuilds every user status the counters are derived from.
+    """
+    exercises = Exercise.objects.all()
+    if not full:
+        exercises = exercises.filter(
+            Q(stats__isnull=True)
+            | Q(stats__reconciled_at__isnull=True)
+            | Q(user_statuses__last_attempt_at__gt=F('stats__reconciled_at'))
+        ).distinct()
+    
+    count = 0
+    for exercise_id in exercises.values_list('id', flat=True):
+        if full:
+            UserExerciseStatus.rebuild(exercise_id=exercise_id)
+        ExerciseStats.reconcile(exercise_id)
+        count += 1
+    
+    logger.info(f"Reconciled statistics of {count} exercises")
+    return count
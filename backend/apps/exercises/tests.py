@@ -1,21 +1,92 @@
 """
 Tests for exercises app.
 """
-from django.test import TestCase
+import gzip
+import io
+import json
+import tempfile
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from pathlib import Path
+from unittest import mock
+
+from django.contrib import admin
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import Count
+from django.urls import reverse
+from django.utils import timezone
 from rest_framework.test import APIClient
 from rest_framework import status
 
-from apps.courses.models import Course, Module, Lesson
-from .models import Exercise, Hint, Submission
+from apps.courses.models import Module, Lesson
+from .admin import ExerciseAdmin
+from .fields import COMPRESSED_MARKER, CURRENT_DICTIONARY, compress_text, decompress_text
+from .models import (
+    ArchivedAttempt, AttemptLimitReached, CodeBlob, Exercise, ExerciseAttempt, ExerciseStats,
+    RegradeJob, RegradeShard, SignatureBucket, SolutionValidation, SubmissionSignature, UserExerciseStatus
+)
+from .services.archive import AttemptArchive
+from .services.partitions import AttemptPartitions, month_start
+from .services.regrade import Regrader, plan_shards
+from .services.similarity import SimilarityIndex, minhash, similarity, tokens
+from .tasks import (
+    cleanup_old_attempts, collect_code_blobs, finalize_regrade, maintain_attempt_partitions,
+    reconcile_exercise_stats, validate_exercise_solution, validate_solutions
+)
 
 User = get_user_model()
 
+# Tests run without HTTPS and Redis
+API_SETTINGS = {
+    'SECURE_SSL_REDIRECT': False,
+    'CACHES': {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+}
+
+
+def create_exercise(slug='test-exercise', **kwargs):
+    """Create a published exercise in a lesson of its own."""
+    module = Module.objects.create(
+        title=f'Module {slug}',
+        slug=f'module-{slug}',
+        description='Test'
+    )
+    lesson = Lesson.objects.create(
+        module=module,
+        title=f'Lesson {slug}',
+        slug=f'lesson-{slug}',
+        content='# Test'
+    )
+    defaults = {
+        'title': 'Test Exercise',
+        'description': 'Write a playbook',
+        'instructions': 'Install nginx',
+        'solution_code': '- hosts: all\n',
+        'is_published': True,
+    }
+    defaults.update(kwargs)
+    return Exercise.objects.create(lesson=lesson, slug=slug, **defaults)
+
 
+def create_attempt(user, exercise, **kwargs):
+    """Record an attempt the way the sandbox does."""
+    defaults = {
+        'code_submitted': '- hosts: all\n',
+        'output': 'ok',
+    }
+    defaults.update(kwargs)
+    return ExerciseAttempt.objects.create(user=user, exercise=exercise, **defaults)
+
+
+@override_settings(**API_SETTINGS)
 class ExerciseTestCase(TestCase):
     """Test Exercise model and endpoints."""
     
     def setUp(self):
+        cache.clear()
         self.client = APIClient()
         
         # Create test user
@@ -26,18 +97,10 @@ class ExerciseTestCase(TestCase):
         )
         
         # Create test data
-        self.course = Course.objects.create(
-            title='Test Course',
-            slug='test-course',
-            description='Test',
-            short_description='Test',
-            is_published=True
-        )
-        
         self.module = Module.objects.create(
-            course=self.course,
             title='Test Module',
             slug='test-module',
+            description='Test',
             is_published=True
         )
         
@@ -54,15 +117,18 @@ class ExerciseTestCase(TestCase):
             title='Test Exercise',
             slug='test-exercise',
             description='Write a playbook',
+            instructions='Print a message',
             difficulty='easy',
-            points=10,
-            initial_code='---\n',
+            xp_reward=10,
+            starter_code='---\n',
+            test_cases=[{'type': 'module_used', 'module': 'debug'}],
             is_published=True
         )
     
     def test_list_exercises(self):
         """Test listing exercises."""
-        response = self.client.get('/api/exercises/exercises/')
+        self.client.force_authenticate(user=self.user)
+        response = self.client.get(reverse('exercises:exercise_list'))
         self.assertEqual(response.status_code, status.HTTP_200_OK)
     
     def test_submit_exercise(self):
@@ -70,26 +136,26 @@ class ExerciseTestCase(TestCase):
         self.client.force_authenticate(user=self.user)
         
         data = {
-            'code': '---\n- hosts: all\n  tasks:\n    - debug: msg="Hello"'
+            'code': '---\n- hosts: all\n  tasks:\n    - debug: msg="Hello"',
+            'exercise_id': self.exercise.id
         }
         
-        response = self.client.post(
-            f'/api/exercises/exercises/{self.exercise.slug}/submit/',
-            data
-        )
-        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        response = self.client.post(reverse('sandbox:execute'), data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertTrue(
-            Submission.objects.filter(
+            ExerciseAttempt.objects.filter(
                 user=self.user,
                 exercise=self.exercise
             ).exists()
         )
 
 
+@override_settings(**API_SETTINGS)
 class HintRevealTestCase(TestCase):
     """Test hint revelation functionality."""
     
     def setUp(self):
+        cache.clear()
         self.client = APIClient()
         
         # Create test data
@@ -99,12 +165,8 @@ class HintRevealTestCase(TestCase):
             password='TestPass123!'
         )
         
-        course = Course.objects.create(
-            title='Test', slug='test', description='T',
-            short_description='T', is_published=True
-        )
         module = Module.objects.create(
-            course=course, title='Test', slug='test', is_published=True
+            title='Test', slug='test', description='T', is_published=True
         )
         lesson = Lesson.objects.create(
             module=module, title='Test', slug='test',
@@ -112,14 +174,8 @@ class HintRevealTestCase(TestCase):
         )
         self.exercise = Exercise.objects.create(
             lesson=lesson, title='Test', slug='test',
-            description='T', is_published=True
-        )
-        
-        self.hint = Hint.objects.create(
-            exercise=self.exercise,
-            order=0,
-            content='Check your syntax',
-            points_penalty=2
+            description='T', instructions='T',
+            hints=['Check your syntax'], is_published=True
         )
     
     def test_reveal_hint(self):
@@ -127,6 +183,894 @@ class HintRevealTestCase(TestCase):
         self.client.force_authenticate(user=self.user)
         
         response = self.client.post(
-            f'/api/exercises/exercises/{self.exercise.slug}/hints/0/reveal/'
+            reverse('exercises:get_hint', args=[self.exercise.id]),
+            {'hint_index': 0},
+            format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+
+@override_settings(**API_SETTINGS)
+class ExerciseListQueriesTestCase(TestCase):
+    """Test the exercise list reads per-user figures from the status read model."""
+    
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            email='test@example.com',
+            username='testuser',
+            password='TestPass123!'
+        )
+        self.other = User.objects.create_user(
+            email='other@example.com',
+            username='other',
+            password='TestPass123!'
         )
-        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+    
+    def list_exercises(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('exercises:exercise_list'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data['results'], len(queries)
+    
+    def test_query_count_does_not_grow(self):
+        """Test the page costs the same queries however many exercises and attempts."""
+        exercise = create_exercise(slug='first')
+        create_attempt(self.user, exercise)
+        _, expected = self.list_exercises()
+        
+        for index in range(5):
+            other = create_exercise(slug=f'more-{index}')
+            for _ in range(3):
+                create_attempt(self.user, other, is_passed=index % 2 == 0)
+                create_attempt(self.other, other, is_passed=True)
+        
+        results, count = self.list_exercises()
+        self.assertEqual(count, expected)
+        self.assertEqual(len(results), 6)
+        figures = {result['slug']: (result['user_attempts'], result['user_passed']) for result in results}
+        self.assertEqual(figures['first'], (1, False))
+        self.assertEqual(figures['more-0'], (3, True))
+        self.assertEqual(figures['more-1'], (3, False))
+
+
+class ExerciseStatsTestCase(TestCase):
+    """Test the precomputed exercise statistics."""
+    
+    def setUp(self):
+        self.users = [
+            User.objects.create_user(
+                email=f'user{index}@example.com',
+                username=f'user{index}',
+                password='TestPass123!'
+            )
+            for index in range(3)
+        ]
+        self.exercise = create_exercise()
+    
+    def test_counters_follow_attempts(self):
+        """Test attempts count attempters, first passes and attempts."""
+        create_attempt(self.users[0], self.exercise, execution_time=1.0)
+        create_attempt(self.users[0], self.exercise, is_passed=True, execution_time=2.0)
+        create_attempt(self.users[0], self.exercise, is_passed=True, execution_time=3.0)
+        create_attempt(self.users[1], self.exercise, execution_time=4.0)
+        
+        stats = ExerciseStats.objects.get(exercise=self.exercise)
+        self.assertEqual((stats.attempters, stats.passers, stats.total_attempts), (2, 1, 4))
+        self.assertEqual(self.exercise.completion_rate, 50.0)
+        # Percentiles are left to reconcile()
+        self.assertIsNone(stats.median_execution_time)
+    
+    def test_reconcile_repairs_drift(self):
+        """Test reconcile recomputes counters and percentiles."""
+        for index, user in enumerate(self.users):
+            create_attempt(user, self.exercise, is_passed=index > 0, execution_time=float(index + 1))
+        ExerciseStats.objects.filter(exercise=self.exercise).update(attempters=7, passers=0, total_attempts=1)
+        
+        stats = ExerciseStats.reconcile(self.exercise.id)
+        self.assertEqual((stats.attempters, stats.passers, stats.total_attempts), (3, 2, 3))
+        self.assertEqual((stats.median_execution_time, stats.p95_execution_time), (2.0, 3.0))
+        self.assertIsNotNone(stats.reconciled_at)
+    
+    def test_reconcile_task_skips_unchanged_exercises(self):
+        """Test the incremental run only recomputes exercises attempted since."""
+        idle = create_exercise(slug='idle')
+        create_attempt(self.users[0], self.exercise, execution_time=1.0)
+        create_attempt(self.users[0], idle, execution_time=1.0)
+        self.assertEqual(reconcile_exercise_stats(), 2)
+        self.assertEqual(reconcile_exercise_stats(), 0)
+        
+        create_attempt(self.users[1], self.exercise, execution_time=1.0)
+        self.assertEqual(reconcile_exercise_stats(), 1)
+        self.assertEqual(reconcile_exercise_stats(full=True), 2)
+
+
+@override_settings(**API_SETTINGS)
+class ExerciseTimingsTestCase(TestCase):
+    """Test the staff endpoint aggregating execution timings."""
+    
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            email='student@example.com',
+            username='student',
+            password='TestPass123!'
+        )
+        self.staff = User.objects.create_user(
+            email='staff@example.com',
+            username='staff',
+            password='TestPass123!',
+            is_staff=True
+        )
+        self.exercise = create_exercise()
+        self.url = reverse('exercises:exercise_timings', args=[self.exercise.id])
+        self.client = APIClient()
+    
+    def test_timings_are_aggregated(self):
+        """Test phases and slowest tasks over the recorded attempts."""
+        for total, apt in ((2.0, 1.0), (4.0, 3.0)):
+            create_attempt(self.user, self.exercise, timings={
+                'total': total,
+                'tasks': [['Gathering Facts', 'gather_facts', 0.5], ['Install nginx', 'apt', apt]],
+            })
+        create_attempt(self.user, self.exercise)
+        
+        self.client.force_authenticate(self.staff)
+        response = self.client.get(self.url, {'limit': 1})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['executions'], 2)
+        self.assertEqual(response.data['phases']['total'], {'avg': 3.0, 'p95': 4.0, 'max': 4.0})
+        self.assertEqual(response.data['slowest_tasks'], [{
+            'name': 'Install nginx', 'action': 'apt', 'count': 2, 'avg': 2.0, 'p95': 3.0, 'max': 3.0,
+        }])
+    
+    def test_students_are_rejected(self):
+        """Test the endpoint is for staff only."""
+        self.client.force_authenticate(self.user)
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_403_FORBIDDEN)
+
+
+class AttemptLimitTestCase(TestCase):
+    """Test attempt numbering and the attempt limit."""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='test@example.com',
+            username='testuser',
+            password='TestPass123!'
+        )
+        self.exercise = create_exercise(max_attempts=2)
+    
+    def test_attempts_are_numbered(self):
+        """Test attempts of a user are numbered from 1."""
+        numbers = [create_attempt(self.user, self.exercise).attempt_number for _ in range(2)]
+        self.assertEqual(numbers, [1, 2])
+    
+    def test_limit_is_enforced(self):
+        """Test an attempt beyond max_attempts is not stored."""
+        create_attempt(self.user, self.exercise)
+        self.assertTrue(UserExerciseStatus.has_attempts_left(self.user.id, self.exercise))
+        create_attempt(self.user, self.exercise)
+        self.assertFalse(UserExerciseStatus.has_attempts_left(self.user.id, self.exercise))
+        
+        with self.assertRaises(AttemptLimitReached):
+            create_attempt(self.user, self.exercise)
+        self.assertEqual(ExerciseAttempt.objects.count(), 2)
+        self.assertEqual(UserExerciseStatus.objects.get().attempts_count, 2)
+    
+    def test_unlimited_attempts(self):
+        """Test max_attempts 0 never limits."""
+        Exercise.objects.filter(id=self.exercise.id).update(max_attempts=0)
+        self.exercise.refresh_from_db()
+        for _ in range(3):
+            create_attempt(self.user, self.exercise)
+        self.assertTrue(UserExerciseStatus.has_attempts_left(self.user.id, self.exercise))
+        self.assertEqual(UserExerciseStatus.objects.get().attempts_count, 3)
+    
+    def test_numbering_continues_stored_attempts(self):
+        """Test a missing status is seeded from the stored attempts."""
+        Exercise.objects.filter(id=self.exercise.id).update(max_attempts=0)
+        self.exercise.refresh_from_db()
+        create_attempt(self.user, self.exercise)
+        create_attempt(self.user, self.exercise)
+        UserExerciseStatus.objects.all().delete()
+        
+        self.assertEqual(create_attempt(self.user, self.exercise).attempt_number, 3)
+
+
+class ArchiveTestMixin:
+    """Archive attempts to a temporary directory."""
+    
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.archive_dir = directory.name
+        settings_override = override_settings(EXERCISE_ATTEMPTS_ARCHIVE_DIR=self.archive_dir, **API_SETTINGS)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+
+@mock.patch('apps.exercises.tasks.time.sleep')
+class AttemptCleanupTestCase(ArchiveTestMixin, TestCase):
+    """Test retention of the latest attempts per user and exercise."""
+    
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(
+            email='test@example.com',
+            username='testuser',
+            password='TestPass123!'
+        )
+        self.other = User.objects.create_user(
+            email='other@example.com',
+            username='other',
+            password='TestPass123!'
+        )
+        self.exercise = create_exercise(max_attempts=0)
+        self.attempts = [create_attempt(self.user, self.exercise) for _ in range(5)]
+        create_attempt(self.other, self.exercise)
+        # Attempts of the same instant are ranked by ID
+        ExerciseAttempt.objects.update(created_at=self.attempts[0].created_at)
+    
+    def test_archives_surplus_attempts(self, sleep):
+        """Test only the newest `keep` attempts of each user stay in the database."""
+        self.assertEqual(cleanup_old_attempts(keep=2, batch_size=2), 3)
+        kept = ExerciseAttempt.objects.filter(user=self.user).values_list('id', flat=True)
+        self.assertEqual(sorted(kept), [attempt.id for attempt in self.attempts[3:]])
+        self.assertEqual(ExerciseAttempt.objects.filter(user=self.other).count(), 1)
+        # The surplus is moved to the archive, one file per batch
+        archived = ArchivedAttempt.objects.order_by('id').values_list('id', flat=True)
+        self.assertEqual(list(archived), [attempt.id for attempt in self.attempts[:3]])
+        self.assertEqual(len(list(Path(self.archive_dir).rglob('*.ndjson.gz'))), 2)
+        # Retention does not reset the counters
+        self.assertEqual(UserExerciseStatus.objects.get(user=self.user).attempts_count, 5)
+
+
+class AttemptArchiveTestCase(ArchiveTestMixin, TestCase):
+    """Test moving attempts to cold storage and reading them back."""
+    
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(
+            email='test@example.com',
+            username='testuser',
+            password='TestPass123!'
+        )
+        self.exercise = create_exercise(max_attempts=0)
+        self.attempts = [
+            create_attempt(
+                self.user,
+                self.exercise,
+                code_submitted=f'- hosts: web{index}\n',
+                output=f'PLAY RECAP {index}',
+                is_passed=index == 1,
+                execution_time=float(index)
+            )
+            for index in range(250)
+        ]
+    
+    def test_round_trip(self):
+        """Test every archived attempt reads back as stored."""
+        archive = AttemptArchive()
+        self.assertEqual(archive.store(ExerciseAttempt.objects.select_related('code_blob')), 250)
+        self.assertFalse(ExerciseAttempt.objects.exists())
+        
+        path, = Path(self.archive_dir).rglob('*.ndjson.gz')
+        # Concatenated gzip members read as one stream
+        with gzip.open(path, 'rt') as archive_file:
+            self.assertEqual([json.loads(line)['id'] for line in archive_file], [a.id for a in self.attempts])
+        
+        for attempt in (self.attempts[0], self.attempts[1], self.attempts[249]):
+            entry = ArchivedAttempt.objects.get(id=attempt.id)
+            loaded = archive.load(entry)
+            self.assertEqual(loaded.code, attempt.code)
+            self.assertEqual(loaded.output, attempt.output)
+            self.assertEqual(
+                (loaded.attempt_number, loaded.is_passed, loaded.execution_time, loaded.created_at),
+                (attempt.attempt_number, attempt.is_passed, attempt.execution_time, attempt.created_at)
+            )
+    
+    def test_archived_attempt_detail(self):
+        """Test the attempt detail is served from the archive."""
+        attempt = self.attempts[1]
+        AttemptArchive().store([ExerciseAttempt.objects.get(id=attempt.id)])
+        client = APIClient()
+        client.force_authenticate(user=self.user)
+        
+        response = client.get(reverse('exercises:attempt_detail', args=[attempt.id]))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.data['archived'])
+        self.assertEqual(response.data['output'], attempt.output)
+    
+    def test_status_keeps_archived_passes(self):
+        """Test rebuilding statuses counts archived attempts."""
+        AttemptArchive().store(ExerciseAttempt.objects.filter(is_passed=True))
+        UserExerciseStatus.objects.all().delete()
+        UserExerciseStatus.rebuild(exercise_id=self.exercise.id)
+        status_row = UserExerciseStatus.objects.get()
+        self.assertEqual((status_row.attempts_count, status_row.passed, status_row.best_time), (250, True, 1.0))
+
+
+class AttemptPartitionsTestCase(TestCase):
+    """Test monthly partition maintenance of exercise_attempts."""
+    
+    def setUp(self):
+        # Partition maintenance issues PostgreSQL DDL; record it instead
+        patcher = mock.patch('apps.exercises.services.partitions.connection')
+        self.connection = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.cursor = self.connection.cursor.return_value.__enter__.return_value
+        patcher = mock.patch(
+            'apps.exercises.services.partitions.timezone.now',
+            return_value=datetime(2024, 11, 15, tzinfo=dt_timezone.utc)
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.partitions = AttemptPartitions()
+    
+    def attached(self, *months):
+        return mock.patch.object(AttemptPartitions, 'partitions', return_value={
+            month: self.partitions.partition_name(month) for month in months
+        })
+    
+    def statements(self):
+        return [call.args[0] for call in self.cursor.execute.call_args_list]
+    
+    def test_month_start(self):
+        """Test month arithmetic across years."""
+        self.assertEqual(month_start(date(2024, 11, 15)), date(2024, 11, 1))
+        self.assertEqual(month_start(date(2024, 11, 15), 2), date(2025, 1, 1))
+        self.assertEqual(month_start(date(2024, 1, 31), -1), date(2023, 12, 1))
+        self.assertEqual(month_start(date(2024, 1, 31), -13), date(2022, 12, 1))
+    
+    def test_ensure_partitions_creates_missing_months(self):
+        """Test only the missing months ahead are created."""
+        with self.attached(date(2024, 11, 1)):
+            created = self.partitions.ensure_partitions(2)
+        self.assertEqual(created, ['exercise_attempts_p202412', 'exercise_attempts_p202501'])
+        self.assertEqual(self.statements(), [
+            'CREATE TABLE IF NOT EXISTS "exercise_attempts_p202412" PARTITION OF "exercise_attempts" '
+            "FOR VALUES FROM ('2024-12-01T00:00:00+00:00') TO ('2025-01-01T00:00:00+00:00')",
+            'CREATE TABLE IF NOT EXISTS "exercise_attempts_p202501" PARTITION OF "exercise_attempts" '
+            "FOR VALUES FROM ('2025-01-01T00:00:00+00:00') TO ('2025-02-01T00:00:00+00:00')",
+        ])
+    
+    def test_expire_partitions_beyond_retention(self):
+        """Test partitions older than the retention are detached, or dropped."""
+        with self.attached(date(2024, 7, 1), date(2024, 8, 1), date(2024, 9, 1)):
+            expired = self.partitions.expire_partitions(3, drop=True)
+        self.assertEqual(expired, ['exercise_attempts_p202407'])
+        self.assertEqual(self.statements(), [
+            'ALTER TABLE "exercise_attempts" DETACH PARTITION "exercise_attempts_p202407"',
+            'DROP TABLE "exercise_attempts_p202407"',
+        ])
+    
+    def test_maintenance_skips_plain_table(self):
+        """Test maintenance does nothing before the table is partitioned."""
+        self.connection.vendor = 'sqlite'
+        self.assertEqual(maintain_attempt_partitions(), {"created": [], "expired": []})
+        self.cursor.execute.assert_not_called()
+
+
+PLAY_OUTPUT = (
+    "\nPLAY [all] " + "*" * 64 + "\n"
+    "\nTASK [Gathering Facts] " + "*" * 64 + "\nok: [node1]\nok: [node2]\n"
+    "\nTASK [Install nginx] " + "*" * 64 + "\nchanged: [node1]\nchanged: [node2]\n"
+    "\nPLAY RECAP " + "*" * 64 + "\n"
+    "node1                      : ok=2    changed=1    unreachable=0    failed=0    "
+    "skipped=0    rescued=0    ignored=0   \n"
+)
+
+
+class CompressedTextFieldTestCase(TestCase):
+    """Test attempt text stored compressed."""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='test@example.com',
+            username='testuser',
+            password='TestPass123!'
+        )
+        self.exercise = create_exercise(max_attempts=0)
+    
+    def stored_output(self, attempt_id):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT output FROM exercise_attempts WHERE id = %s", [attempt_id])
+            return bytes(cursor.fetchone()[0])
+    
+    def test_compress_round_trip(self):
+        """Test long text is compressed with the dictionary and restored."""
+        data = compress_text(PLAY_OUTPUT)
+        self.assertEqual(data[:2], bytes([COMPRESSED_MARKER, CURRENT_DICTIONARY]))
+        self.assertLess(len(data), len(PLAY_OUTPUT) // 4)
+        self.assertEqual(decompress_text(data), PLAY_OUTPUT)
+        
+        text = 'Установка nginx — ' * 10
+        self.assertEqual(decompress_text(compress_text(text)), text)
+    
+    def test_short_text_stored_plain(self):
+        """Test text too short to be worth compressing is kept as UTF-8."""
+        self.assertEqual(compress_text('ok: [node1]'), b'ok: [node1]')
+        self.assertEqual(decompress_text(b'ok: [node1]'), 'ok: [node1]')
+    
+    def test_attempt_round_trip(self):
+        """Test attempt output is compressed in the database and read back."""
+        attempt = create_attempt(self.user, self.exercise, output=PLAY_OUTPUT)
+        self.assertEqual(self.stored_output(attempt.id)[:1], bytes([COMPRESSED_MARKER]))
+        
+        attempt = ExerciseAttempt.objects.get(id=attempt.id)
+        self.assertEqual(attempt.output, PLAY_OUTPUT)
+        self.assertEqual(attempt.output_preview, PLAY_OUTPUT[-ExerciseAttempt.OUTPUT_PREVIEW_LENGTH:])
+    
+    def test_legacy_rows(self):
+        """Test rows stored as plain text read back and are compressed by the command."""
+        attempt = create_attempt(self.user, self.exercise)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "UPDATE exercise_attempts SET output = %s, output_preview = '' WHERE id = %s",
+                [PLAY_OUTPUT.encode('utf-8'), attempt.id]
+            )
+        self.assertEqual(ExerciseAttempt.objects.get(id=attempt.id).output, PLAY_OUTPUT)
+        
+        call_command('compress_attempt_text', stdout=io.StringIO())
+        self.assertEqual(self.stored_output(attempt.id)[:1], bytes([COMPRESSED_MARKER]))
+        attempt = ExerciseAttempt.objects.get(id=attempt.id)
+        self.assertEqual(attempt.output, PLAY_OUTPUT)
+        self.assertTrue(PLAY_OUTPUT.endswith(attempt.output_preview))
+
+
+@override_settings(CODE_BLOB_GC_GRACE_HOURS=24)
+class CodeBlobTestCase(TestCase):
+    """Test deduplicated storage of submitted code."""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='test@example.com',
+            username='testuser',
+            password='TestPass123!'
+        )
+        self.exercise = create_exercise(max_attempts=0)
+    
+    def test_identical_code_shares_a_blob(self):
+        """Test attempts with the same code reference one blob."""
+        first = create_attempt(self.user, self.exercise, code_submitted='- hosts: web\n')
+        second = create_attempt(self.user, self.exercise, code_submitted='- hosts: web\n')
+        other = create_attempt(self.user, self.exercise, code_submitted='- hosts: db\n')
+        
+        self.assertEqual(first.code_blob_id, second.code_blob_id)
+        self.assertNotEqual(first.code_blob_id, other.code_blob_id)
+        self.assertEqual(CodeBlob.objects.count(), 2)
+        attempt = ExerciseAttempt.objects.get(id=second.id)
+        self.assertEqual((attempt.code, attempt.code_submitted), ('- hosts: web\n', ''))
+        self.assertEqual(attempt.code_blob.sha256, CodeBlob.digest('- hosts: web\n'))
+    
+    def test_collect_unreferenced_blobs(self):
+        """Test only blobs nothing references are collected after the grace period."""
+        referenced = create_attempt(self.user, self.exercise, code_submitted='- hosts: web\n').code_blob
+        signed = CodeBlob.store('- hosts: db\n')
+        SubmissionSignature.objects.create(exercise=self.exercise, code_blob=signed, minhash=[1, 2])
+        orphan = CodeBlob.store('- hosts: all\n')
+        recent = CodeBlob.store('- hosts: new\n')
+        CodeBlob.objects.exclude(id=recent.id).update(last_used_at=timezone.now() - timedelta(days=2))
+        
+        self.assertEqual(collect_code_blobs(batch_size=1), 1)
+        self.assertEqual(
+            set(CodeBlob.objects.values_list('id', flat=True)),
+            {referenced.id, signed.id, recent.id}
+        )
+        self.assertFalse(CodeBlob.objects.filter(id=orphan.id).exists())
+        self.assertTrue(SubmissionSignature.objects.filter(code_blob=signed).exists())
+
+
+class SolutionValidationTestCase(TestCase):
+    """Test publication waits for the solution to pass its own test cases."""
+    
+    def setUp(self):
+        self.staff = User.objects.create_user(
+            email='staff@example.com',
+            username='staff',
+            password='TestPass123!',
+            is_staff=True
+        )
+        self.exercise = create_exercise(
+            is_published=False,
+            test_cases=[{'type': 'exit_code', 'expected': 0}]
+        )
+        patcher = mock.patch('apps.exercises.tasks.DockerExecutor')
+        self.executor = patcher.start().return_value
+        self.addCleanup(patcher.stop)
+        self.executor.prepare_node_image.return_value = 'baseline'
+        self.succeed(True)
+        patcher = mock.patch('apps.exercises.admin.messages')
+        self.messages = patcher.start()
+        self.addCleanup(patcher.stop)
+        # Queued validations run right away
+        patcher = mock.patch.object(
+            validate_exercise_solution, 'delay', side_effect=validate_exercise_solution
+        )
+        self.delay = patcher.start()
+        self.addCleanup(patcher.stop)
+    
+    def succeed(self, passed):
+        self.executor.run_isolated.return_value = {
+            'success': passed, 'exit_code': 0 if passed else 2, 'stdout': 'PLAY RECAP', 'stderr': '',
+            'execution_time': 1.0,
+        }
+    
+    def save(self, *changed_data, **fields):
+        """Save the exercise through the admin, running the validation it queues."""
+        for name, value in fields.items():
+            setattr(self.exercise, name, value)
+        request = RequestFactory().post('/admin/')
+        request.user = self.staff
+        with self.captureOnCommitCallbacks(execute=True):
+            ExerciseAdmin(Exercise, admin.site).save_model(
+                request, self.exercise, mock.Mock(changed_data=list(changed_data)), change=True
+            )
+        self.exercise.refresh_from_db()
+        return self.exercise.current_validation()
+    
+    def test_publication_waits_for_passing_solution(self):
+        """Test publishing is deferred on save and done once the solution passes."""
+        self.delay.side_effect = None
+        self.save('is_published', is_published=True)
+        self.delay.assert_called_once_with(self.exercise.id, publish_on_pass=True)
+        self.assertFalse(self.exercise.is_published)
+        self.messages.warning.assert_called_once()
+        
+        self.assertEqual(validate_exercise_solution(self.exercise.id, publish_on_pass=True), 'passed')
+        self.exercise.refresh_from_db()
+        self.assertTrue(self.exercise.is_published)
+        self.assertEqual(self.exercise.current_validation().status, 'passed')
+    
+    def test_failing_solution_stays_unpublished(self):
+        """Test an exercise whose solution fails is never published."""
+        self.succeed(False)
+        validation = self.save('is_published', is_published=True)
+        self.assertEqual((validation.status, validation.publish_on_pass), ('failed', True))
+        self.assertFalse(self.exercise.is_published)
+        
+        # Asking again reports the failure without running it again
+        self.executor.run_isolated.reset_mock()
+        self.save('is_published', is_published=True)
+        self.assertFalse(self.exercise.is_published)
+        self.messages.error.assert_called_once()
+        self.executor.run_isolated.assert_not_called()
+    
+    def test_running_validation_is_claimed_once(self):
+        """Test a version being validated is not run by a second task."""
+        SolutionValidation.objects.create(
+            exercise=self.exercise, version=self.exercise.solution_version, status='running'
+        )
+        self.assertEqual(validate_exercise_solution(self.exercise.id, publish_on_pass=True), 'running')
+        self.executor.run_isolated.assert_not_called()
+        validation = self.exercise.current_validation()
+        self.assertTrue(validation.publish_on_pass)
+        
+        SolutionValidation.objects.filter(id=validation.id).update(status='passed')
+        self.assertEqual(validate_exercise_solution(self.exercise.id), 'passed')
+        self.executor.run_isolated.assert_not_called()
+        self.exercise.refresh_from_db()
+        self.assertTrue(self.exercise.is_published)
+        
+        self.assertEqual(validate_exercise_solution(self.exercise.id, force=True), 'passed')
+        self.executor.run_isolated.assert_called_once()
+    
+    @mock.patch('apps.sandbox.tasks.build_precondition_image')
+    def test_changes_revalidate_solution(self, build):
+        """Test editing what decides the result validates the new version."""
+        self.assertEqual(self.save('is_published', is_published=True).status, 'passed')
+        self.assertTrue(self.exercise.is_published)
+        
+        self.assertEqual(self.save('title', title='Renamed').status, 'passed')
+        self.assertEqual(self.executor.run_isolated.call_count, 1)
+        
+        changes = [
+            ('solution_code', '- hosts: all\n  tasks: []\n'),
+            ('test_cases', [{'type': 'exit_code', 'expected': 0, 'name': 'Runs'}]),
+            ('precondition_playbook', '- hosts: all\n  tasks: []\n'),
+        ]
+        for count, (field, value) in enumerate(changes, start=2):
+            with self.subTest(field=field):
+                validation = self.save(field, **{field: value})
+                self.assertEqual(validation.status, 'passed')
+                self.assertEqual(self.executor.run_isolated.call_count, count)
+                self.assertTrue(self.exercise.is_published)
+        self.assertEqual(self.exercise.validations.count(), 4)
+        build.delay.assert_called_once_with(self.exercise.id)
+    
+    @mock.patch('apps.exercises.tasks.group')
+    def test_validate_solutions_queues_published_exercises(self, group):
+        """Test every published exercise gets its own validation task."""
+        published = create_exercise(slug='published')
+        self.assertEqual(validate_solutions(), 1)
+        signatures = list(group.call_args.args[0])
+        self.assertEqual([signature.args for signature in signatures], [(published.id,)])
+        
+        self.assertEqual(validate_solutions(include_unpublished=True, force=True), 2)
+        signatures = list(group.call_args.args[0])
+        self.assertEqual({signature.kwargs['force'] for signature in signatures}, {True})
+
+
+class RegradeTestCase(TestCase):
+    """Test planning and grading of regrades."""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='test@example.com',
+            username='testuser',
+            password='TestPass123!'
+        )
+        self.exercise = create_exercise(max_attempts=0)
+    
+    def test_plan_shards_groups_identical_code(self):
+        """Test attempts are grouped by code hash and each group lands in one shard."""
+        web, db = CodeBlob.digest('- hosts: web\n'), CodeBlob.digest('- hosts: db\n')
+        shards, unique_codes = plan_shards([(1, web), (2, db), (3, web)], 4)
+        
+        self.assertEqual(unique_codes, 2)
+        self.assertEqual(len(shards), 4)
+        groups = [group for shard in shards for group in shard]
+        self.assertEqual(sorted(groups), sorted([[web, [1, 3]], [db, [2]]]))
+        self.assertIn([web, [1, 3]], shards[int(web[:8], 16) % 4])
+        self.assertEqual(plan_shards([(3, web), (2, db), (1, web)], 4)[1], 2)
+    
+    def test_grade_group_reuses_stored_output(self):
+        """Test attempts with a stored exit code are regraded without running."""
+        executor = mock.MagicMock()
+        regrader = Regrader(self.exercise, [
+            {'type': 'output_contains', 'name': 'Recap', 'expected': 'changed=1'},
+        ], executor=executor)
+        code = '- hosts: all\n  tasks: []\n'
+        passing = create_attempt(self.user, self.exercise, code_submitted=code, output='changed=1', exit_code=0)
+        failing = create_attempt(self.user, self.exercise, code_submitted=code, output='changed=0', exit_code=0)
+        
+        graded, executed = regrader.grade_group(code, [passing, failing])
+        self.assertFalse(executed)
+        self.assertEqual((graded[passing.id]['passed'], graded[failing.id]['passed']), (True, False))
+        executor.run_isolated.assert_not_called()
+    
+    def test_grade_group_runs_code_once(self):
+        """Test a group with attempts lacking an exit code is executed once."""
+        executor = mock.MagicMock()
+        executor.run_isolated.return_value = {'success': True, 'exit_code': 0, 'stdout': 'changed=1', 'stderr': ''}
+        regrader = Regrader(self.exercise, [
+            {'type': 'output_contains', 'name': 'Recap', 'expected': 'changed=1'},
+        ], executor=executor)
+        code = '- hosts: all\n  tasks: []\n'
+        attempts = [create_attempt(self.user, self.exercise, code_submitted=code) for _ in range(3)]
+        
+        graded, executed = regrader.grade_group(code, attempts)
+        self.assertTrue(executed)
+        self.assertTrue(all(result['passed'] for result in graded.values()))
+        executor.run_isolated.assert_called_once()
+    
+    def test_finalize_applies_xp_changes(self):
+        """Test regrades move XP both ways but never take a level back."""
+        other = User.objects.create_user(
+            email='other@example.com',
+            username='other',
+            password='TestPass123!'
+        )
+        User.objects.filter(id=self.user.id).update(total_xp=1050, level=2)
+        User.objects.filter(id=other.id).update(total_xp=950, level=1)
+        job = RegradeJob.objects.create(
+            exercise=self.exercise, version='v2', status='running', total_attempts=2
+        )
+        RegradeShard.objects.create(job=job, index=0, status='done', passed_deltas={
+            str(self.user.id): -1, str(other.id): 1,
+        })
+        
+        self.assertEqual(finalize_regrade(job.id), job.id)
+        self.user.refresh_from_db()
+        other.refresh_from_db()
+        self.assertEqual((self.user.total_xp, self.user.level), (950, 2))
+        self.assertEqual((other.total_xp, other.level), (1050, 2))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.xp_changed), ('completed', 0))
+
+
+@override_settings(**API_SETTINGS)
+class AttemptPaginationTestCase(TestCase):
+    """Test keyset pagination of the attempt history."""
+    
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            email='test@example.com',
+            username='testuser',
+            password='TestPass123!'
+        )
+        self.exercise = create_exercise(max_attempts=0)
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        attempts = [create_attempt(self.user, self.exercise) for _ in range(7)]
+        # Three attempts of the same instant in the middle of the history
+        now = timezone.now()
+        for index, attempt in enumerate(attempts):
+            created_at = now - timedelta(minutes=min(index, 3) if index <= 5 else index)
+            ExerciseAttempt.objects.filter(id=attempt.id).update(created_at=created_at)
+        self.expected = list(
+            ExerciseAttempt.objects.order_by('-created_at', '-id').values_list('id', flat=True)
+        )
+    
+    def history(self, **params):
+        ids = []
+        url = reverse('exercises:attempt_list', args=[self.exercise.id])
+        response = self.client.get(url, {'page_size': 2, **params})
+        while True:
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertLessEqual(len(response.data['results']), 2)
+            ids.extend(attempt['id'] for attempt in response.data['results'])
+            if response.data['next'] is None:
+                return ids
+            response = self.client.get(response.data['next'])
+    
+    def test_pages_break_ties_by_id(self):
+        """Test following the cursor visits every attempt once, newest first."""
+        self.assertEqual(self.history(), self.expected)
+        self.assertEqual(self.history(slim=1), self.expected)
+    
+    def test_invalid_cursor(self):
+        """Test a malformed cursor is rejected."""
+        response = self.client.get(
+            reverse('exercises:attempt_list', args=[self.exercise.id]),
+            {'cursor': 'not-a-cursor'}
+        )
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+STARTER_PLAYBOOK = """---
+- name: Configure web servers
+  hosts: web
+  become: true
+  tasks:
+    - name: Install nginx
+      ansible.builtin.package:
+        name: nginx
+        state: present
+"""
+
+
+def solution_playbook(port=8080, user='deploy'):
+    return STARTER_PLAYBOOK + f"""    - name: Create the deploy user
+      ansible.builtin.user:
+        name: {user}
+        shell: /bin/bash
+    - name: Deploy the site configuration
+      ansible.builtin.template:
+        src: site.conf.j2
+        dest: /etc/nginx/conf.d/site.conf
+        mode: "0644"
+      notify: restart nginx
+    - name: Open the firewall
+      ansible.posix.firewalld:
+        port: {port}/tcp
+        permanent: true
+        state: enabled
+    - name: Start nginx
+      ansible.builtin.service:
+        name: nginx
+        state: started
+        enabled: true
+  handlers:
+    - name: restart nginx
+      ansible.builtin.service:
+        name: nginx
+        state: restarted
+"""
+
+
+DATABASE_PLAYBOOK = """---
+- hosts: db
+  become: true
+  vars:
+    postgres_version: 16
+  tasks:
+    - ansible.builtin.apt:
+        name: "postgresql-{{ postgres_version }}"
+        state: present
+        update_cache: true
+    - community.postgresql.postgresql_db:
+        name: shop
+        encoding: UTF-8
+    - community.postgresql.postgresql_user:
+        db: shop
+        name: shop
+        password: "{{ vault_shop_password }}"
+        priv: ALL
+    - ansible.builtin.lineinfile:
+        path: /etc/postgresql/16/main/postgresql.conf
+        regexp: "^listen_addresses"
+        line: "listen_addresses = '*'"
+      notify: restart postgresql
+  handlers:
+    - ansible.builtin.service:
+        name: postgresql
+        state: restarted
+"""
+
+
+class SimilarityTestCase(TestCase):
+    """Test near-duplicate detection of submissions."""
+    
+    def setUp(self):
+        self.users = [
+            User.objects.create_user(
+                email=f'user{index}@example.com',
+                username=f'user{index}',
+                password='TestPass123!'
+            )
+            for index in range(12)
+        ]
+        self.exercise = create_exercise(max_attempts=0, starter_code=STARTER_PLAYBOOK)
+    
+    def submit(self, user, code):
+        attempt = create_attempt(user, self.exercise, code_submitted=code)
+        SimilarityIndex.add(self.exercise.id, [attempt.code_blob])
+        return attempt
+    
+    def cluster_users(self):
+        return sorted(
+            sorted({user['username'] for submission in cluster['submissions'] for user in submission['users']})
+            for cluster in SimilarityIndex.clusters(self.exercise)
+        )
+    
+    def test_tokens_ignore_comments_names_and_case(self):
+        """Test renaming tasks or adding comments leaves the signature unchanged."""
+        renamed = solution_playbook().replace('Start nginx', 'Bring the server up') + '# done\n'
+        self.assertEqual(tokens(renamed), tokens(solution_playbook().upper().lower()))
+        self.assertEqual(minhash(renamed), minhash(solution_playbook()))
+        self.assertGreaterEqual(similarity(minhash(solution_playbook()), minhash(solution_playbook(port=8443))), 0.8)
+        self.assertLess(similarity(minhash(solution_playbook()), minhash(STARTER_PLAYBOOK)), 0.5)
+    
+    def test_clusters_near_duplicates_of_different_users(self):
+        """Test copies across users are clustered, own resubmissions and starter code are not."""
+        self.submit(self.users[0], solution_playbook())
+        self.submit(self.users[1], solution_playbook(port=8443))
+        self.submit(self.users[2], solution_playbook(user='www', port=9000).replace('present', 'latest'))
+        # Identical code of two users
+        self.submit(self.users[3], DATABASE_PLAYBOOK)
+        self.submit(self.users[4], DATABASE_PLAYBOOK)
+        # One student's resubmissions
+        self.submit(self.users[5], DATABASE_PLAYBOOK.replace('present', 'latest'))
+        self.submit(self.users[5], DATABASE_PLAYBOOK.replace('present', 'latest') + '    - meta: flush_handlers\n')
+        # Barely changed starter code
+        self.submit(self.users[6], STARTER_PLAYBOOK)
+        self.submit(self.users[7], STARTER_PLAYBOOK.replace('nginx', 'apache2', 1))
+        
+        self.assertEqual(self.cluster_users(), [
+            ['user0', 'user1', 'user2'],
+            ['user3', 'user4', 'user5'],
+        ])
+    
+    def test_starter_code_is_not_a_cluster(self):
+        """Test submissions near the starter code are left out even when identical."""
+        self.submit(self.users[0], STARTER_PLAYBOOK)
+        self.submit(self.users[1], STARTER_PLAYBOOK)
+        self.submit(self.users[2], STARTER_PLAYBOOK + '# TODO\n')
+        self.assertEqual(self.cluster_users(), [])
+    
+    def test_bucket_size_is_capped(self):
+        """Test oversized buckets are sampled instead of compared pairwise."""
+        for index, user in enumerate(self.users):
+            self.submit(user, solution_playbook(port=8000 + index))
+        
+        colliding = SignatureBucket.objects.filter(exercise=self.exercise).values('band', 'bucket').annotate(
+            members=Count('id')
+        ).filter(members__gt=1).count()
+        
+        with mock.patch('apps.exercises.services.similarity.similarity', wraps=similarity) as compare:
+            SimilarityIndex.clusters(self.exercise)
+        uncapped = compare.call_count
+        with mock.patch('apps.exercises.services.similarity.MAX_BUCKET_SIZE', 2), \
+                mock.patch('apps.exercises.services.similarity.similarity', wraps=similarity) as compare:
+            clusters = SimilarityIndex.clusters(self.exercise)
+        # One comparison per signature against the starter code, then at
+        # most one pair per bucket
+        self.assertLessEqual(compare.call_count - len(self.users), colliding)
+        self.assertLess(compare.call_count, uncapped)
+        self.assertTrue(clusters)
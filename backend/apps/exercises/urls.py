@@ -6,7 +6,12 @@ from .views import (
     ExerciseListView,
     ExerciseDetailView,
     ExerciseAttemptListView,
-    GetHintView
+    ArchivedAttemptListView,
+    ExerciseAttemptDetailView,
+    GetHintView,
+    ExerciseTimingsView,
+    ExerciseRegradeView,
+    ExerciseSimilarityView
 )
 
 app_name = 'exercises'
@@ -15,5 +20,10 @@ urlpatterns = [
     path('', ExerciseListView.as_view(), name='exercise_list'),
     path('<int:pk>/', ExerciseDetailView.as_view(), name='exercise_detail'),
     path('<int:exercise_id>/attempts/', ExerciseAttemptListView.as_view(), name='attempt_list'),
+    path('<int:exercise_id>/attempts/archived/', ArchivedAttemptListView.as_view(), name='archived_attempt_list'),
+    path('attempts/<int:attempt_id>/', ExerciseAttemptDetailView.as_view(), name='attempt_detail'),
     path('<int:exercise_id>/hint/', GetHintView.as_view(), name='get_hint'),
+    path('<int:exercise_id>/timings/', ExerciseTimingsView.as_view(), name='exercise_timings'),
+    path('<int:exercise_id>/regrade/', ExerciseRegradeView.as_view(), name='exercise_regrade'),
+    path('<int:exercise_id>/similarity/', ExerciseSimilarityView.as_view(), name='exercise_similarity'),
 ]
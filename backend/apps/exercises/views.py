@@ -4,13 +4,22 @@ Views for exercises.
 from rest_framework import generics, permissions, status
 from rest_framework.views import APIView
 from rest_framework.response import Response
+from django.db.models import F, FilteredRelation, Q
+from django.db.models.functions import Coalesce
 from django_filters.rest_framework import DjangoFilterBackend
 
-from .models import Exercise, ExerciseAttempt
+from apps.sandbox.services.timings import summarize_timings
+from .models import ArchivedAttempt, Exercise, ExerciseAttempt, RegradeJob
+from .pagination import AttemptCursorPagination
+from .services.archive import AttemptArchive
+from .services.similarity import SimilarityIndex
 from .serializers import (
     ExerciseListSerializer,
     ExerciseDetailSerializer,
     ExerciseAttemptSerializer,
+    ExerciseAttemptListSerializer,
+    ExerciseAttemptSummarySerializer,
+    ArchivedAttemptSerializer,
     HintRequestSerializer
 )
 
@@ -27,7 +36,16 @@ class ExerciseListView(generics.ListAPIView):
     filterset_fields = ['lesson', 'difficulty']
     
     def get_queryset(self):
-        return Exercise.objects.filter(is_published=True).order_by('lesson', 'order')
+        # Per-user figures come from the status read model and completion
+        # from the precomputed stats, joined once for the whole page
+        return Exercise.objects.filter(is_published=True).select_related('lesson', 'stats').annotate(
+            user_status=FilteredRelation(
+                'user_statuses',
+                condition=Q(user_statuses__user=self.request.user)
+            ),
+            user_attempts=Coalesce(F('user_status__attempts_count'), 0),
+            user_passed=Coalesce(F('user_status__passed'), False),
+        ).order_by('lesson', 'order')
 
 
 class ExerciseDetailView(generics.RetrieveAPIView):
@@ -43,21 +61,97 @@ class ExerciseDetailView(generics.RetrieveAPIView):
 
 class ExerciseAttemptListView(generics.ListAPIView):
     """
-    List user's attempts for an exercise.
+    List user's attempts for an exercise, newest first, with output previews.
     
-    GET /api/exercises/{exercise_id}/attempts/
+    GET /api/exercises/{exercise_id}/attempts/?cursor=&page_size=&slim=1
+    
+    Cursor-paginated: follow `next` for older attempts. With slim=1 only
+    the fields of the attempt history are returned.
+    """
+    serializer_class = ExerciseAttemptListSerializer
+    pagination_class = AttemptCursorPagination
+    permission_classes = [permissions.IsAuthenticated]
+    
+    @property
+    def slim(self) -> bool:
+        return self.request.query_params.get('slim') in ('1', 'true')
+    
+    def get_serializer_class(self):
+        if self.slim:
+            return ExerciseAttemptSummarySerializer
+        return ExerciseAttemptListSerializer
+    
+    def get_queryset(self):
+        exercise_id = self.kwargs.get('exercise_id')
+        attempts = ExerciseAttempt.objects.filter(
+            exercise_id=exercise_id,
+            user=self.request.user
+        )
+        if self.slim:
+            return attempts.only(*ExerciseAttemptSummarySerializer.Meta.fields)
+        return attempts.select_related('exercise').only(
+            *(field for field in ExerciseAttemptListSerializer.Meta.fields if field != 'exercise_title'),
+            'exercise__title'
+        )
+
+
+class ArchivedAttemptListView(generics.ListAPIView):
     """
-    serializer_class = ExerciseAttemptSerializer
+    List user's archived attempts for an exercise.
+    
+    GET /api/exercises/{exercise_id}/attempts/archived/
+    """
+    serializer_class = ArchivedAttemptSerializer
     permission_classes = [permissions.IsAuthenticated]
     
     def get_queryset(self):
         exercise_id = self.kwargs.get('exercise_id')
-        return ExerciseAttempt.objects.filter(
+        return ArchivedAttempt.objects.filter(
             exercise_id=exercise_id,
             user=self.request.user
         ).order_by('-created_at')
 
 
+class ExerciseAttemptDetailView(APIView):
+    """
+    Get one of the user's attempts, reading it from the archive if moved there.
+    
+    GET /api/exercises/attempts/{attempt_id}/
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    
+    def get(self, request, attempt_id):
+        archived = False
+        attempt = ExerciseAttempt.objects.select_related('exercise', 'code_blob').filter(
+            id=attempt_id,
+            user=request.user
+        ).first()
+        if attempt is None:
+            entry = ArchivedAttempt.objects.select_related('exercise').filter(
+                id=attempt_id,
+                user=request.user
+            ).first()
+            if entry is None:
+                return Response(
+                    {"error": "Attempt not found"},
+                    status=status.HTTP_404_NOT_FOUND
+                )
+            try:
+                attempt = AttemptArchive().load(entry)
+            except OSError:
+                return Response(
+                    {"error": "Archived attempt is not available"},
+                    status=status.HTTP_503_SERVICE_UNAVAILABLE
+                )
+            attempt.exercise = entry.exercise
+            archived = True
+        
+        return Response({
+            **ExerciseAttemptSerializer(attempt).data,
+            "archived": archived
+        }, status=status.HTTP_200_OK)
+
+
 class GetHintView(APIView):
     """
     Get a hint for an exercise.
@@ -92,3 +186,122 @@ class GetHintView(APIView):
             "hint_index": hint_index,
             "total_hints": len(hints)
         }, status=status.HTTP_200_OK)
+
+
+class ExerciseTimingsView(APIView):
+    """
+    Phase timings and slowest tasks of an exercise's recent executions, for staff.
+    
+    GET /api/exercises/{exercise_id}/timings/?limit=10
+    """
+    permission_classes = [permissions.IsAdminUser]
+    
+    # Most recent attempts included in the aggregate
+    SAMPLE_SIZE = 500
+    
+    def get(self, request, exercise_id):
+        if not Exercise.objects.filter(id=exercise_id).exists():
+            return Response(
+                {"error": "Exercise not found"},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        
+        try:
+            limit = max(1, min(int(request.query_params.get('limit', 10)), 50))
+        except ValueError:
+            return Response(
+                {"error": "limit must be an integer"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        timings = ExerciseAttempt.objects.filter(
+            exercise_id=exercise_id
+        ).exclude(
+            timings={}
+        ).order_by('-created_at').values_list('timings', flat=True)[:self.SAMPLE_SIZE]
+        
+        return Response({
+            "exercise_id": exercise_id,
+            **summarize_timings(timings, limit=limit)
+        }, status=status.HTTP_200_OK)
+
+
+class ExerciseRegradeView(APIView):
+    """
+    Regrade an exercise's attempts with its current test cases, for staff.
+    
+    GET /api/exercises/{exercise_id}/regrade/ - latest regrade and its progress
+    POST /api/exercises/{exercise_id}/regrade/ - start a regrade
+    """
+    permission_classes = [permissions.IsAdminUser]
+    
+    @staticmethod
+    def _job_data(job):
+        return {
+            "id": job.id,
+            "exercise_id": job.exercise_id,
+            "status": job.status,
+            "total_attempts": job.total_attempts,
+            "unique_codes": job.unique_codes,
+            "progress": job.progress(),
+            "xp_changed": job.xp_changed,
+            "error": job.error_message or None,
+            "created_at": job.created_at,
+            "started_at": job.started_at,
+            "completed_at": job.completed_at,
+        }
+    
+    def get(self, request, exercise_id):
+        job = RegradeJob.objects.filter(exercise_id=exercise_id).order_by('-created_at').first()
+        if job is None:
+            return Response(
+                {"error": "No regrade found for this exercise"},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        return Response(self._job_data(job), status=status.HTTP_200_OK)
+    
+    def post(self, request, exercise_id):
+        from .tasks import queue_regrade
+        
+        exercise = Exercise.objects.filter(id=exercise_id).first()
+        if exercise is None:
+            return Response(
+                {"error": "Exercise not found"},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        job = queue_regrade(exercise, created_by=request.user)
+        return Response(self._job_data(job), status=status.HTTP_202_ACCEPTED)
+
+
+class ExerciseSimilarityView(APIView):
+    """
+    Clusters of near-identical submissions to an exercise by different users, for staff.
+    
+    GET /api/exercises/{exercise_id}/similarity/?threshold=0.8
+    """
+    permission_classes = [permissions.IsAdminUser]
+    
+    def get(self, request, exercise_id):
+        exercise = Exercise.objects.filter(id=exercise_id).only('id', 'starter_code').first()
+        if exercise is None:
+            return Response(
+                {"error": "Exercise not found"},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        
+        try:
+            threshold = float(request.query_params.get('threshold', SimilarityIndex.THRESHOLD))
+        except ValueError:
+            threshold = -1
+        if not 0 < threshold <= 1:
+            return Response(
+                {"error": "threshold must be a number between 0 and 1"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        clusters = SimilarityIndex.clusters(exercise, threshold)
+        return Response({
+            "exercise_id": exercise.id,
+            "threshold": threshold,
+            "clusters": clusters
+        }, status=status.HTTP_200_OK)
@@ -15,7 +15,7 @@ from .serializers import (
     MarkLessonCompleteSerializer
 )
 from apps.courses.models import Module, Lesson
-from apps.exercises.models import ExerciseAttempt
+from apps.exercises.models import UserExerciseStatus
 
 
 class UserProgressOverviewView(APIView):
@@ -51,15 +51,15 @@ class UserProgressOverviewView(APIView):
             is_completed=True
         ).count()
         
-        # Exercise stats
-        total_exercises_attempted = ExerciseAttempt.objects.filter(
+        # Exercise stats (statuses also cover archived attempts)
+        total_exercises_attempted = UserExerciseStatus.objects.filter(
             user=user
-        ).values('exercise').distinct().count()
+        ).count()
         
-        exercises_passed = ExerciseAttempt.objects.filter(
+        exercises_passed = UserExerciseStatus.objects.filter(
             user=user,
-            is_passed=True
-        ).values('exercise').distinct().count()
+            passed=True
+        ).count()
         
         # Daily streak
         streak, _ = DailyStreak.objects.get_or_create(user=user)
@@ -211,10 +211,10 @@ class LeaderboardView(APIView):
         
         leaderboard = []
         for rank, user in enumerate(top_users, start=1):
-            completed_exercises = ExerciseAttempt.objects.filter(
+            completed_exercises = UserExerciseStatus.objects.filter(
                 user=user,
-                is_passed=True
-            ).values('exercise').distinct().count()
+                passed=True
+            ).count()
             
             leaderboard.append({
                 'rank': rank,
@@ -2,7 +2,7 @@
 Admin interface for sandbox.
 """
 from django.contrib import admin
-from .models import SandboxSession
+from .models import SandboxSession, WorkspaceVolume
 
 
 @admin.register(SandboxSession)
@@ -12,3 +12,11 @@ class SandboxSessionAdmin(admin.ModelAdmin):
     search_fields = ['user__email', 'container_name', 'container_id']
     readonly_fields = ['container_id', 'container_name', 'created_at', 'last_activity']
     ordering = ['-created_at']
+
+
+@admin.register(WorkspaceVolume)
+class WorkspaceVolumeAdmin(admin.ModelAdmin):
+    list_display = ['user', 'size_bytes', 'created_at', 'last_used_at']
+    search_fields = ['user__email']
+    readonly_fields = ['size_bytes', 'created_at', 'last_used_at']
+    ordering = ['last_used_at']
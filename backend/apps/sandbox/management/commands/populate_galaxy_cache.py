@@ -0,0 +1,107 @@
+"""
+Populate the offline Galaxy content cache mounted into sandboxes.
+"""
+import re
+from pathlib import Path
+
+import yaml
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.sandbox.services import DockerExecutor
+
+EXACT_VERSION = re.compile(r'^\d+(\.\d+)*([-+][0-9A-Za-z.-]+)?$')
+TARBALL_SUFFIXES = ('.tar.gz', '.tgz')
+
+
+class Command(BaseCommand):
+    help = (
+        'Install pinned Ansible collections and roles into the read-only '
+        'volume mounted into sandbox controllers.'
+    )
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--requirements',
+            default=settings.SANDBOX_GALAXY_REQUIREMENTS,
+            help='ansible-galaxy requirements file (default: SANDBOX_GALAXY_REQUIREMENTS)'
+        )
+        parser.add_argument(
+            '--tarballs',
+            help='Install collection and role archives from this directory instead, without network'
+        )
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Reinstall even if the volume already holds the same content'
+        )
+        parser.add_argument(
+            '--allow-unpinned',
+            action='store_true',
+            help='Accept requirements without an exact version'
+        )
+    
+    def handle(self, *args, **options):
+        requirements = ''
+        tarballs = {}
+        
+        if options['tarballs']:
+            directory = Path(options['tarballs'])
+            if not directory.is_dir():
+                raise CommandError(f"{directory} is not a directory")
+            tarballs = {
+                path.name: path.read_bytes()
+                for path in sorted(directory.iterdir())
+                if path.name.endswith(TARBALL_SUFFIXES)
+            }
+            if not tarballs:
+                raise CommandError(f"No .tar.gz archives found in {directory}")
+        else:
+            path = Path(options['requirements'])
+            if not path.is_file():
+                raise CommandError(f"Requirements file {path} not found")
+            requirements = path.read_text()
+            self._check_pins(requirements, options['allow_unpinned'])
+        
+        try:
+            result = DockerExecutor().populate_galaxy_cache(
+                requirements,
+                tarballs=tarballs,
+                force=options['force']
+            )
+        except Exception as e:
+            raise CommandError(f"Failed to populate Galaxy cache: {e}")
+        
+        if options['verbosity'] > 1 and result['output']:
+            self.stdout.write(result['output'])
+        
+        volume = settings.SANDBOX_GALAXY_CACHE_VOLUME
+        if result['changed']:
+            self.stdout.write(self.style.SUCCESS(
+                f"Galaxy cache {volume} populated ({result['digest'][:12]})"
+            ))
+        else:
+            self.stdout.write(f"Galaxy cache {volume} is up to date ({result['digest'][:12]})")
+    
+    def _check_pins(self, requirements: str, allow_unpinned: bool) -> None:
+        """Reject requirements that could resolve to different content later."""
+        try:
+            data = yaml.safe_load(requirements) or {}
+        except yaml.YAMLError as e:
+            raise CommandError(f"Invalid requirements file: {e}")
+        if not isinstance(data, dict):
+            raise CommandError("Requirements file must define 'collections' and/or 'roles'")
+        
+        unpinned = []
+        for section in ('collections', 'roles'):
+            for entry in data.get(section) or []:
+                if isinstance(entry, str):
+                    entry = {'name': entry}
+                version = str(entry.get('version', ''))
+                if not EXACT_VERSION.match(version):
+                    unpinned.append(f"{section}: {entry.get('name') or entry.get('src')}")
+        
+        if unpinned and not allow_unpinned:
+            raise CommandError(
+                "Requirements must pin exact versions:\n  " + "\n  ".join(unpinned)
+            )
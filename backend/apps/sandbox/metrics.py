@@ -0,0 +1,124 @@
+"""
+Lightweight sandbox counters kept in the cache, bucketed per day.
+"""
+from datetime import timedelta
+from typing import Any, Dict
+
+from django.core.cache import cache
+from django.utils import timezone
+
+# Counters are kept a little longer than the longest report window
+COUNTER_TTL = 60 * 60 * 24 * 35
+
+PREFETCH_COUNTERS = [
+    'prefetch_issued',    # reservations started by the prefetch endpoint
+    'prefetch_hit',       # create claimed a ready reservation
+    'prefetch_partial',   # create claimed a reservation still provisioning
+    'prefetch_expired',   # reservation released unclaimed
+    'create_miss',        # create had to provision from scratch
+    'create_ms_hit',      # total create latency of claimed reservations
+    'create_ms_miss',     # total create latency without a reservation
+]
+
+WARM_POOL_COUNTERS = [
+    'warm_pool_hit',      # sandbox started from a warm pool sandbox
+    'warm_pool_miss',     # warm pool empty, provisioned from scratch
+]
+
+EARLY_ABORT_COUNTERS = [
+    'early_abort_eligible',  # graded runs that could be stopped on a failure
+    'early_abort',           # runs stopped once their tests were decided
+    'early_abort_ms_run',    # total run time of stopped runs
+    'early_abort_ms_saved',  # estimated run time saved by stopping them
+]
+
+
+def _key(name: str, day) -> str:
+    return f"djarvis:metrics:{name}:{day:%Y%m%d}"
+
+
+def incr(name: str, amount: int = 1) -> None:
+    """Increment today's value of a counter."""
+    key = _key(name, timezone.now().date())
+    cache.add(key, 0, COUNTER_TTL)
+    try:
+        cache.incr(key, amount)
+    except ValueError:
+        # Evicted between add and incr
+        cache.set(key, amount, COUNTER_TTL)
+
+
+def totals(names, days: int = 7) -> Dict[str, int]:
+    """Sum counters over the last `days` days, today included."""
+    today = timezone.now().date()
+    keys = {
+        _key(name, today - timedelta(days=offset)): name
+        for name in names
+        for offset in range(days)
+    }
+    result = dict.fromkeys(names, 0)
+    for key, value in cache.get_many(list(keys)).items():
+        result[keys[key]] += int(value)
+    return result
+
+
+def prefetch_report(days: int = 7) -> Dict[str, Any]:
+    """
+    Prefetch effectiveness over the last `days` days.
+    
+    Partial hits count as hits: the student still waits less than for a
+    sandbox provisioned from scratch.
+    """
+    counts = totals(PREFETCH_COUNTERS, days)
+    claimed = counts['prefetch_hit'] + counts['prefetch_partial']
+    creates = claimed + counts['create_miss']
+    
+    return {
+        'days': days,
+        **{name: counts[name] for name in PREFETCH_COUNTERS if not name.startswith('create_ms')},
+        'hit_rate': claimed / creates if creates else None,
+        'waste_rate': (
+            counts['prefetch_expired'] / counts['prefetch_issued']
+            if counts['prefetch_issued'] else None
+        ),
+        'avg_create_seconds_hit': (
+            counts['create_ms_hit'] / claimed / 1000 if claimed else None
+        ),
+        'avg_create_seconds_miss': (
+            counts['create_ms_miss'] / counts['create_miss'] / 1000
+            if counts['create_miss'] else None
+        ),
+    }
+
+
+def warm_pool_report(days: int = 7) -> Dict[str, Any]:
+    """Warm pool hit rate over the last `days` days."""
+    counts = totals(WARM_POOL_COUNTERS, days)
+    total = counts['warm_pool_hit'] + counts['warm_pool_miss']
+    return {
+        'days': days,
+        **counts,
+        'hit_rate': counts['warm_pool_hit'] / total if total else None,
+    }
+
+
+def early_abort_report(days: int = 7) -> Dict[str, Any]:
+    """
+    Runs stopped early over the last `days` days and the time saved.
+    
+    Savings are estimated per run from the exercise's recent complete runs.
+    """
+    counts = totals(EARLY_ABORT_COUNTERS, days)
+    aborted = counts['early_abort']
+    return {
+        'days': days,
+        'eligible': counts['early_abort_eligible'],
+        'aborted': aborted,
+        'abort_rate': (
+            aborted / counts['early_abort_eligible']
+            if counts['early_abort_eligible'] else None
+        ),
+        'avg_seconds_run': counts['early_abort_ms_run'] / aborted / 1000 if aborted else None,
+        'avg_seconds_saved': counts['early_abort_ms_saved'] / aborted / 1000 if aborted else None,
+        'total_seconds_saved': counts['early_abort_ms_saved'] / 1000,
+    }
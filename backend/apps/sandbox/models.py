@@ -12,27 +12,33 @@ class SandboxSession(models.Model):
     Tracks active sandbox containers for students.
     
     Attributes:
-        user: Student using the sandbox
+        user: Student using the sandbox (empty for unclaimed warm sandboxes)
         container_id: Docker container ID
         container_name: Unique container name
-        status: Current status (starting, running, stopped, error)
-        created_at: When session was created
+        status: Current status (warm, reserved, starting, running, stopped, error)
+        node_image: Image the managed nodes currently run
+        created_at: When session was created (claimed, for warm sandboxes)
         expires_at: When session should be cleaned up
         last_activity: Last time container was used
     """
     
     STATUS_CHOICES = [
+        ('warm', 'Warm'),
+        ('reserved', 'Reserved'),
         ('starting', 'Starting'),
         ('running', 'Running'),
         ('stopped', 'Stopped'),
         ('error', 'Error'),
         ('expired', 'Expired'),
+        ('released', 'Released'),
     ]
     
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE,
-        related_name='sandbox_sessions'
+        related_name='sandbox_sessions',
+        null=True,
+        blank=True
     )
     container_id = models.CharField(
         max_length=64,
@@ -49,6 +55,11 @@ class SandboxSession(models.Model):
         choices=STATUS_CHOICES,
         default='starting'
     )
+    node_image = models.CharField(
+        max_length=200,
+        blank=True,
+        help_text='Managed node image (baseline or exercise precondition)'
+    )
     created_at = models.DateTimeField(auto_now_add=True)
     expires_at = models.DateTimeField()
     last_activity = models.DateTimeField(auto_now=True)
@@ -59,10 +70,12 @@ class SandboxSession(models.Model):
         indexes = [
             models.Index(fields=['user', 'status']),
             models.Index(fields=['expires_at']),
+            models.Index(fields=['status', 'created_at']),
         ]
     
     def __str__(self) -> str:
-        return f"{self.user.email} - {self.container_name} ({self.status})"
+        owner = self.user.email if self.user else 'warm pool'
+        return f"{owner} - {self.container_name} ({self.status})"
     
     def save(self, *args, **kwargs):
         # Set expiration time on creation
@@ -72,6 +85,11 @@ class SandboxSession(models.Model):
             )
         super().save(*args, **kwargs)
     
+    @property
+    def is_ready(self) -> bool:
+        """Whether the sandbox containers have been provisioned."""
+        return bool(self.container_id)
+    
     @property
     def is_expired(self) -> bool:
         """Check if session has expired."""
@@ -81,3 +99,41 @@ class SandboxSession(models.Model):
         """Extend session expiration time."""
         self.expires_at = timezone.now() + timedelta(minutes=minutes)
         self.save(update_fields=['expires_at'])
+
+
+class WorkspaceVolume(models.Model):
+    """
+    Tracks a user's persistent sandbox volumes (workspace and fact cache).
+    
+    Attributes:
+        user: Owner of the volumes
+        size_bytes: Disk usage reported by Docker at the last eviction run
+        created_at: When the volumes were first created
+        last_used_at: Last time a sandbox used the volumes (LRU key)
+    """
+    
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='workspace_volume'
+    )
+    size_bytes = models.BigIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_used_at = models.DateTimeField(default=timezone.now)
+    
+    class Meta:
+        db_table = 'sandbox_workspace_volumes'
+        ordering = ['last_used_at']
+        indexes = [
+            models.Index(fields=['last_used_at']),
+        ]
+    
+    def __str__(self) -> str:
+        return f"{self.user.email} - {self.size_bytes} bytes"
+    
+    @classmethod
+    def touch(cls, user) -> None:
+        """Mark the user's volumes as recently used."""
+        updated = cls.objects.filter(user=user).update(last_used_at=timezone.now())
+        if not updated:
+            cls.objects.get_or_create(user=user)
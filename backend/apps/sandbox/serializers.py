@@ -9,14 +9,33 @@ class SandboxSessionSerializer(serializers.ModelSerializer):
     """Serializer for sandbox sessions."""
     
     is_expired = serializers.BooleanField(read_only=True)
+    is_ready = serializers.BooleanField(read_only=True)
     
     class Meta:
         model = SandboxSession
         fields = [
-            'id', 'container_id', 'container_name', 'status',
-            'created_at', 'expires_at', 'last_activity', 'is_expired'
+            'id', 'container_id', 'container_name', 'status', 'node_image',
+            'created_at', 'expires_at', 'last_activity', 'is_expired', 'is_ready'
         ]
-        read_only_fields = ['container_id', 'container_name', 'status']
+        read_only_fields = ['container_id', 'container_name', 'status', 'node_image']
+
+
+class CreateSandboxSerializer(serializers.Serializer):
+    """Serializer for sandbox creation requests."""
+    
+    exercise_id = serializers.IntegerField(
+        required=False,
+        help_text='Optional exercise ID to start from its precondition state'
+    )
+
+
+class PrefetchSandboxSerializer(serializers.Serializer):
+    """Serializer for speculative sandbox prefetch requests."""
+    
+    exercise_id = serializers.IntegerField(
+        required=True,
+        help_text='Exercise whose sandbox topology should be prepared'
+    )
 
 
 class ExecuteCodeSerializer(serializers.Serializer):
@@ -46,6 +65,11 @@ class ExecutionResultSerializer(serializers.Serializer):
     stdout = serializers.CharField(allow_blank=True)
     stderr = serializers.CharField(allow_blank=True)
     execution_time = serializers.FloatField(required=False)
+    queue_wait_time = serializers.FloatField(required=False)
+    timings = serializers.DictField(required=False)
     error = serializers.CharField(required=False, allow_blank=True)
     test_results = serializers.DictField(required=False)
     is_passed = serializers.BooleanField(required=False)
+    executed = serializers.BooleanField(required=False)
+    aborted = serializers.BooleanField(required=False)
+    abort_reason = serializers.CharField(required=False, allow_blank=True)
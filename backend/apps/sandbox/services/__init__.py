@@ -1,5 +1,6 @@
 from .docker_executor import DockerExecutor
 from .ansible_validator import AnsibleValidator
 from .test_runner import TestRunner
+from .static_checks import StaticChecker
 
-__all__ = ['DockerExecutor', 'AnsibleValidator', 'TestRunner']
+__all__ = ['DockerExecutor', 'AnsibleValidator', 'TestRunner', 'StaticChecker']
@@ -0,0 +1,280 @@
+"""
+Client for the execution agent running inside sandbox controllers.
+"""
+import base64
+import json
+import logging
+import queue
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from django_redis import get_redis_connection
+from docker.utils.socket import frames_iter, STDOUT
+from redis.exceptions import RedisError
+
+logger = logging.getLogger(__name__)
+
+AGENT_SOURCE = (Path(__file__).parent / 'sandbox_agent.py').read_text()
+
+# Environment variable carrying the agent source into the controller
+AGENT_ENV = 'DJARVIS_AGENT'
+AGENT_COMMAND = f'exec python3 -u -c "${AGENT_ENV}"'
+
+# Value of the "agent" label of containers running the current agent protocol
+AGENT_PROTOCOL = '2'
+
+
+class AgentError(Exception):
+    """Raised when the agent connection fails or a request errors out."""
+
+
+class AgentConnection:
+    """
+    Persistent connection to the agent of one controller container.
+    
+    The connection attaches to the container's stdin/stdout once and is
+    reused for every command; responses are routed to callers by request ID.
+    Connections are cached per process, one per container.
+    
+    Every web and worker process attaches on its own, and Docker copies all
+    their writes into the one stdin of the agent. A request line is only
+    sent while holding a per-container Redis lock, until the agent reports
+    it has read the whole line, so lines of concurrent clients never mix.
+    """
+    
+    # Seconds the agent has to read a request line
+    ACCEPT_TIMEOUT = 30
+    
+    _connections: Dict[str, 'AgentConnection'] = {}
+    _registry_lock = threading.Lock()
+    
+    def __init__(self, container):
+        self.container_name = container.name
+        self._socket = container.attach_socket(
+            params={'stdin': 1, 'stdout': 1, 'stderr': 1, 'stream': 1}
+        )
+        self._raw = getattr(self._socket, '_sock', self._socket)
+        self._send_lock = threading.Lock()
+        self._pending: Dict[str, queue.Queue] = {}
+        self._pending_lock = threading.Lock()
+        self.closed = False
+        self._reader = threading.Thread(target=self._read_loop, daemon=True)
+        self._reader.start()
+    
+    @classmethod
+    def for_container(cls, container) -> 'AgentConnection':
+        """Get the cached live connection to a container, or open one."""
+        with cls._registry_lock:
+            connection = cls._connections.get(container.name)
+            if connection is None or connection.closed:
+                connection = cls(container)
+                cls._connections[container.name] = connection
+            return connection
+    
+    @classmethod
+    def cached(cls, container_name: str) -> Optional['AgentConnection']:
+        """Get an already open connection without any Docker API call."""
+        with cls._registry_lock:
+            connection = cls._connections.get(container_name)
+        if connection is None or connection.closed:
+            return None
+        return connection
+    
+    @classmethod
+    def discard(cls, container_name: str) -> None:
+        """Close and forget the connection to a container."""
+        with cls._registry_lock:
+            connection = cls._connections.pop(container_name, None)
+        if connection is not None:
+            connection.close()
+    
+    def close(self) -> None:
+        self.closed = True
+        try:
+            self._socket.close()
+        except Exception:
+            pass
+        with self._pending_lock:
+            pending = list(self._pending.values())
+        for events in pending:
+            events.put({'event': 'error', 'error': 'Agent connection closed'})
+    
+    def _read_loop(self) -> None:
+        """Demultiplex agent events from the attached stream."""
+        buffer = b''
+        try:
+            for stream, data in frames_iter(self._socket, tty=False):
+                if stream != STDOUT:
+                    logger.warning(f"Agent {self.container_name}: {data.decode('utf-8', errors='replace').strip()}")
+                    continue
+                buffer += data
+                while b'\n' in buffer:
+                    line, buffer = buffer.split(b'\n', 1)
+                    self._dispatch(line)
+        except Exception as e:
+            logger.warning(f"Agent connection to {self.container_name} lost: {e}")
+        finally:
+            self.close()
+    
+    def _dispatch(self, line: bytes) -> None:
+        try:
+            event = json.loads(line)
+        except ValueError:
+            return
+        with self._pending_lock:
+            events = self._pending.get(event.get('id'))
+        # Events for other clients attached to the same agent are ignored
+        if events is not None:
+            events.put(event)
+    
+    def _request(self, op: str, **payload) -> Tuple[str, queue.Queue]:
+        if self.closed:
+            raise AgentError('Agent connection closed')
+        request_id = uuid.uuid4().hex
+        events: queue.Queue = queue.Queue()
+        with self._pending_lock:
+            self._pending[request_id] = events
+        line = json.dumps({'id': request_id, 'op': op, **payload}) + '\n'
+        try:
+            with self._send_lock, self._stdin_lock():
+                self._raw.sendall(line.encode('utf-8'))
+                try:
+                    event = events.get(timeout=self.ACCEPT_TIMEOUT)
+                except queue.Empty:
+                    event = {'event': 'error', 'error': 'Agent did not accept the request'}
+        except OSError as e:
+            self._forget(request_id)
+            self.close()
+            raise AgentError(f'Failed to send request: {e}')
+        except RedisError as e:
+            self._forget(request_id)
+            raise AgentError(f'Failed to lock the agent stdin: {e}')
+        if event.get('event') != 'accepted':
+            self._forget(request_id)
+            raise AgentError(event.get('error', 'Agent error'))
+        return request_id, events
+    
+    def _stdin_lock(self):
+        """Lock on the agent's stdin shared by all processes."""
+        return get_redis_connection('default').lock(
+            f'djarvis:agent_stdin:{self.container_name}',
+            timeout=self.ACCEPT_TIMEOUT + 5,
+            blocking_timeout=self.ACCEPT_TIMEOUT
+        )
+    
+    def _forget(self, request_id: str) -> None:
+        with self._pending_lock:
+            self._pending.pop(request_id, None)
+    
+    def _wait_done(self, request_id: str, events: queue.Queue, timeout: float) -> Dict[str, Any]:
+        try:
+            event = events.get(timeout=timeout)
+        except queue.Empty:
+            raise AgentError('Agent request timed out')
+        finally:
+            self._forget(request_id)
+        if event.get('event') == 'error':
+            raise AgentError(event.get('error', 'Agent error'))
+        return event
+    
+    @staticmethod
+    def _encode_files(files: Dict[str, str]) -> Dict[str, str]:
+        return {
+            path: base64.b64encode(content.encode('utf-8')).decode('ascii')
+            for path, content in files.items()
+        }
+    
+    def write_files(self, files: Dict[str, str], base: str, timeout: float = 30) -> None:
+        """Write text files relative to a base directory."""
+        request_id, events = self._request(
+            'write_files', base=base, files=self._encode_files(files)
+        )
+        self._wait_done(request_id, events, timeout)
+    
+    def probe(self, timeout: float = 5) -> Dict[str, Any]:
+        """Check agent liveness and list running jobs (controller health check)."""
+        request_id, events = self._request('probe')
+        return self._wait_done(request_id, events, timeout)
+    
+    def kill(self, job_id: str, timeout: float = 5) -> bool:
+        """Kill a running job's process group."""
+        request_id, events = self._request('kill', target=job_id)
+        return bool(self._wait_done(request_id, events, timeout).get('ok'))
+    
+    def run(
+        self,
+        argv: List[str],
+        cwd: Optional[str] = None,
+        env: Optional[Dict[str, str]] = None,
+        timeout: Optional[int] = None,
+        files: Optional[Dict[str, str]] = None,
+        base: Optional[str] = None,
+        on_output: Optional[Callable[[str, str, str], None]] = None
+    ) -> Dict[str, Any]:
+        """
+        Run a command and collect its output.
+        
+        Args:
+            argv: Command and arguments
+            cwd: Working directory
+            env: Extra environment variables
+            timeout: Seconds after which the agent kills the command
+            files: Text files written (relative to base) before the command
+                starts, in the same round trip
+            base: Base directory for files
+            on_output: Called as on_output(job_id, stream, data) for each chunk
+        
+        Returns:
+            Dictionary with exit_code, stdout, stderr, duration (of the
+            process), timed_out, transfer_time (from sending the request to
+            the process being spawned) and spawned_at (agent clock)
+        """
+        sent_at = time.time()
+        job_id, events = self._request(
+            'run',
+            argv=argv,
+            cwd=cwd,
+            env=env or {},
+            timeout=timeout,
+            base=base,
+            files=self._encode_files(files or {}),
+        )
+        stdout: List[str] = []
+        stderr: List[str] = []
+        transfer_time = spawned_at = None
+        # Allow for the agent-side timeout plus transfer slack
+        deadline = time.time() + (timeout or 3600) + 30
+        try:
+            while True:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    raise AgentError('Agent job timed out')
+                try:
+                    event = events.get(timeout=remaining)
+                except queue.Empty:
+                    raise AgentError('Agent job timed out')
+                kind = event.get('event')
+                if kind == 'started':
+                    transfer_time = time.time() - sent_at
+                    spawned_at = event.get('at')
+                elif kind in ('stdout', 'stderr'):
+                    (stdout if kind == 'stdout' else stderr).append(event['data'])
+                    if on_output is not None:
+                        on_output(job_id, kind, event['data'])
+                elif kind == 'exit':
+                    return {
+                        'exit_code': event.get('code'),
+                        'stdout': ''.join(stdout),
+                        'stderr': ''.join(stderr),
+                        'duration': event.get('duration'),
+                        'timed_out': event.get('timed_out', False),
+                        'transfer_time': transfer_time,
+                        'spawned_at': spawned_at,
+                    }
+                elif kind == 'error':
+                    raise AgentError(event.get('error', 'Agent error'))
+        finally:
+            self._forget(job_id)
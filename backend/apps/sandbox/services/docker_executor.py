@@ -2,14 +2,46 @@
 Docker-based code execution engine.
 """
 import docker
+import hashlib
+import hmac
+import io
+import json
 import logging
+import tarfile
 import time
-from typing import Dict, Any, Optional, Tuple
+import uuid
+import yaml
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack, contextmanager
+from typing import Dict, Any, List, Optional, Tuple, Union
 from django.conf import settings
+from django_redis import get_redis_connection
+
+from .agent_client import (
+    AgentConnection,
+    AgentError,
+    AGENT_COMMAND,
+    AGENT_ENV,
+    AGENT_PROTOCOL,
+    AGENT_SOURCE
+)
+from .fingerprint import PROBE_SOURCE
+from .test_runner import StreamingTestEvaluator
+from .timings import CALLBACK_NAME, CALLBACK_SOURCE, build_timings, extract_report
 
 logger = logging.getLogger(__name__)
 
 
+def parse_memory_size(value: str) -> int:
+    """Convert a Docker memory size ('512m', '4g', '1024') to bytes."""
+    units = {'b': 1, 'k': 1024, 'm': 1024 ** 2, 'g': 1024 ** 3}
+    value = str(value).strip().lower()
+    if value and value[-1] in units:
+        return int(float(value[:-1]) * units[value[-1]])
+    return int(value)
+
+
 class DockerExecutor:
     """
     Handles execution of Ansible code in isolated Docker containers.
@@ -19,8 +51,77 @@ class DockerExecutor:
     - Execute Ansible playbooks
     - Manage container lifecycle
     - Enforce resource limits
+    - Persist per-user workspaces across sessions
     """
     
+    MANAGED_NODE_COUNT = 2
+    
+    # Owner label of warm pool sandboxes not yet claimed by a user
+    WARM_POOL_OWNER = "pool"
+    
+    # Commands that turn a plain Ubuntu container into an Ansible target
+    NODE_SETUP_COMMANDS = [
+        "apt-get update",
+        "apt-get install -y python3 python3-pip openssh-server sudo",
+        "useradd -m -s /bin/bash ansible",
+        "sh -c \"echo 'ansible:ansible' | chpasswd\"",
+        "sh -c \"echo 'ansible ALL=(ALL) NOPASSWD:ALL' >> /etc/sudoers\"",
+    ]
+    # Each node sets its own ``ansible`` password at start (see node_password)
+    NODE_PASSWORD_ENV = "DJARVIS_NODE_PASSWORD"
+    NODE_COMMAND = (
+        f"sh -c 'echo \"ansible:${NODE_PASSWORD_ENV}\" | chpasswd && "
+        f"unset {NODE_PASSWORD_ENV} && service ssh start && exec sleep infinity'"
+    )
+    NODE_MEMORY_LIMIT = "256m"
+    
+    # Upper bound (seconds) of an image build, and of waiting for another one
+    IMAGE_BUILD_TIMEOUT = 900
+    
+    # Mount points of the per-user persistent volumes on the control node
+    WORKSPACE_PATH = "/ansible"
+    FACT_CACHE_PATH = "/var/cache/djarvis/facts"
+    
+    # Read-only Galaxy content cache (collections and roles) on controllers
+    GALAXY_PATH = "/usr/share/djarvis/galaxy"
+    GALAXY_MANIFEST = ".djarvis-manifest.json"
+    
+    # Timing callback plugin installed into every controller
+    CALLBACK_PLUGINS_PATH = "/opt/djarvis/callback_plugins"
+    
+    # Shared controller pool: per-execution directories and cgroup subtree
+    JOBS_PATH = "/jobs"
+    JOBS_CGROUP = "/sys/fs/cgroup/jobs"
+    
+    # Jobs run as a uid from this range, leased per controller
+    JOB_UID_BASE = 20000
+    JOB_UID_COUNT = 30000
+    
+    # Bumped whenever the shared controller configuration changes, so that
+    # ensure_controller_pool replaces controllers started with an older one
+    CONTROLLER_REVISION = "3"
+    
+    # All the root of a shared controller needs: remounting the cgroup tree
+    # (SYS_ADMIN, dropped again before the agent starts), preparing job
+    # directories, switching to the job uid and killing jobs.
+    CONTROLLER_CAPABILITIES = [
+        "SYS_ADMIN", "CHOWN", "DAC_OVERRIDE", "FOWNER",
+        "SETUID", "SETGID", "SETPCAP", "KILL",
+    ]
+    
+    # Moves the controller's own processes out of the cgroup root so that
+    # per-job child cgroups can get memory/cpu/pids controllers enabled.
+    CONTROLLER_INIT_COMMAND = (
+        "sh -c '"
+        "mount -o remount,rw /sys/fs/cgroup && "
+        "mkdir -p /sys/fs/cgroup/init /sys/fs/cgroup/jobs /jobs && "
+        "echo $$ > /sys/fs/cgroup/init/cgroup.procs && "
+        "echo \"+memory +cpu +pids\" > /sys/fs/cgroup/cgroup.subtree_control && "
+        "echo \"+memory +cpu +pids\" > /sys/fs/cgroup/jobs/cgroup.subtree_control && "
+        "chmod 711 /jobs && "
+        f"exec setpriv --bounding-set=-sys_admin --inh-caps=-sys_admin python3 -u -c \"${AGENT_ENV}\"'"
+    )
+    
     def __init__(self):
         """Initialize Docker client."""
         try:
@@ -30,104 +131,1016 @@ class DockerExecutor:
             logger.error(f"Failed to initialize Docker client: {e}")
             raise
     
-    def create_sandbox(self, user_id: int, session_name: str) -> Tuple[str, str]:
+    @staticmethod
+    def sandbox_name(owner: Union[int, str], session_name: str) -> str:
+        """Container name of a sandbox session."""
+        return f"djarvis_sandbox_{owner}_{session_name}"
+    
+    @staticmethod
+    def network_name_for(container_name: str) -> str:
+        """Name of a sandbox's managed nodes network."""
+        return container_name.replace("djarvis_sandbox_", "djarvis_net_", 1)
+    
+    @property
+    def shared_controllers(self) -> bool:
+        """Whether playbooks run on the shared controller pool."""
+        return settings.SANDBOX_CONTROLLER_MODE == 'shared'
+    
+    def create_sandbox(
+        self,
+        user_id: int,
+        session_name: str,
+        node_image: Optional[str] = None
+    ) -> Tuple[str, str]:
         """
         Create an isolated sandbox container.
         
         Args:
             user_id: User ID for container naming
             session_name: Unique session identifier
+            node_image: Managed node image (defaults to the baseline image)
         
         Returns:
             Tuple of (container_id, container_name)
         """
-        container_name = f"djarvis_sandbox_{user_id}_{session_name}"
+        try:
+            container_name, node_id = self.provision_nodes(user_id, session_name, node_image)
+            control_id = self.start_controller(container_name, user_id)
+            return control_id or node_id, container_name
+            
+        except Exception as e:
+            logger.error(f"Failed to create sandbox: {e}")
+            raise
+    
+    def provision_nodes(
+        self,
+        owner: Union[int, str],
+        session_name: str,
+        node_image: Optional[str] = None
+    ) -> Tuple[str, str]:
+        """
+        Create a sandbox's network and managed nodes, without a controller.
+        
+        Warm pool sandboxes stop here until a user claims them, since the
+        controller mounts the user's workspace volumes.
+        
+        Args:
+            owner: User ID, or WARM_POOL_OWNER for unassigned sandboxes
+            session_name: Unique session identifier
+            node_image: Managed node image (defaults to the baseline image)
+        
+        Returns:
+            Tuple of (container_name, first managed node ID)
+        """
+        container_name = self.sandbox_name(owner, session_name)
+        network_name = self.network_name_for(container_name)
+        
+        # Create managed nodes network
+        self.client.networks.create(
+            network_name,
+            driver="bridge",
+            labels={
+                "app": "djarvis",
+                "user_id": str(owner),
+                "parent": container_name
+            }
+        )
+        
+        # Create managed nodes (target hosts) from a prepared image
+        node_image = node_image or self.ensure_node_baseline_image()
+        managed_nodes = []
+        for i in range(self.MANAGED_NODE_COUNT):
+            node = self._run_managed_node(
+                name=f"{container_name}_node{i+1}",
+                image=node_image,
+                network_name=network_name,
+                user_id=owner,
+                parent=container_name,
+            )
+            managed_nodes.append(node)
+        
+        logger.info(f"Created sandbox: {container_name} with {len(managed_nodes)} managed nodes")
+        return container_name, managed_nodes[0].id
+    
+    def start_controller(self, container_name: str, user_id: int) -> Optional[str]:
+        """
+        Give a sandbox its Ansible controller.
+        
+        In dedicated mode a control node with the user's workspace volumes
+        is started; in shared mode the controller pool is made sure to run,
+        and a pooled controller joins the network for each job only.
+        
+        Returns:
+            Control node ID, or None in shared mode
+        """
+        if self.shared_controllers:
+            self._controller_for(container_name)
+            return None
+        
+        control_node = self.client.containers.run(
+            image="ansible/ansible:latest",
+            name=container_name,
+            detach=True,
+            remove=False,
+            network=self.network_name_for(container_name),
+            mem_limit=settings.SANDBOX_MEMORY_LIMIT,
+            cpu_quota=int(settings.SANDBOX_CPU_LIMIT * 100000),
+            cpu_period=100000,
+            # The execution agent keeps the container running
+            command=["sh", "-c", AGENT_COMMAND],
+            stdin_open=True,
+            labels={
+                "app": "djarvis",
+                "user_id": str(user_id),
+                "type": "control_node",
+                "agent": AGENT_PROTOCOL
+            },
+            working_dir=self.WORKSPACE_PATH,
+            volumes={
+                **self._workspace_mounts(user_id),
+                **self._galaxy_mounts(),
+            },
+            environment={
+                **self._ansible_environment(),
+                **self._galaxy_environment(),
+                **self._callback_environment(),
+                AGENT_ENV: AGENT_SOURCE,
+            },
+        )
+        
+        # Create inventory file on control node
+        self._write_files(control_node, {
+            "inventory.ini": self._inventory_content(container_name)
+        })
+        self._install_callback_plugin(control_node)
+        # The fact cache volume may hold facts of an earlier sandbox's nodes
+        self._clear_fact_cache(control_node)
+        return control_node.id
+    
+    def _clear_fact_cache(self, control_node) -> None:
+        """
+        Empty the fact cache of a control node.
+        
+        Cached facts are keyed by the stable node aliases, not by container,
+        so they must go whenever the managed nodes are (re)created.
+        """
+        exec_result = control_node.exec_run(
+            ["find", self.FACT_CACHE_PATH, "-mindepth", "1", "-delete"]
+        )
+        if exec_result.exit_code != 0:
+            raise RuntimeError(
+                f"Failed to clear the fact cache of {control_node.name}: "
+                f"{exec_result.output.decode('utf-8', errors='replace')[-500:]}"
+            )
+    
+    def _inventory_content(self, container_name: str) -> str:
+        """
+        Inventory of a sandbox's managed nodes, under stable aliases
+        (node1, node2, ...) whatever their container.
+        """
+        inventory_content = "[managed_nodes]\n"
+        for i in range(self.MANAGED_NODE_COUNT):
+            inventory_content += self._inventory_line(f"node{i+1}", f"{container_name}_node{i+1}")
+        return inventory_content
+    
+    def _inventory_line(self, alias: str, node_name: str) -> str:
+        return (
+            f"{alias} ansible_host={node_name} ansible_connection=ssh "
+            f"ansible_user=ansible ansible_password={self.node_password(node_name)}\n"
+        )
+    
+    @staticmethod
+    def node_password(node_name: str) -> str:
+        """
+        SSH password of a managed node's ``ansible`` user.
+        
+        Derived from the node's container name with the secret key: a
+        recreated node keeps it, but no two nodes share one, so a playbook
+        only ever holds the credentials of its own sandbox's nodes.
+        """
+        return hmac.new(
+            settings.SECRET_KEY.encode('utf-8'),
+            node_name.encode('utf-8'),
+            hashlib.sha256
+        ).hexdigest()[:32]
+    
+    def ensure_controller_pool(self) -> List[Any]:
+        """
+        Get the shared controller containers, starting any that are missing.
+        
+        Returns:
+            Controller containers ordered by pool index
+        """
+        controllers = []
+        for i in range(settings.SANDBOX_CONTROLLER_POOL_SIZE):
+            name = f"djarvis_controller_{i}"
+            try:
+                controller = self.client.containers.get(name)
+                if controller.labels.get("revision") != self.CONTROLLER_REVISION:
+                    logger.info(f"Replacing outdated shared controller: {name}")
+                    AgentConnection.discard(name)
+                    controller.remove(force=True)
+                    controller = None
+                elif controller.status != 'running':
+                    controller.start()
+                else:
+                    self._check_controller(controller)
+            except docker.errors.NotFound:
+                controller = None
+            if controller is None:
+                controller = self._start_shared_controller(name)
+            controllers.append(controller)
+        return controllers
+    
+    def _check_controller(self, controller) -> None:
+        """Restart a running controller whose agent does not answer a probe."""
+        try:
+            AgentConnection.for_container(controller).probe()
+        except Exception as e:
+            logger.warning(f"Shared controller {controller.name} unresponsive, restarting: {e}")
+            AgentConnection.discard(controller.name)
+            controller.restart(timeout=5)
+    
+    def _start_shared_controller(self, name: str):
+        """
+        Start a pooled controller.
+        
+        Its root keeps only the capabilities job handling needs and cannot
+        gain others; jobs themselves run without any.
+        """
+        controller = self.client.containers.run(
+            image="ansible/ansible:latest",
+            name=name,
+            detach=True,
+            remove=False,
+            mem_limit=settings.SANDBOX_CONTROLLER_MEMORY_LIMIT,
+            cpu_quota=int(settings.SANDBOX_CONTROLLER_CPU_LIMIT * 100000),
+            cpu_period=100000,
+            cgroupns="private",
+            cap_drop=["ALL"],
+            cap_add=self.CONTROLLER_CAPABILITIES,
+            security_opt=["no-new-privileges"],
+            command=self.CONTROLLER_INIT_COMMAND,
+            stdin_open=True,
+            labels={
+                "app": "djarvis",
+                "type": "shared_controller",
+                "agent": AGENT_PROTOCOL,
+                "revision": self.CONTROLLER_REVISION
+            },
+            working_dir=self.JOBS_PATH,
+            volumes=self._galaxy_mounts(),
+            environment={
+                **self._galaxy_environment(),
+                **self._callback_environment(),
+                AGENT_ENV: AGENT_SOURCE,
+            },
+        )
+        self._install_callback_plugin(controller)
+        logger.info(f"Started shared controller: {name}")
+        return controller
+    
+    @staticmethod
+    def _controller_name_for(container_name: str) -> str:
+        """Name of the pooled controller serving a sandbox (stable hash)."""
+        index = zlib.crc32(container_name.encode('utf-8')) % settings.SANDBOX_CONTROLLER_POOL_SIZE
+        return f"djarvis_controller_{index}"
+    
+    def _controller_for(self, container_name: str):
+        """
+        Pick the shared controller serving a sandbox.
+        
+        The choice is a stable hash of the sandbox name, so a sandbox keeps
+        using the same controller while the pool size is unchanged.
+        """
+        controllers = {
+            controller.name: controller
+            for controller in self.ensure_controller_pool()
+        }
+        return controllers[self._controller_name_for(container_name)]
+    
+    @contextmanager
+    def _shared_job(self, container_name: str, controller_name: str, job_id: str, timeout: int):
+        """
+        Lease a job uid on a shared controller and attach the controller to
+        the sandbox network for the duration of one job.
+        
+        The uid lease outlives the job's own kill timeout, so a uid is never
+        handed out while a job may still run under it. The network is shared
+        by concurrent jobs of the sandbox and detached after the last one.
+        
+        Yields:
+            The job uid
+        """
+        redis = get_redis_connection('default')
+        lease = timeout + 120
+        job_uid = self._lease_job_uid(redis, controller_name, job_id, lease)
         
+        network_name = self.network_name_for(container_name)
+        attached_key = f"djarvis:attached:{controller_name}:{network_name}"
+        with redis.lock(f"{attached_key}:lock", timeout=30, blocking_timeout=30):
+            if redis.incr(attached_key) == 1:
+                try:
+                    self.client.api.connect_container_to_network(controller_name, network_name)
+                except docker.errors.APIError as e:
+                    # Still attached if the last job's worker died
+                    if 'already exists' not in str(e):
+                        redis.decr(attached_key)
+                        raise
+            redis.expire(attached_key, lease)
         try:
-            # Create managed nodes network
-            network_name = f"djarvis_net_{user_id}_{session_name}"
-            network = self.client.networks.create(
-                network_name,
-                driver="bridge",
-                labels={"app": "djarvis", "user_id": str(user_id)}
+            yield job_uid
+        finally:
+            with redis.lock(f"{attached_key}:lock", timeout=30, blocking_timeout=30):
+                if redis.decr(attached_key) <= 0:
+                    redis.delete(attached_key)
+                    try:
+                        self.client.api.disconnect_container_from_network(controller_name, network_name)
+                    except docker.errors.APIError as e:
+                        logger.warning(f"Failed to detach {controller_name} from {network_name}: {e}")
+    
+    def _lease_job_uid(self, redis, controller_name: str, job_id: str, lease: int) -> int:
+        """Pick a uid no other job on the controller holds, for lease seconds."""
+        counter_key = f"djarvis:job_uid:{controller_name}"
+        for _ in range(self.JOB_UID_COUNT):
+            job_uid = self.JOB_UID_BASE + redis.incr(counter_key) % self.JOB_UID_COUNT
+            if redis.set(f"{counter_key}:{job_uid}", job_id, nx=True, ex=lease):
+                return job_uid
+        raise RuntimeError(f"No free job uid on {controller_name}")
+    
+    def _job_command(self, job_dir: str, job_id: str, job_uid: int, timeout: int) -> List[str]:
+        """
+        Shell command running one playbook job on a shared controller.
+        
+        The job runs as an unprivileged per-job user, without capabilities,
+        in its own working directory and in a child cgroup with the per-user
+        memory, CPU and process limits. Anything the job left running is
+        killed, and the cgroup and directory are removed afterwards.
+        """
+        cgroup = f"{self.JOBS_CGROUP}/{job_id}"
+        memory_limit = parse_memory_size(settings.SANDBOX_MEMORY_LIMIT)
+        cpu_quota = int(settings.SANDBOX_CPU_LIMIT * 100000)
+        script = (
+            f"mkdir {cgroup} && "
+            f"echo {memory_limit} > {cgroup}/memory.max && "
+            f"echo '{cpu_quota} 100000' > {cgroup}/cpu.max && "
+            f"echo {settings.SANDBOX_JOB_PIDS_LIMIT} > {cgroup}/pids.max && "
+            f"chown -R {job_uid}:{job_uid} {job_dir} && chmod 700 {job_dir} && "
+            f"sh -c 'echo $$ > {cgroup}/cgroup.procs && cd {job_dir} && "
+            f"exec timeout -s KILL {timeout} "
+            f"setpriv --reuid={job_uid} --regid={job_uid} --clear-groups "
+            f"--no-new-privs --bounding-set=-all --inh-caps=-all "
+            f"env HOME={job_dir} ANSIBLE_LOCAL_TEMP={job_dir}/.tmp "
+            f"ansible-playbook -i inventory.ini playbook.yml -v'; "
+            f"rc=$?; echo 1 > {cgroup}/cgroup.kill; rm -rf {job_dir}; "
+            f"n=0; until rmdir {cgroup} 2>/dev/null || [ $n -ge 50 ]; do n=$((n+1)); sleep 0.1; done; "
+            f"exit $rc"
+        )
+        return ["sh", "-c", script]
+    
+    def ensure_node_baseline_image(self) -> str:
+        """
+        Build the managed node baseline image once and reuse it.
+        
+        The baseline is a committed Ubuntu container with SSH, Python and the
+        ``ansible`` user already set up, so sandboxes skip the package install
+        and reset can recreate nodes in seconds.
+        
+        Returns:
+            Image tag of the baseline
+        """
+        image_tag = settings.SANDBOX_NODE_BASELINE_IMAGE
+        if self._image_exists(image_tag):
+            return image_tag
+        
+        with self._build_lock(image_tag):
+            # Another worker may have built it while we waited for the lock
+            if not self._image_exists(image_tag):
+                self._build_baseline_image(image_tag)
+        return image_tag
+    
+    def _build_baseline_image(self, image_tag: str) -> None:
+        """Set up a fresh Ubuntu container as managed node and commit it."""
+        logger.info(f"Building managed node baseline image: {image_tag}")
+        builder = self.client.containers.run(
+            image="ubuntu:22.04",
+            detach=True,
+            command="sleep infinity",
+            labels={"app": "djarvis", "type": "image_builder"},
+        )
+        try:
+            for cmd in self.NODE_SETUP_COMMANDS:
+                result = builder.exec_run(
+                    cmd,
+                    environment={"DEBIAN_FRONTEND": "noninteractive"}
+                )
+                if result.exit_code != 0:
+                    raise RuntimeError(
+                        f"Baseline setup failed on '{cmd}': "
+                        f"{result.output.decode('utf-8', errors='replace')[-500:]}"
+                    )
+            repository, tag = image_tag.rsplit(':', 1)
+            builder.commit(
+                repository=repository,
+                tag=tag,
+                changes=[f"CMD {self.NODE_COMMAND}"],
             )
-            
-            # Create control node (Ansible controller)
-            control_node = self.client.containers.run(
+        finally:
+            builder.remove(force=True)
+    
+    def _image_exists(self, image_tag: str) -> bool:
+        try:
+            self.client.images.get(image_tag)
+            return True
+        except docker.errors.ImageNotFound:
+            return False
+    
+    def _build_lock(self, image_tag: str):
+        """
+        Lock serializing the builds of an image across workers.
+        
+        Concurrent builds of the same image would only repeat the work and
+        race on committing the tag.
+        """
+        return get_redis_connection('default').lock(
+            f"djarvis:image_build:{image_tag}",
+            timeout=self.IMAGE_BUILD_TIMEOUT,
+            blocking_timeout=self.IMAGE_BUILD_TIMEOUT
+        )
+    
+    @staticmethod
+    def precondition_image_tag(precondition_playbook: str) -> str:
+        """Image tag of a precondition, derived from a hash of its content."""
+        repository = settings.SANDBOX_NODE_BASELINE_IMAGE.rsplit(':', 1)[0]
+        digest = hashlib.sha256(precondition_playbook.encode('utf-8')).hexdigest()
+        return f"{repository}:pre-{digest[:16]}"
+    
+    def prepare_node_image(self, precondition_playbook: str = '') -> str:
+        """
+        Get the managed node image for an exercise precondition.
+        
+        Args:
+            precondition_playbook: Playbook describing the starting host state
+        
+        Returns:
+            Baseline image tag if there is no precondition, otherwise the
+            (cached) precondition image tag
+        """
+        if not precondition_playbook.strip():
+            return self.ensure_node_baseline_image()
+        return self.build_precondition_image(precondition_playbook)
+    
+    def cached_node_image(self, precondition_playbook: str = '') -> Optional[str]:
+        """
+        Get the managed node image for an exercise precondition if it is built.
+        
+        Unlike prepare_node_image this never builds, so request handlers can
+        leave a missing image to the build_precondition_image task.
+        
+        Returns:
+            Image tag, or None if the image still has to be built
+        """
+        if precondition_playbook.strip():
+            image_tag = self.precondition_image_tag(precondition_playbook)
+        else:
+            image_tag = settings.SANDBOX_NODE_BASELINE_IMAGE
+        return image_tag if self._image_exists(image_tag) else None
+    
+    def build_precondition_image(self, precondition_playbook: str) -> str:
+        """
+        Apply a precondition playbook to the baseline and commit the result.
+        
+        The image is tagged by the hash of the playbook, so it is built once
+        and rebuilt only when the precondition content changes.
+        
+        Args:
+            precondition_playbook: Playbook to apply to a managed node
+        
+        Returns:
+            Image tag of the precondition image
+        """
+        image_tag = self.precondition_image_tag(precondition_playbook)
+        if self._image_exists(image_tag):
+            return image_tag
+        
+        baseline_image = self.ensure_node_baseline_image()
+        with self._build_lock(image_tag):
+            # Another worker may have built it while we waited for the lock
+            if not self._image_exists(image_tag):
+                self._build_precondition_image(precondition_playbook, baseline_image, image_tag)
+        return image_tag
+    
+    def _build_precondition_image(
+        self,
+        precondition_playbook: str,
+        baseline_image: str,
+        image_tag: str
+    ) -> None:
+        """Run a precondition playbook on a baseline node and commit the node."""
+        # Unique per build, so a build outliving its lock cannot collide
+        build_name = f"djarvis_build_{image_tag.rsplit('-', 1)[1]}_{uuid.uuid4().hex[:8]}"
+        logger.info(f"Building precondition image: {image_tag}")
+        
+        network = self.client.networks.create(
+            build_name,
+            driver="bridge",
+            labels={"app": "djarvis", "type": "image_builder"}
+        )
+        node = controller = None
+        try:
+            node = self._run_managed_node(
+                name=f"{build_name}_node1",
+                image=baseline_image,
+                network_name=build_name,
+                user_id=0,
+                parent=build_name,
+            )
+            controller = self.client.containers.run(
                 image="ansible/ansible:latest",
-                name=container_name,
+                name=build_name,
                 detach=True,
-                remove=False,
-                network=network_name,
-                mem_limit=settings.SANDBOX_MEMORY_LIMIT,
-                cpu_quota=int(settings.SANDBOX_CPU_LIMIT * 100000),
-                cpu_period=100000,
-                command="sleep infinity",  # Keep container running
-                labels={
-                    "app": "djarvis",
-                    "user_id": str(user_id),
-                    "type": "control_node"
-                },
-                working_dir="/ansible",
+                network=build_name,
+                command="sleep infinity",
+                labels={"app": "djarvis", "type": "image_builder"},
+                working_dir=self.WORKSPACE_PATH,
+                volumes=self._galaxy_mounts(),
+                environment=self._galaxy_environment(),
             )
+            self._write_files(controller, {
+                "inventory.ini": "[managed_nodes]\n" + self._inventory_line("node1", node.name),
+                "precondition.yml": precondition_playbook,
+            })
             
-            # Create managed nodes (target hosts)
-            managed_nodes = []
-            for i in range(2):  # 2 managed nodes
-                node = self.client.containers.run(
-                    image="ubuntu:22.04",
-                    name=f"{container_name}_node{i+1}",
-                    detach=True,
-                    remove=False,
-                    network=network_name,
-                    mem_limit="256m",
-                    command="sleep infinity",
+            exec_result = controller.exec_run(
+                "ansible-playbook -i inventory.ini precondition.yml",
+                environment={"ANSIBLE_HOST_KEY_CHECKING": "False"},
+            )
+            if exec_result.exit_code != 0:
+                raise RuntimeError(
+                    "Precondition playbook failed: "
+                    f"{exec_result.output.decode('utf-8', errors='replace')[-1000:]}"
+                )
+            
+            repository, tag = image_tag.rsplit(':', 1)
+            node.commit(
+                repository=repository,
+                tag=tag,
+                changes=[f"CMD {self.NODE_COMMAND}"],
+            )
+            logger.info(f"Built precondition image: {image_tag}")
+        finally:
+            for container in (controller, node):
+                if container is not None:
+                    container.remove(force=True)
+            network.remove()
+    
+    def _write_files(
+        self,
+        container,
+        files: Dict[str, Union[str, bytes]],
+        base_path: Optional[str] = None
+    ) -> None:
+        """Copy text (or bytes) files into a directory (default: workspace) of the container."""
+        buffer = io.BytesIO()
+        with tarfile.open(fileobj=buffer, mode='w') as archive:
+            for path, content in files.items():
+                data = content if isinstance(content, bytes) else content.encode('utf-8')
+                info = tarfile.TarInfo(name=path)
+                info.size = len(data)
+                info.mtime = int(time.time())
+                archive.addfile(info, io.BytesIO(data))
+        container.put_archive(base_path or self.WORKSPACE_PATH, buffer.getvalue())
+    
+    def _run_managed_node(
+        self,
+        name: str,
+        image: str,
+        network_name: str,
+        user_id: Union[int, str],
+        parent: str
+    ):
+        """Start a managed node container from a prepared image."""
+        return self.client.containers.run(
+            image=image,
+            name=name,
+            detach=True,
+            remove=False,
+            network=network_name,
+            mem_limit=self.NODE_MEMORY_LIMIT,
+            command=self.NODE_COMMAND,
+            environment={self.NODE_PASSWORD_ENV: self.node_password(name)},
+            labels={
+                "app": "djarvis",
+                "user_id": str(user_id),
+                "type": "managed_node",
+                "parent": parent,
+                "network": network_name,
+                "image": image,
+            },
+        )
+    
+    def reset_managed_nodes(
+        self,
+        container_name: str,
+        image: Optional[str] = None
+    ) -> bool:
+        """
+        Recreate a sandbox's managed nodes from their baseline image.
+        
+        The network and the control node are kept; only the target hosts are
+        replaced (in parallel), so every run starts from a clean state. Facts
+        cached about the replaced hosts are dropped.
+        
+        Args:
+            container_name: Name of the sandbox control node
+            image: Switch the nodes to this image instead of their current one
+        
+        Returns:
+            True if all nodes were recreated
+        """
+        nodes = self.client.containers.list(
+            all=True,
+            filters={"label": [f"parent={container_name}", "type=managed_node"]}
+        )
+        if not nodes:
+            logger.warning(f"No managed nodes to reset for {container_name}")
+            return False
+        
+        def recreate(node) -> None:
+            labels = node.labels
+            name = node.name
+            node.remove(force=True)
+            self._run_managed_node(
+                name=name,
+                image=image or labels["image"],
+                network_name=labels["network"],
+                user_id=labels["user_id"],
+                parent=container_name,
+            )
+        
+        start_time = time.time()
+        try:
+            with ThreadPoolExecutor(max_workers=len(nodes)) as pool:
+                list(pool.map(recreate, nodes))
+            if not self.shared_controllers:
+                self._clear_fact_cache(self.client.containers.get(container_name))
+        except Exception as e:
+            logger.error(f"Failed to reset managed nodes of {container_name}: {e}")
+            return False
+        
+        logger.info(
+            f"Reset {len(nodes)} managed nodes of {container_name} "
+            f"in {time.time() - start_time:.2f}s"
+        )
+        return True
+    
+    @staticmethod
+    def workspace_volume_names(user_id: int) -> List[str]:
+        """Names of the persistent volumes (workspace, fact cache) of a user."""
+        return [
+            f"djarvis_workspace_{user_id}",
+            f"djarvis_facts_{user_id}",
+        ]
+    
+    def _workspace_mounts(self, user_id: int) -> Dict[str, Dict[str, str]]:
+        """
+        Get (or create) the user's persistent volumes and their mount spec.
+        
+        Existing volumes are reused, so a recreated sandbox starts from the
+        last workspace state instead of an empty directory.
+        """
+        workspace_volume, facts_volume = self.workspace_volume_names(user_id)
+        mounts = {}
+        for volume_name, path in (
+            (workspace_volume, self.WORKSPACE_PATH),
+            (facts_volume, self.FACT_CACHE_PATH),
+        ):
+            try:
+                self.client.volumes.get(volume_name)
+            except docker.errors.NotFound:
+                self.client.volumes.create(
+                    name=volume_name,
                     labels={
                         "app": "djarvis",
                         "user_id": str(user_id),
-                        "type": "managed_node",
-                        "parent": container_name
-                    },
+                        "type": "workspace"
+                    }
                 )
-                managed_nodes.append(node)
-            
-            # Wait for containers to start
-            time.sleep(2)
-            
-            # Setup SSH and Python on managed nodes
-            for i, node in enumerate(managed_nodes):
-                setup_commands = [
-                    "apt-get update",
-                    "apt-get install -y python3 python3-pip openssh-server sudo",
-                    "service ssh start",
-                    "useradd -m -s /bin/bash ansible",
-                    "echo 'ansible:ansible' | chpasswd",
-                    "echo 'ansible ALL=(ALL) NOPASSWD:ALL' >> /etc/sudoers"
-                ]
-                for cmd in setup_commands:
-                    node.exec_run(cmd)
+            mounts[volume_name] = {"bind": path, "mode": "rw"}
+        return mounts
+    
+    def _ansible_environment(self) -> Dict[str, str]:
+        """Ansible configuration passed to the control node."""
+        return {
+            "ANSIBLE_GATHERING": "smart",
+            "ANSIBLE_CACHE_PLUGIN": "jsonfile",
+            "ANSIBLE_CACHE_PLUGIN_CONNECTION": self.FACT_CACHE_PATH,
+            "ANSIBLE_CACHE_PLUGIN_TIMEOUT": str(settings.SANDBOX_FACT_CACHE_TIMEOUT),
+        }
+    
+    def host_memory_bytes(self) -> int:
+        """Total memory of the Docker host."""
+        return int(self.client.info().get('MemTotal', 0))
+    
+    def _galaxy_mounts(self) -> Dict[str, Dict[str, str]]:
+        """Read-only mount of the Galaxy content cache volume."""
+        return {
+            settings.SANDBOX_GALAXY_CACHE_VOLUME: {"bind": self.GALAXY_PATH, "mode": "ro"}
+        }
+    
+    def _galaxy_environment(self) -> Dict[str, str]:
+        """
+        Ansible settings resolving collections and roles from the cache.
+        
+        Roles in the playbook directory still take precedence over cached ones.
+        """
+        return {
+            "ANSIBLE_COLLECTIONS_PATH": f"{self.GALAXY_PATH}/collections",
+            "ANSIBLE_ROLES_PATH": f"roles:{self.GALAXY_PATH}/roles",
+        }
+    
+    def populate_galaxy_cache(
+        self,
+        requirements: str,
+        tarballs: Optional[Dict[str, bytes]] = None,
+        force: bool = False
+    ) -> Dict[str, Any]:
+        """
+        Install pinned collections and roles into the Galaxy cache volume.
+        
+        Content is installed by a temporary controller with the volume
+        mounted read-write. Tarball-only installs run without network.
+        Nothing is done if the volume already holds the same content,
+        unless force is set.
+        
+        Args:
+            requirements: ansible-galaxy requirements YAML (may be empty)
+            tarballs: Local collection or role archives by file name
+            force: Reinstall even if the content is unchanged
+        
+        Returns:
+            Dictionary with 'changed', 'digest' and installer 'output'
+        """
+        tarballs = tarballs or {}
+        digest = hashlib.sha256(requirements.encode('utf-8'))
+        for name in sorted(tarballs):
+            digest.update(name.encode('utf-8'))
+            digest.update(tarballs[name])
+        digest = digest.hexdigest()
+        
+        volume_name = settings.SANDBOX_GALAXY_CACHE_VOLUME
+        try:
+            self.client.volumes.get(volume_name)
+        except docker.errors.NotFound:
+            self.client.volumes.create(
+                name=volume_name,
+                labels={"app": "djarvis", "type": "galaxy_cache"}
+            )
+        
+        builder = self.client.containers.run(
+            image="ansible/ansible:latest",
+            name=f"djarvis_galaxy_{digest[:12]}",
+            detach=True,
+            command="sleep infinity",
+            labels={"app": "djarvis", "type": "galaxy_cache_builder"},
+            volumes={volume_name: {"bind": self.GALAXY_PATH, "mode": "rw"}},
+            network_disabled=not requirements.strip(),
+        )
+        try:
+            manifest_path = f"{self.GALAXY_PATH}/{self.GALAXY_MANIFEST}"
+            current = builder.exec_run(["cat", manifest_path]).output.decode('utf-8', errors='replace')
+            if not force and digest in current:
+                return {"changed": False, "digest": digest, "output": ""}
             
-            # Create inventory file on control node
-            inventory_content = "[managed_nodes]\n"
-            for i in range(len(managed_nodes)):
-                inventory_content += f"{container_name}_node{i+1} ansible_connection=ssh ansible_user=ansible ansible_password=ansible\n"
+            files = {"requirements.yml": requirements}
+            files.update({f"tarballs/{name}": data for name, data in tarballs.items()})
+            self._write_files(builder, files, base_path="/tmp")
             
-            control_node.exec_run(
-                f"sh -c 'echo \"{inventory_content}\" > /ansible/inventory.ini'"
-            )
+            collections_path = f"{self.GALAXY_PATH}/collections"
+            roles_path = f"{self.GALAXY_PATH}/roles"
+            commands = []
+            if requirements.strip():
+                commands += [
+                    ["ansible-galaxy", "collection", "install", "-r", "/tmp/requirements.yml",
+                     "-p", collections_path, "--force"],
+                    ["ansible-galaxy", "role", "install", "-r", "/tmp/requirements.yml",
+                     "-p", roles_path, "--force"],
+                ]
+            for name in sorted(tarballs):
+                kind = "collection" if self._is_collection_archive(tarballs[name]) else "role"
+                path = collections_path if kind == "collection" else roles_path
+                commands.append([
+                    "ansible-galaxy", kind, "install", f"/tmp/tarballs/{name}",
+                    "-p", path, "--force",
+                ])
             
-            logger.info(f"Created sandbox: {container_name} with {len(managed_nodes)} managed nodes")
-            return control_node.id, container_name
+            output = []
+            for command in commands:
+                exec_result = builder.exec_run(command)
+                output.append(exec_result.output.decode('utf-8', errors='replace'))
+                if exec_result.exit_code != 0:
+                    raise RuntimeError(f"{' '.join(command)} failed: {output[-1][-1000:]}")
             
+            self._write_files(builder, {
+                self.GALAXY_MANIFEST: json.dumps({
+                    "digest": digest,
+                    "installed_at": time.time(),
+                    "tarballs": sorted(tarballs),
+                })
+            }, base_path=self.GALAXY_PATH)
+            logger.info(f"Populated Galaxy cache volume {volume_name} ({digest[:12]})")
+            return {"changed": True, "digest": digest, "output": "".join(output)}
+        finally:
+            builder.remove(force=True)
+    
+    @staticmethod
+    def _is_collection_archive(data: bytes) -> bool:
+        """Collection archives have a MANIFEST.json at their root, roles do not."""
+        try:
+            with tarfile.open(fileobj=io.BytesIO(data), mode='r:*') as archive:
+                return any(name.lstrip('./') == 'MANIFEST.json' for name in archive.getnames())
+        except tarfile.TarError:
+            return False
+    
+    def _callback_environment(self) -> Dict[str, str]:
+        """Ansible settings enabling the timing callback plugin."""
+        return {
+            "ANSIBLE_CALLBACK_PLUGINS": self.CALLBACK_PLUGINS_PATH,
+            "ANSIBLE_CALLBACKS_ENABLED": CALLBACK_NAME,
+        }
+    
+    def _install_callback_plugin(self, container) -> None:
+        """Copy the timing callback plugin into a controller."""
+        self._write_files(
+            container,
+            {f"{self.CALLBACK_PLUGINS_PATH.lstrip('/')}/{CALLBACK_NAME}.py": CALLBACK_SOURCE},
+            base_path="/"
+        )
+    
+    def get_workspace_volume_sizes(self) -> Dict[int, int]:
+        """
+        Get disk usage of persistent workspace volumes.
+        
+        Returns:
+            Dictionary mapping user ID to total bytes used by their volumes
+        """
+        sizes: Dict[int, int] = {}
+        try:
+            volumes = self.client.df().get('Volumes') or []
         except Exception as e:
-            logger.error(f"Failed to create sandbox: {e}")
-            raise
+            logger.error(f"Failed to get volume usage: {e}")
+            return sizes
+        
+        for volume in volumes:
+            labels = volume.get('Labels') or {}
+            if labels.get('app') != 'djarvis' or labels.get('type') != 'workspace':
+                continue
+            try:
+                user_id = int(labels.get('user_id', ''))
+            except ValueError:
+                continue
+            size = (volume.get('UsageData') or {}).get('Size', 0)
+            sizes[user_id] = sizes.get(user_id, 0) + max(size, 0)
+        return sizes
+    
+    def remove_workspace_volumes(self, user_id: int) -> bool:
+        """Remove a user's persistent volumes. Returns False if still in use."""
+        removed = True
+        for volume_name in self.workspace_volume_names(user_id):
+            try:
+                self.client.volumes.get(volume_name).remove()
+            except docker.errors.NotFound:
+                pass
+            except docker.errors.APIError as e:
+                logger.warning(f"Cannot remove volume {volume_name}: {e}")
+                removed = False
+        return removed
+    
+    def _agent(self, container) -> Optional[AgentConnection]:
+        """Open the persistent agent connection of a controller, if it runs one."""
+        if container.labels.get("agent") != AGENT_PROTOCOL:
+            # Started before the current protocol; exec still works
+            return None
+        try:
+            return AgentConnection.for_container(container)
+        except Exception as e:
+            logger.warning(f"Agent unavailable on {container.name}, using exec: {e}")
+            return None
+    
+    def _abort_job(self, agent: AgentConnection, job_id: str, cgroup: Optional[str] = None) -> None:
+        """
+        Kill a running playbook job.
+        
+        Shared-mode jobs are killed through their cgroup: the job's timeout
+        wrapper runs the playbook in a process group of its own, and the job
+        script still removes the job directory and cgroup afterwards.
+        """
+        try:
+            if cgroup:
+                agent.run(["sh", "-c", f"echo 1 > {cgroup}/cgroup.kill"], timeout=10)
+            else:
+                agent.kill(job_id)
+        except AgentError as e:
+            logger.warning(f"Failed to abort job on {agent.container_name}: {e}")
+    
+    def _run_with_agent(
+        self,
+        agent: AgentConnection,
+        command: List[str],
+        files: Dict[str, str],
+        base_path: str,
+        timeout: int,
+        evaluator: Optional[StreamingTestEvaluator] = None,
+        cgroup: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Write files and run a command through the controller agent.
+        
+        With an evaluator, the output is evaluated while it streams in and
+        the job is killed as soon as its tests are decided as failed.
+        """
+        aborted_at = None
+        
+        def on_output(job_id: str, stream: str, data: str) -> None:
+            nonlocal aborted_at
+            if stream != 'stdout' or aborted_at is not None or not evaluator.feed(data):
+                return
+            aborted_at = time.time()
+            self._abort_job(agent, job_id, cgroup)
+        
+        try:
+            # Shared-mode jobs enforce their own timeout and clean up after
+            # it, so the agent only steps in if that fails
+            result = agent.run(
+                command,
+                files=files,
+                base=base_path,
+                timeout=timeout + 30 if self.shared_controllers else timeout,
+                on_output=on_output if evaluator is not None else None,
+            )
+        except AgentError as e:
+            AgentConnection.discard(agent.container_name)
+            return {
+                "success": False,
+                "error": f"Agent error: {e}",
+                "output": ""
+            }
+        
+        run_result = {
+            "success": result["exit_code"] == 0,
+            "exit_code": result["exit_code"],
+            "stdout": result["stdout"],
+            "stderr": result["stderr"],
+            "timed_out": result["timed_out"],
+            "transfer_time": result["transfer_time"],
+            "spawned_at": result["spawned_at"],
+        }
+        if aborted_at is not None:
+            run_result["aborted"] = True
+            run_result["abort_reason"] = evaluator.reason
+        return run_result
+    
+    def _run_with_exec(
+        self,
+        container,
+        command: List[str],
+        files: Dict[str, str],
+        base_path: str
+    ) -> Dict[str, Any]:
+        """Write files and run a command with docker exec (no agent)."""
+        start_time = time.time()
+        try:
+            self._write_files(container, files, base_path=base_path)
+        except docker.errors.APIError as e:
+            return {
+                "success": False,
+                "error": "Failed to write playbook to container",
+                "output": str(e)
+            }
+        transfer_time = time.time() - start_time
+        
+        exec_result = container.exec_run(
+            command,
+            demux=True,
+            stream=False,
+        )
+        stdout = exec_result.output[0].decode('utf-8') if exec_result.output[0] else ""
+        stderr = exec_result.output[1].decode('utf-8') if exec_result.output[1] else ""
+        
+        return {
+            "success": exec_result.exit_code == 0,
+            "exit_code": exec_result.exit_code,
+            "stdout": stdout,
+            "stderr": stderr,
+            "transfer_time": transfer_time,
+        }
     
     def execute_playbook(
         self,
         container_name: str,
         playbook_content: str,
-        timeout: int = 300
+        timeout: int = 300,
+        early_abort_tests: Optional[List[Dict[str, Any]]] = None
     ) -> Dict[str, Any]:
         """
         Execute Ansible playbook in container.
@@ -136,45 +1149,85 @@ class DockerExecutor:
             container_name: Name of the container
             playbook_content: YAML playbook content
             timeout: Execution timeout in seconds
+            early_abort_tests: Test cases graded on the result; the run is
+                stopped once they are decided as failed (agent only)
         
         Returns:
-            Dictionary with execution results
+            Dictionary with execution results; aborted and abort_reason are
+            set when the run was stopped early, with the output so far
         """
+        evaluator = None
+        if early_abort_tests:
+            try:
+                playbook_data = yaml.safe_load(playbook_content)
+            except yaml.YAMLError:
+                playbook_data = None
+            evaluator = StreamingTestEvaluator(early_abort_tests, playbook_data)
+            if not evaluator.can_decide:
+                evaluator = None
+        
+        job = ExitStack()
         try:
-            container = self.client.containers.get(container_name)
-            
-            # Write playbook to container
-            playbook_path = "/ansible/playbook.yml"
-            exec_result = container.exec_run(
-                f"sh -c 'echo \"{playbook_content}\" > {playbook_path}'"
-            )
-            
-            if exec_result.exit_code != 0:
-                return {
-                    "success": False,
-                    "error": "Failed to write playbook to container",
-                    "output": exec_result.output.decode('utf-8')
+            cgroup = None
+            if self.shared_controllers:
+                # Isolated per-execution directory on a pooled controller
+                controller_name = self._controller_name_for(container_name)
+                job_id = uuid.uuid4().hex
+                job_uid = job.enter_context(
+                    self._shared_job(container_name, controller_name, job_id, timeout)
+                )
+                job_dir = f"{self.JOBS_PATH}/{job_id}"
+                base_path = self.JOBS_PATH
+                files = {
+                    f"{job_id}/playbook.yml": playbook_content,
+                    f"{job_id}/inventory.ini": self._inventory_content(container_name),
                 }
+                command = self._job_command(job_dir, job_id, job_uid, timeout)
+                cgroup = f"{self.JOBS_CGROUP}/{job_id}"
+            else:
+                controller_name = container_name
+                base_path = self.WORKSPACE_PATH
+                files = {"playbook.yml": playbook_content}
+                command = [
+                    "ansible-playbook",
+                    "-i", f"{self.WORKSPACE_PATH}/inventory.ini",
+                    f"{self.WORKSPACE_PATH}/playbook.yml",
+                    "-v",
+                ]
+            
+            # Fast path: an open agent connection takes files and command in
+            # a single request, without any Docker API call
+            agent = AgentConnection.cached(controller_name)
+            container = None
+            if agent is None:
+                if self.shared_controllers:
+                    container = self._controller_for(container_name)
+                else:
+                    container = self.client.containers.get(container_name)
+                agent = self._agent(container)
             
             # Execute playbook
             start_time = time.time()
-            exec_result = container.exec_run(
-                f"ansible-playbook -i /ansible/inventory.ini {playbook_path} -v",
-                demux=True,
-                stream=False,
-            )
-            execution_time = time.time() - start_time
-            
-            stdout = exec_result.output[0].decode('utf-8') if exec_result.output[0] else ""
-            stderr = exec_result.output[1].decode('utf-8') if exec_result.output[1] else ""
+            if agent is not None:
+                result = self._run_with_agent(
+                    agent, command, files, base_path, timeout,
+                    evaluator=evaluator, cgroup=cgroup
+                )
+            else:
+                result = self._run_with_exec(container, command, files, base_path)
+            result["execution_time"] = time.time() - start_time
             
-            return {
-                "success": exec_result.exit_code == 0,
-                "exit_code": exec_result.exit_code,
-                "stdout": stdout,
-                "stderr": stderr,
-                "execution_time": execution_time,
-            }
+            # Phase breakdown; the timing report line is not shown to students
+            stdout, report = extract_report(result.get("stdout", ""))
+            if "stdout" in result:
+                result["stdout"] = stdout
+            result["timings"] = build_timings(
+                report,
+                result["execution_time"],
+                transfer_time=result.pop("transfer_time", None),
+                spawned_at=result.pop("spawned_at", None)
+            )
+            return result
             
         except docker.errors.NotFound:
             logger.error(f"Container not found: {container_name}")
@@ -190,14 +1243,201 @@ class DockerExecutor:
                 "error": str(e),
                 "output": ""
             }
+        finally:
+            job.close()
+    
+    def run_execution(
+        self,
+        container_name: str,
+        playbook_content: str,
+        timeout: int = 300,
+        node_image: Optional[str] = None,
+        reset_nodes: bool = False,
+        probe_spec: Optional[Dict[str, List[str]]] = None,
+        early_abort_tests: Optional[List[Dict[str, Any]]] = None
+    ) -> Dict[str, Any]:
+        """
+        Run one queued execution: reset managed nodes if asked, then the playbook.
+        
+        Args:
+            container_name: Name of the sandbox
+            playbook_content: YAML playbook content
+            timeout: Execution timeout in seconds
+            node_image: Image the managed nodes are reset from
+            reset_nodes: Whether to recreate managed nodes first
+            probe_spec: Managed node state to fingerprint after the run
+            early_abort_tests: Test cases to stop the run early for
+        
+        Returns:
+            Dictionary with execution results; reset_failed is set when the
+            nodes could not be recreated and nothing was run, fingerprint
+            when a probe spec was given and the nodes could be probed
+        """
+        if reset_nodes and not self.reset_managed_nodes(container_name, image=node_image):
+            return {
+                "success": False,
+                "error": "Failed to reset sandbox managed nodes",
+                "output": "",
+                "reset_failed": True
+            }
+        result = self.execute_playbook(
+            container_name,
+            playbook_content,
+            timeout=timeout,
+            early_abort_tests=early_abort_tests
+        )
+        if probe_spec:
+            try:
+                result["fingerprint"] = self.probe_nodes(container_name, probe_spec)
+            except Exception as e:
+                logger.error(f"Failed to probe managed nodes of {container_name}: {e}")
+        return result
+    
+    def probe_nodes(
+        self,
+        container_name: str,
+        probe_spec: Dict[str, List[str]]
+    ) -> Dict[str, Any]:
+        """
+        Fingerprint the state of a sandbox's managed nodes.
+        
+        Runs the probe once per node, in parallel.
+        
+        Returns:
+            Node alias (as in the inventory) -> probed state
+        """
+        command = ["python3", "-c", PROBE_SOURCE, json.dumps(probe_spec)]
+        
+        def probe(index: int) -> Tuple[str, Any]:
+            node = self.client.containers.get(f"{container_name}_node{index}")
+            exec_result = node.exec_run(command, demux=True)
+            stdout, stderr = exec_result.output
+            if exec_result.exit_code != 0:
+                raise RuntimeError(
+                    f"Probe failed on node{index}: "
+                    f"{(stderr or b'').decode('utf-8', errors='replace')[-500:]}"
+                )
+            return f"node{index}", json.loads(stdout)
+        
+        with ThreadPoolExecutor(max_workers=self.MANAGED_NODE_COUNT) as pool:
+            return dict(pool.map(probe, range(1, self.MANAGED_NODE_COUNT + 1)))
+    
+    def run_isolated(
+        self,
+        playbook_content: str,
+        node_image: str,
+        timeout: int = 300,
+        probe_spec: Optional[Dict[str, List[str]]] = None
+    ) -> Dict[str, Any]:
+        """
+        Run a playbook in a throwaway topology, e.g. an exercise's solution.
+        
+        The topology mirrors a sandbox (same node count, image and inventory)
+        but has no workspace, so nothing a student did can leak into it.
+        
+        Args:
+            playbook_content: YAML playbook content
+            node_image: Managed node image to start from
+            timeout: Playbook timeout in seconds
+            probe_spec: Managed node state to fingerprint after the run
+        
+        Returns:
+            Dictionary with execution results, and the fingerprint when a
+            probe spec was given
+        """
+        name = f"djarvis_isolated_{uuid.uuid4().hex[:12]}"
+        labels = {"app": "djarvis", "type": "isolated"}
+        
+        network = self.client.networks.create(name, driver="bridge", labels=labels)
+        containers = []
+        try:
+            for i in range(self.MANAGED_NODE_COUNT):
+                containers.append(self._run_managed_node(
+                    name=f"{name}_node{i+1}",
+                    image=node_image,
+                    network_name=name,
+                    user_id=0,
+                    parent=name,
+                ))
+            controller = self.client.containers.run(
+                image="ansible/ansible:latest",
+                name=name,
+                detach=True,
+                network=name,
+                command="sleep infinity",
+                labels=labels,
+                working_dir=self.WORKSPACE_PATH,
+                volumes=self._galaxy_mounts(),
+                environment=self._galaxy_environment(),
+            )
+            containers.append(controller)
+            self._write_files(controller, {
+                "inventory.ini": self._inventory_content(name),
+                "playbook.yml": playbook_content,
+            })
+            
+            start_time = time.time()
+            exec_result = controller.exec_run(
+                ["timeout", "-s", "KILL", str(timeout),
+                 "ansible-playbook", "-i", "inventory.ini", "playbook.yml", "-v"],
+                environment={"ANSIBLE_HOST_KEY_CHECKING": "False"},
+                demux=True,
+            )
+            stdout, stderr = exec_result.output
+            result = {
+                "success": exec_result.exit_code == 0,
+                "exit_code": exec_result.exit_code,
+                "stdout": (stdout or b"").decode("utf-8", errors="replace"),
+                "stderr": (stderr or b"").decode("utf-8", errors="replace"),
+                "execution_time": time.time() - start_time,
+            }
+            if probe_spec:
+                result["fingerprint"] = self.probe_nodes(name, probe_spec)
+            return result
+        finally:
+            for container in containers:
+                container.remove(force=True)
+            network.remove()
+    
+    def capture_reference(
+        self,
+        playbook_content: str,
+        node_image: str,
+        probe_spec: Dict[str, List[str]],
+        timeout: int = 300
+    ) -> Dict[str, Any]:
+        """
+        Run a reference playbook in a throwaway topology and fingerprint it.
+        
+        Returns:
+            Node alias -> probed state
+        
+        Raises:
+            RuntimeError: If the reference playbook fails
+        """
+        result = self.run_isolated(playbook_content, node_image, timeout, probe_spec=probe_spec)
+        if not result["success"]:
+            raise RuntimeError(
+                f"Reference solution failed: {(result['stdout'] + result['stderr'])[-1000:]}"
+            )
+        return result.get("fingerprint", {})
     
     def stop_container(self, container_name: str) -> bool:
         """Stop and remove container."""
         try:
-            container = self.client.containers.get(container_name)
+            container = None
+            if not self.shared_controllers:
+                try:
+                    container = self.client.containers.get(container_name)
+                except docker.errors.NotFound:
+                    pass
+            if container is None:
+                # Shared mode or an unclaimed warm sandbox: no dedicated
+                # control node, the first managed node marks the sandbox
+                self.client.containers.get(f"{container_name}_node1")
             
             # Stop and remove managed nodes
-            for i in range(2):
+            for i in range(self.MANAGED_NODE_COUNT):
                 try:
                     node = self.client.containers.get(f"{container_name}_node{i+1}")
                     node.stop(timeout=5)
@@ -206,15 +1446,20 @@ class DockerExecutor:
                     pass
             
             # Stop and remove control node
-            container.stop(timeout=5)
-            container.remove()
+            if container is not None:
+                AgentConnection.discard(container_name)
+                container.stop(timeout=5)
+                container.remove()
             
-            # Remove network
+            # Remove network (detaching shared controllers first)
             try:
                 networks = self.client.networks.list(
                     filters={"label": f"parent={container_name}"}
                 )
                 for network in networks:
+                    network.reload()
+                    for attached in network.containers:
+                        network.disconnect(attached, force=True)
                     network.remove()
             except:
                 pass
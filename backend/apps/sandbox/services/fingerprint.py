@@ -0,0 +1,215 @@
+"""
+Final-state grading against a fingerprint of the reference solution.
+"""
+import hashlib
+import json
+import logging
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+PROBE_SOURCE = (Path(__file__).parent / 'fingerprint_probe.py').read_text()
+
+TEST_TYPE = 'state_matches_solution'
+
+# Probed categories, as keys of both test cases and fingerprints
+CATEGORIES = ('paths', 'packages', 'services', 'users')
+
+MAX_DIFFERENCES = 20
+
+
+def is_fingerprint_test(test_case: Dict[str, Any]) -> bool:
+    return test_case.get('type') == TEST_TYPE
+
+
+def split(test_cases: List[Dict[str, Any]]) -> Tuple[List[Dict], List[Dict]]:
+    """
+    Separate fingerprint test cases from the other ones.
+    
+    Returns:
+        Tuple of (fingerprint test cases, other test cases)
+    """
+    fingerprint = [test for test in test_cases if is_fingerprint_test(test)]
+    other = [test for test in test_cases if not is_fingerprint_test(test)]
+    return fingerprint, other
+
+
+def probe_spec(test_cases: List[Dict[str, Any]]) -> Dict[str, List[str]]:
+    """Everything the fingerprint test cases look at, probed in one pass."""
+    spec = {}
+    for category in CATEGORIES:
+        items = sorted({item for test in test_cases for item in test.get(category, [])})
+        if items:
+            spec[category] = items
+    return spec
+
+
+def reference_version(solution_code: str, precondition_playbook: str, spec: Dict[str, Any]) -> str:
+    """Identifies a reference fingerprint; any input change invalidates it."""
+    content = json.dumps(
+        {'solution': solution_code, 'precondition': precondition_playbook, 'spec': spec},
+        sort_keys=True
+    )
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+
+# Probed attributes as named to students
+ATTRIBUTE_NAMES = {'sha256': 'content', 'target': 'link target'}
+
+
+def _difference(expected: Optional[Dict], found: Optional[Dict]) -> Optional[str]:
+    """What differs about an item, without revealing the expected state."""
+    if expected is None and found is None:
+        return None
+    if found is None:
+        return 'is missing'
+    if expected is None:
+        return 'should not exist'
+    attributes = sorted(
+        ATTRIBUTE_NAMES.get(key, key)
+        for key in set(expected) | set(found)
+        if expected.get(key) != found.get(key)
+    )
+    if not attributes:
+        return None
+    return f"{', '.join(attributes)} {'differs' if len(attributes) == 1 else 'differ'}"
+
+
+def diff_fingerprints(
+    reference: Dict[str, Any],
+    actual: Optional[Dict[str, Any]],
+    spec: Dict[str, List[str]],
+    package_versions: bool = False
+) -> List[str]:
+    """
+    Differences between the reference and the actual state of every node.
+    
+    Args:
+        reference: Node alias -> probed state of the reference run
+        actual: Node alias -> probed state of the student run
+        spec: Categories and items to compare
+        package_versions: Compare package versions, not only whether
+            packages are installed (versions change as mirrors update)
+    
+    Returns:
+        Human-readable differences, empty when the states match
+    """
+    actual = actual or {}
+    differences = []
+    for node, expected_state in sorted(reference.items()):
+        node_state = actual.get(node)
+        if node_state is None:
+            differences.append(f"{node}: state could not be probed")
+            continue
+        for category in CATEGORIES:
+            for item in spec.get(category, []):
+                expected = expected_state.get(category, {}).get(item)
+                found = node_state.get(category, {}).get(item)
+                if category == 'packages' and not package_versions:
+                    expected = expected if expected is None else {}
+                    found = found if found is None else {}
+                difference = _difference(expected, found)
+                if difference:
+                    differences.append(f"{node}: {category[:-1]} {item} {difference}")
+    return differences
+
+
+class FingerprintGrader:
+    """
+    Grades runs by comparing the managed nodes' final state with the state
+    the reference solution leaves behind.
+    
+    The reference solution is run once per exercise version in a clean
+    topology; its fingerprint is stored on the exercise together with the
+    version it was captured for.
+    """
+    
+    def __init__(self, executor):
+        self.executor = executor
+    
+    @staticmethod
+    def version_of(exercise, spec: Dict[str, Any]) -> str:
+        return reference_version(exercise.solution_code, exercise.precondition_playbook, spec)
+    
+    @classmethod
+    def is_current(cls, exercise, spec: Dict[str, Any]) -> bool:
+        stored = exercise.reference_fingerprint or {}
+        return stored.get('version') == cls.version_of(exercise, spec)
+    
+    def reference(self, exercise, spec: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Reference fingerprint of an exercise, captured if missing or stale.
+        
+        Returns:
+            Node alias -> probed state
+        
+        Raises:
+            RuntimeError: If the reference solution cannot be run
+        """
+        if self.is_current(exercise, spec):
+            return exercise.reference_fingerprint['nodes']
+        
+        nodes = self.executor.capture_reference(
+            exercise.solution_code,
+            self.executor.prepare_node_image(exercise.precondition_playbook),
+            spec,
+            timeout=exercise.time_limit_seconds
+        )
+        exercise.reference_fingerprint = {
+            'version': self.version_of(exercise, spec),
+            'nodes': nodes,
+        }
+        exercise.save(update_fields=['reference_fingerprint'])
+        logger.info(f"Captured reference fingerprint of exercise {exercise.id}")
+        return nodes
+    
+    @staticmethod
+    def run_tests(
+        test_cases: List[Dict[str, Any]],
+        reference: Dict[str, Any],
+        actual: Optional[Dict[str, Any]]
+    ) -> Dict[str, Any]:
+        """
+        Grade fingerprint test cases by diffing the probed states.
+        
+        Packages are compared on whether they are installed; a test case
+        with package_versions set compares their versions as well.
+        
+        Returns:
+            Test execution results, in TestRunner's format
+        """
+        test_results = []
+        for test_case in test_cases:
+            # A test case without categories compares everything probed
+            spec = probe_spec([test_case]) or probe_spec(test_cases)
+            if not spec:
+                test_results.append({
+                    "passed": False,
+                    "name": test_case.get('name', 'Final state matches the solution'),
+                    "error": "No paths, packages, services or users to compare"
+                })
+                continue
+            differences = diff_fingerprints(
+                reference, actual, spec,
+                package_versions=bool(test_case.get('package_versions'))
+            )
+            passed = not differences
+            result = {
+                "passed": passed,
+                "name": test_case.get('name', 'Final state matches the solution'),
+                "message": "Final state matches the reference solution" if passed
+                else f"{len(differences)} difference(s) from the reference solution",
+            }
+            if differences:
+                result["differences"] = differences[:MAX_DIFFERENCES]
+            test_results.append(result)
+        
+        passed_count = sum(1 for result in test_results if result['passed'])
+        return {
+            "passed": passed_count == len(test_cases),
+            "total_tests": len(test_cases),
+            "passed_tests": passed_count,
+            "failed_tests": len(test_cases) - passed_count,
+            "test_results": test_results
+        }
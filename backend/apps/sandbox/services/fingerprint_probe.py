@@ -0,0 +1,117 @@
+"""
+Managed node state probe.
+
+This file is not imported by Django: its source is run on a managed node
+with ``python3 -c`` and the probe spec as JSON argument, e.g.
+
+    {"paths": ["/etc/nginx/nginx.conf"], "packages": ["nginx"],
+     "services": ["nginx"], "users": ["deploy"]}
+
+It prints one JSON object with the state of every probed item; items that
+do not exist are null.
+"""
+import grp
+import hashlib
+import json
+import os
+import pwd
+import stat
+import subprocess
+import sys
+
+
+def _owner(uid):
+    try:
+        return pwd.getpwuid(uid).pw_name
+    except KeyError:
+        return str(uid)
+
+
+def _group(gid):
+    try:
+        return grp.getgrgid(gid).gr_name
+    except KeyError:
+        return str(gid)
+
+
+def path_state(path):
+    try:
+        info = os.lstat(path)
+    except OSError:
+        return None
+    state = {
+        "mode": oct(stat.S_IMODE(info.st_mode)),
+        "owner": _owner(info.st_uid),
+        "group": _group(info.st_gid),
+    }
+    if stat.S_ISLNK(info.st_mode):
+        state["type"] = "link"
+        state["target"] = os.readlink(path)
+    elif stat.S_ISDIR(info.st_mode):
+        state["type"] = "directory"
+    elif stat.S_ISREG(info.st_mode):
+        state["type"] = "file"
+        digest = hashlib.sha256()
+        with open(path, "rb") as handle:
+            for chunk in iter(lambda: handle.read(65536), b""):
+                digest.update(chunk)
+        state["sha256"] = digest.hexdigest()
+    else:
+        state["type"] = "other"
+    return state
+
+
+def package_state(name):
+    result = subprocess.run(
+        ["dpkg-query", "-W", "-f=${Status}\t${Version}", name],
+        stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, universal_newlines=True
+    )
+    status, _, version = result.stdout.partition("\t")
+    if result.returncode != 0 or not status.endswith(" installed"):
+        return None
+    return {"version": version}
+
+
+def service_state(name):
+    if not os.path.exists(os.path.join("/etc/init.d", name)):
+        return None
+    result = subprocess.run(
+        ["service", name, "status"],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    return {"running": result.returncode == 0}
+
+
+def user_state(name):
+    try:
+        entry = pwd.getpwnam(name)
+    except KeyError:
+        return None
+    groups = sorted(group.gr_name for group in grp.getgrall() if name in group.gr_mem)
+    return {
+        "home": entry.pw_dir,
+        "shell": entry.pw_shell,
+        "group": _group(entry.pw_gid),
+        "groups": groups,
+    }
+
+
+PROBES = {
+    "paths": path_state,
+    "packages": package_state,
+    "services": service_state,
+    "users": user_state,
+}
+
+
+def main():
+    spec = json.loads(sys.argv[1])
+    state = {
+        category: {item: probe(item) for item in spec.get(category, [])}
+        for category, probe in PROBES.items()
+    }
+    sys.stdout.write(json.dumps(state, sort_keys=True))
+
+
+if __name__ == "__main__":
+    main()
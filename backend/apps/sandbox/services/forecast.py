@@ -0,0 +1,174 @@
+"""
+Sandbox demand forecasting for sizing the warm pool.
+"""
+import math
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Tuple
+
+from django.conf import settings
+from django.db.models import Count
+from django.db.models.functions import ExtractHour, ExtractIsoWeekDay
+from django.utils import timezone
+
+from ..models import SandboxSession
+
+# Seasonal slot: (ISO weekday 1-7, hour 0-23) -> arrivals per minute
+Profile = Dict[Tuple[int, int], float]
+
+
+def slot_of(moment: datetime) -> Tuple[int, int]:
+    """Seasonal slot of a local datetime."""
+    return moment.isoweekday(), moment.hour
+
+
+def ewma_level(
+    observed: List[float],
+    expected: List[float],
+    alpha: float,
+    prior: float = 0.05
+) -> Tuple[float, float]:
+    """
+    Smooth recent arrival rates against the seasonal expectation.
+    
+    Args:
+        observed: Actual arrivals per minute of recent buckets, oldest first
+        expected: Seasonal arrivals per minute of the same buckets
+        alpha: EWMA smoothing factor (weight of the newest bucket)
+        prior: Rate added to both sides so quiet slots do not yield
+            extreme ratios
+    
+    Returns:
+        Tuple of (smoothed observed rate, level = how busy today is relative
+        to the seasonal profile)
+    """
+    smoothed_observed = smoothed_expected = None
+    for actual, seasonal in zip(observed, expected):
+        if smoothed_observed is None:
+            smoothed_observed, smoothed_expected = actual, seasonal
+        else:
+            smoothed_observed = alpha * actual + (1 - alpha) * smoothed_observed
+            smoothed_expected = alpha * seasonal + (1 - alpha) * smoothed_expected
+    if smoothed_observed is None:
+        return 0.0, 1.0
+    
+    level = (smoothed_observed + prior) / (smoothed_expected + prior)
+    return smoothed_observed, min(max(level, 0.25), 4.0)
+
+
+def expected_arrivals(
+    profile: Profile,
+    start: datetime,
+    minutes: int,
+    level: float,
+    recent_rate: float
+) -> float:
+    """
+    Arrivals expected in the `minutes` after `start`.
+    
+    The seasonal rate of each minute is scaled by the level; the recent rate
+    is a floor so a busy period is not assumed to end before it does.
+    """
+    seasonal = sum(
+        profile.get(slot_of(start + timedelta(minutes=offset)), 0.0)
+        for offset in range(minutes)
+    )
+    return max(seasonal * level, recent_rate * minutes)
+
+
+def pool_size_for(arrivals: float, safety_z: float) -> int:
+    """Sandboxes needed to serve Poisson arrivals with a safety margin."""
+    if arrivals <= 0:
+        return 0
+    return math.ceil(arrivals + safety_z * math.sqrt(arrivals))
+
+
+class DemandForecaster:
+    """
+    Predicts sandbox demand over the next few minutes.
+    
+    Demand is modelled as a weekly seasonal profile (mean session starts per
+    weekday and hour over the last weeks) scaled by an EWMA level tracking
+    how today compares with a typical week, so both scheduled classes and
+    unusually busy days are anticipated.
+    """
+    
+    BUCKET_MINUTES = 15
+    RECENT_BUCKETS = 8
+    
+    def __init__(self):
+        self.history_weeks = settings.SANDBOX_WARM_POOL_HISTORY_WEEKS
+        self.horizon_minutes = settings.SANDBOX_WARM_POOL_HORIZON_MINUTES
+        self.alpha = settings.SANDBOX_WARM_POOL_EWMA_ALPHA
+        self.safety_z = settings.SANDBOX_WARM_POOL_SAFETY_Z
+    
+    @staticmethod
+    def _demand():
+        # Warm pool sandboxes have no user, and prefetched ones are demand
+        # only once claimed
+        return SandboxSession.objects.filter(user__isnull=False).exclude(
+            status__in=['reserved', 'released']
+        )
+    
+    def seasonal_profile(self, now: datetime) -> Profile:
+        """Mean session starts per minute for each weekday and hour."""
+        since = now - timedelta(weeks=self.history_weeks)
+        rows = (
+            self._demand()
+            .filter(created_at__gte=since, created_at__lt=now)
+            .annotate(
+                weekday=ExtractIsoWeekDay('created_at'),
+                hour=ExtractHour('created_at')
+            )
+            .values('weekday', 'hour')
+            .annotate(count=Count('id'))
+        )
+        # Every slot occurs exactly once per week of history
+        return {
+            (row['weekday'], row['hour']): row['count'] / (self.history_weeks * 60)
+            for row in rows
+        }
+    
+    def recent_rates(self, now: datetime, profile: Profile) -> Tuple[List[float], List[float]]:
+        """Observed and seasonal arrivals per minute of the recent buckets."""
+        window = self.BUCKET_MINUTES * self.RECENT_BUCKETS
+        start = now - timedelta(minutes=window)
+        counts = [0] * self.RECENT_BUCKETS
+        created = self._demand().filter(
+            created_at__gte=start,
+            created_at__lt=now
+        ).values_list('created_at', flat=True)
+        for moment in created:
+            index = int((moment - start).total_seconds() // (self.BUCKET_MINUTES * 60))
+            counts[min(index, self.RECENT_BUCKETS - 1)] += 1
+        
+        observed = [count / self.BUCKET_MINUTES for count in counts]
+        expected = [
+            profile.get(slot_of(start + timedelta(minutes=self.BUCKET_MINUTES * i)), 0.0)
+            for i in range(self.RECENT_BUCKETS)
+        ]
+        return observed, expected
+    
+    def forecast(self, now: datetime = None) -> Dict[str, Any]:
+        """
+        Forecast demand over the horizon and the warm pool size serving it.
+        
+        Returns:
+            Dictionary with expected arrivals, level, recent rate and the
+            unconstrained target pool size
+        """
+        now = timezone.localtime(now or timezone.now())
+        profile = self.seasonal_profile(now)
+        observed, expected = self.recent_rates(now, profile)
+        recent_rate, level = ewma_level(observed, expected, self.alpha)
+        arrivals = expected_arrivals(
+            profile, now, self.horizon_minutes, level, recent_rate
+        )
+        
+        return {
+            'computed_at': now.isoformat(),
+            'horizon_minutes': self.horizon_minutes,
+            'expected_arrivals': round(arrivals, 2),
+            'level': round(level, 3),
+            'recent_rate_per_minute': round(recent_rate, 3),
+            'target': pool_size_for(arrivals, self.safety_z),
+        }
@@ -0,0 +1,189 @@
+"""
+Execution agent running inside sandbox controllers.
+
+This file is not imported by Django: its source is passed to the control
+node and started as the container's main process. It reads newline-delimited
+JSON requests from stdin and writes JSON events to stdout, so one attached
+stream carries any number of concurrent jobs, told apart by request ID.
+
+Every request is answered with an "accepted" event as soon as its line has
+been read. Clients attached from several processes write to the same stdin,
+so each holds a per-controller lock from sending a request until then.
+
+Operations:
+    write_files: {"base": dir, "files": {relative_path: base64_content}}
+    run:         {"argv": [...], "cwd": dir, "env": {...}, "timeout": seconds,
+                  "base": dir, "files": {...}}
+                 writes the optional files first, reports "started" once
+                 the process is spawned, streams "stdout"/"stderr" events,
+                 then an "exit" event
+    kill:        {"target": run_request_id, "signal": number}
+    probe:       reports liveness, uptime and running jobs
+
+Only the Python standard library is used, since the controller image is not
+under our control.
+"""
+import base64
+import json
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+
+STARTED_AT = time.time()
+OUTPUT_LOCK = threading.Lock()
+JOBS = {}
+JOBS_LOCK = threading.Lock()
+
+
+def emit(request_id, event, **fields):
+    """Write one event line to the attached stream."""
+    fields.update({"id": request_id, "event": event})
+    line = json.dumps(fields) + "\n"
+    with OUTPUT_LOCK:
+        sys.stdout.write(line)
+        sys.stdout.flush()
+
+
+def store_files(base, files):
+    for path, content in files.items():
+        target = os.path.join(base, path)
+        directory = os.path.dirname(target)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(target, "wb") as handle:
+            handle.write(base64.b64decode(content))
+
+
+def write_files(request):
+    store_files(request.get("base", "."), request.get("files", {}))
+    emit(request["id"], "done", ok=True)
+
+
+def pump(request_id, stream, name):
+    for chunk in iter(lambda: stream.readline(), b""):
+        emit(request_id, name, data=chunk.decode("utf-8", errors="replace"))
+    stream.close()
+
+
+def run(request):
+    request_id = request["id"]
+    env = dict(os.environ)
+    env.update(request.get("env") or {})
+    try:
+        if request.get("files"):
+            store_files(request.get("base", "."), request["files"])
+        process = subprocess.Popen(
+            request["argv"],
+            cwd=request.get("cwd") or None,
+            env=env,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            start_new_session=True,
+        )
+    except OSError as error:
+        emit(request_id, "exit", code=127, duration=0.0, error=str(error))
+        return
+    start = time.time()
+    emit(request_id, "started", pid=process.pid, at=start)
+    
+    with JOBS_LOCK:
+        JOBS[request_id] = process
+    
+    timer = None
+    timeout = request.get("timeout")
+    if timeout:
+        timer = threading.Timer(timeout, kill_process, (process, signal.SIGKILL))
+        timer.daemon = True
+        timer.start()
+    
+    pumps = [
+        threading.Thread(target=pump, args=(request_id, process.stdout, "stdout"), daemon=True),
+        threading.Thread(target=pump, args=(request_id, process.stderr, "stderr"), daemon=True),
+    ]
+    for thread in pumps:
+        thread.start()
+    
+    def wait():
+        code = process.wait()
+        for thread in pumps:
+            thread.join()
+        timed_out = timer is not None and not timer.is_alive() and code < 0
+        if timer is not None:
+            timer.cancel()
+        with JOBS_LOCK:
+            JOBS.pop(request_id, None)
+        emit(
+            request_id,
+            "exit",
+            code=code,
+            duration=time.time() - start,
+            timed_out=timed_out,
+        )
+    
+    threading.Thread(target=wait, daemon=True).start()
+
+
+def kill_process(process, sig):
+    try:
+        os.killpg(process.pid, sig)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+def kill(request):
+    with JOBS_LOCK:
+        process = JOBS.get(request.get("target"))
+    if process is not None:
+        kill_process(process, request.get("signal", signal.SIGKILL))
+    emit(request["id"], "done", ok=process is not None)
+
+
+def probe(request):
+    with JOBS_LOCK:
+        jobs = list(JOBS)
+    emit(
+        request["id"],
+        "done",
+        ok=True,
+        pid=os.getpid(),
+        uptime=time.time() - STARTED_AT,
+        jobs=jobs,
+    )
+
+
+HANDLERS = {
+    "write_files": write_files,
+    "run": run,
+    "kill": kill,
+    "probe": probe,
+}
+
+
+def main():
+    for line in sys.stdin:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            request = json.loads(line)
+            handler = HANDLERS[request["op"]]
+        except (ValueError, KeyError) as error:
+            emit(None, "error", error=f"Bad request: {error}")
+            continue
+        emit(request.get("id"), "accepted")
+        try:
+            handler(request)
+        except Exception as error:
+            emit(request.get("id"), "error", error=str(error))
+    
+    # stdin closed: keep serving running jobs, container stays up
+    while True:
+        time.sleep(3600)
+
+
+if __name__ == "__main__":
+    main()
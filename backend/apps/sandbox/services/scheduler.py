@@ -0,0 +1,295 @@
+"""
+Weighted fair-queue scheduler for sandbox executions.
+"""
+import json
+import logging
+import time
+import uuid
+from typing import Any, Dict, Optional
+
+from django.conf import settings
+from django_redis import get_redis_connection
+
+logger = logging.getLogger(__name__)
+
+
+# Enqueue a job and put its user on the lane's round-robin ring if needed.
+# ARGV: prefix, lane, user_id, weight, job, job_id, status_ttl
+SUBMIT_SCRIPT = """
+local prefix, lane, uid = ARGV[1], ARGV[2], ARGV[3]
+local status = prefix .. 'status:' .. ARGV[6]
+redis.call('HSET', status, 'user_id', uid, 'state', 'queued')
+redis.call('EXPIRE', status, tonumber(ARGV[7]))
+redis.call('RPUSH', prefix .. 'q:' .. lane .. ':' .. uid, ARGV[5])
+redis.call('HSET', prefix .. 'weight', uid, ARGV[4])
+if redis.call('SADD', prefix .. 'members:' .. lane, uid) == 1 then
+    redis.call('RPUSH', prefix .. 'ring:' .. lane, uid)
+end
+return 1
+"""
+
+# Deficit round-robin over users, lanes in strict priority order.
+# Each job costs 1; a user's deficit grows by its weight per turn. Users at
+# their in-flight cap are skipped without losing their place in the round.
+# In-flight counters expire so a crashed worker cannot lock a user out.
+# ARGV: prefix, max_inflight, inflight_ttl, lane...
+DISPATCH_SCRIPT = """
+local prefix = ARGV[1]
+local cap = tonumber(ARGV[2])
+local ttl = tonumber(ARGV[3])
+
+local function drop(ring, members, deficits, uid)
+    redis.call('LPOP', ring)
+    redis.call('SREM', members, uid)
+    redis.call('HDEL', deficits, uid)
+end
+
+for li = 4, #ARGV do
+    local lane = ARGV[li]
+    local ring = prefix .. 'ring:' .. lane
+    local members = prefix .. 'members:' .. lane
+    local deficits = prefix .. 'deficit:' .. lane
+    -- Enough turns for every user to accumulate one job at the minimum weight
+    local turns = redis.call('LLEN', ring) * 4 + 1
+    for i = 1, turns do
+        local uid = redis.call('LINDEX', ring, 0)
+        if not uid then
+            break
+        end
+        local queue = prefix .. 'q:' .. lane .. ':' .. uid
+        if redis.call('LLEN', queue) == 0 then
+            drop(ring, members, deficits, uid)
+        elseif cap > 0 and tonumber(redis.call('GET', prefix .. 'inflight:' .. uid) or '0') >= cap then
+            redis.call('RPUSH', ring, redis.call('LPOP', ring))
+        else
+            local deficit = tonumber(redis.call('HGET', deficits, uid) or '0')
+            if deficit < 1 then
+                deficit = deficit + tonumber(redis.call('HGET', prefix .. 'weight', uid) or '1')
+            end
+            if deficit >= 1 then
+                local job = redis.call('LPOP', queue)
+                deficit = deficit - 1
+                redis.call('INCR', prefix .. 'inflight:' .. uid)
+                redis.call('EXPIRE', prefix .. 'inflight:' .. uid, ttl)
+                if redis.call('LLEN', queue) == 0 then
+                    drop(ring, members, deficits, uid)
+                else
+                    redis.call('HSET', deficits, uid, deficit)
+                    if deficit < 1 then
+                        redis.call('RPUSH', ring, redis.call('LPOP', ring))
+                    end
+                end
+                return job
+            end
+            redis.call('HSET', deficits, uid, deficit)
+            redis.call('RPUSH', ring, redis.call('LPOP', ring))
+        end
+    end
+end
+return false
+"""
+
+# Release one in-flight slot; the counter may have expired while the job ran.
+# ARGV: prefix, user_id
+RELEASE_SCRIPT = """
+local key = ARGV[1] .. 'inflight:' .. ARGV[2]
+if redis.call('DECR', key) <= 0 then
+    redis.call('DEL', key)
+end
+return 1
+"""
+
+# Mark a dispatched job running, unless it was cancelled or waited too long
+# (or its status expired); such a job is dropped and its slot released.
+# ARGV: prefix, user_id, job_id, expired (1 if queued for too long)
+START_SCRIPT = """
+local prefix = ARGV[1]
+local status = prefix .. 'status:' .. ARGV[3]
+if redis.call('HGET', status, 'state') == 'queued' then
+    if ARGV[4] == '0' then
+        redis.call('HSET', status, 'state', 'running')
+        return 1
+    end
+    redis.call('HSET', status, 'state', 'expired')
+end
+local key = prefix .. 'inflight:' .. ARGV[2]
+if redis.call('DECR', key) <= 0 then
+    redis.call('DEL', key)
+end
+return 0
+"""
+
+# Cancel a job that has not started yet; returns the job's state afterwards.
+# ARGV: prefix, job_id
+CANCEL_SCRIPT = """
+local status = ARGV[1] .. 'status:' .. ARGV[2]
+local state = redis.call('HGET', status, 'state')
+if state == 'queued' then
+    redis.call('HSET', status, 'state', 'cancelled')
+    return 'cancelled'
+end
+return state
+"""
+
+
+class FairScheduler:
+    """
+    Orders sandbox executions fairly across users.
+    
+    Every user has a FIFO queue per lane. Graded submissions (with an
+    exercise) are always dispatched before scratch runs; within a lane, users
+    are served by deficit round-robin so one user flooding the queue cannot
+    starve the others. A per-user in-flight cap limits parallel executions.
+    
+    Submitting returns at once; a job's status (queued, running, done,
+    cancelled or expired) and finally its result are polled by job ID.
+    Cancelled jobs, and jobs queued longer than SANDBOX_QUEUE_WAIT_TIMEOUT,
+    are skipped when their turn comes.
+    
+    State lives in Redis so all web and worker processes share one schedule.
+    """
+    
+    LANE_GRADED = 'graded'
+    LANE_SCRATCH = 'scratch'
+    LANES = (LANE_GRADED, LANE_SCRATCH)
+    
+    PREFIX = 'djarvis:sched:'
+    RESULT_TTL = 300
+    
+    STATE_QUEUED = 'queued'
+    STATE_RUNNING = 'running'
+    STATE_DONE = 'done'
+    STATE_CANCELLED = 'cancelled'
+    STATE_EXPIRED = 'expired'
+    MIN_WEIGHT = 0.25
+    
+    def __init__(self, redis=None):
+        self.redis = redis or get_redis_connection('default')
+        self._submit = self.redis.register_script(SUBMIT_SCRIPT)
+        self._dispatch = self.redis.register_script(DISPATCH_SCRIPT)
+        self._release = self.redis.register_script(RELEASE_SCRIPT)
+        self._start = self.redis.register_script(START_SCRIPT)
+        self._cancel = self.redis.register_script(CANCEL_SCRIPT)
+    
+    def submit(
+        self,
+        user_id: int,
+        lane: str,
+        payload: Dict[str, Any],
+        weight: float = 1.0
+    ) -> str:
+        """
+        Add a job to the user's queue.
+        
+        Args:
+            user_id: Owner of the job
+            lane: LANE_GRADED or LANE_SCRATCH
+            payload: Job arguments passed to the worker
+            weight: Share of dispatch turns relative to other users
+        
+        Returns:
+            Job ID
+        """
+        if lane not in self.LANES:
+            raise ValueError(f"Unknown lane: {lane}")
+        
+        job = {
+            'id': uuid.uuid4().hex,
+            'user_id': user_id,
+            'lane': lane,
+            'payload': payload,
+            'enqueued_at': time.time(),
+        }
+        self._submit(args=[
+            self.PREFIX,
+            lane,
+            user_id,
+            max(weight, self.MIN_WEIGHT),
+            json.dumps(job),
+            job['id'],
+            self._status_ttl(payload),
+        ])
+        return job['id']
+    
+    def _status_ttl(self, payload: Dict[str, Any]) -> int:
+        """Seconds a job's status is kept: longest wait and run, then the result."""
+        return (
+            settings.SANDBOX_QUEUE_WAIT_TIMEOUT
+            + payload.get('timeout', settings.SANDBOX_TIMEOUT)
+            + self.RESULT_TTL
+        )
+    
+    def dispatch(self) -> Optional[Dict[str, Any]]:
+        """
+        Take the next job to run, or None if nothing is dispatchable.
+        
+        The job counts as in flight for its user until complete() is called.
+        """
+        raw = self._dispatch(args=[
+            self.PREFIX,
+            settings.SANDBOX_USER_MAX_INFLIGHT,
+            settings.SANDBOX_TIMEOUT + settings.SANDBOX_QUEUE_WAIT_TIMEOUT,
+            *self.LANES,
+        ])
+        if not raw:
+            return None
+        job = json.loads(raw)
+        job['queue_wait_time'] = time.time() - job['enqueued_at']
+        return job
+    
+    def start(self, job: Dict[str, Any]) -> bool:
+        """
+        Mark a dispatched job as running.
+        
+        Returns:
+            False if the job was cancelled or waited longer than
+            SANDBOX_QUEUE_WAIT_TIMEOUT; it must then not run, and its
+            in-flight slot is already released
+        """
+        expired = job['queue_wait_time'] > settings.SANDBOX_QUEUE_WAIT_TIMEOUT
+        return bool(self._start(args=[self.PREFIX, job['user_id'], job['id'], int(expired)]))
+    
+    def complete(self, job: Dict[str, Any], result: Dict[str, Any]) -> None:
+        """Release the user's in-flight slot and publish the job result."""
+        self._release(args=[self.PREFIX, job['user_id']])
+        status_key = f"{self.PREFIX}status:{job['id']}"
+        pipe = self.redis.pipeline()
+        pipe.hset(status_key, mapping={'state': self.STATE_DONE, 'result': json.dumps(result)})
+        pipe.expire(status_key, self.RESULT_TTL)
+        pipe.execute()
+    
+    def status(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Get a job's owner, state and, once done, its result.
+        
+        Returns:
+            Dictionary with user_id, state and result (None until done), or
+            None for an unknown or forgotten job
+        """
+        fields = self.redis.hgetall(f"{self.PREFIX}status:{job_id}")
+        if not fields:
+            return None
+        fields = {key.decode(): value.decode() for key, value in fields.items()}
+        return {
+            'user_id': int(fields['user_id']),
+            'state': fields['state'],
+            'result': json.loads(fields['result']) if 'result' in fields else None,
+        }
+    
+    def cancel(self, job_id: str) -> Optional[str]:
+        """
+        Cancel a job that has not started running.
+        
+        Returns:
+            The job's state afterwards (cancelled unless it already ran or
+            started), or None for an unknown job
+        """
+        state = self._cancel(args=[self.PREFIX, job_id])
+        return state.decode() if state else None
+    
+    def has_pending(self) -> bool:
+        """Whether any lane still has users with queued jobs."""
+        pipe = self.redis.pipeline()
+        for lane in self.LANES:
+            pipe.llen(f"{self.PREFIX}ring:{lane}")
+        return any(pipe.execute())
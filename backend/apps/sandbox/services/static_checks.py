@@ -0,0 +1,406 @@
+"""
+Static test cases evaluated on the parsed playbook, without execution.
+"""
+import logging
+import shlex
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Keys of a task that are not its module
+TASK_KEYWORDS = {
+    'name', 'action', 'local_action', 'args', 'async', 'become', 'become_exe',
+    'become_flags', 'become_method', 'become_user', 'changed_when', 'check_mode',
+    'collections', 'connection', 'debugger', 'delay', 'delegate_facts',
+    'delegate_to', 'diff', 'environment', 'failed_when', 'ignore_errors',
+    'ignore_unreachable', 'listen', 'loop', 'loop_control', 'module_defaults',
+    'no_log', 'notify', 'poll', 'port', 'register', 'remote_user', 'retries',
+    'run_once', 'tags', 'throttle', 'timeout', 'until', 'vars', 'when',
+    'block', 'rescue', 'always',
+}
+
+# Task lists of a play, in execution order
+PLAY_TASK_SECTIONS = ('pre_tasks', 'tasks', 'post_tasks')
+
+TRUE_VALUES = {'true', 'yes', 'on', '1'}
+FALSE_VALUES = {'false', 'no', 'off', '0'}
+
+
+def _normalize(value: Any) -> Any:
+    """Compare YAML scalars the way Ansible reads them ('yes' == True)."""
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, str):
+        lowered = value.strip().lower()
+        if lowered in TRUE_VALUES:
+            return True
+        if lowered in FALSE_VALUES:
+            return False
+        return value.strip()
+    if isinstance(value, (list, tuple)):
+        return [_normalize(item) for item in value]
+    if isinstance(value, dict):
+        return {key: _normalize(item) for key, item in value.items()}
+    if value is None:
+        return None
+    return str(value)
+
+
+def _matches(expected: Any, actual: Any) -> bool:
+    """Expected dicts match any superset, other values must be equal."""
+    if isinstance(expected, dict):
+        return isinstance(actual, dict) and all(
+            key in actual and _matches(value, actual[key])
+            for key, value in expected.items()
+        )
+    return _normalize(expected) == _normalize(actual)
+
+
+def module_matches(expected: str, actual: Optional[str]) -> bool:
+    """
+    Whether a task's module is the expected one.
+    
+    Short names match any collection ('copy' matches 'ansible.builtin.copy');
+    fully qualified names match themselves and, for builtins, the short name.
+    """
+    if not actual:
+        return False
+    if actual == expected:
+        return True
+    if '.' not in expected:
+        return actual.rsplit('.', 1)[-1] == expected
+    return expected in (f'ansible.builtin.{actual}', f'ansible.legacy.{actual}')
+
+
+def _parse_free_form(arguments: str) -> Dict[str, Any]:
+    """Parse 'key=value' module arguments; other words go to _raw_params."""
+    parsed, raw = {}, []
+    try:
+        words = shlex.split(arguments)
+    except ValueError:
+        words = arguments.split()
+    for word in words:
+        key, sep, value = word.partition('=')
+        if sep and key.isidentifier():
+            parsed[key] = value
+        else:
+            raw.append(word)
+    if raw:
+        parsed['_raw_params'] = ' '.join(raw)
+    return parsed
+
+
+def task_module(task: Dict[str, Any]) -> Tuple[Optional[str], Dict[str, Any]]:
+    """
+    Module of a task and its arguments.
+    
+    Returns:
+        Tuple of (module name or None, arguments)
+    """
+    module, arguments = None, None
+    for key in ('action', 'local_action'):
+        if key in task:
+            action = task[key]
+            if isinstance(action, dict):
+                arguments = dict(action)
+                module = arguments.pop('module', None)
+            else:
+                module, _, arguments = str(action).partition(' ')
+            break
+    else:
+        for key, value in task.items():
+            if key not in TASK_KEYWORDS and not key.startswith('with_'):
+                module, arguments = key, value
+                break
+    
+    if isinstance(arguments, dict):
+        arguments = dict(arguments)
+    elif isinstance(arguments, str):
+        arguments = _parse_free_form(arguments)
+    else:
+        arguments = {}
+    if isinstance(task.get('args'), dict):
+        arguments.update(task['args'])
+    return module, arguments
+
+
+class PlaybookModel:
+    """
+    Flattened view of a parsed playbook.
+    
+    Tasks are listed per play in execution order with blocks expanded; each
+    task keeps the keywords inherited from its enclosing blocks and play so
+    keyword checks see the effective value.
+    """
+    
+    def __init__(self, data: Any):
+        self.plays = [
+            play for play in (data if isinstance(data, list) else [])
+            if isinstance(play, dict) and 'import_playbook' not in play
+        ]
+    
+    @staticmethod
+    def _flatten(tasks: Any, inherited: List[Dict[str, Any]]) -> Iterator[Tuple[Dict, List[Dict]]]:
+        for task in tasks if isinstance(tasks, list) else []:
+            if not isinstance(task, dict):
+                continue
+            if 'block' in task:
+                scopes = [task] + inherited
+                for section in ('block', 'rescue', 'always'):
+                    yield from PlaybookModel._flatten(task.get(section), scopes)
+            else:
+                yield task, inherited
+    
+    def tasks(self, play: Dict[str, Any]) -> List[Tuple[Dict, List[Dict]]]:
+        """Tasks of a play with their enclosing blocks and play, innermost first."""
+        return [
+            item
+            for section in PLAY_TASK_SECTIONS
+            for item in self._flatten(play.get(section), [play])
+        ]
+    
+    def handlers(self, play: Dict[str, Any]) -> List[Dict[str, Any]]:
+        return [task for task, _ in self._flatten(play.get('handlers'), [play])]
+    
+    def all_tasks(self) -> List[Tuple[Dict, List[Dict]]]:
+        return [item for play in self.plays for item in self.tasks(play)]
+
+
+class StaticChecker:
+    """
+    Runs structural test cases against a parsed playbook.
+    
+    Static test types:
+        module_used: some task uses `module`, with at least the given `args`
+            (and at least `count` times, default 1)
+        keyword_present: `keyword` is set (to `value`, if given) on a play or
+            task, per `scope` ('play', 'task' or 'any'); with `module`, every
+            task using that module must have it, directly or inherited
+        task_order: `modules` (or task `names`) appear in this order within
+            one play, other tasks may come in between
+        handler_notified: a handler named (or listening to) `handler` exists
+            and is notified by a task of the same play, optionally a task
+            using `module`
+    
+    Results have the same shape as TestRunner's, so both can be merged.
+    """
+    
+    TEST_TYPES = frozenset({
+        'module_used', 'keyword_present', 'task_order', 'handler_notified',
+    })
+    
+    @classmethod
+    def is_static(cls, test_case: Dict[str, Any]) -> bool:
+        return test_case.get('type') in cls.TEST_TYPES
+    
+    @classmethod
+    def split(cls, test_cases: List[Dict[str, Any]]) -> Tuple[List[Dict], List[Dict]]:
+        """
+        Separate static test cases from ones needing an execution.
+        
+        Returns:
+            Tuple of (static test cases, runtime test cases)
+        """
+        static = [test for test in test_cases if cls.is_static(test)]
+        runtime = [test for test in test_cases if not cls.is_static(test)]
+        return static, runtime
+    
+    @classmethod
+    def run_tests(cls, test_cases: List[Dict[str, Any]], playbook_data: Any) -> Dict[str, Any]:
+        """
+        Evaluate static test cases on a parsed playbook.
+        
+        Args:
+            test_cases: Static test case definitions
+            playbook_data: Playbook as returned by yaml.safe_load
+        
+        Returns:
+            Test execution results
+        """
+        playbook = PlaybookModel(playbook_data)
+        test_results = [cls._run_single_test(test_case, playbook) for test_case in test_cases]
+        passed_count = sum(1 for result in test_results if result['passed'])
+        
+        return {
+            "passed": passed_count == len(test_cases),
+            "total_tests": len(test_cases),
+            "passed_tests": passed_count,
+            "failed_tests": len(test_cases) - passed_count,
+            "test_results": test_results
+        }
+    
+    @classmethod
+    def _run_single_test(cls, test_case: Dict[str, Any], playbook: PlaybookModel) -> Dict[str, Any]:
+        checks = {
+            'module_used': cls._test_module_used,
+            'keyword_present': cls._test_keyword_present,
+            'task_order': cls._test_task_order,
+            'handler_notified': cls._test_handler_notified,
+        }
+        try:
+            return checks[test_case['type']](test_case, playbook)
+        except Exception as e:
+            logger.error(f"Static test error: {e}")
+            return {
+                "passed": False,
+                "name": test_case.get('name', 'Unknown test'),
+                "error": str(e)
+            }
+    
+    @staticmethod
+    def _test_module_used(test_case: Dict[str, Any], playbook: PlaybookModel) -> Dict[str, Any]:
+        """Test that a module is used, optionally with given arguments."""
+        module = test_case['module']
+        expected_args = test_case.get('args') or {}
+        count = test_case.get('count', 1)
+        
+        used = matching = 0
+        for task, _ in playbook.all_tasks():
+            name, arguments = task_module(task)
+            if module_matches(module, name):
+                used += 1
+                if _matches(expected_args, arguments):
+                    matching += 1
+        
+        passed = matching >= count
+        if passed:
+            message = f"Module '{module}' is used"
+        elif used and expected_args:
+            message = f"Module '{module}' is used, but not with the expected arguments"
+        else:
+            message = f"Module '{module}' is not used"
+        
+        return {
+            "passed": passed,
+            "name": test_case.get('name', f"Uses {module}"),
+            "expected": {"module": module, "args": expected_args, "count": count},
+            "message": message
+        }
+    
+    @staticmethod
+    def _test_keyword_present(test_case: Dict[str, Any], playbook: PlaybookModel) -> Dict[str, Any]:
+        """Test that a play or task keyword is set."""
+        keyword = test_case['keyword']
+        has_value = 'value' in test_case
+        value = test_case.get('value')
+        scope = test_case.get('scope', 'any')
+        module = test_case.get('module')
+        
+        def is_set(scopes: List[Dict[str, Any]]) -> bool:
+            # The innermost scope setting the keyword wins
+            for item in scopes:
+                if keyword in item:
+                    return not has_value or _matches(value, item[keyword])
+            return False
+        
+        if module:
+            using = [
+                [task] + inherited
+                for task, inherited in playbook.all_tasks()
+                if module_matches(module, task_module(task)[0])
+            ]
+            passed = bool(using) and all(is_set(scopes) for scopes in using)
+            message = (
+                f"Tasks using '{module}' set '{keyword}'" if passed
+                else f"Every task using '{module}' must set '{keyword}'" if using
+                else f"No task uses '{module}'"
+            )
+        else:
+            candidates = []
+            if scope in ('play', 'any'):
+                candidates += [[play] for play in playbook.plays]
+            if scope in ('task', 'any'):
+                candidates += [[task] for task, _ in playbook.all_tasks()]
+            passed = any(is_set(scopes) for scopes in candidates)
+            message = f"'{keyword}' is set" if passed else f"'{keyword}' is not set"
+        
+        return {
+            "passed": passed,
+            "name": test_case.get('name', f"Sets {keyword}"),
+            "expected": {keyword: value} if has_value else keyword,
+            "message": message
+        }
+    
+    @staticmethod
+    def _test_task_order(test_case: Dict[str, Any], playbook: PlaybookModel) -> Dict[str, Any]:
+        """Test that tasks appear in a given order within a play."""
+        if 'modules' in test_case:
+            steps = test_case['modules']
+            
+            def matches(task, step):
+                return module_matches(step, task_module(task)[0])
+        else:
+            steps = test_case['names']
+            
+            def matches(task, step):
+                return str(task.get('name', '')).strip().lower() == step.strip().lower()
+        
+        passed = False
+        for play in playbook.plays:
+            position = 0
+            for task, _ in playbook.tasks(play):
+                if position < len(steps) and matches(task, steps[position]):
+                    position += 1
+            if position == len(steps):
+                passed = True
+                break
+        
+        return {
+            "passed": passed,
+            "name": test_case.get('name', 'Task order'),
+            "expected": steps,
+            "message": "Tasks are in the expected order" if passed
+            else "Tasks are missing or out of order"
+        }
+    
+    @staticmethod
+    def _test_handler_notified(test_case: Dict[str, Any], playbook: PlaybookModel) -> Dict[str, Any]:
+        """Test that a handler exists and is notified by a task of its play."""
+        handler = test_case['handler']
+        module = test_case.get('module')
+        
+        defined = notified = False
+        for play in playbook.plays:
+            topics = set()
+            for task in playbook.handlers(play):
+                listen = task.get('listen') or []
+                topics.update([task.get('name')] + (listen if isinstance(listen, list) else [listen]))
+            if handler not in topics:
+                continue
+            defined = True
+            
+            for task, _ in playbook.tasks(play):
+                notify = task.get('notify') or []
+                if handler in (notify if isinstance(notify, list) else [notify]):
+                    if not module or module_matches(module, task_module(task)[0]):
+                        notified = True
+        
+        if notified:
+            message = f"Handler '{handler}' is notified"
+        elif defined:
+            message = f"Handler '{handler}' is never notified"
+        else:
+            message = f"Handler '{handler}' is not defined"
+        
+        return {
+            "passed": notified,
+            "name": test_case.get('name', f"Notifies {handler}"),
+            "expected": handler,
+            "message": message
+        }
+
+
+def merge_results(*results: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Combine static and runtime test results into one report."""
+    results = [result for result in results if result is not None]
+    merged = {
+        "passed": all(result['passed'] for result in results),
+        "total_tests": sum(result['total_tests'] for result in results),
+        "passed_tests": sum(result['passed_tests'] for result in results),
+        "failed_tests": sum(result['failed_tests'] for result in results),
+        "test_results": [test for result in results for test in result['test_results']],
+    }
+    errors = [result['error'] for result in results if result.get('error')]
+    if errors:
+        merged['error'] = errors[0]
+    return merged
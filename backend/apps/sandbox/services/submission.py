@@ -0,0 +1,147 @@
+"""
+Grading and recording of sandbox runs of submitted code.
+
+A run is finished here whether it ran in the request (direct execution) or
+on a worker (fair queue), so a queued result is recorded even if the client
+stopped waiting for it.
+"""
+import logging
+from typing import Any, Dict, Optional, Tuple
+
+from django.contrib.auth import get_user_model
+from django.utils import timezone
+
+from apps.exercises.models import AttemptLimitReached, Exercise, ExerciseAttempt
+from .. import metrics
+from ..models import SandboxSession, WorkspaceVolume
+from .fingerprint import FingerprintGrader
+from .static_checks import merge_results
+from .test_runner import TestRunner
+
+logger = logging.getLogger(__name__)
+
+# Recent complete runs of an exercise an early-stopped run is compared to
+EARLY_ABORT_BASELINE_RUNS = 50
+
+
+def attempts_exhausted(exercise) -> Tuple[Dict[str, Any], int]:
+    """Response to a submission beyond the exercise's attempt limit."""
+    return (
+        {"error": f"All {exercise.max_attempts} attempts at this exercise have been used."},
+        403
+    )
+
+
+def record_early_abort(exercise, execution_result: Dict[str, Any]) -> None:
+    """
+    Count a run stopped early and estimate the run time it saved, from
+    the median of the exercise's recent complete runs.
+    """
+    run_time = execution_result.get('execution_time') or 0.0
+    recent = sorted(
+        ExerciseAttempt.objects.filter(exercise=exercise, execution_time__gt=0)
+        .exclude(timings__has_key='aborted')
+        .order_by('-created_at')
+        .values_list('execution_time', flat=True)[:EARLY_ABORT_BASELINE_RUNS]
+    )
+    metrics.incr('early_abort')
+    metrics.incr('early_abort_ms_run', int(run_time * 1000))
+    if recent:
+        full_run = recent[len(recent) // 2]
+        metrics.incr('early_abort_ms_saved', int(max(full_run - run_time, 0.0) * 1000))
+
+
+def finish_execution(
+    user_id: int,
+    session_id: int,
+    execution_result: Dict[str, Any],
+    grading: Dict[str, Any]
+) -> Tuple[Dict[str, Any], int]:
+    """
+    Grade a sandbox run, record the attempt and build the submission response.
+    
+    Args:
+        user_id: Submitting user
+        session_id: Sandbox session the code ran in
+        execution_result: Result of DockerExecutor.run_execution
+        grading: JSON-serializable grading context prepared by the request:
+            exercise_id (or None), code, node_image, reset_nodes,
+            static_results, runtime_tests, fingerprint_tests, reference
+            and warnings
+    
+    Returns:
+        Tuple of (response data, HTTP status)
+    """
+    user = get_user_model().objects.get(id=user_id)
+    session: Optional[SandboxSession] = SandboxSession.objects.filter(id=session_id).first()
+    
+    if execution_result.pop('reset_failed', False):
+        return {"error": "Failed to reset sandbox managed nodes"}, 500
+    if grading['reset_nodes'] and session is not None:
+        session.node_image = grading['node_image']
+        session.save(update_fields=['node_image'])
+    
+    exercise = None
+    if grading['exercise_id']:
+        exercise = Exercise.objects.filter(id=grading['exercise_id']).first()
+    
+    timings = execution_result.get('timings') or {}
+    if execution_result.get('queue_wait_time') is not None:
+        timings['queue'] = round(execution_result['queue_wait_time'], 3)
+    if execution_result.get('aborted'):
+        timings['aborted'] = True
+        if exercise:
+            record_early_abort(exercise, execution_result)
+    
+    # Run tests if exercise_id provided
+    test_results = None
+    is_passed = False
+    fingerprint = execution_result.pop('fingerprint', None)
+    
+    if exercise:
+        fingerprint_tests = grading['fingerprint_tests']
+        test_results = merge_results(
+            grading['static_results'],
+            TestRunner.run_tests(grading['runtime_tests'], execution_result),
+            FingerprintGrader.run_tests(
+                fingerprint_tests,
+                grading['reference'],
+                fingerprint
+            ) if fingerprint_tests else None
+        )
+        is_passed = test_results['passed']
+        
+        # Save attempt; concurrent submissions may have used the last one
+        try:
+            ExerciseAttempt.objects.create(
+                exercise=exercise,
+                user=user,
+                code_submitted=grading['code'],
+                output=execution_result.get('stdout', ''),
+                error_message=execution_result.get('stderr', ''),
+                test_results=test_results,
+                is_passed=is_passed,
+                execution_time=execution_result.get('execution_time'),
+                queue_wait_time=execution_result.get('queue_wait_time'),
+                exit_code=execution_result.get('exit_code'),
+                timings=timings
+            )
+        except AttemptLimitReached:
+            return attempts_exhausted(exercise)
+        
+        # Award XP if passed
+        if is_passed:
+            user.add_xp(exercise.xp_reward)
+    
+    # Update session activity
+    if session is not None:
+        session.last_activity = timezone.now()
+        session.save(update_fields=['last_activity'])
+    WorkspaceVolume.touch(user)
+    
+    return {
+        **execution_result,
+        "test_results": test_results,
+        "is_passed": is_passed,
+        "warnings": grading['warnings']
+    }, 200
@@ -3,10 +3,57 @@ Test runner for exercise validation.
 """
 import logging
 import json
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Optional
+
+from .static_checks import PLAY_TASK_SECTIONS, task_module
+from .timings import EVENT_MARKER
 
 logger = logging.getLogger(__name__)
 
+# Modules running tasks that are not part of the submitted playbook
+INCLUDE_MODULES = {'include', 'include_tasks', 'import_tasks', 'include_role', 'import_role'}
+
+# Callback events after which a run cannot succeed
+FAILURE_EVENTS = {'failed', 'unreachable'}
+
+
+def _tasks_may_recover(tasks: Any) -> bool:
+    for task in tasks if isinstance(tasks, list) else []:
+        if not isinstance(task, dict):
+            continue
+        if task.get('rescue'):
+            return True
+        if 'block' in task:
+            if _tasks_may_recover(task.get('block')) or _tasks_may_recover(task.get('always')):
+                return True
+            continue
+        module, arguments = task_module(task)
+        name = (module or '').rsplit('.', 1)[-1]
+        if name in INCLUDE_MODULES:
+            return True
+        if name == 'meta' and 'clear_host_errors' in (arguments.get('_raw_params'), arguments.get('free_form')):
+            return True
+    return False
+
+
+def may_recover_from_failure(playbook_data: Any) -> bool:
+    """
+    Whether a failed task might not fail the whole run.
+    
+    True for playbooks with rescue sections or clear_host_errors, and for
+    playbooks running tasks that cannot be inspected (roles, included
+    files, imported playbooks) or that could not be parsed.
+    """
+    if not isinstance(playbook_data, list):
+        return True
+    for play in playbook_data:
+        if not isinstance(play, dict) or 'import_playbook' in play or play.get('roles'):
+            return True
+        for section in PLAY_TASK_SECTIONS + ('handlers',):
+            if _tasks_may_recover(play.get(section)):
+                return True
+    return False
+
 
 class TestRunner:
     """
@@ -29,13 +76,16 @@ class TestRunner:
             Test execution results
         """
         if not execution_result.get('success'):
+            error = "Playbook execution failed"
+            if execution_result.get('aborted'):
+                error = f"Playbook stopped early: {execution_result.get('abort_reason')}"
             return {
                 "passed": False,
                 "total_tests": len(test_cases),
                 "passed_tests": 0,
                 "failed_tests": len(test_cases),
                 "test_results": [],
-                "error": "Playbook execution failed"
+                "error": error
             }
         
         test_results = []
@@ -163,3 +213,56 @@ class TestRunner:
             "name": test_case.get('name', 'No errors test'),
             "message": "Execution completed without errors" if passed else "Errors detected"
         }
+
+
+class StreamingTestEvaluator:
+    """
+    Evaluates test cases incrementally over a playbook's live output.
+    
+    TestRunner fails every test of a run that did not succeed, so the
+    outcome is decided by the first task failure the controller's callback
+    plugin reports, unless the playbook might recover from it. Until then
+    nothing is decided: output and changes are only known at the end.
+    """
+    
+    def __init__(self, test_cases: List[Dict[str, Any]], playbook_data: Any):
+        self.test_cases = test_cases
+        self.can_decide = bool(test_cases) and not may_recover_from_failure(playbook_data)
+        self.failure: Optional[Dict[str, Any]] = None
+        self._partial = ''
+    
+    @property
+    def decided_failed(self) -> bool:
+        return self.can_decide and self.failure is not None
+    
+    @property
+    def reason(self) -> Optional[str]:
+        if self.failure is None:
+            return None
+        task = self.failure.get('task') or 'unnamed task'
+        host = self.failure.get('host') or 'unknown host'
+        if self.failure.get('event') == 'unreachable':
+            return f"{host} was unreachable in task '{task}'"
+        return f"task '{task}' failed on {host}"
+    
+    def feed(self, data: str) -> bool:
+        """
+        Consume a chunk of playbook stdout.
+        
+        Returns:
+            Whether the tests are decided as failed
+        """
+        lines = (self._partial + data).split('\n')
+        self._partial = lines.pop()
+        for line in lines:
+            if self.failure is not None:
+                break
+            if not line.startswith(EVENT_MARKER):
+                continue
+            try:
+                event = json.loads(line[len(EVENT_MARKER):])
+            except ValueError:
+                continue
+            if isinstance(event, dict) and event.get('event') in FAILURE_EVENTS:
+                self.failure = event
+        return self.decided_failed
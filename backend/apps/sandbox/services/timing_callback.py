@@ -0,0 +1,94 @@
+"""
+Ansible callback plugin reporting playbook and per-task timings.
+
+This file is not imported by Django: its source is installed into sandbox
+controllers as the "djarvis_timings" callback plugin and enabled through
+ANSIBLE_CALLBACKS_ENABLED. Like profile_tasks, a task lasts from its start
+until the next task (or the end of the run) starts, across all hosts.
+
+At the end of the run it prints a single line
+
+    DJARVIS_TIMINGS {"start": ..., "end": ..., "tasks": [[name, action, seconds], ...]}
+
+which the executor removes from the output shown to students.
+
+Task failures that are not ignored are reported as soon as they happen,
+so graded runs can be stopped early, with one line each:
+
+    DJARVIS_EVENT {"event": "failed" | "unreachable", "host": ..., "task": ...}
+"""
+import json
+import time
+
+from ansible.plugins.callback import CallbackBase
+
+DOCUMENTATION = '''
+    name: djarvis_timings
+    type: aggregate
+    short_description: Reports playbook and per-task timings to Djarvis
+    description:
+      - Prints one JSON line with the playbook start and end time and the
+        duration of every task.
+    requirements:
+      - enable in configuration
+'''
+
+MARKER = "DJARVIS_TIMINGS "
+EVENT_MARKER = "DJARVIS_EVENT "
+
+
+class CallbackModule(CallbackBase):
+    CALLBACK_VERSION = 2.0
+    CALLBACK_TYPE = 'aggregate'
+    CALLBACK_NAME = 'djarvis_timings'
+    CALLBACK_NEEDS_ENABLED = True
+    CALLBACK_NEEDS_WHITELIST = True
+    
+    def __init__(self, *args, **kwargs):
+        super(CallbackModule, self).__init__(*args, **kwargs)
+        self.started = None
+        self.tasks = []
+        self.current = None
+    
+    def _finish_task(self):
+        if self.current is not None:
+            name, action, start = self.current
+            self.tasks.append([name, action, round(time.time() - start, 3)])
+            self.current = None
+    
+    def _start_task(self, task):
+        self._finish_task()
+        self.current = (task.get_name(), task.action, time.time())
+    
+    def _event(self, event, result):
+        report = {
+            "event": event,
+            "host": result._host.get_name(),
+            "task": result._task.get_name(),
+        }
+        self._display.display(EVENT_MARKER + json.dumps(report), screen_only=True)
+    
+    def v2_playbook_on_start(self, playbook):
+        self.started = time.time()
+    
+    def v2_playbook_on_play_start(self, play):
+        self._finish_task()
+    
+    def v2_playbook_on_task_start(self, task, is_conditional):
+        self._start_task(task)
+    
+    def v2_playbook_on_handler_task_start(self, task):
+        self._start_task(task)
+    
+    def v2_runner_on_failed(self, result, ignore_errors=False):
+        if not ignore_errors:
+            self._event("failed", result)
+    
+    def v2_runner_on_unreachable(self, result):
+        if not result._task.ignore_unreachable:
+            self._event("unreachable", result)
+    
+    def v2_playbook_on_stats(self, stats):
+        self._finish_task()
+        report = {"start": self.started, "end": time.time(), "tasks": self.tasks}
+        self._display.display(MARKER + json.dumps(report), screen_only=True)
@@ -0,0 +1,135 @@
+"""
+Phase and per-task timing breakdown of executions.
+"""
+import json
+import math
+from collections import defaultdict
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+CALLBACK_NAME = 'djarvis_timings'
+CALLBACK_SOURCE = (Path(__file__).parent / 'timing_callback.py').read_text()
+MARKER = 'DJARVIS_TIMINGS '
+EVENT_MARKER = 'DJARVIS_EVENT '
+
+# Phases stored on attempts, in execution order
+PHASES = ('queue', 'transfer', 'startup', 'facts', 'run', 'total')
+
+FACT_ACTIONS = {
+    'gather_facts', 'setup',
+    'ansible.builtin.gather_facts', 'ansible.builtin.setup',
+}
+
+MAX_TASKS = 200
+MAX_NAME_LENGTH = 120
+
+
+def _seconds(value: float) -> float:
+    return round(value, 3)
+
+
+def extract_report(stdout: str) -> Tuple[str, Optional[Dict[str, Any]]]:
+    """
+    Split the timing callback's report line from playbook output.
+    
+    Live event lines of the callback are dropped as well.
+    
+    Returns:
+        Tuple of (output without the report line, report or None)
+    """
+    report = None
+    kept = []
+    for line in stdout.splitlines(keepends=True):
+        if line.startswith(MARKER):
+            try:
+                report = json.loads(line[len(MARKER):])
+            except ValueError:
+                pass
+            continue
+        if line.startswith(EVENT_MARKER):
+            continue
+        kept.append(line)
+    return ''.join(kept), report
+
+
+def build_timings(
+    report: Optional[Dict[str, Any]],
+    total_time: float,
+    transfer_time: Optional[float] = None,
+    spawned_at: Optional[float] = None
+) -> Dict[str, Any]:
+    """
+    Compact timing breakdown of one execution.
+    
+    Phases are in seconds: transfer (request until the process is spawned),
+    startup (interpreter and playbook loading until the first play), facts
+    (fact gathering tasks), run (playbook start to end) and total. Tasks are
+    [name, action, seconds] lists in execution order.
+    """
+    timings: Dict[str, Any] = {'total': _seconds(total_time)}
+    if transfer_time is not None:
+        timings['transfer'] = _seconds(transfer_time)
+    if not report:
+        return timings
+    
+    start, end = report.get('start'), report.get('end')
+    if start and spawned_at:
+        timings['startup'] = _seconds(max(start - spawned_at, 0.0))
+    if start and end:
+        timings['run'] = _seconds(end - start)
+    
+    tasks = report.get('tasks') or []
+    timings['facts'] = _seconds(sum(
+        duration for _, action, duration in tasks if action in FACT_ACTIONS
+    ))
+    timings['tasks'] = [
+        [name[:MAX_NAME_LENGTH], action, duration]
+        for name, action, duration in tasks[:MAX_TASKS]
+    ]
+    return timings
+
+
+def _stats(values: List[float]) -> Dict[str, float]:
+    values = sorted(values)
+    p95 = values[min(len(values) - 1, math.ceil(len(values) * 0.95) - 1)]
+    return {
+        'avg': _seconds(sum(values) / len(values)),
+        'p95': _seconds(p95),
+        'max': _seconds(values[-1]),
+    }
+
+
+def summarize_timings(timings_list: Iterable[Dict[str, Any]], limit: int = 10) -> Dict[str, Any]:
+    """
+    Aggregate the timings of many executions.
+    
+    Returns:
+        Dictionary with the number of executions, avg/p95/max per phase and
+        the `limit` tasks with the highest average duration
+    """
+    phases: Dict[str, List[float]] = defaultdict(list)
+    tasks: Dict[Tuple[str, str], List[float]] = defaultdict(list)
+    count = 0
+    
+    for timings in timings_list:
+        count += 1
+        for phase in PHASES:
+            if timings.get(phase) is not None:
+                phases[phase].append(timings[phase])
+        for name, action, duration in timings.get('tasks', []):
+            tasks[(name, action)].append(duration)
+    
+    slowest = sorted(
+        (
+            {'name': name, 'action': action, 'count': len(durations), **_stats(durations)}
+            for (name, action), durations in tasks.items()
+        ),
+        key=lambda task: task['avg'],
+        reverse=True
+    )
+    
+    return {
+        'executions': count,
+        'phases': {phase: _stats(phases[phase]) for phase in PHASES if phases[phase]},
+        'slowest_tasks': slowest[:limit],
+    }
@@ -0,0 +1,224 @@
+"""
+Pool of pre-provisioned sandboxes waiting to be claimed.
+"""
+import logging
+import uuid
+from datetime import timedelta
+from typing import Any, Dict, Optional, Tuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from .. import metrics
+from ..models import SandboxSession
+from .docker_executor import DockerExecutor, parse_memory_size
+
+logger = logging.getLogger(__name__)
+
+
+class WarmPool:
+    """
+    Keeps unassigned sandboxes ready so new sessions skip provisioning.
+    
+    A warm sandbox has its network and baseline managed nodes running but no
+    controller, since the controller mounts the claiming user's workspace
+    volumes. Claiming one only starts the controller. Warm sandboxes are
+    SandboxSession rows without a user in the 'warm' status.
+    """
+    
+    FORECAST_CACHE_KEY = 'djarvis:warm_pool:forecast'
+    
+    # Below interactive work, but refilling the pool matters more than prefetch
+    TASK_PRIORITY = 6
+    
+    def __init__(self, executor: Optional[DockerExecutor] = None):
+        self.executor = executor or DockerExecutor()
+    
+    @staticmethod
+    def _warm():
+        return SandboxSession.objects.filter(status='warm', user__isnull=True)
+    
+    def take(self, node_image: str) -> Optional[Tuple[str, str]]:
+        """
+        Remove a ready warm sandbox with the given node image from the pool.
+        
+        The caller owns the containers afterwards and must start their
+        controller (or stop them).
+        
+        Returns:
+            Tuple of (container_name, first managed node ID), or None
+        """
+        with transaction.atomic():
+            warm = (
+                self._warm()
+                .filter(
+                    container_id__isnull=False,
+                    node_image=node_image,
+                    expires_at__gt=timezone.now()
+                )
+                .order_by('created_at')
+                .select_for_update(skip_locked=True)
+                .first()
+            )
+            if warm is None:
+                return None
+            taken = warm.container_name, warm.container_id
+            warm.delete()
+        return taken
+    
+    def create_sandbox(
+        self,
+        user_id: int,
+        session_name: str,
+        node_image: str
+    ) -> Tuple[str, str]:
+        """
+        Create a user's sandbox, from the warm pool when possible.
+        
+        Same contract as DockerExecutor.create_sandbox; a sandbox taken from
+        the pool keeps its pool container name.
+        """
+        if settings.SANDBOX_WARM_POOL_ENABLED:
+            taken = self.take(node_image)
+            if taken is not None:
+                container_name, node_id = taken
+                try:
+                    control_id = self.executor.start_controller(container_name, user_id)
+                except Exception as e:
+                    logger.error(f"Failed to claim warm sandbox {container_name}: {e}")
+                    self.executor.stop_container(container_name)
+                else:
+                    metrics.incr('warm_pool_hit')
+                    return control_id or node_id, container_name
+            metrics.incr('warm_pool_miss')
+        
+        return self.executor.create_sandbox(user_id, session_name, node_image=node_image)
+    
+    def provision(self, session_id: int) -> Optional[str]:
+        """Start the containers of a placeholder warm sandbox."""
+        session = self._warm().filter(id=session_id, container_id__isnull=True).first()
+        if session is None:
+            return None
+        
+        session_name = session.container_name.rsplit('_', 1)[-1]
+        try:
+            container_name, node_id = self.executor.provision_nodes(
+                DockerExecutor.WARM_POOL_OWNER,
+                session_name,
+                session.node_image
+            )
+        except Exception as e:
+            logger.error(f"Failed to provision warm sandbox {session.container_name}: {e}")
+            self.executor.stop_container(session.container_name)
+            SandboxSession.objects.filter(id=session_id).update(status='error')
+            return None
+        
+        # Retired while starting: undo
+        if not self._warm().filter(id=session_id).update(container_id=node_id):
+            self.executor.stop_container(container_name)
+            return None
+        return container_name
+    
+    def sandbox_memory(self) -> Tuple[int, int]:
+        """Memory reserved by one warm sandbox and by one claimed sandbox."""
+        warm = DockerExecutor.MANAGED_NODE_COUNT * parse_memory_size(DockerExecutor.NODE_MEMORY_LIMIT)
+        claimed = warm
+        if not self.executor.shared_controllers:
+            claimed += parse_memory_size(settings.SANDBOX_MEMORY_LIMIT)
+        return warm, claimed
+    
+    def capacity(self) -> int:
+        """
+        Largest pool allowed by the guardrails.
+        
+        Warm sandboxes count against MAX_CONCURRENT_SANDBOXES together with
+        active sessions, and must fit, with the active sessions and shared
+        controllers, in SANDBOX_HOST_MEMORY_FRACTION of the Docker host memory.
+        """
+        active = SandboxSession.objects.filter(
+            status__in=['reserved', 'starting', 'running'],
+            expires_at__gt=timezone.now()
+        ).count()
+        by_count = settings.MAX_CONCURRENT_SANDBOXES - active
+        
+        warm_memory, claimed_memory = self.sandbox_memory()
+        budget = self.executor.host_memory_bytes() * settings.SANDBOX_HOST_MEMORY_FRACTION
+        budget -= active * claimed_memory
+        if self.executor.shared_controllers:
+            budget -= (
+                settings.SANDBOX_CONTROLLER_POOL_SIZE
+                * parse_memory_size(settings.SANDBOX_CONTROLLER_MEMORY_LIMIT)
+            )
+        by_memory = int(budget // warm_memory)
+        
+        return max(0, min(by_count, by_memory))
+    
+    def scale(self, target: int) -> Dict[str, Any]:
+        """
+        Grow or shrink the pool towards a target size.
+        
+        New sandboxes are added as placeholder rows for the caller to
+        provision asynchronously; expired and surplus ready sandboxes are
+        removed here.
+        
+        Returns:
+            Dictionary with 'added' (placeholder session IDs), 'retired' and
+            'size' (pool size after scaling, including provisioning)
+        """
+        now = timezone.now()
+        retired = 0
+        
+        expired = list(self._warm().filter(expires_at__lte=now))
+        for session in expired:
+            retired += self._retire(session)
+        
+        pool = self._warm().filter(expires_at__gt=now)
+        size = pool.count()
+        
+        added = []
+        if size < target:
+            node_image = self.executor.ensure_node_baseline_image()
+            for _ in range(target - size):
+                session_name = str(uuid.uuid4())[:8]
+                added.append(SandboxSession.objects.create(
+                    user=None,
+                    container_name=DockerExecutor.sandbox_name(
+                        DockerExecutor.WARM_POOL_OWNER, session_name
+                    ),
+                    node_image=node_image,
+                    status='warm',
+                    expires_at=now + timedelta(seconds=settings.SANDBOX_WARM_POOL_MAX_AGE)
+                ).id)
+        elif size > target:
+            # Oldest ready sandboxes first; ones still provisioning are kept
+            surplus = pool.filter(container_id__isnull=False).order_by('created_at')[:size - target]
+            for session in surplus:
+                retired += self._retire(session)
+        
+        return {
+            'added': added,
+            'retired': retired,
+            'size': self._warm().filter(expires_at__gt=now).count(),
+        }
+    
+    def _retire(self, session) -> int:
+        """Remove a warm sandbox unless it was taken meanwhile."""
+        with transaction.atomic():
+            locked = self._warm().filter(id=session.id).select_for_update(skip_locked=True).first()
+            if locked is None:
+                return 0
+            locked.delete()
+        if session.container_id:
+            self.executor.stop_container(session.container_name)
+        return 1
+    
+    def report(self) -> Dict[str, Any]:
+        """Current pool state and the latest forecast."""
+        pool = self._warm().filter(expires_at__gt=timezone.now())
+        return {
+            'ready': pool.filter(container_id__isnull=False).count(),
+            'provisioning': pool.filter(container_id__isnull=True).count(),
+            'forecast': cache.get(self.FORECAST_CACHE_KEY),
+        }
@@ -2,11 +2,20 @@
 Celery tasks for sandbox management.
 """
 from celery import shared_task
+from django.conf import settings
+from django.core.cache import cache
 from django.utils import timezone
+from datetime import timedelta
+from typing import Optional
 import logging
 
-from .models import SandboxSession
-from .services import DockerExecutor
+from . import metrics
+from .models import SandboxSession, WorkspaceVolume
+from .services import DockerExecutor, fingerprint, submission
+from .services.fingerprint import FingerprintGrader
+from .services.forecast import DemandForecaster
+from .services.scheduler import FairScheduler
+from .services.warm_pool import WarmPool
 
 logger = logging.getLogger(__name__)
 
@@ -41,3 +50,286 @@ def cleanup_expired_sandboxes():
     
     logger.info(f"Sandbox cleanup completed. Cleaned {cleaned} containers.")
     return cleaned
+
+
+@shared_task
+def evict_workspace_volumes():
+    """
+    Evict persistent workspace volumes by TTL and LRU under a disk budget.
+    Runs hourly via Celery Beat.
+    
+    Volumes unused for SANDBOX_WORKSPACE_TTL_DAYS are removed first. If the
+    remaining volumes still exceed SANDBOX_WORKSPACE_DISK_BUDGET_MB, the least
+    recently used ones are removed until usage fits the budget. Volumes of
+    users with a running sandbox are never evicted.
+    """
+    logger.info("Starting workspace volume eviction")
+    
+    executor = DockerExecutor()
+    sizes = executor.get_workspace_volume_sizes()
+    
+    volumes = list(WorkspaceVolume.objects.order_by('last_used_at'))
+    for volume in volumes:
+        volume.size_bytes = sizes.get(volume.user_id, 0)
+    WorkspaceVolume.objects.bulk_update(volumes, ['size_bytes'])
+    
+    active_users = set(
+        SandboxSession.objects.filter(
+            status='running'
+        ).values_list('user_id', flat=True)
+    )
+    ttl_cutoff = timezone.now() - timedelta(days=settings.SANDBOX_WORKSPACE_TTL_DAYS)
+    budget = settings.SANDBOX_WORKSPACE_DISK_BUDGET_MB * 1024 * 1024
+    total_size = sum(volume.size_bytes for volume in volumes)
+    evicted = 0
+    
+    # Oldest first: expired volumes go regardless, then LRU until under budget
+    for volume in volumes:
+        if volume.user_id in active_users:
+            continue
+        if volume.last_used_at >= ttl_cutoff and total_size <= budget:
+            continue
+        if executor.remove_workspace_volumes(volume.user_id):
+            total_size -= volume.size_bytes
+            volume.delete()
+            evicted += 1
+    
+    logger.info(
+        f"Workspace eviction completed. Evicted {evicted} volumes, "
+        f"{total_size / (1024 * 1024):.1f} MB in use."
+    )
+    return evicted
+
+
+@shared_task
+def build_precondition_image(exercise_id: Optional[int] = None):
+    """
+    Build the cached managed node image for an exercise precondition.
+    Triggered when an exercise's precondition playbook changes, and when a
+    request finds the image it needs missing. Without an exercise, the
+    baseline image is built.
+    """
+    from apps.exercises.models import Exercise
+    
+    precondition = ''
+    if exercise_id is not None:
+        try:
+            precondition = Exercise.objects.get(id=exercise_id).precondition_playbook
+        except Exercise.DoesNotExist:
+            logger.warning(f"Exercise {exercise_id} not found, skipping image build")
+            return None
+    
+    executor = DockerExecutor()
+    try:
+        image_tag = executor.prepare_node_image(precondition)
+    except Exception as e:
+        logger.error(f"Failed to build node image for exercise {exercise_id}: {e}")
+        raise
+    
+    logger.info(f"Precondition image for exercise {exercise_id}: {image_tag}")
+    return image_tag
+
+
+@shared_task
+def capture_reference_fingerprint(exercise_id: int):
+    """
+    Run an exercise's reference solution and store its final-state fingerprint.
+    Triggered when the solution, precondition or test cases change, and when
+    a graded run finds the fingerprint missing or stale.
+    """
+    from apps.exercises.models import Exercise
+    
+    try:
+        exercise = Exercise.objects.get(id=exercise_id)
+    except Exercise.DoesNotExist:
+        logger.warning(f"Exercise {exercise_id} not found, skipping reference fingerprint")
+        return None
+    
+    fingerprint_tests, _ = fingerprint.split(exercise.test_cases)
+    spec = fingerprint.probe_spec(fingerprint_tests)
+    if not spec:
+        return None
+    
+    try:
+        FingerprintGrader(DockerExecutor()).reference(exercise, spec)
+    except Exception as e:
+        logger.error(f"Failed to capture reference fingerprint for exercise {exercise_id}: {e}")
+        raise
+    return exercise.reference_fingerprint['version']
+
+
+@shared_task
+def process_execution_queue():
+    """
+    Dispatch, run and record the next fair-queued sandbox execution.
+    Triggered once per submitted job, and again after each completion while
+    jobs remain queued (e.g. behind a user's in-flight cap).
+    
+    Cancelled jobs and jobs that waited longer than SANDBOX_QUEUE_WAIT_TIMEOUT
+    are skipped. The run is graded and its attempt recorded here, so the
+    result does not depend on the client still polling for it.
+    """
+    scheduler = FairScheduler()
+    while True:
+        job = scheduler.dispatch()
+        if job is None:
+            return None
+        if scheduler.start(job):
+            break
+        logger.info(f"Skipped queued execution {job['id']} (cancelled or expired)")
+    
+    payload = job['payload']
+    result = {
+        "status": 500,
+        "data": {"success": False, "error": "Execution aborted", "output": ""}
+    }
+    try:
+        execution_result = DockerExecutor().run_execution(
+            payload['container_name'],
+            payload['code'],
+            timeout=payload.get('timeout', settings.SANDBOX_TIMEOUT),
+            node_image=payload.get('node_image'),
+            reset_nodes=payload.get('reset_nodes', False),
+            probe_spec=payload.get('probe_spec'),
+            early_abort_tests=payload.get('early_abort_tests')
+        )
+        execution_result['queue_wait_time'] = job['queue_wait_time']
+        data, http_status = submission.finish_execution(
+            job['user_id'], payload['session_id'], execution_result, payload['grading']
+        )
+        result = {"status": http_status, "data": data}
+    except Exception as e:
+        logger.error(f"Queued execution {job['id']} failed: {e}")
+        result = {"status": 500, "data": {"success": False, "error": str(e), "output": ""}}
+    finally:
+        # Always release the user's slot and publish a result to poll
+        scheduler.complete(job, result)
+    
+    if scheduler.has_pending():
+        process_execution_queue.delay()
+    return job['id']
+
+
+@shared_task
+def prefetch_sandbox(session_id: int, exercise_id: int):
+    """
+    Provision a reserved sandbox for an exercise ahead of its first run.
+    Enqueued at low priority by the prefetch endpoint.
+    """
+    from apps.exercises.models import Exercise
+    
+    session = SandboxSession.objects.filter(
+        id=session_id,
+        status='reserved'
+    ).select_related('user').first()
+    if session is None or session.is_expired:
+        return None
+    
+    exercise = Exercise.objects.filter(id=exercise_id).first()
+    precondition = exercise.precondition_playbook if exercise else ''
+    session_name = session.container_name.rsplit('_', 1)[-1]
+    
+    executor = DockerExecutor()
+    try:
+        node_image = executor.prepare_node_image(precondition)
+        container_id, container_name = WarmPool(executor).create_sandbox(
+            session.user_id,
+            session_name,
+            node_image
+        )
+    except Exception as e:
+        logger.error(f"Failed to prefetch sandbox {session.container_name}: {e}")
+        SandboxSession.objects.filter(id=session_id, status='reserved').update(status='released')
+        SandboxSession.objects.filter(id=session_id, status='running').update(status='error')
+        return None
+    
+    # The reservation may have been claimed (keep it) or released (undo)
+    # while the containers were starting
+    updated = SandboxSession.objects.filter(
+        id=session_id,
+        status__in=['reserved', 'running']
+    ).update(
+        container_id=container_id,
+        container_name=container_name,
+        node_image=node_image
+    )
+    if not updated:
+        executor.stop_container(container_name)
+        return None
+    
+    WorkspaceVolume.touch(session.user)
+    logger.info(f"Prefetched sandbox {container_name} for exercise {exercise_id}")
+    return container_name
+
+
+@shared_task
+def release_expired_reservations():
+    """
+    Tear down prefetched sandboxes that were never claimed.
+    Runs every minute via Celery Beat.
+    """
+    expired = SandboxSession.objects.filter(
+        status='reserved',
+        expires_at__lt=timezone.now()
+    )
+    
+    executor = DockerExecutor()
+    released = 0
+    
+    for session in expired:
+        # Claim the row first so a concurrent create cannot take it over
+        if not SandboxSession.objects.filter(id=session.id, status='reserved').update(status='released'):
+            continue
+        if session.is_ready:
+            executor.stop_container(session.container_name)
+        metrics.incr('prefetch_expired')
+        released += 1
+    
+    if released:
+        logger.info(f"Released {released} unclaimed sandbox reservations")
+    return released
+
+
+@shared_task
+def autoscale_warm_pool():
+    """
+    Resize the warm sandbox pool to forecast demand.
+    Runs every 5 minutes via Celery Beat.
+    
+    The forecast target is clamped to SANDBOX_WARM_POOL_MIN/MAX, then capped
+    by the MAX_CONCURRENT_SANDBOXES and host memory guardrails.
+    """
+    if not settings.SANDBOX_WARM_POOL_ENABLED:
+        return None
+    
+    forecast = DemandForecaster().forecast()
+    pool = WarmPool()
+    capacity = pool.capacity()
+    target = min(
+        max(forecast['target'], settings.SANDBOX_WARM_POOL_MIN),
+        settings.SANDBOX_WARM_POOL_MAX,
+        capacity
+    )
+    
+    result = pool.scale(target)
+    for session_id in result['added']:
+        provision_warm_sandbox.apply_async(args=[session_id], priority=WarmPool.TASK_PRIORITY)
+    
+    forecast.update({
+        'capacity': capacity,
+        'applied_target': target,
+        'size': result['size'],
+    })
+    cache.set(WarmPool.FORECAST_CACHE_KEY, forecast, 60 * 60)
+    
+    logger.info(
+        f"Warm pool target {target} (forecast {forecast['target']}, capacity {capacity}): "
+        f"added {len(result['added'])}, retired {result['retired']}"
+    )
+    return target
+
+
+@shared_task
+def provision_warm_sandbox(session_id: int):
+    """Start the containers of a new warm pool sandbox."""
+    return WarmPool().provision(session_id)
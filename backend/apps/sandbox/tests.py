@@ -0,0 +1,1186 @@
+"""
+Tests for sandbox app.
+"""
+import io
+import json
+import socket
+import struct
+import subprocess
+import sys
+import tarfile
+import tempfile
+import threading
+from datetime import datetime, timedelta
+from unittest import mock
+
+import docker
+import fakeredis
+import yaml
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from apps.courses.models import Lesson, Module
+from apps.exercises.models import Exercise, ExerciseAttempt
+
+from .models import SandboxSession, WorkspaceVolume
+from .services.agent_client import AGENT_SOURCE, AgentConnection, AgentError
+from .services.docker_executor import DockerExecutor
+from .services.fingerprint import FingerprintGrader, diff_fingerprints, probe_spec
+from .services.forecast import DemandForecaster, ewma_level, expected_arrivals, pool_size_for
+from .services.scheduler import FairScheduler
+from .services.static_checks import StaticChecker, merge_results
+from .services.test_runner import StreamingTestEvaluator, TestRunner
+from .services.timings import extract_report
+from .tasks import evict_workspace_volumes, process_execution_queue, release_expired_reservations
+
+User = get_user_model()
+
+
+# Tests run without HTTPS and Redis
+API_SETTINGS = {
+    'SECURE_SSL_REDIRECT': False,
+    'CACHES': {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+}
+
+
+class DemandForecastTestCase(SimpleTestCase):
+    """Test warm pool demand forecasting."""
+    
+    def test_level_tracks_busier_than_usual_day(self):
+        """Test level rises when arrivals exceed the seasonal profile."""
+        recent_rate, level = ewma_level([1.0] * 8, [0.5] * 8, alpha=0.3)
+        self.assertAlmostEqual(recent_rate, 1.0)
+        self.assertGreater(level, 1.5)
+    
+    def test_level_is_bounded_in_quiet_slots(self):
+        """Test level stays bounded when the profile expects no demand."""
+        _, level = ewma_level([2.0] * 8, [0.0] * 8, alpha=0.3)
+        self.assertEqual(level, 4.0)
+    
+    def test_level_without_history(self):
+        """Test neutral level when there are no recent buckets."""
+        self.assertEqual(ewma_level([], [], alpha=0.3), (0.0, 1.0))
+    
+    def test_expected_arrivals_anticipates_class_start(self):
+        """Test demand of the next hour slot is included in the horizon."""
+        # Monday 8:50, class starting at 9:00
+        profile = {(1, 8): 0.0, (1, 9): 2.0}
+        start = datetime(2024, 1, 1, 8, 50)
+        arrivals = expected_arrivals(profile, start, 15, level=1.0, recent_rate=0.0)
+        self.assertAlmostEqual(arrivals, 10.0)
+    
+    def test_expected_arrivals_floored_by_recent_rate(self):
+        """Test a busy period is not assumed to end early."""
+        start = datetime(2024, 1, 1, 8, 50)
+        arrivals = expected_arrivals({}, start, 15, level=1.0, recent_rate=0.5)
+        self.assertAlmostEqual(arrivals, 7.5)
+    
+    def test_pool_size_adds_safety_margin(self):
+        """Test target pool size covers Poisson variation."""
+        self.assertEqual(pool_size_for(0, 1.0), 0)
+        self.assertEqual(pool_size_for(9, 1.0), 12)
+        self.assertEqual(pool_size_for(9, 0.0), 9)
+
+
+@override_settings(**API_SETTINGS)
+class DemandHistoryTestCase(TestCase):
+    """Test which sandbox sessions count as demand."""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='student@example.com',
+            username='student',
+            password='TestPass123!'
+        )
+    
+    def session(self, status, **kwargs):
+        kwargs.setdefault('user', self.user)
+        return SandboxSession.objects.create(
+            container_name=f'djarvis_sandbox_{SandboxSession.objects.count()}',
+            status=status,
+            **kwargs
+        )
+    
+    @mock.patch('apps.sandbox.tasks.DockerExecutor')
+    def test_unclaimed_prefetch_is_not_demand(self, executor):
+        """Test prefetches released unclaimed are left out of the forecast."""
+        self.session('running')
+        self.session('stopped')
+        self.session('reserved')
+        self.session('reserved', expires_at=timezone.now() - timedelta(minutes=1))
+        self.session('warm', user=None)
+        
+        self.assertEqual(release_expired_reservations(), 1)
+        self.assertEqual(SandboxSession.objects.filter(status='released').count(), 1)
+        
+        forecaster = DemandForecaster()
+        observed, _ = forecaster.recent_rates(timezone.now() + timedelta(seconds=1), {})
+        arrivals = sum(observed) * forecaster.BUCKET_MINUTES
+        self.assertAlmostEqual(arrivals, 2.0)
+
+
+WEB_PLAYBOOK = yaml.safe_load("""
+- hosts: web
+  become: yes
+  tasks:
+    - name: Install nginx
+      ansible.builtin.apt: name=nginx state=present
+    - block:
+        - name: Deploy config
+          template:
+            src: nginx.conf.j2
+            dest: /etc/nginx/nginx.conf
+          notify: restart nginx
+      become_user: root
+    - name: Start nginx
+      service:
+        name: nginx
+        state: started
+  handlers:
+    - name: restart nginx
+      service:
+        name: nginx
+        state: restarted
+""")
+
+
+class StaticCheckerTestCase(SimpleTestCase):
+    """Test static test cases evaluated on the playbook."""
+    
+    def check(self, test_case):
+        return StaticChecker.run_tests([test_case], WEB_PLAYBOOK)['test_results'][0]
+    
+    def test_split_static_and_runtime_tests(self):
+        """Test only structural test types are static."""
+        static, runtime = StaticChecker.split([
+            {'type': 'module_used', 'module': 'apt'},
+            {'type': 'exit_code', 'expected': 0},
+            {'name': 'defaults to output_contains'},
+        ])
+        self.assertEqual(len(static), 1)
+        self.assertEqual(len(runtime), 2)
+    
+    def test_module_used_with_free_form_args(self):
+        """Test short module names and key=value arguments match."""
+        self.assertTrue(self.check({
+            'type': 'module_used', 'module': 'apt', 'args': {'name': 'nginx'}
+        })['passed'])
+        result = self.check({
+            'type': 'module_used', 'module': 'apt', 'args': {'state': 'absent'}
+        })
+        self.assertFalse(result['passed'])
+        self.assertIn('not with the expected arguments', result['message'])
+        self.assertFalse(self.check({'type': 'module_used', 'module': 'community.general.apt'})['passed'])
+    
+    def test_keyword_inherited_from_play(self):
+        """Test keywords set on the play apply to its tasks."""
+        self.assertTrue(self.check({
+            'type': 'keyword_present', 'keyword': 'become', 'value': True, 'module': 'apt'
+        })['passed'])
+        self.assertFalse(self.check({
+            'type': 'keyword_present', 'keyword': 'become', 'scope': 'task'
+        })['passed'])
+        self.assertTrue(self.check({
+            'type': 'keyword_present', 'keyword': 'become_user', 'module': 'template'
+        })['passed'])
+    
+    def test_task_order(self):
+        """Test tasks must appear in order, possibly with others between."""
+        self.assertTrue(self.check({'type': 'task_order', 'modules': ['apt', 'service']})['passed'])
+        self.assertFalse(self.check({'type': 'task_order', 'modules': ['service', 'apt']})['passed'])
+        self.assertTrue(self.check({
+            'type': 'task_order', 'names': ['install nginx', 'Deploy config']
+        })['passed'])
+    
+    def test_handler_notified(self):
+        """Test handler wiring through a notify inside a block."""
+        self.assertTrue(self.check({
+            'type': 'handler_notified', 'handler': 'restart nginx', 'module': 'template'
+        })['passed'])
+        result = self.check({'type': 'handler_notified', 'handler': 'reload nginx'})
+        self.assertFalse(result['passed'])
+        self.assertIn('not defined', result['message'])
+    
+    def test_merge_results(self):
+        """Test static and runtime results combine into one report."""
+        static = StaticChecker.run_tests([{'type': 'module_used', 'module': 'apt'}], WEB_PLAYBOOK)
+        runtime = {
+            'passed': False, 'total_tests': 2, 'passed_tests': 0, 'failed_tests': 2,
+            'test_results': [], 'error': 'Playbook execution failed'
+        }
+        merged = merge_results(static, runtime)
+        self.assertFalse(merged['passed'])
+        self.assertEqual((merged['total_tests'], merged['passed_tests']), (3, 1))
+        self.assertEqual(merged['error'], 'Playbook execution failed')
+        self.assertTrue(merge_results(None, static)['passed'])
+
+
+class FingerprintTestCase(SimpleTestCase):
+    """Test final-state grading against the reference fingerprint."""
+    
+    REFERENCE = {
+        'node1': {
+            'packages': {'nginx': {'version': '1.18.0'}},
+            'paths': {'/etc/motd': {'type': 'file', 'mode': '0o644', 'sha256': 'abc'}},
+        },
+    }
+    
+    def test_probe_spec_merges_test_cases(self):
+        """Test one probe covers every fingerprint test case."""
+        spec = probe_spec([
+            {'type': 'state_matches_solution', 'packages': ['nginx']},
+            {'type': 'state_matches_solution', 'packages': ['curl', 'nginx'], 'users': ['deploy']},
+        ])
+        self.assertEqual(spec, {'packages': ['curl', 'nginx'], 'users': ['deploy']})
+    
+    def test_diff_reports_each_difference(self):
+        """Test differing and missing items are reported per node."""
+        actual = {'node1': {'packages': {'nginx': None}, 'paths': {'/etc/motd': {
+            'type': 'file', 'mode': '0o600', 'sha256': 'def'
+        }}}}
+        differences = diff_fingerprints(
+            self.REFERENCE, actual, {'packages': ['nginx'], 'paths': ['/etc/motd']}
+        )
+        self.assertEqual(differences, [
+            'node1: path /etc/motd content, mode differ',
+            'node1: package nginx is missing',
+        ])
+        self.assertEqual(diff_fingerprints(self.REFERENCE, None, {}), ['node1: state could not be probed'])
+    
+    def test_diff_does_not_reveal_the_solution(self):
+        """Test differences name what differs, not the expected values."""
+        actual = {'node1': {'paths': {'/etc/motd': {'type': 'file', 'mode': '0o600', 'sha256': 'def'}}}}
+        differences = diff_fingerprints(self.REFERENCE, actual, {'paths': ['/etc/motd']})
+        self.assertNotIn('abc', differences[0])
+        self.assertNotIn('0o644', differences[0])
+        
+        extra = diff_fingerprints({'node1': {'users': {'backdoor': None}}}, {'node1': {'users': {
+            'backdoor': {'home': '/root', 'shell': '/bin/sh', 'group': 'root', 'groups': []}
+        }}}, {'users': ['backdoor']})
+        self.assertEqual(extra, ['node1: user backdoor should not exist'])
+    
+    def test_package_versions_compared_on_request(self):
+        """Test packages match on being installed unless versions are asked for."""
+        actual = {'node1': {'packages': {'nginx': {'version': '1.18.1'}}}}
+        spec = {'packages': ['nginx']}
+        self.assertEqual(diff_fingerprints(self.REFERENCE, actual, spec), [])
+        self.assertEqual(
+            diff_fingerprints(self.REFERENCE, actual, spec, package_versions=True),
+            ['node1: package nginx version differs']
+        )
+        
+        results = FingerprintGrader.run_tests([
+            {'type': 'state_matches_solution', 'packages': ['nginx']},
+            {'type': 'state_matches_solution', 'packages': ['nginx'], 'package_versions': True},
+        ], self.REFERENCE, actual)
+        self.assertEqual([result['passed'] for result in results['test_results']], [True, False])
+    
+    def test_grader_compares_only_test_case_items(self):
+        """Test each test case is graded on its own categories."""
+        actual = {'node1': {
+            'packages': {'nginx': {'version': '1.18.0'}},
+            'paths': {'/etc/motd': None},
+        }}
+        results = FingerprintGrader.run_tests([
+            {'type': 'state_matches_solution', 'packages': ['nginx']},
+            {'type': 'state_matches_solution', 'paths': ['/etc/motd']},
+        ], self.REFERENCE, actual)
+        self.assertEqual((results['passed_tests'], results['failed_tests']), (1, 1))
+        self.assertEqual(len(results['test_results'][1]['differences']), 1)
+
+
+class StreamingTestEvaluatorTestCase(SimpleTestCase):
+    """Test early decisions on live playbook output."""
+    
+    TESTS = [{'type': 'no_errors'}, {'type': 'output_contains', 'expected': 'ok=2'}]
+    
+    PLAYBOOK = yaml.safe_load("""
+- hosts: all
+  tasks:
+    - name: Install nginx
+      apt:
+        name: nginx
+""")
+    
+    FAILED = 'DJARVIS_EVENT {"event": "failed", "host": "node1", "task": "Install nginx"}\n'
+    
+    def test_failure_event_decides_run(self):
+        """Test a reported failure decides the tests, even split over chunks."""
+        evaluator = StreamingTestEvaluator(self.TESTS, self.PLAYBOOK)
+        self.assertTrue(evaluator.can_decide)
+        self.assertFalse(evaluator.feed('TASK [Install nginx] ***\n'))
+        self.assertFalse(evaluator.feed(self.FAILED[:20]))
+        self.assertTrue(evaluator.feed(self.FAILED[20:]))
+        self.assertEqual(evaluator.reason, "task 'Install nginx' failed on node1")
+        
+        results = TestRunner.run_tests(self.TESTS, {
+            'success': False, 'aborted': True, 'abort_reason': evaluator.reason
+        })
+        self.assertEqual(results['error'], "Playbook stopped early: task 'Install nginx' failed on node1")
+    
+    def test_recoverable_playbooks_are_not_decided(self):
+        """Test rescue sections, roles and includes prevent early decisions."""
+        for playbook in (
+            "- hosts: all\n  tasks:\n    - block:\n        - command: 'false'\n      rescue:\n        - debug: msg=x\n",
+            "- hosts: all\n  roles:\n    - common\n",
+            "- hosts: all\n  tasks:\n    - ansible.builtin.include_tasks: more.yml\n",
+            "- import_playbook: other.yml\n",
+        ):
+            evaluator = StreamingTestEvaluator(self.TESTS, yaml.safe_load(playbook))
+            self.assertFalse(evaluator.can_decide, playbook)
+            evaluator.feed(self.FAILED)
+            self.assertFalse(evaluator.decided_failed)
+        self.assertFalse(StreamingTestEvaluator([], self.PLAYBOOK).can_decide)
+    
+    def test_event_lines_are_not_shown(self):
+        """Test callback event lines are removed from the output."""
+        stdout, report = extract_report('TASK [x]\n' + self.FAILED + 'fatal: [node1]: FAILED!\n')
+        self.assertEqual(stdout, 'TASK [x]\nfatal: [node1]: FAILED!\n')
+        self.assertIsNone(report)
+
+
+@override_settings(SANDBOX_CONTROLLER_MODE='dedicated')
+class WorkspaceVolumeTestCase(SimpleTestCase):
+    """Test per-user workspace volumes and the fact cache of control nodes."""
+    
+    SANDBOX = 'djarvis_sandbox_7_abc'
+    
+    def setUp(self):
+        patcher = mock.patch('docker.from_env')
+        self.client = patcher.start().return_value
+        self.addCleanup(patcher.stop)
+        self.executor = DockerExecutor()
+        self.control_node = mock.Mock()
+        self.control_node.exec_run.return_value = mock.Mock(exit_code=0, output=b'')
+        self.client.containers.run.return_value = self.control_node
+        self.client.containers.get.return_value = self.control_node
+    
+    def test_existing_volumes_are_mounted_again(self):
+        """Test a recreated sandbox gets the user's existing volumes."""
+        mounts = self.executor._workspace_mounts(7)
+        self.client.volumes.create.assert_not_called()
+        self.assertEqual(mounts, {
+            'djarvis_workspace_7': {'bind': DockerExecutor.WORKSPACE_PATH, 'mode': 'rw'},
+            'djarvis_facts_7': {'bind': DockerExecutor.FACT_CACHE_PATH, 'mode': 'rw'},
+        })
+    
+    def test_missing_volumes_are_created(self):
+        """Test a first sandbox creates labelled volumes."""
+        self.client.volumes.get.side_effect = docker.errors.NotFound('No such volume')
+        self.executor._workspace_mounts(7)
+        created = self.client.volumes.create.call_args_list
+        self.assertEqual(
+            [call.kwargs['name'] for call in created],
+            ['djarvis_workspace_7', 'djarvis_facts_7']
+        )
+        self.assertEqual(created[0].kwargs['labels']['user_id'], '7')
+        self.assertEqual(created[0].kwargs['labels']['type'], 'workspace')
+    
+    def test_new_control_node_drops_cached_facts(self):
+        """Test facts of an earlier sandbox's nodes are not reused."""
+        self.executor.start_controller(self.SANDBOX, 7)
+        volumes = self.client.containers.run.call_args.kwargs['volumes']
+        self.assertIn('djarvis_workspace_7', volumes)
+        self.assertIn('djarvis_facts_7', volumes)
+        self.control_node.exec_run.assert_called_once_with(
+            ['find', DockerExecutor.FACT_CACHE_PATH, '-mindepth', '1', '-delete']
+        )
+    
+    def test_reset_drops_cached_facts(self):
+        """Test recreated managed nodes are gathered again."""
+        node = mock.Mock(labels={'image': 'baseline', 'network': 'net', 'user_id': '7'})
+        node.name = f'{self.SANDBOX}_node1'
+        self.client.containers.list.return_value = [node]
+        
+        self.assertTrue(self.executor.reset_managed_nodes(self.SANDBOX, image='precondition'))
+        self.assertEqual(self.client.containers.run.call_args.kwargs['image'], 'precondition')
+        self.client.containers.get.assert_called_with(self.SANDBOX)
+        self.control_node.exec_run.assert_called_once()
+        
+        self.control_node.exec_run.return_value = mock.Mock(exit_code=1, output=b'Permission denied')
+        self.assertFalse(self.executor.reset_managed_nodes(self.SANDBOX))
+
+
+@override_settings(SANDBOX_CONTROLLER_MODE='dedicated')
+class NodeResetTestCase(SimpleTestCase):
+    """Test managed nodes are recreated from their snapshot image."""
+    
+    SANDBOX = 'djarvis_sandbox_7_abc'
+    
+    def setUp(self):
+        patcher = mock.patch('docker.from_env')
+        self.client = patcher.start().return_value
+        self.addCleanup(patcher.stop)
+        self.executor = DockerExecutor()
+        self.client.containers.get.return_value.exec_run.return_value = mock.Mock(exit_code=0, output=b'')
+        self.nodes = []
+        for index in range(3):
+            node = mock.Mock(labels={'image': 'djarvis-node:pre-abc', 'network': 'net_abc', 'user_id': '7'})
+            node.name = f'{self.SANDBOX}_node{index + 1}'
+            self.nodes.append(node)
+        self.client.containers.list.return_value = self.nodes
+    
+    def started(self):
+        return {call.kwargs['name']: call.kwargs for call in self.client.containers.run.call_args_list}
+    
+    def test_nodes_recreated_from_snapshot(self):
+        """Test every node is replaced by a fresh container of its image."""
+        self.assertTrue(self.executor.reset_managed_nodes(self.SANDBOX))
+        
+        for node in self.nodes:
+            node.remove.assert_called_once_with(force=True)
+        started = self.started()
+        self.assertEqual(set(started), {node.name for node in self.nodes})
+        for kwargs in started.values():
+            self.assertEqual(kwargs['image'], 'djarvis-node:pre-abc')
+            self.assertEqual(kwargs['network'], 'net_abc')
+            self.assertEqual(kwargs['labels']['parent'], self.SANDBOX)
+            self.assertEqual(kwargs['labels']['image'], 'djarvis-node:pre-abc')
+    
+    def test_failed_node_does_not_stop_the_others(self):
+        """Test one node failing to start is reported after the others are replaced."""
+        def run(**kwargs):
+            if kwargs['name'].endswith('_node2'):
+                raise docker.errors.APIError('Conflict')
+            return mock.Mock()
+        self.client.containers.run.side_effect = run
+        
+        self.assertFalse(self.executor.reset_managed_nodes(self.SANDBOX))
+        self.assertEqual(set(self.started()), {node.name for node in self.nodes})
+    
+    def test_no_nodes(self):
+        """Test a sandbox without managed nodes cannot be reset."""
+        self.client.containers.list.return_value = []
+        self.assertFalse(self.executor.reset_managed_nodes(self.SANDBOX))
+        self.client.containers.run.assert_not_called()
+
+
+@override_settings(SANDBOX_WORKSPACE_TTL_DAYS=14, SANDBOX_WORKSPACE_DISK_BUDGET_MB=3)
+class WorkspaceEvictionTestCase(TestCase):
+    """Test TTL and LRU eviction of workspace volumes under the disk budget."""
+    
+    MB = 1024 * 1024
+    
+    def setUp(self):
+        now = timezone.now()
+        self.users = []
+        # Least recently used first; the first one is past the TTL
+        for index, days in enumerate([20, 3, 2, 1]):
+            user = User.objects.create_user(
+                email=f'user{index}@example.com',
+                username=f'user{index}',
+                password='TestPass123!'
+            )
+            WorkspaceVolume.objects.create(user=user, last_used_at=now - timedelta(days=days))
+            self.users.append(user)
+        
+        patcher = mock.patch('apps.sandbox.tasks.DockerExecutor')
+        self.executor = patcher.start().return_value
+        self.addCleanup(patcher.stop)
+        self.executor.remove_workspace_volumes.return_value = True
+    
+    def evict(self, size_mb):
+        self.executor.get_workspace_volume_sizes.return_value = {
+            user.id: size_mb * self.MB for user in self.users
+        }
+        self.evicted = evict_workspace_volumes()
+        return [call.args[0] for call in self.executor.remove_workspace_volumes.call_args_list]
+    
+    def test_expired_volumes_are_evicted_within_budget(self):
+        """Test volumes past the TTL go even when usage fits the budget."""
+        self.assertEqual(self.evict(size_mb=0), [self.users[0].id])
+        self.assertFalse(WorkspaceVolume.objects.filter(user=self.users[0]).exists())
+    
+    def test_least_recently_used_evicted_until_under_budget(self):
+        """Test eviction stops as soon as usage fits the budget."""
+        self.assertEqual(self.evict(size_mb=2), [self.users[0].id, self.users[1].id, self.users[2].id])
+        self.assertEqual(self.evicted, 3)
+        kept = WorkspaceVolume.objects.get()
+        self.assertEqual((kept.user, kept.size_bytes), (self.users[3], 2 * self.MB))
+    
+    def test_volumes_of_running_sandboxes_are_kept(self):
+        """Test a volume mounted by a running sandbox is never evicted."""
+        SandboxSession.objects.create(
+            user=self.users[1],
+            container_name='djarvis_sandbox_1_abc',
+            status='running'
+        )
+        self.assertEqual(self.evict(size_mb=2), [self.users[0].id, self.users[2].id, self.users[3].id])
+    
+    def test_volume_still_in_use_is_kept_tracked(self):
+        """Test a volume Docker refuses to remove keeps its row."""
+        self.executor.remove_workspace_volumes.return_value = False
+        self.assertEqual(self.evict(size_mb=0), [self.users[0].id])
+        self.assertEqual(self.evicted, 0)
+        self.assertTrue(WorkspaceVolume.objects.filter(user=self.users[0]).exists())
+
+
+class NodeImageTestCase(SimpleTestCase):
+    """Test managed node images are looked up, and built once."""
+    
+    PRECONDITION = '- hosts: all\n  tasks: []\n'
+    
+    def setUp(self):
+        patcher = mock.patch('docker.from_env')
+        self.client = patcher.start().return_value
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch('apps.sandbox.services.docker_executor.get_redis_connection')
+        self.redis = patcher.start().return_value
+        self.addCleanup(patcher.stop)
+        self.executor = DockerExecutor()
+    
+    def test_cached_image_is_never_built(self):
+        """Test a missing image is reported instead of built."""
+        self.client.images.get.side_effect = docker.errors.ImageNotFound('No such image')
+        self.assertIsNone(self.executor.cached_node_image(self.PRECONDITION))
+        self.client.images.get.side_effect = None
+        self.assertEqual(
+            self.executor.cached_node_image(self.PRECONDITION),
+            DockerExecutor.precondition_image_tag(self.PRECONDITION)
+        )
+        self.assertEqual(self.executor.cached_node_image(), settings.SANDBOX_NODE_BASELINE_IMAGE)
+        self.client.containers.run.assert_not_called()
+    
+    def test_image_built_while_waiting_for_lock_is_reused(self):
+        """Test concurrent requests for one image build it only once."""
+        image_tag = DockerExecutor.precondition_image_tag(self.PRECONDITION)
+        lock = self.redis.lock.return_value
+        
+        def get_image(tag):
+            # Missing before the lock, built by another worker once it is held
+            if tag == image_tag and not lock.__enter__.called:
+                raise docker.errors.ImageNotFound('No such image')
+        
+        self.client.images.get.side_effect = get_image
+        self.assertEqual(self.executor.build_precondition_image(self.PRECONDITION), image_tag)
+        self.redis.lock.assert_called_once_with(
+            f'djarvis:image_build:{image_tag}',
+            timeout=DockerExecutor.IMAGE_BUILD_TIMEOUT,
+            blocking_timeout=DockerExecutor.IMAGE_BUILD_TIMEOUT
+        )
+        self.client.networks.create.assert_not_called()
+    
+    def test_build_names_are_unique(self):
+        """Test builds of the same precondition use their own containers."""
+        self.client.images.get.side_effect = docker.errors.ImageNotFound('No such image')
+        container = self.client.containers.run.return_value
+        container.name = 'djarvis_build_abc_node1'
+        container.exec_run.return_value = mock.Mock(exit_code=0, output=b'')
+        for _ in range(2):
+            self.executor._build_precondition_image(self.PRECONDITION, 'baseline', 'djarvis-node:pre-abc')
+        names = [call.args[0] for call in self.client.networks.create.call_args_list]
+        self.assertEqual(len(set(names)), 2)
+        self.assertTrue(all(name.startswith('djarvis_build_abc_') for name in names))
+
+
+@override_settings(SANDBOX_CONTROLLER_MODE='shared', SANDBOX_CONTROLLER_POOL_SIZE=1)
+class SharedControllerTestCase(SimpleTestCase):
+    """Test isolation of jobs run on the shared controller pool."""
+    
+    SANDBOX = 'djarvis_sandbox_7_abc'
+    CONTROLLER = 'djarvis_controller_0'
+    
+    def setUp(self):
+        patcher = mock.patch('docker.from_env')
+        self.client = patcher.start().return_value
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch('apps.sandbox.services.docker_executor.get_redis_connection')
+        self.redis = patcher.start().return_value
+        self.addCleanup(patcher.stop)
+        self.redis.incr.return_value = 1
+        self.redis.decr.return_value = 0
+        self.executor = DockerExecutor()
+    
+    def test_each_node_has_its_own_password(self):
+        """Test an inventory only carries its own sandbox's credentials."""
+        inventory = self.executor._inventory_content(self.SANDBOX)
+        other = self.executor._inventory_content('djarvis_sandbox_8_def')
+        passwords = {
+            line.rsplit('ansible_password=', 1)[1]
+            for line in (inventory + other).splitlines()[1:] if 'ansible_password=' in line
+        }
+        self.assertEqual(len(passwords), 4)
+        self.assertNotIn('ansible_password=ansible\n', inventory)
+        
+        self.executor._run_managed_node(f'{self.SANDBOX}_node1', 'baseline', 'net', 7, self.SANDBOX)
+        environment = self.client.containers.run.call_args.kwargs['environment']
+        self.assertIn(
+            f"ansible_password={environment[DockerExecutor.NODE_PASSWORD_ENV]}\n",
+            inventory
+        )
+    
+    def test_job_uids_held_by_running_jobs_are_skipped(self):
+        """Test a job never gets the uid of another job on its controller."""
+        self.redis.incr.side_effect = [1, 2, 3]
+        self.redis.set.side_effect = [None, None, True]
+        job_uid = self.executor._lease_job_uid(self.redis, self.CONTROLLER, 'job', 420)
+        self.assertEqual(job_uid, DockerExecutor.JOB_UID_BASE + 3)
+        self.redis.set.assert_called_with(
+            f'djarvis:job_uid:{self.CONTROLLER}:{job_uid}', 'job', nx=True, ex=420
+        )
+    
+    def test_controller_attached_for_the_job_only(self):
+        """Test the controller leaves the sandbox network after the job."""
+        agent = mock.Mock()
+        agent.run.return_value = {
+            'exit_code': 0, 'stdout': 'ok', 'stderr': '', 'timed_out': False,
+            'transfer_time': 0.0, 'spawned_at': None,
+        }
+        with mock.patch.object(AgentConnection, 'cached', return_value=agent):
+            result = self.executor.execute_playbook(self.SANDBOX, '- hosts: all\n', timeout=60)
+        
+        self.assertTrue(result['success'])
+        network = 'djarvis_net_7_abc'
+        self.client.api.connect_container_to_network.assert_called_once_with(self.CONTROLLER, network)
+        self.client.api.disconnect_container_from_network.assert_called_once_with(self.CONTROLLER, network)
+        script = agent.run.call_args.args[0][2]
+        self.assertIn(f'--reuid={DockerExecutor.JOB_UID_BASE + 1} ', script)
+        self.assertIn('--bounding-set=-all', script)
+    
+    def test_controller_stays_attached_for_concurrent_jobs(self):
+        """Test a job ending does not detach another job of the sandbox."""
+        self.redis.incr.return_value = 2
+        self.redis.decr.return_value = 1
+        with self.executor._shared_job(self.SANDBOX, self.CONTROLLER, 'job', 60):
+            pass
+        self.client.api.connect_container_to_network.assert_not_called()
+        self.client.api.disconnect_container_from_network.assert_not_called()
+    
+    def test_outdated_controllers_are_replaced(self):
+        """Test controllers started with an older configuration are restarted."""
+        outdated = mock.Mock(labels={'revision': '1'})
+        self.client.containers.get.return_value = outdated
+        self.client.containers.run.return_value.exec_run.return_value = mock.Mock(exit_code=0, output=b'')
+        self.executor.ensure_controller_pool()
+        outdated.remove.assert_called_once_with(force=True)
+        options = self.client.containers.run.call_args.kwargs
+        self.assertEqual(options['cap_drop'], ['ALL'])
+        self.assertEqual(options['labels']['revision'], DockerExecutor.CONTROLLER_REVISION)
+
+
+class GalaxyCacheTestCase(SimpleTestCase):
+    """Test the offline Galaxy content cache."""
+    
+    REQUIREMENTS = 'collections:\n  - name: community.general\n    version: "8.6.0"\n'
+    
+    def setUp(self):
+        patcher = mock.patch('docker.from_env')
+        self.client = patcher.start().return_value
+        self.addCleanup(patcher.stop)
+        self.builder = self.client.containers.run.return_value
+        self.builder.exec_run.return_value = mock.Mock(exit_code=0, output=b'')
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.requirements = f'{directory.name}/requirements.yml'
+        with open(self.requirements, 'w') as requirements:
+            requirements.write(self.REQUIREMENTS)
+    
+    def test_controllers_mount_cache_read_only(self):
+        """Test controllers resolve collections and roles from the read-only cache."""
+        self.client.containers.get.side_effect = docker.errors.NotFound('missing')
+        DockerExecutor().ensure_controller_pool()
+        
+        options = self.client.containers.run.call_args.kwargs
+        self.assertEqual(options['volumes'], {
+            settings.SANDBOX_GALAXY_CACHE_VOLUME: {'bind': DockerExecutor.GALAXY_PATH, 'mode': 'ro'}
+        })
+        self.assertEqual(
+            options['environment']['ANSIBLE_COLLECTIONS_PATH'],
+            f'{DockerExecutor.GALAXY_PATH}/collections'
+        )
+        self.assertEqual(
+            options['environment']['ANSIBLE_ROLES_PATH'],
+            f'roles:{DockerExecutor.GALAXY_PATH}/roles'
+        )
+    
+    def test_populate_installs_requirements(self):
+        """Test the command installs the requirements into the writable volume."""
+        call_command('populate_galaxy_cache', requirements=self.requirements, stdout=io.StringIO())
+        
+        options = self.client.containers.run.call_args.kwargs
+        self.assertEqual(options['volumes'][settings.SANDBOX_GALAXY_CACHE_VOLUME]['mode'], 'rw')
+        self.assertFalse(options['network_disabled'])
+        commands = [call.args[0] for call in self.builder.exec_run.call_args_list]
+        self.assertIn([
+            'ansible-galaxy', 'collection', 'install', '-r', '/tmp/requirements.yml',
+            '-p', f'{DockerExecutor.GALAXY_PATH}/collections', '--force',
+        ], commands)
+        with tarfile.open(fileobj=io.BytesIO(self.builder.put_archive.call_args_list[0].args[1])) as archive:
+            self.assertEqual(
+                archive.extractfile('requirements.yml').read().decode(), self.REQUIREMENTS
+            )
+        self.assertEqual(self.builder.put_archive.call_args.args[0], DockerExecutor.GALAXY_PATH)
+        self.builder.remove.assert_called_once_with(force=True)
+    
+    def test_unchanged_cache_is_kept(self):
+        """Test nothing is installed when the manifest has the same digest."""
+        digest = DockerExecutor().populate_galaxy_cache(self.REQUIREMENTS, force=True)['digest']
+        self.builder.exec_run.reset_mock()
+        self.builder.exec_run.return_value = mock.Mock(exit_code=0, output=digest.encode())
+        
+        result = DockerExecutor().populate_galaxy_cache(self.REQUIREMENTS)
+        self.assertFalse(result['changed'])
+        self.builder.exec_run.assert_called_once()
+    
+    def test_unpinned_requirements_are_rejected(self):
+        """Test the command refuses requirements without exact versions."""
+        with open(self.requirements, 'w') as requirements:
+            requirements.write('collections:\n  - name: community.general\n    version: ">=8"\n')
+        with self.assertRaises(CommandError):
+            call_command('populate_galaxy_cache', requirements=self.requirements)
+        self.client.containers.run.assert_not_called()
+
+
+@override_settings(SANDBOX_CONTROLLER_MODE='dedicated')
+class ExecutionTimingsTestCase(SimpleTestCase):
+    """Test the timing report of a run is split from the student's output."""
+    
+    REPORT = {
+        'start': 100.5, 'end': 103.0,
+        'tasks': [['Gathering Facts', 'gather_facts', 1.2], ['Install nginx', 'apt', 0.8]],
+    }
+    
+    def setUp(self):
+        patcher = mock.patch('docker.from_env')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.executor = DockerExecutor()
+    
+    def test_report_line_is_not_shown(self):
+        """Test the report is removed from stdout and turned into timings."""
+        stdout = f"PLAY [all]\nDJARVIS_TIMINGS {json.dumps(self.REPORT)}\nPLAY RECAP\n"
+        agent = mock.Mock()
+        agent.run.return_value = {
+            'exit_code': 0, 'stdout': stdout, 'stderr': '', 'timed_out': False,
+            'transfer_time': 0.05, 'spawned_at': 100.0,
+        }
+        with mock.patch.object(AgentConnection, 'cached', return_value=agent):
+            result = self.executor.execute_playbook('djarvis_sandbox_1_abc', '- hosts: all\n')
+        
+        self.assertEqual(result['stdout'], 'PLAY [all]\nPLAY RECAP\n')
+        timings = result['timings']
+        self.assertEqual(
+            (timings['transfer'], timings['startup'], timings['run'], timings['facts']),
+            (0.05, 0.5, 2.5, 1.2)
+        )
+        self.assertEqual(timings['tasks'], self.REPORT['tasks'])
+        self.assertNotIn('transfer_time', result)
+    
+    def test_malformed_report_is_dropped(self):
+        """Test a broken report line is hidden without failing the run."""
+        stdout, report = extract_report('ok\nDJARVIS_TIMINGS {broken\n')
+        self.assertEqual((stdout, report), ('ok\n', None))
+
+
+class AgentProtocolTestCase(SimpleTestCase):
+    """Test the controller agent accepts each request before handling it."""
+    
+    def setUp(self):
+        patcher = mock.patch('apps.sandbox.services.agent_client.get_redis_connection')
+        self.redis = patcher.start().return_value
+        self.addCleanup(patcher.stop)
+    
+    def test_agent_accepts_before_handling(self):
+        """Test the agent acknowledges a request line before answering it."""
+        with tempfile.TemporaryDirectory() as base:
+            requests = ''.join(json.dumps(request) + '\n' for request in [
+                {'id': 'w', 'op': 'write_files', 'base': base, 'files': {'a.txt': 'aGk='}},
+                {'id': 'p', 'op': 'probe'},
+            ])
+            # The agent keeps running after stdin closes, like in a container
+            agent = subprocess.Popen(
+                [sys.executable, '-c', AGENT_SOURCE],
+                stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True
+            )
+            self.addCleanup(agent.stdout.close)
+            self.addCleanup(agent.wait)
+            self.addCleanup(agent.kill)
+            agent.stdin.write(requests)
+            agent.stdin.close()
+            lines = [agent.stdout.readline() for _ in range(4)]
+            with open(f'{base}/a.txt') as handle:
+                self.assertEqual(handle.read(), 'hi')
+        events = [(event['id'], event['event']) for event in map(json.loads, lines)]
+        self.assertEqual(events, [('w', 'accepted'), ('w', 'done'), ('p', 'accepted'), ('p', 'done')])
+    
+    def connect(self, answer):
+        """Connection to a fake agent answering each request line with events."""
+        client_end, agent_end = socket.socketpair()
+        self.addCleanup(agent_end.close)
+        
+        def serve():
+            for line in agent_end.makefile('rb'):
+                for event in answer(json.loads(line)):
+                    data = (json.dumps(event) + '\n').encode('utf-8')
+                    agent_end.sendall(struct.pack('>BxxxL', 1, len(data)) + data)
+        
+        threading.Thread(target=serve, daemon=True).start()
+        container = mock.Mock()
+        container.name = 'djarvis_controller_0'
+        container.attach_socket.return_value = client_end
+        connection = AgentConnection(container)
+        self.addCleanup(connection.close)
+        return connection
+    
+    def test_request_holds_stdin_lock_until_accepted(self):
+        """Test request lines are sent under the controller's stdin lock."""
+        connection = self.connect(lambda request: [
+            {'id': request['id'], 'event': 'accepted'},
+            {'id': request['id'], 'event': 'done', 'ok': True},
+        ])
+        connection.write_files({'a.txt': 'hi'}, base='/tmp')
+        self.redis.lock.assert_called_once_with(
+            'djarvis:agent_stdin:djarvis_controller_0',
+            timeout=AgentConnection.ACCEPT_TIMEOUT + 5,
+            blocking_timeout=AgentConnection.ACCEPT_TIMEOUT
+        )
+        self.assertTrue(self.redis.lock.return_value.__exit__.called)
+    
+    @mock.patch.object(AgentConnection, 'ACCEPT_TIMEOUT', 0.2)
+    def test_request_not_accepted_fails(self):
+        """Test an agent that does not accept a request is not waited for."""
+        connection = self.connect(lambda request: [])
+        with self.assertRaisesMessage(AgentError, 'did not accept'):
+            connection.probe()
+    
+    @mock.patch('docker.from_env')
+    def test_agent_of_older_protocol_is_not_used(self, from_env):
+        """Test controllers started with an older agent fall back to exec."""
+        container = mock.Mock(labels={'agent': '1'})
+        self.assertIsNone(DockerExecutor()._agent(container))
+    
+    @mock.patch('docker.from_env')
+    @override_settings(SANDBOX_CONTROLLER_POOL_SIZE=1)
+    def test_unresponsive_controller_is_restarted(self, from_env):
+        """Test the pool check restarts a controller whose agent is down."""
+        controller = mock.Mock(
+            labels={'revision': DockerExecutor.CONTROLLER_REVISION},
+            status='running'
+        )
+        from_env.return_value.containers.get.return_value = controller
+        with mock.patch.object(AgentConnection, 'for_container') as for_container:
+            for_container.return_value.probe.side_effect = AgentError('Agent request timed out')
+            DockerExecutor().ensure_controller_pool()
+        controller.restart.assert_called_once_with(timeout=5)
+
+
+@override_settings(SANDBOX_USER_MAX_INFLIGHT=1, SANDBOX_QUEUE_WAIT_TIMEOUT=120)
+class FairSchedulerTestCase(SimpleTestCase):
+    """Test job status, cancellation and expiry of the fair queue."""
+    
+    def setUp(self):
+        self.scheduler = FairScheduler(redis=fakeredis.FakeRedis())
+    
+    def submit(self, user_id=1):
+        return self.scheduler.submit(user_id, FairScheduler.LANE_GRADED, {'timeout': 60})
+    
+    def test_job_runs_through_its_states(self):
+        """Test a job is queued, running and done with its result."""
+        job_id = self.submit()
+        self.assertEqual(self.scheduler.status(job_id), {'user_id': 1, 'state': 'queued', 'result': None})
+        
+        job = self.scheduler.dispatch()
+        self.assertTrue(self.scheduler.start(job))
+        self.assertEqual(self.scheduler.status(job_id)['state'], 'running')
+        self.assertEqual(self.scheduler.cancel(job_id), 'running')
+        
+        self.scheduler.complete(job, {'status': 200, 'data': {'is_passed': True}})
+        self.assertEqual(self.scheduler.status(job_id), {
+            'user_id': 1, 'state': 'done', 'result': {'status': 200, 'data': {'is_passed': True}}
+        })
+    
+    def test_cancelled_job_is_skipped(self):
+        """Test a cancelled job does not run nor hold the user's slot."""
+        cancelled_id, next_id = self.submit(), self.submit()
+        self.assertEqual(self.scheduler.cancel(cancelled_id), 'cancelled')
+        
+        self.assertFalse(self.scheduler.start(self.scheduler.dispatch()))
+        job = self.scheduler.dispatch()
+        self.assertEqual(job['id'], next_id)
+        self.assertTrue(self.scheduler.start(job))
+    
+    def test_job_queued_too_long_expires(self):
+        """Test a job whose client stopped waiting is not run."""
+        job_id = self.submit()
+        job = self.scheduler.dispatch()
+        job['queue_wait_time'] = 121
+        self.assertFalse(self.scheduler.start(job))
+        self.assertEqual(self.scheduler.status(job_id)['state'], 'expired')
+        self.assertIsNone(self.scheduler.status('unknown'))
+        self.assertIsNone(self.scheduler.cancel('unknown'))
+
+
+@override_settings(SANDBOX_FAIR_QUEUE_ENABLED=True, **API_SETTINGS)
+class QueuedExecutionTestCase(TestCase):
+    """Test queued runs are recorded by the worker and polled by the client."""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='student@example.com',
+            username='student',
+            password='TestPass123!'
+        )
+        module = Module.objects.create(title='Basics', slug='basics', description='Basics')
+        lesson = Lesson.objects.create(
+            module=module, title='First', slug='first', content='First'
+        )
+        self.exercise = Exercise.objects.create(
+            lesson=lesson,
+            title='Ping',
+            description='Ping the nodes',
+            instructions='Ping the nodes',
+            test_cases=[{'type': 'exit_code', 'expected': 0}],
+            is_published=True
+        )
+        self.session = SandboxSession.objects.create(
+            user=self.user,
+            container_name='djarvis_sandbox_1_abc',
+            status='running'
+        )
+        redis = fakeredis.FakeRedis()
+        patcher = mock.patch('apps.sandbox.services.scheduler.get_redis_connection', return_value=redis)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.scheduler = FairScheduler()
+    
+    def submit(self):
+        grading = {
+            'exercise_id': self.exercise.id, 'code': '- hosts: all\n', 'node_image': None,
+            'reset_nodes': False, 'static_results': None,
+            'runtime_tests': self.exercise.test_cases, 'fingerprint_tests': [],
+            'reference': None, 'warnings': [],
+        }
+        return self.scheduler.submit(self.user.id, FairScheduler.LANE_GRADED, {
+            'container_name': self.session.container_name, 'session_id': self.session.id,
+            'code': grading['code'], 'timeout': 60, 'grading': grading,
+        })
+    
+    @mock.patch('apps.sandbox.tasks.DockerExecutor')
+    def test_worker_records_attempt_nobody_waits_for(self, executor):
+        """Test the attempt is recorded by the worker, not the request."""
+        executor.return_value.run_execution.return_value = {
+            'success': True, 'exit_code': 0, 'stdout': 'ok', 'stderr': '', 'timings': {},
+        }
+        job_id = self.submit()
+        self.assertEqual(process_execution_queue(), job_id)
+        
+        attempt = ExerciseAttempt.objects.get(user=self.user)
+        self.assertTrue(attempt.is_passed)
+        self.assertIn('queue', attempt.timings)
+        result = self.scheduler.status(job_id)['result']
+        self.assertEqual((result['status'], result['data']['is_passed']), (200, True))
+    
+    @mock.patch('apps.sandbox.tasks.DockerExecutor')
+    def test_task_timings_are_stored(self, executor):
+        """Test the phase and per-task timings of a run are kept on its attempt."""
+        tasks = [['Gathering Facts', 'gather_facts', 1.2], ['Install nginx', 'apt', 0.8]]
+        executor.return_value.run_execution.return_value = {
+            'success': True, 'exit_code': 0, 'stdout': 'ok', 'stderr': '',
+            'timings': {'total': 2.5, 'facts': 1.2, 'tasks': tasks},
+        }
+        self.submit()
+        process_execution_queue()
+        
+        timings = ExerciseAttempt.objects.get(user=self.user).timings
+        self.assertEqual((timings['total'], timings['facts'], timings['tasks']), (2.5, 1.2, tasks))
+    
+    @mock.patch('apps.sandbox.tasks.DockerExecutor')
+    def test_cancelled_job_is_not_run(self, executor):
+        """Test the worker skips a job cancelled while queued."""
+        self.scheduler.cancel(self.submit())
+        self.assertIsNone(process_execution_queue())
+        executor.return_value.run_execution.assert_not_called()
+        self.assertFalse(ExerciseAttempt.objects.exists())
+    
+    def test_poll_and_cancel(self):
+        """Test only the owner polls or cancels a job, until it starts."""
+        client = APIClient()
+        job_id = self.submit()
+        url = reverse('sandbox:execution-status', args=[job_id])
+        
+        other = User.objects.create_user(email='other@example.com', username='other', password='TestPass123!')
+        client.force_authenticate(other)
+        self.assertEqual(client.get(url).status_code, 404)
+        self.assertEqual(client.delete(url).status_code, 404)
+        
+        client.force_authenticate(self.user)
+        response = client.get(url)
+        self.assertEqual((response.status_code, response.data['status']), (202, 'queued'))
+        self.assertEqual(client.delete(url).data['status'], 'cancelled')
+        self.assertEqual(client.get(url).data['status'], 'cancelled')
+
+
+@override_settings(SANDBOX_PREFETCH_CLAIM_WAIT=30, **API_SETTINGS)
+class PrefetchClaimTestCase(TestCase):
+    """Test claiming a prefetched sandbox never waits in the request."""
+    
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            email='student@example.com',
+            username='student',
+            password='TestPass123!'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.reservation = SandboxSession.objects.create(
+            user=self.user,
+            container_name='djarvis_sandbox_1_abc',
+            status='reserved'
+        )
+        patcher = mock.patch('apps.sandbox.views.DockerExecutor')
+        self.executor = patcher.start().return_value
+        self.addCleanup(patcher.stop)
+        self.executor.cached_node_image.return_value = 'baseline'
+    
+    def create(self):
+        return self.client.post(reverse('sandbox:create'), {}, format='json')
+    
+    def test_claim_of_starting_sandbox_is_polled(self):
+        """Test a claimed prefetch still starting answers 202 until ready."""
+        response = self.create()
+        self.assertEqual(response.status_code, 202)
+        self.assertFalse(response.data['is_ready'])
+        self.reservation.refresh_from_db()
+        self.assertEqual(self.reservation.status, 'running')
+        
+        self.assertEqual(self.create().status_code, 202)
+        
+        SandboxSession.objects.filter(id=self.reservation.id).update(container_id='abc123')
+        response = self.create()
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.data['is_ready'])
+    
+    @mock.patch('apps.sandbox.views.WarmPool')
+    def test_claim_not_ready_in_time_is_replaced(self, warm_pool):
+        """Test a fresh sandbox is created once the claimed one took too long."""
+        warm_pool.return_value.create_sandbox.return_value = ('def456', 'djarvis_sandbox_1_def')
+        self.create()
+        SandboxSession.objects.filter(id=self.reservation.id).update(
+            last_activity=timezone.now() - timedelta(seconds=31)
+        )
+        
+        response = self.create()
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['container_name'], 'djarvis_sandbox_1_def')
+        self.reservation.refresh_from_db()
+        self.assertEqual(self.reservation.status, 'expired')
+    
+    def test_starting_sandbox_is_not_executed_on(self):
+        """Test execute asks to retry until the claimed sandbox is ready."""
+        self.create()
+        response = self.client.post(reverse('sandbox:execute'), {'code': '- hosts: all\n  tasks: []\n'}, format='json')
+        self.assertEqual((response.status_code, response.data['status']), (503, 'starting'))
+    
+    def test_destroy_starting_sandbox(self):
+        """Test a claimed sandbox still starting is destroyed without Docker."""
+        self.create()
+        response = self.client.post(reverse('sandbox:destroy'))
+        self.assertEqual(response.status_code, 200)
+        self.reservation.refresh_from_db()
+        self.assertEqual(self.reservation.status, 'stopped')
+        self.executor.stop_container.assert_not_called()
+
+
+@override_settings(SANDBOX_FAIR_QUEUE_ENABLED=False, SANDBOX_EARLY_ABORT_ENABLED=False, **API_SETTINGS)
+class CleanStateExecutionTestCase(TestCase):
+    """Test which graded runs start from freshly reset managed nodes."""
+    
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            email='student@example.com',
+            username='student',
+            password='TestPass123!'
+        )
+        module = Module.objects.create(title='Basics', slug='basics', description='Basics')
+        lesson = Lesson.objects.create(
+            module=module, title='First', slug='first', content='First'
+        )
+        self.exercise = Exercise.objects.create(
+            lesson=lesson,
+            title='Ping',
+            description='Ping the nodes',
+            instructions='Ping the nodes',
+            solution_code='- hosts: all\n  tasks: []\n',
+            test_cases=[{'type': 'exit_code', 'expected': 0}],
+            is_published=True
+        )
+        SandboxSession.objects.create(
+            user=self.user,
+            container_name='djarvis_sandbox_1_abc',
+            container_id='abc123',
+            status='running',
+            node_image='baseline'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        patcher = mock.patch('apps.sandbox.views.DockerExecutor')
+        self.executor = patcher.start().return_value
+        self.addCleanup(patcher.stop)
+        self.executor.cached_node_image.return_value = 'baseline'
+        self.executor.run_execution.return_value = {
+            'success': True, 'exit_code': 0, 'stdout': 'ok', 'stderr': '', 'timings': {},
+        }
+    
+    def execute(self):
+        response = self.client.post(reverse('sandbox:execute'), {
+            'code': '- hosts: all\n  tasks: []\n',
+            'exercise_id': self.exercise.id,
+        }, format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        return self.executor.run_execution.call_args.kwargs['reset_nodes']
+    
+    def test_nodes_kept_between_runs(self):
+        """Test runs on the current image reuse the managed nodes."""
+        self.assertFalse(self.execute())
+    
+    def test_clean_state_exercise_resets(self):
+        """Test exercises requiring a clean state reset before every run."""
+        Exercise.objects.filter(id=self.exercise.id).update(requires_clean_state=True)
+        self.assertTrue(self.execute())
+    
+    def test_image_change_resets(self):
+        """Test nodes are replaced when the exercise needs another image."""
+        self.executor.cached_node_image.return_value = 'djarvis-node:pre-abc'
+        self.assertTrue(self.execute())
+    
+    def use_fingerprint(self):
+        test_cases = [
+            {'type': 'exit_code', 'expected': 0},
+            {'type': 'state_matches_solution', 'packages': ['nginx']},
+        ]
+        Exercise.objects.filter(id=self.exercise.id).update(test_cases=test_cases)
+        self.exercise.refresh_from_db()
+        return probe_spec(test_cases[1:])
+    
+    def test_fingerprint_run_resets(self):
+        """Test final-state grading always starts from clean nodes."""
+        spec = self.use_fingerprint()
+        Exercise.objects.filter(id=self.exercise.id).update(reference_fingerprint={
+            'version': FingerprintGrader.version_of(self.exercise, spec),
+            'nodes': {'node1': {'packages': {'nginx': {'version': '1.18.0'}}}},
+        })
+        self.assertTrue(self.execute())
+        self.executor.capture_reference.assert_not_called()
+    
+    @mock.patch('apps.sandbox.views.capture_reference_fingerprint')
+    def test_stale_fingerprint_is_captured_by_worker(self, capture):
+        """Test a missing reference is queued instead of captured in the request."""
+        self.use_fingerprint()
+        response = self.client.post(reverse('sandbox:execute'), {
+            'code': '- hosts: all\n  tasks: []\n',
+            'exercise_id': self.exercise.id,
+        }, format='json')
+        
+        self.assertEqual((response.status_code, response.data['status']), (503, 'preparing'))
+        capture.delay.assert_called_once_with(self.exercise.id)
+        self.executor.capture_reference.assert_not_called()
+        self.executor.prepare_node_image.assert_not_called()
+        self.executor.run_execution.assert_not_called()
@@ -2,12 +2,26 @@
 URL patterns for sandbox app.
 """
 from django.urls import path
-from .views import CreateSandboxView, ExecuteCodeView, DestroySandboxView
+from .views import (
+    CreateSandboxView,
+    PrefetchSandboxView,
+    PrefetchMetricsView,
+    WarmPoolMetricsView,
+    EarlyAbortMetricsView,
+    ExecuteCodeView,
+    ExecutionStatusView,
+    DestroySandboxView
+)
 
 app_name = 'sandbox'
 
 urlpatterns = [
     path('create/', CreateSandboxView.as_view(), name='create'),
+    path('prefetch/', PrefetchSandboxView.as_view(), name='prefetch'),
+    path('metrics/prefetch/', PrefetchMetricsView.as_view(), name='prefetch-metrics'),
+    path('metrics/warm-pool/', WarmPoolMetricsView.as_view(), name='warm-pool-metrics'),
+    path('metrics/early-abort/', EarlyAbortMetricsView.as_view(), name='early-abort-metrics'),
     path('execute/', ExecuteCodeView.as_view(), name='execute'),
+    path('executions/<str:job_id>/', ExecutionStatusView.as_view(), name='execution-status'),
     path('destroy/', DestroySandboxView.as_view(), name='destroy'),
 ]
@@ -5,18 +5,35 @@ from rest_framework import status, permissions
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.throttling import UserRateThrottle
+from django.conf import settings
 from django.utils import timezone
+from datetime import timedelta
+import time
 import uuid
 import logging
 
-from .models import SandboxSession
+from . import metrics
+from .models import SandboxSession, WorkspaceVolume
 from .serializers import (
     SandboxSessionSerializer,
+    CreateSandboxSerializer,
+    PrefetchSandboxSerializer,
     ExecuteCodeSerializer,
     ExecutionResultSerializer
 )
-from .services import DockerExecutor, AnsibleValidator, TestRunner
-from apps.exercises.models import Exercise, ExerciseAttempt
+from .services import DockerExecutor, AnsibleValidator, StaticChecker
+from .services import fingerprint, submission
+from .services.fingerprint import FingerprintGrader
+from .services.scheduler import FairScheduler
+from .services.test_runner import StreamingTestEvaluator
+from .services.warm_pool import WarmPool
+from .tasks import (
+    build_precondition_image,
+    capture_reference_fingerprint,
+    prefetch_sandbox,
+    process_execution_queue
+)
+from apps.exercises.models import AttemptLimitReached, Exercise, ExerciseAttempt, UserExerciseStatus
 
 logger = logging.getLogger(__name__)
 
@@ -26,6 +43,33 @@ class SandboxThrottle(UserRateThrottle):
     rate = '10/minute'
 
 
+class PrefetchThrottle(UserRateThrottle):
+    """Throttle for speculative prefetches (one per page view)."""
+    scope = 'sandbox_prefetch'
+    rate = '30/minute'
+
+
+def _image_preparing_response(exercise=None):
+    """
+    Queue the build of a missing managed node image and ask the client to retry.
+    
+    Images are built by a worker; a web request only ever looks them up.
+    """
+    build_precondition_image.delay(exercise.id if exercise else None)
+    return _preparing_response()
+
+
+def _preparing_response():
+    """Ask the client to retry once a worker has prepared what the run needs."""
+    return Response(
+        {
+            "error": "The sandbox image is being prepared. Please try again shortly.",
+            "status": "preparing"
+        },
+        status=status.HTTP_503_SERVICE_UNAVAILABLE
+    )
+
+
 class CreateSandboxView(APIView):
     """
     Create a new sandbox session.
@@ -35,7 +79,11 @@ class CreateSandboxView(APIView):
     permission_classes = [permissions.IsAuthenticated]
     
     def post(self, request):
+        started = time.monotonic()
         user = request.user
+        serializer = CreateSandboxSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        exercise_id = serializer.validated_data.get('exercise_id')
         
         # Check if user already has an active session
         active_session = SandboxSession.objects.filter(
@@ -44,9 +92,32 @@ class CreateSandboxView(APIView):
         ).first()
         
         if active_session and not active_session.is_expired:
+            if active_session.is_ready:
+                return Response(
+                    SandboxSessionSerializer(active_session).data,
+                    status=status.HTTP_200_OK
+                )
+            if not self._given_up(active_session):
+                # Claimed while its prefetch is still starting; ask again
+                return Response(
+                    SandboxSessionSerializer(active_session).data,
+                    status=status.HTTP_202_ACCEPTED
+                )
+        
+        # Take over a sandbox prefetched for this user, if any
+        session = self._claim_reservation(user)
+        if session is not None:
+            metrics.incr('prefetch_hit' if session.is_ready else 'prefetch_partial')
+            WorkspaceVolume.touch(user)
+            if not session.is_ready:
+                return Response(
+                    SandboxSessionSerializer(session).data,
+                    status=status.HTTP_202_ACCEPTED
+                )
+            metrics.incr('create_ms_hit', int((time.monotonic() - started) * 1000))
             return Response(
-                SandboxSessionSerializer(active_session).data,
-                status=status.HTTP_200_OK
+                SandboxSessionSerializer(session).data,
+                status=status.HTTP_201_CREATED
             )
         
         # Create new session
@@ -54,17 +125,34 @@ class CreateSandboxView(APIView):
         executor = DockerExecutor()
         
         try:
-            container_id, container_name = executor.create_sandbox(
+            exercise = None
+            if exercise_id:
+                exercise = Exercise.objects.filter(
+                    id=exercise_id,
+                    is_published=True
+                ).first()
+            node_image = executor.cached_node_image(
+                exercise.precondition_playbook if exercise else ''
+            )
+            if node_image is None:
+                return _image_preparing_response(exercise)
+            
+            container_id, container_name = WarmPool(executor).create_sandbox(
                 user.id,
-                session_name
+                session_name,
+                node_image
             )
             
             session = SandboxSession.objects.create(
                 user=user,
                 container_id=container_id,
                 container_name=container_name,
+                node_image=node_image,
                 status='running'
             )
+            WorkspaceVolume.touch(user)
+            metrics.incr('create_miss')
+            metrics.incr('create_ms_miss', int((time.monotonic() - started) * 1000))
             
             return Response(
                 SandboxSessionSerializer(session).data,
@@ -77,6 +165,203 @@ class CreateSandboxView(APIView):
                 {"error": "Failed to create sandbox"},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
+    
+    @staticmethod
+    def _claim_reservation(user):
+        """
+        Turn the user's prefetched sandbox into their active session.
+        
+        A reservation still being provisioned is claimed as well; the
+        client polls this endpoint (202) until it is ready.
+        
+        Returns:
+            Claimed session, or None
+        """
+        reservation = SandboxSession.objects.filter(
+            user=user,
+            status='reserved',
+            expires_at__gt=timezone.now()
+        ).order_by('-created_at').first()
+        if reservation is None:
+            return None
+        
+        # last_activity marks the claim until the sandbox is ready
+        claimed = SandboxSession.objects.filter(
+            id=reservation.id,
+            status='reserved'
+        ).update(
+            status='running',
+            expires_at=timezone.now() + timedelta(seconds=settings.SESSION_COOKIE_AGE),
+            last_activity=timezone.now()
+        )
+        if not claimed:
+            return None
+        reservation.refresh_from_db()
+        return reservation
+    
+    @staticmethod
+    def _given_up(session) -> bool:
+        """
+        Drop a claimed sandbox not ready SANDBOX_PREFETCH_CLAIM_WAIT seconds
+        after its claim, so that a fresh one is created instead.
+        """
+        deadline = session.last_activity + timedelta(seconds=settings.SANDBOX_PREFETCH_CLAIM_WAIT)
+        if timezone.now() < deadline:
+            return False
+        # Too slow: the prefetch task tears it down when it finishes
+        SandboxSession.objects.filter(id=session.id, status='running').update(status='expired')
+        return True
+
+
+class PrefetchSandboxView(APIView):
+    """
+    Speculatively prepare a sandbox when an exercise page opens.
+    
+    POST /api/sandbox/prefetch/
+    
+    The sandbox is only reserved: it does not count as the user's active
+    session until /create/ claims it, and is released after
+    SANDBOX_PREFETCH_TTL seconds otherwise.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    throttle_classes = [PrefetchThrottle]
+    
+    # Lowest Celery priority: prefetches never delay real work
+    TASK_PRIORITY = 9
+    
+    def post(self, request):
+        user = request.user
+        serializer = PrefetchSandboxSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        
+        if not settings.SANDBOX_PREFETCH_ENABLED:
+            return Response({"status": "disabled"}, status=status.HTTP_200_OK)
+        
+        exercise = Exercise.objects.filter(
+            id=serializer.validated_data['exercise_id'],
+            is_published=True
+        ).first()
+        if not exercise:
+            return Response(
+                {"error": "Exercise not found"},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        
+        if not StaticChecker.split(exercise.test_cases)[1]:
+            # Graded statically, no sandbox needed
+            return Response({"status": "static"}, status=status.HTTP_200_OK)
+        
+        fingerprint_tests, _ = fingerprint.split(exercise.test_cases)
+        if fingerprint_tests and not FingerprintGrader.is_current(
+            exercise, fingerprint.probe_spec(fingerprint_tests)
+        ):
+            capture_reference_fingerprint.apply_async(
+                args=[exercise.id],
+                priority=self.TASK_PRIORITY
+            )
+        
+        now = timezone.now()
+        if SandboxSession.objects.filter(user=user, status='running', expires_at__gt=now).exists():
+            # Execute switches the active sandbox to the exercise image;
+            # make sure that image is already built
+            if exercise.precondition_playbook:
+                build_precondition_image.apply_async(
+                    args=[exercise.id],
+                    priority=self.TASK_PRIORITY
+                )
+            return Response({"status": "active"}, status=status.HTTP_200_OK)
+        
+        reservation = SandboxSession.objects.filter(
+            user=user,
+            status='reserved',
+            expires_at__gt=now
+        ).first()
+        if reservation:
+            reservation.expires_at = now + timedelta(seconds=settings.SANDBOX_PREFETCH_TTL)
+            reservation.save(update_fields=['expires_at'])
+            return Response(
+                SandboxSessionSerializer(reservation).data,
+                status=status.HTTP_200_OK
+            )
+        
+        # Speculative sandboxes must never crowd out real ones
+        in_use = SandboxSession.objects.filter(
+            status__in=['running', 'reserved'],
+            expires_at__gt=now
+        ).count()
+        if in_use >= settings.MAX_CONCURRENT_SANDBOXES:
+            return Response({"status": "skipped"}, status=status.HTTP_200_OK)
+        
+        session_name = str(uuid.uuid4())[:8]
+        reservation = SandboxSession.objects.create(
+            user=user,
+            container_name=DockerExecutor.sandbox_name(user.id, session_name),
+            status='reserved',
+            expires_at=now + timedelta(seconds=settings.SANDBOX_PREFETCH_TTL)
+        )
+        prefetch_sandbox.apply_async(
+            args=[reservation.id, exercise.id],
+            priority=self.TASK_PRIORITY
+        )
+        metrics.incr('prefetch_issued')
+        
+        return Response(
+            SandboxSessionSerializer(reservation).data,
+            status=status.HTTP_202_ACCEPTED
+        )
+
+
+class PrefetchMetricsView(APIView):
+    """
+    Prefetch hit rate and create latency, for staff.
+    
+    GET /api/sandbox/metrics/prefetch/?days=7
+    """
+    permission_classes = [permissions.IsAdminUser]
+    
+    def get(self, request):
+        try:
+            days = max(1, min(int(request.query_params.get('days', 7)), 30))
+        except ValueError:
+            return Response(
+                {"error": "days must be an integer"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        return Response(metrics.prefetch_report(days), status=status.HTTP_200_OK)
+
+
+class WarmPoolMetricsView(APIView):
+    """
+    Warm pool size, latest demand forecast and hit rate, for staff.
+    
+    GET /api/sandbox/metrics/warm-pool/
+    """
+    permission_classes = [permissions.IsAdminUser]
+    
+    def get(self, request):
+        return Response({
+            **WarmPool().report(),
+            'claims': metrics.warm_pool_report(),
+        }, status=status.HTTP_200_OK)
+
+
+class EarlyAbortMetricsView(APIView):
+    """
+    Graded runs stopped early and the run time saved, for staff.
+    
+    GET /api/sandbox/metrics/early-abort/?days=7
+    """
+    permission_classes = [permissions.IsAdminUser]
+    
+    def get(self, request):
+        try:
+            days = max(1, min(int(request.query_params.get('days', 7)), 30))
+        except ValueError:
+            return Response(
+                {"error": "days must be an integer"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        return Response(metrics.early_abort_report(days), status=status.HTTP_200_OK)
 
 
 class ExecuteCodeView(APIView):
@@ -104,6 +389,29 @@ class ExecuteCodeView(APIView):
                 "warnings": validation_result['warnings']
             }, status=status.HTTP_400_BAD_REQUEST)
         
+        exercise = None
+        if exercise_id:
+            exercise = Exercise.objects.filter(
+                id=exercise_id,
+                is_published=True
+            ).first()
+        if exercise and not UserExerciseStatus.has_attempts_left(request.user.id, exercise):
+            return self._attempts_exhausted(exercise)
+        
+        # Structural tests are graded on the parsed playbook. Exercises with
+        # only static tests never need the sandbox, and static failures of
+        # mixed exercises are reported before spending sandbox time.
+        static_results = None
+        runtime_tests = []
+        if exercise:
+            static_tests, runtime_tests = StaticChecker.split(exercise.test_cases)
+            if static_tests:
+                static_results = StaticChecker.run_tests(static_tests, validation_result['data'])
+                if not static_results['passed'] or not runtime_tests:
+                    return self._grade_statically(
+                        request.user, exercise, code, static_results, validation_result
+                    )
+        
         # Get or create sandbox session
         session = SandboxSession.objects.filter(
             user=request.user,
@@ -115,60 +423,196 @@ class ExecuteCodeView(APIView):
                 {"error": "No active sandbox session. Please create one first."},
                 status=status.HTTP_400_BAD_REQUEST
             )
+        if not session.is_ready:
+            return Response(
+                {"error": "The sandbox is still starting. Please try again shortly.", "status": "starting"},
+                status=status.HTTP_503_SERVICE_UNAVAILABLE
+            )
         
-        # Execute code
         executor = DockerExecutor()
-        execution_result = executor.execute_playbook(
+        
+        # Graded runs start from the exercise's precondition image, and
+        # stateful exercises from clean managed nodes. Final-state tests
+        # compare with the reference solution's state, so they need both.
+        node_image = None
+        reset_nodes = False
+        fingerprint_tests, runtime_tests = fingerprint.split(runtime_tests)
+        spec = fingerprint.probe_spec(fingerprint_tests)
+        reference = None
+        if exercise:
+            try:
+                node_image = executor.cached_node_image(exercise.precondition_playbook)
+                if node_image is None:
+                    return _image_preparing_response(exercise)
+            except Exception as e:
+                logger.error(f"Failed to prepare node image of exercise {exercise.id}: {e}")
+                return Response(
+                    {"error": "Failed to prepare sandbox"},
+                    status=status.HTTP_500_INTERNAL_SERVER_ERROR
+                )
+            reset_nodes = (
+                exercise.requires_clean_state
+                or bool(fingerprint_tests)
+                or session.node_image != node_image
+            )
+            if fingerprint_tests:
+                # Like images, reference fingerprints are captured by a worker
+                if not FingerprintGrader.is_current(exercise, spec):
+                    capture_reference_fingerprint.delay(exercise.id)
+                    return _preparing_response()
+                reference = exercise.reference_fingerprint['nodes']
+        
+        # Graded runs are stopped as soon as a task failure decides them
+        early_abort_tests = None
+        if (
+            exercise
+            and settings.SANDBOX_EARLY_ABORT_ENABLED
+            and StreamingTestEvaluator(runtime_tests, validation_result['data']).can_decide
+        ):
+            early_abort_tests = runtime_tests
+            metrics.incr('early_abort_eligible')
+        
+        grading = {
+            "exercise_id": exercise.id if exercise else None,
+            "code": code,
+            "node_image": node_image,
+            "reset_nodes": reset_nodes,
+            "static_results": static_results,
+            "runtime_tests": runtime_tests,
+            "fingerprint_tests": fingerprint_tests,
+            "reference": reference,
+            "warnings": validation_result.get('warnings', []),
+        }
+        
+        # Queued runs are graded and recorded by the worker; the client
+        # polls ExecutionStatusView for the result
+        if settings.SANDBOX_FAIR_QUEUE_ENABLED:
+            scheduler = FairScheduler()
+            weight = settings.SANDBOX_STAFF_QUEUE_WEIGHT if request.user.is_staff else 1.0
+            job_id = scheduler.submit(
+                request.user.id,
+                FairScheduler.LANE_GRADED if exercise else FairScheduler.LANE_SCRATCH,
+                {
+                    "container_name": session.container_name,
+                    "session_id": session.id,
+                    "code": code,
+                    "timeout": 300,
+                    "node_image": node_image,
+                    "reset_nodes": reset_nodes,
+                    "probe_spec": spec,
+                    "early_abort_tests": early_abort_tests,
+                    "grading": grading,
+                },
+                weight=weight
+            )
+            process_execution_queue.delay()
+            return Response(
+                {"job_id": job_id, "status": FairScheduler.STATE_QUEUED},
+                status=status.HTTP_202_ACCEPTED
+            )
+        
+        execution_result = executor.run_execution(
             session.container_name,
             code,
-            timeout=300
+            timeout=300,
+            node_image=node_image,
+            reset_nodes=reset_nodes,
+            probe_spec=spec,
+            early_abort_tests=early_abort_tests
+        )
+        data, http_status = submission.finish_execution(
+            request.user.id, session.id, execution_result, grading
         )
+        return Response(data, status=http_status)
+    
+    @staticmethod
+    def _attempts_exhausted(exercise):
+        data, http_status = submission.attempts_exhausted(exercise)
+        return Response(data, status=http_status)
+    
+    @classmethod
+    def _grade_statically(cls, user, exercise, code: str, test_results: dict, validation_result: dict):
+        """Record an attempt graded without running the playbook."""
+        is_passed = test_results['passed']
         
-        # Run tests if exercise_id provided
-        test_results = None
-        is_passed = False
+        try:
+            ExerciseAttempt.objects.create(
+                exercise=exercise,
+                user=user,
+                code_submitted=code,
+                test_results=test_results,
+                is_passed=is_passed,
+                execution_time=0.0
+            )
+        except AttemptLimitReached:
+            return cls._attempts_exhausted(exercise)
+        if is_passed:
+            user.add_xp(exercise.xp_reward)
         
-        if exercise_id:
-            try:
-                exercise = Exercise.objects.get(id=exercise_id, is_published=True)
-                test_results = TestRunner.run_tests(
-                    exercise.test_cases,
-                    execution_result
-                )
-                is_passed = test_results['passed']
-                
-                # Save attempt
-                ExerciseAttempt.objects.create(
-                    exercise=exercise,
-                    user=request.user,
-                    code_submitted=code,
-                    output=execution_result.get('stdout', ''),
-                    error_message=execution_result.get('stderr', ''),
-                    test_results=test_results,
-                    is_passed=is_passed,
-                    execution_time=execution_result.get('execution_time'),
-                    attempt_number=1  # Will be auto-incremented
-                )
-                
-                # Award XP if passed
-                if is_passed:
-                    request.user.add_xp(exercise.xp_reward)
-                
-            except Exercise.DoesNotExist:
-                pass
-        
-        # Update session activity
-        session.last_activity = timezone.now()
-        session.save(update_fields=['last_activity'])
-        
-        response_data = {
-            **execution_result,
+        return Response({
+            "success": True,
+            "executed": False,
+            "stdout": "",
+            "stderr": "",
+            "execution_time": 0.0,
             "test_results": test_results,
             "is_passed": is_passed,
             "warnings": validation_result.get('warnings', [])
-        }
+        }, status=status.HTTP_200_OK)
+
+
+class ExecutionStatusView(APIView):
+    """
+    Poll or cancel a queued execution.
+    
+    GET /api/sandbox/executions/<job_id>/
+    DELETE /api/sandbox/executions/<job_id>/
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    
+    def get(self, request, job_id):
+        scheduler = FairScheduler()
+        job = self._job_of(scheduler, request.user, job_id)
+        if job is None:
+            return self._not_found()
+        
+        if job['state'] == FairScheduler.STATE_DONE:
+            return Response(job['result']['data'], status=job['result']['status'])
+        if job['state'] == FairScheduler.STATE_EXPIRED:
+            return Response(
+                {"error": "Execution queue is busy. Please try again.", "status": job['state']},
+                status=status.HTTP_503_SERVICE_UNAVAILABLE
+            )
+        if job['state'] == FairScheduler.STATE_CANCELLED:
+            return Response({"job_id": job_id, "status": job['state']}, status=status.HTTP_200_OK)
+        return Response({"job_id": job_id, "status": job['state']}, status=status.HTTP_202_ACCEPTED)
+    
+    def delete(self, request, job_id):
+        scheduler = FairScheduler()
+        if self._job_of(scheduler, request.user, job_id) is None:
+            return self._not_found()
         
-        return Response(response_data, status=status.HTTP_200_OK)
+        state = scheduler.cancel(job_id)
+        if state != FairScheduler.STATE_CANCELLED:
+            return Response(
+                {"error": "Execution has already started", "status": state},
+                status=status.HTTP_409_CONFLICT
+            )
+        return Response({"job_id": job_id, "status": state}, status=status.HTTP_200_OK)
+    
+    @staticmethod
+    def _job_of(scheduler, user, job_id):
+        job = scheduler.status(job_id)
+        if job is None or job['user_id'] != user.id:
+            return None
+        return job
+    
+    @staticmethod
+    def _not_found():
+        return Response(
+            {"error": "Execution not found"},
+            status=status.HTTP_404_NOT_FOUND
+        )
 
 
 class DestroySandboxView(APIView):
@@ -191,6 +635,15 @@ class DestroySandboxView(APIView):
                 status=status.HTTP_404_NOT_FOUND
             )
         
+        if not session.is_ready:
+            # Still being prefetched: the prefetch task tears it down
+            session.status = 'stopped'
+            session.save(update_fields=['status'])
+            return Response(
+                {"message": "Sandbox destroyed successfully"},
+                status=status.HTTP_200_OK
+            )
+        
         executor = DockerExecutor()
         success = executor.stop_container(session.container_name)
         
@@ -22,10 +22,43 @@ app.conf.beat_schedule = {
         'task': 'apps.sandbox.tasks.cleanup_expired_sandboxes',
         'schedule': crontab(minute='*/5'),  # Every 5 minutes
     },
+    'release-expired-reservations': {
+        'task': 'apps.sandbox.tasks.release_expired_reservations',
+        'schedule': crontab(),  # Every minute
+    },
+    'autoscale-warm-pool': {
+        'task': 'apps.sandbox.tasks.autoscale_warm_pool',
+        'schedule': crontab(minute='*/5'),  # Every 5 minutes
+    },
+    'evict-workspace-volumes': {
+        'task': 'apps.sandbox.tasks.evict_workspace_volumes',
+        'schedule': crontab(minute=30),  # Hourly
+    },
+    'reconcile-exercise-stats': {
+        'task': 'apps.exercises.tasks.reconcile_exercise_stats',
+        'schedule': crontab(minute=15),  # Hourly
+    },
+    'reconcile-exercise-stats-full': {
+        'task': 'apps.exercises.tasks.reconcile_exercise_stats',
+        'schedule': crontab(hour=3, minute=0),  # Daily at 3 AM
+        'kwargs': {'full': True},
+    },
     'cleanup-old-attempts': {
         'task': 'apps.exercises.tasks.cleanup_old_attempts',
         'schedule': crontab(hour=2, minute=0),  # Daily at 2 AM
     },
+    'archive-old-attempts': {
+        'task': 'apps.exercises.tasks.archive_old_attempts',
+        'schedule': crontab(hour=2, minute=30),  # Daily at 2:30 AM
+    },
+    'maintain-attempt-partitions': {
+        'task': 'apps.exercises.tasks.maintain_attempt_partitions',
+        'schedule': crontab(hour=4, minute=0),  # Daily at 4 AM
+    },
+    'collect-code-blobs': {
+        'task': 'apps.exercises.tasks.collect_code_blobs',
+        'schedule': crontab(hour=4, minute=30),  # Daily at 4:30 AM
+    },
 }
 
 
@@ -181,12 +181,66 @@ CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = TIME_ZONE
+# Enables per-task priorities on the Redis broker (0 highest, 9 lowest)
+CELERY_BROKER_TRANSPORT_OPTIONS = {
+    'priority_steps': list(range(10)),
+    'queue_order_strategy': 'priority',
+}
 
 # Sandbox Settings
 SANDBOX_TIMEOUT = env.int('SANDBOX_TIMEOUT', default=300)  # 5 minutes
 SANDBOX_MEMORY_LIMIT = env('SANDBOX_MEMORY_LIMIT', default='512m')
 SANDBOX_CPU_LIMIT = env.float('SANDBOX_CPU_LIMIT', default=1.0)
 MAX_CONCURRENT_SANDBOXES = env.int('MAX_CONCURRENT_SANDBOXES', default=50)
+SANDBOX_NODE_BASELINE_IMAGE = env('SANDBOX_NODE_BASELINE_IMAGE', default='djarvis/managed-node:baseline')
+# 'dedicated' control node per sandbox, or 'shared' pool of controllers
+SANDBOX_CONTROLLER_MODE = env('SANDBOX_CONTROLLER_MODE', default='dedicated')
+SANDBOX_CONTROLLER_POOL_SIZE = env.int('SANDBOX_CONTROLLER_POOL_SIZE', default=4)
+SANDBOX_CONTROLLER_MEMORY_LIMIT = env('SANDBOX_CONTROLLER_MEMORY_LIMIT', default='4g')
+SANDBOX_CONTROLLER_CPU_LIMIT = env.float('SANDBOX_CONTROLLER_CPU_LIMIT', default=4.0)
+SANDBOX_JOB_PIDS_LIMIT = env.int('SANDBOX_JOB_PIDS_LIMIT', default=256)
+SANDBOX_FACT_CACHE_TIMEOUT = env.int('SANDBOX_FACT_CACHE_TIMEOUT', default=86400)  # 1 day
+SANDBOX_WORKSPACE_TTL_DAYS = env.int('SANDBOX_WORKSPACE_TTL_DAYS', default=14)
+SANDBOX_WORKSPACE_DISK_BUDGET_MB = env.int('SANDBOX_WORKSPACE_DISK_BUDGET_MB', default=20480)
+# Fair-queue scheduling of executions across users
+SANDBOX_FAIR_QUEUE_ENABLED = env.bool('SANDBOX_FAIR_QUEUE_ENABLED', default=True)
+SANDBOX_USER_MAX_INFLIGHT = env.int('SANDBOX_USER_MAX_INFLIGHT', default=1)
+SANDBOX_STAFF_QUEUE_WEIGHT = env.float('SANDBOX_STAFF_QUEUE_WEIGHT', default=2.0)
+SANDBOX_QUEUE_WAIT_TIMEOUT = env.int('SANDBOX_QUEUE_WAIT_TIMEOUT', default=120)  # then a queued job is dropped
+# Stop graded runs as soon as a task failure decides the outcome
+SANDBOX_EARLY_ABORT_ENABLED = env.bool('SANDBOX_EARLY_ABORT_ENABLED', default=True)
+# Speculative sandboxes reserved when an exercise page opens
+SANDBOX_PREFETCH_ENABLED = env.bool('SANDBOX_PREFETCH_ENABLED', default=True)
+SANDBOX_PREFETCH_TTL = env.int('SANDBOX_PREFETCH_TTL', default=120)  # 2 minutes
+SANDBOX_PREFETCH_CLAIM_WAIT = env.int('SANDBOX_PREFETCH_CLAIM_WAIT', default=30)  # to finish once claimed
+# Warm pool of pre-provisioned sandboxes, sized from forecast demand
+SANDBOX_WARM_POOL_ENABLED = env.bool('SANDBOX_WARM_POOL_ENABLED', default=True)
+SANDBOX_WARM_POOL_MIN = env.int('SANDBOX_WARM_POOL_MIN', default=0)
+SANDBOX_WARM_POOL_MAX = env.int('SANDBOX_WARM_POOL_MAX', default=20)
+SANDBOX_WARM_POOL_MAX_AGE = env.int('SANDBOX_WARM_POOL_MAX_AGE', default=21600)  # 6 hours
+SANDBOX_WARM_POOL_HORIZON_MINUTES = env.int('SANDBOX_WARM_POOL_HORIZON_MINUTES', default=15)
+SANDBOX_WARM_POOL_HISTORY_WEEKS = env.int('SANDBOX_WARM_POOL_HISTORY_WEEKS', default=4)
+SANDBOX_WARM_POOL_EWMA_ALPHA = env.float('SANDBOX_WARM_POOL_EWMA_ALPHA', default=0.3)
+SANDBOX_WARM_POOL_SAFETY_Z = env.float('SANDBOX_WARM_POOL_SAFETY_Z', default=1.0)
+SANDBOX_HOST_MEMORY_FRACTION = env.float('SANDBOX_HOST_MEMORY_FRACTION', default=0.8)
+# Offline Galaxy collections and roles mounted read-only into controllers
+SANDBOX_GALAXY_CACHE_VOLUME = env('SANDBOX_GALAXY_CACHE_VOLUME', default='djarvis_galaxy_cache')
+SANDBOX_GALAXY_REQUIREMENTS = env('SANDBOX_GALAXY_REQUIREMENTS', default=str(BASE_DIR / 'galaxy_requirements.yml'))
+
+# Exercise attempt retention
+EXERCISE_ATTEMPTS_KEEP = env.int('EXERCISE_ATTEMPTS_KEEP', default=10)  # per user and exercise, older ones are archived
+EXERCISE_ATTEMPTS_CLEANUP_BATCH_SIZE = env.int('EXERCISE_ATTEMPTS_CLEANUP_BATCH_SIZE', default=5000)
+EXERCISE_ATTEMPTS_CLEANUP_PAUSE = env.float('EXERCISE_ATTEMPTS_CLEANUP_PAUSE', default=0.5)  # seconds between batches
+# Attempts older than this move to compressed archive files
+EXERCISE_ATTEMPTS_ARCHIVE_AFTER_DAYS = env.int('EXERCISE_ATTEMPTS_ARCHIVE_AFTER_DAYS', default=180)
+EXERCISE_ATTEMPTS_ARCHIVE_DIR = env('EXERCISE_ATTEMPTS_ARCHIVE_DIR', default=str(BASE_DIR / 'archive' / 'attempts'))
+EXERCISE_ATTEMPTS_ARCHIVE_BATCH_SIZE = env.int('EXERCISE_ATTEMPTS_ARCHIVE_BATCH_SIZE', default=5000)
+# Monthly partitions of exercise_attempts (PostgreSQL, see partition_exercise_attempts)
+EXERCISE_ATTEMPTS_PARTITIONS_AHEAD = env.int('EXERCISE_ATTEMPTS_PARTITIONS_AHEAD', default=3)  # months
+EXERCISE_ATTEMPTS_PARTITION_RETENTION_MONTHS = env.int('EXERCISE_ATTEMPTS_PARTITION_RETENTION_MONTHS', default=0)  # 0 keeps all
+EXERCISE_ATTEMPTS_PARTITION_DROP = env.bool('EXERCISE_ATTEMPTS_PARTITION_DROP', default=False)  # drop instead of detach
+# Unreferenced code blobs used more recently are not collected
+CODE_BLOB_GC_GRACE_HOURS = env.int('CODE_BLOB_GC_GRACE_HOURS', default=24)
 
 # Session Settings
 SESSION_COOKIE_AGE = env.int('SESSION_COOKIE_AGE', default=1800)  # 30 minutes
@@ -1,6 +1,6 @@
-import React, { useState } from 'react'
+import React, { useState, useEffect, useRef } from 'react'
 import { useParams, useNavigate } from 'react-router-dom'
-import { useQuery, useMutation } from 'react-query'
+import { useQuery, useMutation, useQueryClient } from 'react-query'
 import {
   Box,
   Typography,
@@ -30,12 +30,77 @@ import { exercisesAPI, sandboxAPI } from '../services/api'
 import CodeEditor from '../components/CodeEditor'
 import MarkdownViewer from '../components/MarkdownViewer'
 
+const PREPARING_RETRY_MS = 3000
+const EXECUTION_POLL_MS = 1000
+const SANDBOX_POLL_MS = 1000
+
+const sleep = (ms) => new Promise((resolve) => setTimeout(resolve, ms))
+
+// Repeats a request while the backend is still building the sandbox image
+// or starting the sandbox
+const retryWhilePreparing = async (request) => {
+  for (;;) {
+    try {
+      return await request()
+    } catch (error) {
+      if (!['preparing', 'starting'].includes(error.response?.data?.status)) throw error
+      await sleep(PREPARING_RETRY_MS)
+    }
+  }
+}
+
+// A claimed prefetch may still be starting (202); ask again until it is ready
+const createSandbox = async (exerciseId) => {
+  let response = await retryWhilePreparing(() => sandboxAPI.createSandbox(exerciseId))
+  while (response.status === 202) {
+    await sleep(SANDBOX_POLL_MS)
+    response = await retryWhilePreparing(() => sandboxAPI.createSandbox(exerciseId))
+  }
+  return response
+}
+
 const ExerciseView = () => {
   const { exerciseId } = useParams()
   const navigate = useNavigate()
   const [code, setCode] = useState('')
   const [output, setOutput] = useState(null)
   const [hintsRevealed, setHintsRevealed] = useState(0)
+  const sandboxReady = useRef(false)
+  const pendingJob = useRef(null)
+  const queryClient = useQueryClient()
+
+  // Start preparing the sandbox while the student reads the task
+  useEffect(() => {
+    sandboxAPI.prefetchSandbox(exerciseId).catch(() => {})
+  }, [exerciseId])
+
+  // A run still queued when the student leaves is not needed anymore
+  useEffect(
+    () => () => {
+      if (pendingJob.current) {
+        sandboxAPI.cancelExecution(pendingJob.current).catch(() => {})
+        pendingJob.current = null
+      }
+    },
+    [exerciseId]
+  )
+
+  // Queued runs are accepted with a job ID; poll until the result is in
+  const waitForExecution = async (response) => {
+    const jobId = response.data.job_id
+    pendingJob.current = jobId
+    try {
+      let current = response
+      while (current.status === 202) {
+        await sleep(EXECUTION_POLL_MS)
+        if (pendingJob.current !== jobId) throw new window.Error('Execution cancelled')
+        current = await sandboxAPI.getExecution(jobId)
+      }
+      return current
+    } finally {
+      if (pendingJob.current === jobId) pendingJob.current = null
+    }
+  }
 
   const { data: exerciseData, isLoading } = useQuery(
     ['exercise', exerciseId],
@@ -48,11 +113,28 @@ const ExerciseView = () => {
   )
 
   const executeMutation = useMutation(
-    (codeToExecute) =>
-      sandboxAPI.executeCode({ code: codeToExecute, exercise_id: exerciseId }),
+    async (codeToExecute) => {
+      // Claims the prefetched sandbox, or creates one on a miss; exercises
+      // graded statically do not need one
+      if (exerciseData?.data.requires_sandbox !== false && !sandboxReady.current) {
+        await createSandbox(exerciseId)
+        sandboxReady.current = true
+      }
+      const response = await retryWhilePreparing(() =>
+        sandboxAPI.executeCode({ code: codeToExecute, exercise_id: exerciseId })
+      )
+      return response.status === 202 ? waitForExecution(response) : response
+    },
     {
       onSuccess: (data) => {
         setOutput(data.data)
+        // Count the attempt without refetching, which would reset the editor
+        queryClient.setQueryData(['exercise', exerciseId], (previous) =>
+          previous && {
+            ...previous,
+            data: { ...previous.data, user_attempts: previous.data.user_attempts + 1 },
+          }
+        )
       },
     }
   )
@@ -72,6 +154,8 @@ const ExerciseView = () => {
   }
 
   const exercise = exerciseData?.data
+  const attemptsExhausted =
+    exercise.max_attempts > 0 && exercise.user_attempts >= exercise.max_attempts
 
   return (
     <Box>
@@ -157,9 +241,13 @@ const ExerciseView = () => {
                   executeMutation.isLoading ? <CircularProgress size={20} /> : <PlayArrow />
                 }
                 onClick={handleRunCode}
-                disabled={executeMutation.isLoading}
+                disabled={executeMutation.isLoading || attemptsExhausted}
               >
-                {executeMutation.isLoading ? 'Executing...' : 'Run Code'}
+                {executeMutation.isLoading
+                  ? 'Executing...'
+                  : attemptsExhausted
+                    ? 'No attempts left'
+                    : 'Run Code'}
               </Button>
             </Box>
           </Paper>
@@ -80,14 +80,20 @@ export const coursesAPI = {
 export const exercisesAPI = {
   getExercises: (params) => api.get('/exercises/', { params }),
   getExercise: (id) => api.get(`/exercises/${id}/`),
-  getAttempts: (exerciseId) => api.get(`/exercises/${exerciseId}/attempts/`),
+  getAttempts: (exerciseId, params) => api.get(`/exercises/${exerciseId}/attempts/`, { params }),
+  getAttempt: (attemptId) => api.get(`/exercises/attempts/${attemptId}/`),
   getHint: (exerciseId, hintIndex) => api.post(`/exercises/${exerciseId}/hint/`, { hint_index: hintIndex }),
 }
 
 // Sandbox API
 export const sandboxAPI = {
-  createSandbox: () => api.post('/sandbox/create/'),
+  createSandbox: (exerciseId) =>
+    api.post('/sandbox/create/', exerciseId ? { exercise_id: exerciseId } : {}),
+  prefetchSandbox: (exerciseId) =>
+    api.post('/sandbox/prefetch/', { exercise_id: exerciseId }),
   executeCode: (data) => api.post('/sandbox/execute/', data),
+  getExecution: (jobId) => api.get(`/sandbox/executions/${jobId}/`),
+  cancelExecution: (jobId) => api.delete(`/sandbox/executions/${jobId}/`),
   destroySandbox: () => api.post('/sandbox/destroy/'),
 }
 